@@ -0,0 +1,209 @@
+"""
+Фоновая запись консоли и BLF для реплееров
+===========================================
+
+В горячем цикле реплееров каждый кадр форматировался f-строкой с ANSI цветами,
+печатался синхронно (print ждёт терминал) и писался в BLF через
+BLFWriter.on_message_received (сжатие + диск). Медленный терминал или диск сдвигали
+время отправки следующего кадра.
+
+AsyncLogWriter выносит это в фоновый поток:
+- цикл отправки кладёт в ограниченную очередь только ссылки (сообщение + функция
+  форматирования), форматирование и запись выполняет поток записи
+- политика перегрузки: если в очереди больше console_limit элементов, вывод в консоль
+  отбрасывается (считается в console_dropped); кадры BLF не отбрасываются никогда -
+  при полностью заполненной очереди put() ждёт свободного места
+- прогресс tqdm обновляется потоком записи по счётчику, без элементов в очереди
+
+ИСПОЛЬЗОВАНИЕ:
+    log_writer = AsyncLogWriter(blf_writer=logger, progress=pbar)
+    ...
+    bus.send(tx_msg)
+    log_writer.blf(log_msg)
+    log_writer.console(format_message, log_msg, color)
+    log_writer.advance()
+    ...
+    log_writer.close()      # дописывает очередь и останавливает поток
+    logger.stop()
+"""
+
+import queue
+import threading
+
+# Размер очереди (элементов). Кадры BLF могут занять её целиком.
+DEFAULT_QUEUE_SIZE = 100000
+
+# Выше этого заполнения очереди консольный вывод отбрасывается
+DEFAULT_CONSOLE_LIMIT = 20000
+
+# Как часто поток записи обновляет прогресс, если очередь пуста (сек)
+PROGRESS_REFRESH = 0.1
+
+_KIND_CONSOLE = 0
+_KIND_BLF = 1
+_KIND_STOP = 2
+
+
+class AsyncLogWriter:
+    def __init__(self, blf_writer=None, progress=None, queue_size=DEFAULT_QUEUE_SIZE,
+                 console_limit=DEFAULT_CONSOLE_LIMIT, console_enabled=True):
+        """
+        blf_writer - can.BLFWriter (или любой can.Listener) либо None
+        progress   - tqdm, который нужно продвигать через advance(), либо None
+        """
+        self.blf_writer = blf_writer
+        self.progress = progress
+        self.console_limit = min(console_limit, queue_size)
+        self.console_enabled = console_enabled
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._advanced = 0   # пишет только поток отправки
+        self._shown = 0
+        self._progress_lock = threading.Lock()
+
+        self.console_lines = 0
+        self.console_dropped = 0
+        self.blf_written = 0
+        self.blf_errors = 0
+        self.max_backlog = 0
+
+        self._thread = threading.Thread(target=self._run, name="AsyncLogWriter", daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------
+    # Поток отправки
+    # ------------------------------------------------------------------
+    def console(self, formatter, *args):
+        """
+        Строка для консоли: formatter(*args) вызывается в потоке записи.
+        При перегрузке строка отбрасывается.
+        """
+        if not self.console_enabled:
+            return
+        backlog = self._queue.qsize()
+        if backlog >= self.console_limit:
+            self.console_dropped += 1
+            return
+        try:
+            self._queue.put_nowait((_KIND_CONSOLE, formatter, args))
+        except queue.Full:
+            self.console_dropped += 1
+            return
+        if backlog > self.max_backlog:
+            self.max_backlog = backlog
+
+    def print(self, text=""):
+        """Готовая строка для консоли (тоже отбрасывается при перегрузке)"""
+        self.console(str, text)
+
+    def blf(self, msg):
+        """Кадр для BLF - никогда не отбрасывается"""
+        if self.blf_writer is None:
+            return
+        backlog = self._queue.qsize()
+        if backlog > self.max_backlog:
+            self.max_backlog = backlog
+        self._queue.put((_KIND_BLF, msg, None))
+
+    def advance(self, n=1):
+        """Продвинуть прогресс на n (фактическое обновление tqdm - в потоке записи)"""
+        self._advanced += n
+
+    def attach_progress(self, progress):
+        """
+        Подключает новый tqdm (или None). Вызывать между прогонами: дожидается,
+        пока очередь опустеет, чтобы старый прогресс получил все обновления.
+        """
+        self.flush()
+        self._update_progress()
+        with self._progress_lock:
+            self.progress = progress
+            self._advanced = 0
+            self._shown = 0
+
+    def set_blf_writer(self, blf_writer):
+        """
+        Переключает BLF writer (новый файл на каждый цикл). Сначала дописывает очередь
+        в старый - после возврата его можно закрывать.
+        """
+        self.flush()
+        self.blf_writer = blf_writer
+
+    def flush(self):
+        """Ждёт, пока поток записи обработает всё, что уже в очереди"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """Дописывает всё из очереди и останавливает поток. BLF writer не закрывает."""
+        if self._thread is None:
+            return
+        self._queue.put((_KIND_STOP, None, None))
+        self._thread.join()
+        self._thread = None
+        self._update_progress()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # ------------------------------------------------------------------
+    # Поток записи
+    # ------------------------------------------------------------------
+    def _update_progress(self):
+        with self._progress_lock:
+            if self.progress is None:
+                return
+            advanced = self._advanced
+            if advanced != self._shown:
+                self.progress.update(advanced - self._shown)
+                self._shown = advanced
+
+    def _run(self):
+        while True:
+            try:
+                kind, payload, args = self._queue.get(timeout=PROGRESS_REFRESH)
+            except queue.Empty:
+                self._update_progress()
+                continue
+
+            if kind == _KIND_STOP:
+                self._queue.task_done()
+                break
+
+            if kind == _KIND_BLF:
+                try:
+                    self.blf_writer.on_message_received(payload)
+                    self.blf_written += 1
+                except Exception as e:
+                    self.blf_errors += 1
+                    print(f"[AsyncLogWriter] BLF log error: {e}")
+            else:
+                try:
+                    print(payload(*args))
+                    self.console_lines += 1
+                except Exception as e:
+                    print(f"[AsyncLogWriter] Console format error: {e}")
+
+            self._queue.task_done()
+            self._update_progress()
+
+    # ------------------------------------------------------------------
+    # Отчёт
+    # ------------------------------------------------------------------
+    def stats(self):
+        return {
+            'console_lines': self.console_lines,
+            'console_dropped': self.console_dropped,
+            'blf_written': self.blf_written,
+            'blf_errors': self.blf_errors,
+            'max_backlog': self.max_backlog,
+        }
+
+    def format_report(self):
+        stats = self.stats()
+        return (f"Log writer: {stats['blf_written']} BLF frames ({stats['blf_errors']} errors), "
+                f"{stats['console_lines']} console lines, {stats['console_dropped']} dropped, "
+                f"max backlog {stats['max_backlog']}")
@@ -0,0 +1,821 @@
+"""
+Индекс BLF и каталог папки логов: выборка по времени без чтения всего файла
+==========================================================================
+
+BLF - это заголовок файла и последовательность LOG_CONTAINER; каждый контейнер - до
+128 КБ объектов (CAN кадры, маркеры...), сжатых zlib. Объект может начаться в одном
+контейнере и закончиться в следующем. can.BLFReader читает только подряд, поэтому
+вырезка минуты из конца многогигабайтного лога распаковывает весь файл.
+
+Индекс файла (scan_blf, один проход, дальше берётся из кэша):
+- для каждого контейнера: смещение в файле, размер, skip - сколько байт в начале его
+  данных принадлежат объекту из предыдущего контейнера, min/max времени и число
+  объектов, которые в нём начинаются
+- сохраняется рядом с логом: log.blf -> log.blf.blfidx (первая строка - JSON,
+  дальше записи INDEX_RECORD по контейнерам) и пересобирается, если изменились
+  размер или mtime BLF (как log_cache.py)
+
+read_objects распаковывает только нужные контейнеры (плюс хвост последнего объекта)
+и отдаёт целые объекты как байты; RawBLFWriter пишет их в новый BLF без can.Message,
+пересчитывая метку времени только если у файлов разный start_timestamp.
+
+Фильтр по ID (анализатору нужны 0x740/0x760, реплеерам - только 0x740):
+- в индексе для каждого arbitration id хранятся диапазоны контейнеров, где он есть,
+  поэтому контейнеры без нужных ID даже не распаковываются
+- в распакованных контейнерах ID берётся прямо из заголовка объекта (object_can_id),
+  can.Message создаётся только для подходящих кадров (read_messages - замена BLFReader)
+- filter_blf пишет уменьшенный BLF только с этими ID - следующие прогоны читают его
+
+Каталог папки (blf_catalog.json в корне): начало/конец каждого BLF. extract_range
+вырезает абсолютный интервал времени из всех файлов, которые его пересекают
+(остальные не открываются), в один BLF, с необязательным фильтром по ID.
+Выходные файлы скриптов (range_*.blf, *_ids.blf, папки *_parts) в каталог не попадают,
+вырезка по умолчанию пишется в текущую папку.
+
+ИСПОЛЬЗОВАНИЕ:
+    python blf_index.py catalog D:/logs/car12                          # построить/обновить каталог
+    python blf_index.py extract D:/logs/car12 "2025-03-14 10:15:00" "2025-03-14 10:17:30" -o brake.blf
+    python blf_index.py extract D:/logs/car12 1741940100 1741940250 --ids 0x740,0x760 -o diag.blf
+    python blf_index.py filter AVA_OK.blf --ids 0x740,0x760                 # -> AVA_OK_ids.blf
+
+    for msg in read_messages('AVA_OK.blf', {0x740, 0x760}):
+        ...
+"""
+
+import argparse
+import fnmatch
+import json
+import math
+import os
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import can
+from can.io.blf import (
+    FILE_HEADER_STRUCT, FILE_HEADER_SIZE, OBJ_HEADER_BASE_STRUCT, LOG_CONTAINER_STRUCT,
+    CAN_MSG_STRUCT, CAN_FD_MSG_STRUCT, CAN_FD_MSG_64_STRUCT, CAN_ERROR_EXT_STRUCT,
+    LOG_CONTAINER, CAN_MESSAGE, CAN_MESSAGE2, CAN_ERROR_EXT, CAN_FD_MESSAGE, CAN_FD_MESSAGE_64,
+    NO_COMPRESSION, ZLIB_DEFLATE, TIME_TEN_MICS, TIME_ONE_NANS, CAN_MSG_EXT, REMOTE_FLAG, DIR,
+    BLFParseError, systemtime_to_timestamp, timestamp_to_systemtime,
+)
+from can.util import dlc2len
+
+INDEX_VERSION = 2
+INDEX_SUFFIX = '.blfidx'
+
+# offset, размер объекта-контейнера, skip, t_min, t_max, объектов в контейнере
+INDEX_RECORD = struct.Struct('<QLLddL')
+
+CATALOG_NAME = 'blf_catalog.json'
+CATALOG_VERSION = 1
+
+# Собственные выходные файлы (extract, filter, разбиение ds_blf_extractor_splitter.py) -
+# не исходные логи: каталог их пропускает, иначе вырезки дублируют кадры источников
+GENERATED_FILE_PATTERNS = ('range_*.blf', '*_ids.blf')
+GENERATED_DIR_PATTERNS = ('*_parts',)
+
+# flags, (client index / timestamp status, object version), timestamp - одинаково для заголовков v1 и v2
+OBJ_TIME_STRUCT = struct.Struct('<L4xQ')
+OBJ_TIME_OFFSET = OBJ_HEADER_BASE_STRUCT.size
+
+# Смещение arbitration id от конца заголовка объекта
+CAN_ID_OFFSETS = {
+    CAN_MESSAGE: 4,
+    CAN_MESSAGE2: 4,
+    CAN_FD_MESSAGE: 4,
+    CAN_FD_MESSAGE_64: 4,
+    CAN_ERROR_EXT: 16,
+}
+
+CAN_ID_MASK = 0x1FFFFFFF
+
+# Диапазонов контейнеров на один ID в индексе; ID, который встречается чаще вразброс,
+# хранится одним диапазоном от первого до последнего контейнера (пропуска по нему нет)
+MAX_ID_RANGES = 512
+
+# Контейнеров, распаковываемых за раз при чтении длинного диапазона (~8 МБ данных)
+READ_BATCH = 64
+
+
+# ----------------------------------------------------------------------
+# Разбор объектов
+# ----------------------------------------------------------------------
+def read_file_header(f):
+    """Заголовок BLF: (размер заголовка, start_timestamp, число объектов)"""
+    header = FILE_HEADER_STRUCT.unpack(f.read(FILE_HEADER_STRUCT.size))
+    if header[0] != b"LOGG":
+        raise BLFParseError("Unexpected file format")
+    return header[1], systemtime_to_timestamp(header[14:22]), header[12]
+
+
+def iter_containers(f, header_size):
+    """(смещение, размер объекта, метод сжатия, сжатые данные) для каждого LOG_CONTAINER по порядку"""
+    base_size = OBJ_HEADER_BASE_STRUCT.size
+    offset = header_size
+    f.seek(offset)
+    while True:
+        data = f.read(base_size)
+        if len(data) < base_size:
+            return
+        signature, _, _, obj_size, obj_type = OBJ_HEADER_BASE_STRUCT.unpack(data)
+        if signature != b"LOBJ":
+            raise BLFParseError(f"No object signature at offset {offset}")
+        body = f.read(obj_size - base_size)
+        if obj_type == LOG_CONTAINER:
+            method, _ = LOG_CONTAINER_STRUCT.unpack_from(body)
+            yield offset, obj_size, method, body[LOG_CONTAINER_STRUCT.size:]
+        # выравнивание между объектами верхнего уровня - как в can.BLFReader
+        offset += obj_size + obj_size % 4
+        f.seek(offset)
+
+
+def decompress(method, payload):
+    if method == NO_COMPRESSION:
+        return bytes(payload)
+    if method == ZLIB_DEFLATE:
+        return zlib.decompress(payload)
+    raise BLFParseError(f"Unknown compression method ({method})")
+
+
+def parse_objects(data, pos=0):
+    """
+    Целые объекты в распакованных данных начиная с pos.
+    Возвращает (список (начало, конец, тип, flags, метка в единицах BLF), позиция незаконченного хвоста).
+    У объектов с неизвестной версией заголовка flags = None.
+    """
+    unpack_base = OBJ_HEADER_BASE_STRUCT.unpack_from
+    unpack_time = OBJ_TIME_STRUCT.unpack_from
+    base_size = OBJ_HEADER_BASE_STRUCT.size
+    max_pos = len(data)
+    objects = []
+
+    while True:
+        # объект ищется с учётом выравнивания (зависит от типа предыдущего)
+        found = data.find(b"LOBJ", pos, pos + 8)
+        if found < 0:
+            if pos + 8 > max_pos:
+                return objects, pos
+            raise BLFParseError("Could not find next object")
+        if found + base_size + OBJ_TIME_STRUCT.size > max_pos:
+            return objects, pos
+        _, _, header_version, obj_size, obj_type = unpack_base(data, found)
+        end = found + obj_size
+        if end > max_pos:
+            return objects, pos
+        if header_version in (1, 2):
+            flags, timestamp = unpack_time(data, found + OBJ_TIME_OFFSET)
+        else:
+            flags, timestamp = None, 0
+        objects.append((found, end, obj_type, flags, timestamp))
+        pos = end
+
+
+def object_time(flags, timestamp, start_timestamp):
+    """Абсолютное время объекта, сек (как в can.BLFReader)"""
+    return timestamp * (1e-5 if flags == TIME_TEN_MICS else 1e-9) + start_timestamp
+
+
+def object_can_id(data, start, obj_type):
+    """arbitration id CAN объекта прямо из байт (без can.Message) или None для прочих объектов"""
+    offset = CAN_ID_OFFSETS.get(obj_type)
+    if offset is None:
+        return None
+    header_size = OBJ_HEADER_BASE_STRUCT.unpack_from(data, start)[1]
+    return struct.unpack_from('<L', data, start + header_size + offset)[0] & CAN_ID_MASK
+
+
+# ----------------------------------------------------------------------
+# Индекс файла
+# ----------------------------------------------------------------------
+def index_path_for(blf_path):
+    return f"{blf_path}{INDEX_SUFFIX}"
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def scan_blf(blf_path):
+    """
+    Один проход по BLF: список контейнеров [offset, obj_size, skip, t_min, t_max, count]
+    и общие данные файла. Объект принадлежит контейнеру, в котором начинается.
+    """
+    containers = []
+    id_ranges = {}
+    t_first = math.inf
+    t_last = -math.inf
+    objects_total = 0
+
+    def add_id(can_id, index):
+        ranges = id_ranges.setdefault(can_id, [])
+        if ranges and ranges[-1][1] >= index - 1:
+            ranges[-1][1] = max(ranges[-1][1], index)
+        else:
+            ranges.append([index, index])
+
+    with open(blf_path, 'rb') as f:
+        header_size, start_timestamp, object_count = read_file_header(f)
+
+        tail = b''
+        tail_owner = None   # контейнер, в котором начался незаконченный объект
+        for offset, obj_size, method, payload in iter_containers(f, header_size):
+            index = len(containers)
+            data = decompress(method, payload)
+            joined = tail + data if tail else data
+            objects, stop = parse_objects(joined)
+
+            t_min = math.inf
+            t_max = -math.inf
+            count = 0
+            skip = len(data) if tail else 0
+            for start, _, obj_type, flags, timestamp in objects:
+                if obj_type in CAN_ID_OFFSETS:
+                    add_id(object_can_id(joined, start, obj_type), tail_owner if start < len(tail) else index)
+                if start < len(tail):
+                    # объект начался в предыдущем контейнере - дописываем время туда
+                    owner = containers[tail_owner]
+                    if flags is not None:
+                        moment = object_time(flags, timestamp, start_timestamp)
+                        owner[3] = min(owner[3], moment)
+                        owner[4] = max(owner[4], moment)
+                    owner[5] += 1
+                    continue
+                if skip > start - len(tail):
+                    skip = start - len(tail)
+                count += 1
+                if flags is not None:
+                    moment = object_time(flags, timestamp, start_timestamp)
+                    t_min = min(t_min, moment)
+                    t_max = max(t_max, moment)
+
+            if tail and stop >= len(tail):
+                # начало следующего объекта (или хвоста) - в этом контейнере
+                skip = min(skip, stop - len(tail))
+            containers.append([offset, obj_size, skip, t_min, t_max, count])
+
+            tail = joined[stop:]
+            if stop >= len(joined) - len(data):
+                tail_owner = index
+            # иначе хвост всё ещё тянется из tail_owner (объект длиннее контейнера)
+
+    for container in containers:
+        objects_total += container[5]
+        if container[5]:
+            t_first = min(t_first, container[3])
+            t_last = max(t_last, container[4])
+
+    meta = {
+        'version': INDEX_VERSION,
+        'source_signature': _file_signature(blf_path),
+        'header_size': header_size,
+        'start_timestamp': start_timestamp,
+        'object_count': object_count,
+        'objects': objects_total,
+        'containers': len(containers),
+        't_first': t_first if objects_total else None,
+        't_last': t_last if objects_total else None,
+        # arbitration id -> диапазоны контейнеров [первый, последний]
+        'ids': {str(can_id): ranges if len(ranges) <= MAX_ID_RANGES else [[ranges[0][0], ranges[-1][1]]]
+                for can_id, ranges in sorted(id_ranges.items())},
+    }
+    return meta, containers
+
+
+def save_index(blf_path, meta, containers):
+    path = index_path_for(blf_path)
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps(meta).encode('utf-8') + b'\n')
+            for container in containers:
+                f.write(INDEX_RECORD.pack(*container))
+        os.replace(tmp_path, path)
+        return path
+    except OSError as e:
+        print(f"[BLF index] Could not write index {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+
+def load_index(blf_path):
+    """Индекс из .blfidx, если он свежий, иначе (None, None)"""
+    path = index_path_for(blf_path)
+    if not os.path.exists(path):
+        return None, None
+    try:
+        with open(path, 'rb') as f:
+            meta = json.loads(f.readline())
+            if meta.get('version') != INDEX_VERSION or meta.get('source_signature') != _file_signature(blf_path):
+                return None, None
+            records = f.read()
+        containers = [list(record) for record in INDEX_RECORD.iter_unpack(records)]
+    except Exception as e:
+        print(f"[BLF index] Could not read index {path}: {e}")
+        return None, None
+    return meta, containers
+
+
+def get_index(blf_path, rebuild=False):
+    """Индекс BLF из кэша или новым проходом по файлу"""
+    if not rebuild:
+        meta, containers = load_index(blf_path)
+        if meta is not None:
+            return meta, containers
+    print(f"[BLF index] Scanning {blf_path}")
+    meta, containers = scan_blf(blf_path)
+    save_index(blf_path, meta, containers)
+    return meta, containers
+
+
+def containers_in_range(containers, t0=None, t1=None):
+    """Номера контейнеров, объекты которых пересекают [t0, t1]"""
+    return [index for index, (_, _, _, t_min, t_max, count) in enumerate(containers)
+            if count and (t1 is None or t_min <= t1) and (t0 is None or t_max >= t0)]
+
+
+def containers_with_ids(meta, containers, ids):
+    """bytearray по контейнерам: 1 - в контейнере есть хотя бы один из ids"""
+    mask = bytearray(len(containers))
+    for can_id in ids:
+        for first, last in meta['ids'].get(str(can_id), ()):
+            mask[first:last + 1] = b'\x01' * (last - first + 1)
+    return mask
+
+
+def container_runs(indices):
+    """[1, 2, 3, 7, 8] -> [(1, 3), (7, 8)]"""
+    runs = []
+    for index in indices:
+        if runs and runs[-1][1] == index - 1:
+            runs[-1][1] = index
+        else:
+            runs.append([index, index])
+    return [tuple(run) for run in runs]
+
+
+def _read_container(f, container):
+    offset, obj_size = container[0], container[1]
+    f.seek(offset)
+    body = f.read(obj_size)[OBJ_HEADER_BASE_STRUCT.size:]
+    method, _ = LOG_CONTAINER_STRUCT.unpack_from(body)
+    return decompress(method, body[LOG_CONTAINER_STRUCT.size:])
+
+
+def read_objects(f, containers, first, last):
+    """
+    Распакованные данные объектов, начавшихся в контейнерах first..last, и их список
+    (как parse_objects). Соседние контейнеры читаются только ради хвоста последнего объекта.
+    """
+    parts = []
+    for index in range(first, last + 1):
+        data = _read_container(f, containers[index])
+        parts.append(data[containers[index][2]:] if index == first else data)
+
+    # последний объект может продолжаться в следующих контейнерах
+    index = last + 1
+    while index < len(containers) and containers[index][2] > 0:
+        data = _read_container(f, containers[index])
+        parts.append(data[:containers[index][2]])
+        if containers[index][2] < len(data):
+            break
+        index += 1
+
+    data = b''.join(parts)
+    objects, _ = parse_objects(data)
+    return data, objects
+
+
+def iter_run_objects(f, containers, first, last):
+    """read_objects по пачкам READ_BATCH контейнеров - память не зависит от длины диапазона"""
+    for batch_first in range(first, last + 1, READ_BATCH):
+        yield read_objects(f, containers, batch_first, min(last, batch_first + READ_BATCH - 1))
+
+
+def iter_range_objects(blf_path, meta, containers, t0=None, t1=None, ids=None):
+    """
+    (байты объекта, абсолютное время) для объектов на [t0, t1].
+    ids - множество arbitration id: остальные объекты отсеиваются по заголовку, без can.Message.
+    """
+    start_timestamp = meta['start_timestamp']
+    selected = containers_in_range(containers, t0, t1)
+    if ids is not None:
+        # контейнеры без нужных ID не распаковываются
+        mask = containers_with_ids(meta, containers, ids)
+        selected = [index for index in selected if mask[index]]
+    with open(blf_path, 'rb') as f:
+        for first, last in container_runs(selected):
+            for data, objects in iter_run_objects(f, containers, first, last):
+                for start, end, obj_type, flags, timestamp in objects:
+                    if flags is None:
+                        continue
+                    moment = object_time(flags, timestamp, start_timestamp)
+                    if (t0 is not None and moment < t0) or (t1 is not None and moment > t1):
+                        continue
+                    if ids is not None and object_can_id(data, start, obj_type) not in ids:
+                        continue
+                    yield data[start:end], moment
+
+
+def message_from_object(data, start, obj_type, timestamp):
+    """can.Message из байт объекта (поля - как в can.BLFReader) или None для не-CAN объектов"""
+    pos = start + OBJ_HEADER_BASE_STRUCT.unpack_from(data, start)[1]
+
+    if obj_type in (CAN_MESSAGE, CAN_MESSAGE2):
+        channel, flags, dlc, can_id, can_data = CAN_MSG_STRUCT.unpack_from(data, pos)
+        return can.Message(timestamp=timestamp, arbitration_id=can_id & CAN_ID_MASK,
+                           is_extended_id=bool(can_id & CAN_MSG_EXT), is_remote_frame=bool(flags & REMOTE_FLAG),
+                           is_rx=not bool(flags & DIR), dlc=dlc, data=can_data[:dlc], channel=channel - 1)
+
+    if obj_type == CAN_FD_MESSAGE:
+        channel, flags, dlc, can_id, _, _, fd_flags, valid_bytes, can_data = CAN_FD_MSG_STRUCT.unpack_from(data, pos)
+        return can.Message(timestamp=timestamp, arbitration_id=can_id & CAN_ID_MASK,
+                           is_extended_id=bool(can_id & CAN_MSG_EXT), is_remote_frame=bool(flags & REMOTE_FLAG),
+                           is_fd=bool(fd_flags & 0x1), is_rx=not bool(flags & DIR),
+                           bitrate_switch=bool(fd_flags & 0x2), error_state_indicator=bool(fd_flags & 0x4),
+                           dlc=dlc2len(dlc), data=can_data[:valid_bytes], channel=channel - 1)
+
+    if obj_type == CAN_FD_MESSAGE_64:
+        members = CAN_FD_MSG_64_STRUCT.unpack_from(data, pos)
+        channel, dlc, valid_bytes, can_id, fd_flags = members[0], members[1], members[2], members[4], members[6]
+        direction, ext_data_offset = members[12], members[13]
+        obj_size = OBJ_HEADER_BASE_STRUCT.unpack_from(data, start)[3]
+        header_size = pos - start
+        length = min(valid_bytes, (ext_data_offset or obj_size) - header_size - CAN_FD_MSG_64_STRUCT.size)
+        data_start = pos + CAN_FD_MSG_64_STRUCT.size
+        payload = bytes(data[data_start:data_start + length]).ljust(valid_bytes, b"\x00")
+        return can.Message(timestamp=timestamp, arbitration_id=can_id & CAN_ID_MASK,
+                           is_extended_id=bool(can_id & CAN_MSG_EXT), is_remote_frame=bool(fd_flags & 0x0010),
+                           is_fd=bool(fd_flags & 0x1000), is_rx=not direction,
+                           bitrate_switch=bool(fd_flags & 0x2000), error_state_indicator=bool(fd_flags & 0x4000),
+                           dlc=dlc2len(dlc), data=payload, channel=channel - 1)
+
+    if obj_type == CAN_ERROR_EXT:
+        members = CAN_ERROR_EXT_STRUCT.unpack_from(data, pos)
+        channel, dlc, can_id, can_data = members[0], members[5], members[7], members[9]
+        return can.Message(timestamp=timestamp, is_error_frame=True, is_extended_id=bool(can_id & CAN_MSG_EXT),
+                           arbitration_id=can_id & CAN_ID_MASK, dlc=dlc, data=can_data[:dlc], channel=channel - 1)
+    return None
+
+
+def iter_stream_objects(blf_path):
+    """Без индекса: (данные, объекты, start_timestamp) по контейнерам подряд, как can.BLFReader"""
+    with open(blf_path, 'rb') as f:
+        header_size, start_timestamp, _ = read_file_header(f)
+        tail = b''
+        for _, _, method, payload in iter_containers(f, header_size):
+            data = decompress(method, payload)
+            joined = tail + data if tail else data
+            objects, stop = parse_objects(joined)
+            yield joined, objects, start_timestamp
+            tail = joined[stop:]
+
+
+def read_messages(blf_path, ids=None, t0=None, t1=None, use_index=True):
+    """
+    Замена can.BLFReader с фильтром: can.Message только для кадров с arbitration id из ids
+    (None - все) на [t0, t1]. use_index=True - индекс .blfidx (строится при первом чтении),
+    контейнеры без нужных ID пропускаются целиком; False - потоковое чтение всего файла.
+    """
+    ids = None if ids is None else frozenset(ids)
+
+    if use_index:
+        meta, containers = get_index(blf_path)
+        for raw, moment in iter_range_objects(blf_path, meta, containers, t0, t1, ids):
+            message = message_from_object(raw, 0, OBJ_HEADER_BASE_STRUCT.unpack_from(raw)[4], moment)
+            if message is not None:
+                yield message
+        return
+
+    for data, objects, start_timestamp in iter_stream_objects(blf_path):
+        for start, _, obj_type, flags, timestamp in objects:
+            if flags is None or obj_type not in CAN_ID_OFFSETS:
+                continue
+            if ids is not None and object_can_id(data, start, obj_type) not in ids:
+                continue
+            moment = object_time(flags, timestamp, start_timestamp)
+            if (t0 is not None and moment < t0) or (t1 is not None and moment > t1):
+                continue
+            yield message_from_object(data, start, obj_type, moment)
+
+
+def filter_blf(blf_path, ids, output_path=None, t0=None, t1=None):
+    """Уменьшенный BLF только с кадрами ids (объекты копируются как есть). Возвращает число кадров"""
+    output_path = output_path or f"{os.path.splitext(blf_path)[0]}_ids.blf"
+    meta, containers = get_index(blf_path)
+    selected = containers_with_ids(meta, containers, ids).count(1)
+
+    written = 0
+    with RawBLFWriter(output_path, start_timestamp=meta['start_timestamp']) as writer:
+        for raw, moment in iter_range_objects(blf_path, meta, containers, t0, t1, frozenset(ids)):
+            writer.add(raw, moment, meta['start_timestamp'])
+            written += 1
+
+    source_size = meta['source_signature']['size']
+    print(f"[BLF filter] {written} frames of {', '.join(hex(can_id) for can_id in sorted(ids))} "
+          f"from {selected}/{len(containers)} containers -> {output_path} "
+          f"({os.path.getsize(output_path) / 1e6:.1f} MB of {source_size / 1e6:.1f} MB)")
+    return written
+
+
+# ----------------------------------------------------------------------
+# Запись
+# ----------------------------------------------------------------------
+class RawBLFWriter:
+    """BLF из готовых объектов (байты LOBJ...), контейнеры и заголовок - как в can.BLFWriter"""
+
+    max_container_size = 128 * 1024
+    application_id = 5
+
+    def __init__(self, path, start_timestamp=None, compression_level=-1):
+        self.path = path
+        self.compression_level = compression_level
+        self.object_count = 0
+        self.uncompressed_size = FILE_HEADER_SIZE
+        self.start_timestamp = None
+        self.stop_timestamp = None
+        if start_timestamp is not None:
+            self._set_start(start_timestamp)
+        self._buffer = []
+        self._buffer_size = 0
+        self.file = open(path, 'wb')
+        self._write_header(FILE_HEADER_SIZE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _set_start(self, timestamp):
+        # в заголовке время хранится с точностью до мс - берём то, что прочитает BLFReader
+        self.start_timestamp = systemtime_to_timestamp(timestamp_to_systemtime(int(timestamp * 1000) / 1000))
+
+    def _write_header(self, file_size):
+        header = [b"LOGG", FILE_HEADER_SIZE, self.application_id, 0, 0, 0, 2, 6, 8, 1]
+        header.extend([file_size, self.uncompressed_size, self.object_count, 0])
+        header.extend(timestamp_to_systemtime(self.start_timestamp))
+        header.extend(timestamp_to_systemtime(self.stop_timestamp))
+        self.file.write(FILE_HEADER_STRUCT.pack(*header))
+        self.file.write(b"\x00" * (FILE_HEADER_SIZE - FILE_HEADER_STRUCT.size))
+
+    def add(self, raw, timestamp, source_start=None):
+        """
+        raw - объект целиком, timestamp - его абсолютное время.
+        Если source_start (start_timestamp исходного файла) совпадает с нашим, объект пишется как есть.
+        """
+        if self.start_timestamp is None:
+            self._set_start(timestamp if source_start is None else source_start)
+        if source_start != self.start_timestamp:
+            ns = max(int(round((timestamp - self.start_timestamp) * 1e9)), 0)
+            raw = b''.join((raw[:OBJ_TIME_OFFSET], struct.pack('<L', TIME_ONE_NANS),
+                            raw[OBJ_TIME_OFFSET + 4:OBJ_TIME_OFFSET + 8], struct.pack('<Q', ns),
+                            raw[OBJ_TIME_OFFSET + OBJ_TIME_STRUCT.size:]))
+        self.stop_timestamp = timestamp
+
+        self._buffer.append(raw)
+        padding = len(raw) % 4
+        if padding:
+            self._buffer.append(b"\x00" * padding)
+        self._buffer_size += len(raw) + padding
+        self.object_count += 1
+        if self._buffer_size >= self.max_container_size:
+            self._flush()
+
+    def _flush(self):
+        buffer = b"".join(self._buffer)
+        if not buffer:
+            return
+        uncompressed = memoryview(buffer)[:self.max_container_size]
+        tail = buffer[self.max_container_size:]
+        self._buffer = [tail]
+        self._buffer_size = len(tail)
+        if not self.compression_level:
+            data, method = uncompressed, NO_COMPRESSION
+        else:
+            data, method = zlib.compress(uncompressed, self.compression_level), ZLIB_DEFLATE
+        obj_size = OBJ_HEADER_BASE_STRUCT.size + LOG_CONTAINER_STRUCT.size + len(data)
+        self.file.write(OBJ_HEADER_BASE_STRUCT.pack(b"LOBJ", OBJ_HEADER_BASE_STRUCT.size, 1, obj_size, LOG_CONTAINER))
+        self.file.write(LOG_CONTAINER_STRUCT.pack(method, len(uncompressed)))
+        self.file.write(data)
+        self.file.write(b"\x00" * (obj_size % 4))
+        self.uncompressed_size += OBJ_HEADER_BASE_STRUCT.size + LOG_CONTAINER_STRUCT.size + len(uncompressed)
+
+    def close(self):
+        if self.file.closed:
+            return
+        while self._buffer_size:
+            self._flush()
+        file_size = self.file.tell()
+        self.file.seek(0)
+        self._write_header(file_size)
+        self.file.close()
+
+
+# ----------------------------------------------------------------------
+# Каталог папки
+# ----------------------------------------------------------------------
+def is_generated_output(name, patterns=GENERATED_FILE_PATTERNS):
+    return any(fnmatch.fnmatch(name.lower(), pattern) for pattern in patterns)
+
+
+def find_blf_files(root_dir):
+    """Исходные BLF папки (рекурсивно), без выходных файлов extract/filter/split"""
+    files = []
+    for directory, dirs, names in os.walk(root_dir):
+        dirs[:] = [name for name in dirs if not is_generated_output(name, GENERATED_DIR_PATTERNS)]
+        files.extend(os.path.join(directory, name) for name in names
+                     if name.lower().endswith('.blf') and not is_generated_output(name))
+    return sorted(files)
+
+
+def _catalog_entry(blf_path):
+    """Воркер: индекс файла (из кэша или сканированием) -> строка каталога"""
+    meta, _ = get_index(blf_path)
+    return blf_path, {
+        'signature': meta['source_signature'],
+        'start_timestamp': meta['start_timestamp'],
+        't_first': meta['t_first'],
+        't_last': meta['t_last'],
+        'objects': meta['objects'],
+        'containers': meta['containers'],
+    }
+
+
+def load_catalog(root_dir):
+    path = os.path.join(root_dir, CATALOG_NAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            catalog = json.load(f)
+    except Exception as e:
+        print(f"[BLF catalog] Could not read {path}: {e}")
+        return {}
+    if catalog.get('version') != CATALOG_VERSION:
+        return {}
+    return catalog.get('files', {})
+
+
+def save_catalog(root_dir, files):
+    path = os.path.join(root_dir, CATALOG_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': CATALOG_VERSION, 'files': files}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def update_catalog(root_dir, jobs=None, force=False):
+    """Каталог папки: новые и изменённые BLF индексируются параллельно, удалённые убираются"""
+    files = {} if force else load_catalog(root_dir)
+    found = {os.path.relpath(path, root_dir): path for path in find_blf_files(root_dir)}
+
+    for key in list(files):
+        if key not in found:
+            del files[key]
+
+    to_scan = [path for key, path in found.items()
+               if key not in files or files[key]['signature'] != _file_signature(path)]
+    print(f"[BLF catalog] Files: {len(found)}, up to date: {len(found) - len(to_scan)}, to index: {len(to_scan)}")
+
+    if to_scan:
+        if force:
+            for path in to_scan:
+                if os.path.exists(index_path_for(path)):
+                    os.remove(index_path_for(path))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(_catalog_entry, path) for path in to_scan]
+            for done, future in enumerate(as_completed(futures), start=1):
+                try:
+                    path, entry = future.result()
+                except Exception as e:
+                    print(f"[BLF catalog] Indexing failed: {e}")
+                    continue
+                files[os.path.relpath(path, root_dir)] = entry
+                print(f"[BLF catalog] ({done}/{len(futures)}) {os.path.relpath(path, root_dir)}")
+        save_catalog(root_dir, files)
+    return files
+
+
+def files_in_range(files, t0, t1):
+    """Ключи файлов каталога, пересекающих [t0, t1], по времени начала"""
+    selected = [(entry['t_first'], key) for key, entry in files.items()
+                if entry['objects'] and entry['t_first'] <= t1 and entry['t_last'] >= t0]
+    return [key for _, key in sorted(selected)]
+
+
+def extract_range(root_dir, t0, t1, output_path, ids=None, files=None):
+    """
+    Вырезает [t0, t1] (абсолютное время) из всех BLF папки, которые его пересекают, в один файл.
+    Возвращает словарь статистики.
+    """
+    if files is None:
+        files = update_catalog(root_dir)
+    keys = files_in_range(files, t0, t1)
+    sources = {os.path.abspath(os.path.join(root_dir, key)) for key in keys}
+    if os.path.abspath(output_path) in sources:
+        raise ValueError(f"Output {output_path} is one of the source files of the range")
+    stats = {'files': keys, 'objects': 0, 'containers_read': 0, 'containers_total': 0}
+    if not keys:
+        print(f"[BLF catalog] No files cover {format_time(t0)} .. {format_time(t1)}")
+        return stats
+
+    writer = None
+    try:
+        for key in keys:
+            blf_path = os.path.join(root_dir, key)
+            meta, containers = get_index(blf_path)
+            selected = containers_in_range(containers, t0, t1)
+            stats['containers_read'] += len(selected)
+            stats['containers_total'] += len(containers)
+            if writer is None:
+                # первый файл пишется без пересчёта меток времени
+                writer = RawBLFWriter(output_path, start_timestamp=meta['start_timestamp'])
+            count = 0
+            for raw, moment in iter_range_objects(blf_path, meta, containers, t0, t1, ids):
+                writer.add(raw, moment, meta['start_timestamp'])
+                count += 1
+            stats['objects'] += count
+            print(f"[BLF catalog] {key}: {count} objects from {len(selected)}/{len(containers)} containers")
+    finally:
+        if writer is not None:
+            writer.close()
+
+    print(f"[BLF catalog] Saved {stats['objects']} objects from {len(keys)} file(s): {output_path}")
+    return stats
+
+
+def format_time(timestamp):
+    if timestamp is None:
+        return '-'
+    if timestamp > 1e9:
+        return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+    return f"{timestamp:.3f}"
+
+
+def parse_time(value):
+    """Секунды (Unix time или относительное время лога) или локальная дата 'YYYY-MM-DD HH:MM:SS[.fff]'"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def parse_ids(value):
+    """'0x740,0x760,1858' -> {0x740, 0x760, 0x742}"""
+    if not value:
+        return None
+    return {int(item, 0) for item in value.replace(' ', '').split(',') if item}
+
+
+def print_catalog(files):
+    for key in sorted(files, key=lambda item: (files[item]['t_first'] or 0, item)):
+        entry = files[key]
+        print(f"  {format_time(entry['t_first'])} .. {format_time(entry['t_last'])}  "
+              f"{entry['objects']:>10} obj  {entry['containers']:>6} cont  {key}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='BLF container index, folder catalog and time-range extraction')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    catalog = commands.add_parser('catalog', help='Build or update the catalog of a folder with BLF files')
+    catalog.add_argument('root')
+    catalog.add_argument('-j', '--jobs', type=int, default=None, help='Indexing processes (default: CPU count)')
+    catalog.add_argument('--force', action='store_true', help='Re-index all files')
+
+    extract = commands.add_parser('extract', help='Extract an absolute time window across files into one BLF')
+    extract.add_argument('root')
+    extract.add_argument('t0', help='Start: seconds or local "YYYY-MM-DD HH:MM:SS"')
+    extract.add_argument('t1', help='End: seconds or local "YYYY-MM-DD HH:MM:SS"')
+    extract.add_argument('-o', '--output', default=None, help='Output BLF (default: ./range_<t0>_<t1>.blf)')
+    extract.add_argument('--ids', default=None, help='Keep only these arbitration IDs, e.g. 0x740,0x760')
+    extract.add_argument('-j', '--jobs', type=int, default=None, help='Indexing processes for new files')
+
+    filter_ids = commands.add_parser('filter', help='Write a reduced BLF with only the given IDs')
+    filter_ids.add_argument('blf')
+    filter_ids.add_argument('--ids', required=True, help='Arbitration IDs to keep, e.g. 0x740,0x760')
+    filter_ids.add_argument('-o', '--output', default=None, help='Output BLF (default: <name>_ids.blf)')
+
+    args = parser.parse_args()
+
+    if args.command == 'filter':
+        filter_blf(args.blf, parse_ids(args.ids), args.output)
+    elif args.command == 'catalog':
+        files = update_catalog(args.root, jobs=args.jobs, force=args.force)
+        print_catalog(files)
+    else:
+        t0, t1 = parse_time(args.t0), parse_time(args.t1)
+        if t1 < t0:
+            t0, t1 = t1, t0
+        # по умолчанию - в текущую папку, не в каталогизируемый корень
+        output_path = args.output or f"range_{t0:.0f}_{t1:.0f}.blf"
+        files = update_catalog(args.root, jobs=args.jobs)
+        extract_range(args.root, t0, t1, output_path, ids=parse_ids(args.ids), files=files)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,4 @@
 import pandas as pd
-import can
 import re
 import numpy as np
 from pathlib import Path
@@ -10,6 +9,8 @@ import matplotlib.pyplot as plt
 
 from canlib import canlib, kvadblib, Frame
 
+from blf_index import read_messages
+
 from defs import *
 
 import plotly.express as px
@@ -42,6 +43,78 @@ BRAKING_DETECTION = {
     'cooldown': 2.0                # время между торможениями для разделения (секунды)
 }
 
+# Окно скользящей эффективности (событий торможения)
+EFFICIENCY_ROLLING_EVENTS = 5
+
+
+# групповой МНК: y = slope * x + intercept сразу для всех групп из сумм
+# (n, Σx, Σy, Σxy, Σx², Σy²); суммы складываются - по ним же считаются диапазоны
+# скорости и скользящее окно, без повторного прохода по точкам
+class RegressionSums:
+    """Суммы МНК по группам. x/y центрируются общим сдвигом - меньше потеря точности"""
+
+    FIELDS = ('n', 'sx', 'sy', 'sxy', 'sxx', 'syy')
+
+    def __init__(self, n, sx, sy, sxy, sxx, syy, x0=0.0, y0=0.0):
+        self.n, self.sx, self.sy, self.sxy, self.sxx, self.syy = n, sx, sy, sxy, sxx, syy
+        self.x0, self.y0 = x0, y0
+
+    @classmethod
+    def from_groups(cls, x, y, groups, count):
+        """groups - номер группы точки (0..count-1), -1 - точка не участвует"""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        groups = np.asarray(groups)
+        used = (groups >= 0) & np.isfinite(x) & np.isfinite(y)
+        x, y, groups = x[used], y[used], groups[used]
+        x0 = float(x.mean()) if len(x) else 0.0
+        y0 = float(y.mean()) if len(y) else 0.0
+        dx, dy = x - x0, y - y0
+
+        def total(weights=None):
+            return np.bincount(groups, weights=weights, minlength=count).astype(np.float64)
+
+        return cls(total(), total(dx), total(dy), total(dx * dy), total(dx * dx), total(dy * dy), x0, y0)
+
+    def _map(self, function):
+        return RegressionSums(*(function(getattr(self, field)) for field in self.FIELDS), self.x0, self.y0)
+
+    def regroup(self, groups, count):
+        """Сумма групп в новые группы (например, события -> диапазоны скорости), -1 - пропустить"""
+        groups = np.asarray(groups)
+        used = groups >= 0
+        return self._map(lambda values: np.bincount(groups[used], weights=values[used], minlength=count))
+
+    def rolling(self, window):
+        """Суммы по скользящему окну из window соседних групп (первые окна - неполные)"""
+        def windowed(values):
+            cumulative = np.concatenate(([0.0], np.cumsum(values)))
+            upper = np.arange(1, len(values) + 1)
+            return cumulative[upper] - cumulative[np.maximum(upper - window, 0)]
+        return self._map(windowed)
+
+    def fit(self):
+        """(slope, intercept, r_squared) по группам; группа < 2 точек или без разброса x - NaN"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            n = np.where(self.n >= 2, self.n, np.nan)
+            cov_xy = self.sxy - self.sx * self.sy / n
+            var_x = self.sxx - self.sx * self.sx / n
+            var_y = self.syy - self.sy * self.sy / n
+            slope = np.where(var_x > 0, cov_xy / var_x, np.nan)
+            intercept = (self.sy - slope * self.sx) / n + self.y0 - slope * self.x0
+            r_squared = np.where(var_y > 0, cov_xy * cov_xy / (var_x * var_y), np.nan)
+        return slope, intercept, r_squared
+
+
+def speed_range_groups(speed, speed_ranges):
+    """Номер диапазона [min, max) для каждой точки, -1 - вне диапазонов (при пересечении - первый)"""
+    speed = np.asarray(speed, dtype=np.float64)
+    groups = np.full(len(speed), -1, dtype=np.int64)
+    for i in range(len(speed_ranges) - 1, -1, -1):
+        min_speed, max_speed = speed_ranges[i]
+        groups[(speed >= min_speed) & (speed < max_speed)] = i
+    return groups
+
 
 def advanced_braking_analysis(df):
     """
@@ -126,26 +199,28 @@ def analyze_by_speed_ranges(df, pressure_col='brake_pressure', decel_col='decele
 
     colors = ['blue', 'green', 'red', 'orange', 'purple']
 
-    for i, (min_speed, max_speed) in enumerate(speed_ranges):
-        # Фильтруем по диапазону скорости
-        speed_df = df[(df[speed_col] >= min_speed) & (df[speed_col] < max_speed)].copy()
+    # Регрессия всех диапазонов за один проход (RegressionSums)
+    pressure = df[pressure_col].to_numpy(dtype=np.float64)
+    deceleration = df[decel_col].to_numpy(dtype=np.float64)
+    groups = speed_range_groups(df[speed_col].to_numpy(), speed_ranges)
+    sums = RegressionSums.from_groups(pressure, deceleration, groups, len(speed_ranges))
+    slopes, intercepts, r_squared = sums.fit()
 
-        if len(speed_df) > 10:  # Минимум точек для анализа
-            # Линейная регрессия
-            slope, intercept, r_value, p_value, std_err = stats.linregress(
-                speed_df[pressure_col], speed_df[decel_col]
-            )
+    for i, (min_speed, max_speed) in enumerate(speed_ranges):
+        if sums.n[i] > 10:  # Минимум точек для анализа
+            in_range = groups == i
+            range_pressure = pressure[in_range]
 
             # Scatter plot
-            plt.scatter(speed_df[pressure_col], speed_df[decel_col],
+            plt.scatter(range_pressure, deceleration[in_range],
                        alpha=0.2, s=8, color=colors[i % len(colors)])
 
             # Линия регрессии
-            x_range = np.linspace(speed_df[pressure_col].min(), speed_df[pressure_col].max(), 100)
-            y_pred = slope * x_range + intercept
+            x_range = np.linspace(range_pressure.min(), range_pressure.max(), 100)
+            y_pred = slopes[i] * x_range + intercepts[i]
 
             plt.plot(x_range, y_pred, color=colors[i % len(colors)], linewidth=2,
-                    label=f'{min_speed}-{max_speed} км/ч: {slope:.3f} м/с²/бар (R²={r_value**2:.3f})')
+                    label=f'{min_speed}-{max_speed} км/ч: {slopes[i]:.3f} м/с²/бар (R²={r_squared[i]:.3f})')
 
     plt.xlabel('Давление в тормозной системе (бар)')
     plt.ylabel('Поперечное ускорение (замедление) (м/с²)')
@@ -257,57 +332,43 @@ def proceed_file(ttmppath, chunk_size=50000):
     current_chunk = []
     last_values = {'pressure': None, 'deceleration': None, 'speed': None}
 
-    with open(ttmppath, "rb") as rr:
-        log_in = can.io.BLFReader(rr)
-        log_in_iter = log_in.__iter__()
-        object_count = log_in.object_count
-        i = 0
-        try:
-            for i in tqdm(range(object_count)):
-
-
-
-
+    # нужны только эти ID - остальные кадры отсеиваются по заголовку объекта, без can.Message (blf_index.py)
+    braking_ids = {DID_SPEED_MESSAGE_XGF, DID_SPEED_MESSAGE_XGD,
+                   DID_BRAKING_PRESSURE_MESSAGE_XGF, DID_BRAKING_DECELERATION_XGF}
 
-                aa = log_in_iter.__next__()
+    for aa in tqdm(read_messages(ttmppath, braking_ids)):
 
-                frame = Frame(aa.arbitration_id, aa.data, timestamp=aa.timestamp)
+        frame = Frame(aa.arbitration_id, aa.data, timestamp=aa.timestamp)
 
-                parsed_data = frameproceed(db, frame)
+        parsed_data = frameproceed(db, frame)
 
-                if parsed_data:
-                    last_values.update(parsed_data)
+        if parsed_data:
+            last_values.update(parsed_data)
 
-                    # Создаем запись с текущими значениями всех параметров
+            # Создаем запись с текущими значениями всех параметров
 
 
-                    # ФИЛЬТРАЦИЯ ПО ЗАМЕДЛЕНИЮ - добавляем только если замедление выше порога
-                    if last_values['deceleration'] is not None and last_values['deceleration'] <= DECEL_THRESHOLD:
-                        record = {
-                            'timestamp': aa.timestamp,
-                            'pressure': last_values['pressure'],
-                            'deceleration': last_values['deceleration'],
-                            'speed': last_values['speed']
-                        }
-                        current_chunk.append(record)
-
-                # Сохраняем чанк при достижении размера
-                if len(current_chunk) >= chunk_size:
-                    chunk_df = pd.DataFrame(current_chunk)
-                    chunks.append(chunk_df)
-                    current_chunk = []
-                    print(f"Создан чанк {len(chunks)}")
+            # ФИЛЬТРАЦИЯ ПО ЗАМЕДЛЕНИЮ - добавляем только если замедление выше порога
+            if last_values['deceleration'] is not None and last_values['deceleration'] <= DECEL_THRESHOLD:
+                record = {
+                    'timestamp': aa.timestamp,
+                    'pressure': last_values['pressure'],
+                    'deceleration': last_values['deceleration'],
+                    'speed': last_values['speed']
+                }
+                current_chunk.append(record)
 
+        # Сохраняем чанк при достижении размера
+        if len(current_chunk) >= chunk_size:
+            chunk_df = pd.DataFrame(current_chunk)
+            chunks.append(chunk_df)
+            current_chunk = []
+            print(f"Создан чанк {len(chunks)}")
 
-            # Последний чанк
-            if current_chunk:
-                chunks.append(pd.DataFrame(current_chunk))
 
-        except StopIteration:
-            pass
-            # print("end of file")
-        finally:
-            pass
+    # Последний чанк
+    if current_chunk:
+        chunks.append(pd.DataFrame(current_chunk))
 
     # Объединяем все чанки
     final_df = pd.concat(chunks, ignore_index=True)
@@ -674,23 +735,25 @@ def plot_pressure_deceleration_advanced(df, speed_bins=[0, 50, 100, 150, 200], s
     plt.figure(figsize=(14, 10))
     colors = plt.cm.tab10(np.linspace(0, 1, len(speed_labels)))
 
-    for i, speed_range in enumerate(speed_labels):
-        range_data = plot_data[plot_data['speed_range'] == speed_range]
+    # Регрессия всех диапазонов за один проход (RegressionSums), -1 - вне диапазонов
+    groups = plot_data['speed_range'].cat.codes.to_numpy()
+    pressure = plot_data['pressure'].to_numpy(dtype=np.float64)
+    deceleration = plot_data['deceleration'].to_numpy(dtype=np.float64)
+    sums = RegressionSums.from_groups(pressure, deceleration, groups, len(speed_labels))
+    slopes, intercepts, r_squared = sums.fit()
 
-        if len(range_data) > 5:  # Минимум точек для анализа
-            plt.scatter(range_data['pressure'], range_data['deceleration'],
+    for i, speed_range in enumerate(speed_labels):
+        if sums.n[i] > 5:  # Минимум точек для анализа
+            in_range = groups == i
+            range_pressure = pressure[in_range]
+            plt.scatter(range_pressure, deceleration[in_range],
                        alpha=0.6, s=25, color=colors[i], label=speed_range)
 
-            # Регрессия для каждого диапазона
-            slope, intercept, r_value, p_value, std_err = stats.linregress(
-                range_data['pressure'], range_data['deceleration']
-            )
-
-            x_range = np.linspace(range_data['pressure'].min(), range_data['pressure'].max(), 100)
-            y_pred = slope * x_range + intercept
+            x_range = np.linspace(range_pressure.min(), range_pressure.max(), 100)
+            y_pred = slopes[i] * x_range + intercepts[i]
 
             plt.plot(x_range, y_pred, color=colors[i], linewidth=2, linestyle='--',
-                    alpha=0.8, label=f'{speed_range}: {slope:.3f} м/с²/бар (R²={r_value**2:.3f})')
+                    alpha=0.8, label=f'{speed_range}: {slopes[i]:.3f} м/с²/бар (R²={r_squared[i]:.3f})')
 
     plt.xlabel('Давление (бар)')
     plt.ylabel('Замедление (м/с²)')
@@ -706,7 +769,27 @@ def plot_pressure_deceleration_advanced(df, speed_bins=[0, 50, 100, 150, 200], s
     plt.show()
 
     # Детальная статистика по диапазонам
-    print_detailed_stats(plot_data, speed_labels)
+    print_detailed_stats(sums, speed_labels)
+
+def print_detailed_stats(sums, speed_labels):
+    """
+    Статистика по диапазонам скорости из сумм RegressionSums (без повторного прохода по данным)
+    """
+    slopes, intercepts, r_squared = sums.fit()
+    print("\nСТАТИСТИКА ПО ДИАПАЗОНАМ СКОРОСТИ:")
+    print("=" * 50)
+    for i, speed_range in enumerate(speed_labels):
+        count = int(sums.n[i])
+        if not count:
+            print(f"{speed_range}: нет данных")
+            continue
+        mean_pressure = sums.x0 + sums.sx[i] / count
+        mean_deceleration = sums.y0 + sums.sy[i] / count
+        print(f"{speed_range}: точек {count}, среднее давление {mean_pressure:.2f} бар, "
+              f"среднее замедление {mean_deceleration:.2f} м/с², "
+              f"эффективность {slopes[i]:.4f} м/с²/бар (R²={r_squared[i]:.3f})")
+
+
 
 
 
@@ -716,11 +799,61 @@ def plot_pressure_deceleration_advanced(df, speed_bins=[0, 50, 100, 150, 200], s
 
 
 
+def segment_braking_events(timestamps, speed, deceleration, pressure, config=None):
+    """
+    Сегментация торможений на массивах (без цикла по точкам).
+    Кандидаты - точки с |замедлением| >= min_deceleration, давлением >= min_pressure и
+    падающей скоростью; соседние кандидаты ближе cooldown по времени - одно событие.
+    Возвращает (candidates, events): candidates - позиции точек-кандидатов, событие -
+    срез candidates[start:stop] плюс длительность, снижение скорости и макс. замедление
+    (np.maximum.reduceat); пороги события проверяет is_valid_braking_event
+    """
+    if config is None:
+        config = BRAKING_DETECTION
 
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    speed = np.asarray(speed, dtype=np.float64)
+    deceleration_abs = np.abs(np.asarray(deceleration, dtype=np.float64))
+    pressure = np.asarray(pressure, dtype=np.float64)
+
+    speed_diff = np.empty_like(speed)
+    speed_diff[:1] = np.nan  # как Series.diff(): у первой точки разницы нет
+    np.subtract(speed[1:], speed[:-1], out=speed_diff[1:])
+
+    candidate_mask = ((deceleration_abs >= config['min_deceleration']) &
+                      (pressure >= config['min_pressure']) &
+                      (speed_diff < 0))  # скорость уменьшается
+    candidates = np.flatnonzero(candidate_mask)
+    if not len(candidates):
+        return candidates, []
+
+    # разрыв больше cooldown между соседними кандидатами - новое событие
+    candidate_times = timestamps[candidates]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(candidate_times) > config['cooldown']) + 1))
+    stops = np.concatenate((starts[1:], [len(candidates)]))
+
+    first = candidates[starts]
+    last = candidates[stops - 1]
+    durations = timestamps[last] - timestamps[first]
+    speed_decreases = speed[first] - speed[last]
+    max_decelerations = np.maximum.reduceat(deceleration_abs[candidates], starts)
+
+    events = [{
+        'rows': slice(start, stop),
+        'duration': duration,
+        'speed_decrease': speed_decrease,
+        'max_deceleration': max_deceleration,
+    } for start, stop, duration, speed_decrease, max_deceleration in zip(
+        starts.tolist(), stops.tolist(), durations.tolist(), speed_decreases.tolist(),
+        max_decelerations.tolist())]
+    return candidates, events
 
 def detect_braking_events(df, config=None):
     """
-    Детектирует отдельные события торможения в данных
+    Детектирует отдельные события торможения в данных (segment_braking_events).
+    Событие: start/end index и time, positions - позиции точек события в df
+    (срез массива кандидатов, без списка индексов), длительность, снижение скорости
+    и максимальное замедление
     """
     if config is None:
         config = BRAKING_DETECTION
@@ -729,99 +862,48 @@ def detect_braking_events(df, config=None):
         print("DataFrame пустой, невозможно детектировать торможения")
         return []
 
-    # Создаем копию данных для работы
-    data = df.copy()
-
-    # Вычисляем производные для детекции изменений
-    data['speed_diff'] = data['speed'].diff()
-    data['deceleration_abs'] = data['deceleration'].abs()
+    timestamps = df['timestamp'].to_numpy(dtype=np.float64)
+    candidates, segments = segment_braking_events(
+        timestamps, df['speed'].to_numpy(), df['deceleration'].to_numpy(), df['pressure'].to_numpy(), config)
 
-    # Ищем моменты начала торможения
-    braking_start_conditions = (
-        (data['deceleration_abs'] >= config['min_deceleration']) &
-        (data['pressure'] >= config['min_pressure']) &
-        (data['speed_diff'] < 0)  # скорость уменьшается
-    )
-
-    braking_starts = data[braking_start_conditions].index.tolist()
-
-    if not braking_starts:
+    if not segments:
         print("Не найдено событий торможения")
         return []
 
-    # Группируем последовательные точки начала торможения в события
     braking_events = []
-    current_event = None
-
-    for i, idx in enumerate(braking_starts):
-        timestamp = data.loc[idx, 'timestamp']
-
-        if current_event is None:
-            # Начало нового события
-            current_event = {
-                'start_index': idx,
-                'start_time': timestamp,
-                'end_index': idx,
-                'end_time': timestamp,
-                'indices': [idx]
-            }
-        else:
-            # Проверяем, продолжается ли текущее событие
-            time_diff = timestamp - current_event['end_time']
-
-            if time_diff <= config['cooldown']:
-                # Продолжение текущего события
-                current_event['end_index'] = idx
-                current_event['end_time'] = timestamp
-                current_event['indices'].append(idx)
-            else:
-                # Завершаем текущее событие и начинаем новое
-                if is_valid_braking_event(data, current_event, config):
-                    braking_events.append(current_event)
-
-                current_event = {
-                    'start_index': idx,
-                    'start_time': timestamp,
-                    'end_index': idx,
-                    'end_time': timestamp,
-                    'indices': [idx]
-                }
-
-    # Добавляем последнее событие
-    if current_event and is_valid_braking_event(data, current_event, config):
-        braking_events.append(current_event)
+    for segment in segments:
+        if not is_valid_braking_event(segment, config):
+            continue
+        positions = candidates[segment['rows']]
+        first, last = positions[0], positions[-1]
+        braking_events.append({
+            'start_index': df.index[first],
+            'start_time': timestamps[first],
+            'end_index': df.index[last],
+            'end_time': timestamps[last],
+            'positions': positions,
+            'duration': segment['duration'],
+            'speed_decrease': segment['speed_decrease'],
+            'max_deceleration': segment['max_deceleration'],
+        })
 
     print(f"Обнаружено событий торможения: {len(braking_events)}")
     return braking_events
 
-def is_valid_braking_event(data, event, config):
+def is_valid_braking_event(event, config):
     """
     Проверяет, является ли событие валидным торможением
+    (длительность, снижение скорости, замедление посчитаны в segment_braking_events)
     """
-    event_data = data.loc[event['indices']]
-
-    # Проверяем длительность
-    duration = event['end_time'] - event['start_time']
-    if duration < config['min_duration']:
-        return False
-
-    # Проверяем снижение скорости
-    speed_decrease = event_data['speed'].iloc[0] - event_data['speed'].iloc[-1]
-    if speed_decrease < config['min_speed_decrease']:
-        return False
-
-    # Проверяем, что есть достаточное замедление
-    max_deceleration = event_data['deceleration_abs'].max()
-    if max_deceleration < config['min_deceleration']:
-        return False
-
-    return True
+    return (event['duration'] >= config['min_duration'] and
+            event['speed_decrease'] >= config['min_speed_decrease'] and
+            event['max_deceleration'] >= config['min_deceleration'])
 
 def extract_braking_event_data(df, event):
     """
     Извлекает данные для конкретного события торможения
     """
-    return df.loc[event['indices']].copy()
+    return df.iloc[event['positions']]
 
 def calculate_braking_efficiency(event_data):
     """
@@ -831,9 +913,9 @@ def calculate_braking_efficiency(event_data):
         return None
 
     # Линейная регрессия давление-замедление
-    slope, intercept, r_value, p_value, std_err = stats.linregress(
-        event_data['pressure'], event_data['deceleration'].abs()
-    )
+    sums = RegressionSums.from_groups(event_data['pressure'], event_data['deceleration'].abs(),
+                                      np.zeros(len(event_data), dtype=np.int64), 1)
+    slope, intercept, r_squared = sums.fit()
 
     # Основные метрики
     max_pressure = event_data['pressure'].max()
@@ -842,8 +924,8 @@ def calculate_braking_efficiency(event_data):
     duration = event_data['timestamp'].iloc[-1] - event_data['timestamp'].iloc[0]
 
     return {
-        'efficiency': slope,  # м/с²/бар
-        'r_squared': r_value**2,
+        'efficiency': slope[0],  # м/с²/бар
+        'r_squared': r_squared[0],
         'max_pressure': max_pressure,
         'max_deceleration': max_deceleration,
         'speed_decrease': speed_decrease,
@@ -853,31 +935,73 @@ def calculate_braking_efficiency(event_data):
         'data_points': len(event_data)
     }
 
-def analyze_braking_events(df, config=None):
+def analyze_braking_events(df, config=None, events=None):
     """
-    Анализирует все события торможения и возвращает статистику
+    Анализирует все события торможения и возвращает статистику.
+    events - уже найденные detect_braking_events (чтобы не искать второй раз).
+    Регрессия давление-замедление - для всех событий сразу (RegressionSums по номеру
+    события); суммы событий лежат в braking_stats.attrs['sums'] - по ним считаются
+    скользящая эффективность (efficiency_rolling) и диапазоны скорости в dashboard
     """
-    events = detect_braking_events(df, config)
+    if events is None:
+        events = detect_braking_events(df, config)
 
+    event_ids = [i + 1 for i, event in enumerate(events) if len(event['positions']) >= 2]
+    events = [event for event in events if len(event['positions']) >= 2]
     if not events:
         return None
 
-    results = []
-
-    for i, event in enumerate(events):
-        event_data = extract_braking_event_data(df, event)
-        efficiency = calculate_braking_efficiency(event_data)
-
-        if efficiency:
-            result = {
-                'event_id': i + 1,
-                'start_time': event['start_time'],
-                'end_time': event['end_time'],
-                **efficiency
-            }
-            results.append(result)
+    # номер события для каждой точки, -1 - точка вне событий
+    positions = np.concatenate([event['positions'] for event in events])
+    lengths = np.array([len(event['positions']) for event in events])
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    groups = np.full(len(df), -1, dtype=np.int64)
+    groups[positions] = np.repeat(np.arange(len(events)), lengths)
+
+    pressure = df['pressure'].to_numpy(dtype=np.float64)
+    deceleration_abs = np.abs(df['deceleration'].to_numpy(dtype=np.float64))
+    speed = df['speed'].to_numpy(dtype=np.float64)
+    sums = RegressionSums.from_groups(pressure, deceleration_abs, groups, len(events))
+    efficiency, _, r_squared = sums.fit()
+    rolling_efficiency, _, _ = sums.rolling(EFFICIENCY_ROLLING_EVENTS).fit()
+
+    first = np.array([event['positions'][0] for event in events])
+    last = np.array([event['positions'][-1] for event in events])
+
+    braking_stats = pd.DataFrame({
+        'event_id': event_ids,
+        'start_time': [event['start_time'] for event in events],
+        'end_time': [event['end_time'] for event in events],
+        'efficiency': efficiency,  # м/с²/бар
+        'r_squared': r_squared,
+        'max_pressure': np.maximum.reduceat(pressure[positions], offsets),
+        'max_deceleration': np.maximum.reduceat(deceleration_abs[positions], offsets),
+        'speed_decrease': speed[first] - speed[last],
+        'duration': [event['end_time'] - event['start_time'] for event in events],
+        'start_speed': speed[first],
+        'end_speed': speed[last],
+        'data_points': lengths,
+        'efficiency_rolling': rolling_efficiency,
+    })
+    braking_stats.attrs['sums'] = sums
+    return braking_stats
 
-    return pd.DataFrame(results)
+def speed_binned_efficiency(braking_stats, speed_ranges=((0, 50), (50, 100), (100, 150), (150, 200))):
+    """
+    Эффективность по диапазонам начальной скорости: суммы событий диапазона складываются
+    (braking_stats.attrs['sums']) - регрессия по всем точкам этих торможений
+    """
+    sums = braking_stats.attrs['sums']
+    groups = speed_range_groups(braking_stats['start_speed'].to_numpy(), speed_ranges)
+    binned = sums.regroup(groups, len(speed_ranges))
+    slopes, _, r_squared = binned.fit()
+    return pd.DataFrame({
+        'speed_range': [f'{min_speed}-{max_speed} км/ч' for min_speed, max_speed in speed_ranges],
+        'events': np.bincount(groups[groups >= 0], minlength=len(speed_ranges)),
+        'data_points': binned.n.astype(np.int64),
+        'efficiency': slopes,
+        'r_squared': r_squared,
+    })
 
 def plot_braking_events_timeline(df, braking_events):
     """
@@ -922,6 +1046,8 @@ def plot_braking_efficiency_trend(braking_stats):
     # Эффективность по событиям
     ax1.plot(braking_stats['event_id'], braking_stats['efficiency'],
              'bo-', linewidth=2, markersize=8, label='Эффективность')
+    ax1.plot(braking_stats['event_id'], braking_stats['efficiency_rolling'],
+             'r--', linewidth=2, label=f'Скользящая ({EFFICIENCY_ROLLING_EVENTS} торможений)')
     ax1.set_xlabel('Номер торможения')
     ax1.set_ylabel('Эффективность (м/с²/бар)')
     ax1.set_title('Эффективность торможений по порядку')
@@ -979,7 +1105,7 @@ def run_complex_braking_to_braking_analysis(df):
     if not df.empty:
         # Анализ отдельных торможений
         braking_events = detect_braking_events(df)
-        braking_stats = analyze_braking_events(df)
+        braking_stats = analyze_braking_events(df, events=braking_events)
 
         if braking_stats is not None:
             print("\nСТАТИСТИКА ТОРМОЖЕНИЙ:")
@@ -988,6 +1114,8 @@ def run_complex_braking_to_braking_analysis(df):
 
             print(f"\nСредняя эффективность: {braking_stats['efficiency'].mean():.4f} м/с²/бар")
             print(f"Стабильность эффективности: {braking_stats['efficiency'].std():.4f} м/с²/бар")
+            print("\nЭффективность по диапазонам начальной скорости:")
+            print(speed_binned_efficiency(braking_stats))
 
             # Визуализация
             plot_braking_events_timeline(df, braking_events)
@@ -1195,6 +1323,17 @@ def create_advanced_interactive_dashboard(braking_stats):
         ),
         row=1, col=1
     )
+    fig.add_trace(
+        go.Scatter(
+            x=braking_stats['start_time'],
+            y=braking_stats['efficiency_rolling'],
+            mode='lines',
+            line=dict(color='red', dash='dash'),
+            name=f'Скользящая ({EFFICIENCY_ROLLING_EVENTS})',
+            hovertemplate='Время: %{x:.1f}с<br>Скользящая эфф.: %{y:.3f} м/с²/бар'
+        ),
+        row=1, col=1
+    )
 
     # 2. Эффективность vs Скорость
     fig.add_trace(
@@ -1214,6 +1353,23 @@ def create_advanced_interactive_dashboard(braking_stats):
         ),
         row=1, col=2
     )
+    # эффективность по диапазонам скорости - из тех же сумм событий
+    speed_ranges = ((0, 50), (50, 100), (100, 150), (150, 200))
+    binned = speed_binned_efficiency(braking_stats, speed_ranges)
+    fig.add_trace(
+        go.Scatter(
+            x=[(min_speed + max_speed) / 2 for min_speed, max_speed in speed_ranges],
+            y=binned['efficiency'],
+            mode='lines+markers',
+            line=dict(color='black', width=2),
+            marker=dict(symbol='diamond', size=10, color='black'),
+            name='По диапазонам скорости',
+            text=binned['speed_range'],
+            customdata=binned['events'],
+            hovertemplate='%{text}<br>Эфф.: %{y:.3f} м/с²/бар<br>Торможений: %{customdata}'
+        ),
+        row=1, col=2
+    )
 
     # 3. Эффективность vs Давление
     fig.add_trace(
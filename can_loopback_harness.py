@@ -0,0 +1,403 @@
+"""
+Программная CAN петля для реплееров (без Kvaser)
+================================================
+
+Все реплееры открывают can.Bus(interface='kvaser', ...), поэтому без адаптера ни один
+путь отправки/приёма нельзя проверить. Здесь:
+
+- EcuResponder - ЭБУ в том же процессе на интерфейсе python-can 'virtual':
+  отвечает на 0x740 кадрами 0x760 (и на Tester Present по остальным адресам) с
+  настраиваемой задержкой, разбросом и долей потерянных ответов
+- бенчмарк всех режимов проигрывания на синтетической последовательности 2F 4B:
+    sequential    - отправить, ждать ответ (как replay_740_760 без --pipelined)
+    sequential_tx - то же, передача через TxScheduler + Tester Present
+    pipelined     - PipelinedReplayEngine
+    pipelined_tx  - PipelinedReplayEngine через TxScheduler + Tester Present
+  для каждого: пропускная способность, ошибка времени отправки (джиттер),
+  корректность сопоставления ответов (сколько ответил ЭБУ vs сколько сопоставлено)
+- прогон настоящего replay_universal_pci_fix.py по файлу лога против EcuResponder
+
+ИСПОЛЬЗОВАНИЕ:
+    python can_loopback_harness.py bench                          # все режимы
+    python can_loopback_harness.py bench --frames 5000 --interval 0.001 --latency 0.002 --loss 0.01
+    python can_loopback_harness.py bench --csv bench.csv
+    python can_loopback_harness.py replay log_to_replay/AVA_OK.xlsx --pipelined
+"""
+
+import argparse
+import csv
+import heapq
+import itertools
+import random
+import threading
+import time
+
+import can
+
+from replay_scheduler import ReplayScheduler
+from pipelined_replay import PipelinedReplayEngine, response_matches, sid_offset
+from tx_scheduler import TxScheduler
+
+# Канал виртуальной шины python-can (общий для всех Bus в процессе)
+DEFAULT_CHANNEL = "replay_loopback"
+
+# Запрос -> ответ, как у ЭБУ на стенде
+DEFAULT_ID_MAP = {0x740: 0x760, 0x745: 0x74D, 0x7E0: 0x7E8, 0x7E1: 0x7E9}
+
+TESTER_PRESENT = bytes([0x02, 0x3E, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00])
+
+BENCH_MODES = ['sequential', 'sequential_tx', 'pipelined', 'pipelined_tx']
+
+
+def open_virtual_bus(channel=DEFAULT_CHANNEL):
+    """Bus python-can 'virtual': все шины с одним channel в процессе видят друг друга"""
+    return can.Bus(interface='virtual', channel=channel, receive_own_messages=False)
+
+
+def default_response(request_data):
+    """
+    Положительный ответ UDS на запрос: SID+0x40 и эхо параметров
+    (2F 4B 12 03 xx yy -> 6F 4B 12 03 xx yy). Формат PCI - как у запроса.
+    """
+    data = bytes(request_data)
+    off = sid_offset(data)
+    if len(data) <= off:
+        return None
+
+    sid = data[off]
+    if sid == 0x3E:
+        payload = bytes([0x7E, 0x00])
+    elif sid == 0x10:
+        payload = bytes([0x50, data[off + 1] if len(data) > off + 1 else 0x03, 0x00, 0x32, 0x01, 0xF4])
+    elif sid == 0x14:
+        payload = bytes([0x54])
+    elif sid == 0x2F:
+        length = data[0] if off == 1 else len(data)
+        payload = bytes([0x6F]) + data[off + 1:off + length]
+    else:
+        payload = bytes([0x7F, sid, 0x11])  # serviceNotSupported
+
+    if off == 1:
+        return (bytes([len(payload)]) + payload).ljust(8, b'\x00')
+    return payload
+
+
+class EcuResponder:
+    """ЭБУ в процессе: отвечает на запросы с задержкой latency (+- jitter), теряет долю loss ответов"""
+
+    def __init__(self, bus, id_map=None, latency=0.005, jitter=0.0, loss=0.0, respond=None, seed=None):
+        """
+        latency - секунды или callable(request_data) -> секунды
+        respond - callable(arbitration_id, request_data) -> bytes ответа или None (не отвечать);
+                  по умолчанию default_response
+        """
+        self.bus = bus
+        self.id_map = dict(id_map or DEFAULT_ID_MAP)
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.respond = respond or (lambda arbitration_id, data: default_response(data))
+        self.rng = random.Random(seed)
+
+        self._due = []
+        self._seq = itertools.count()
+        self._running = False
+        self._thread = None
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.received = 0
+            self.answered = 0
+            self.dropped = 0
+            self.answered_by = {}  # (response_id, SID ответа) -> количество
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="EcuResponder", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _delay_for(self, data):
+        delay = self.latency(data) if callable(self.latency) else self.latency
+        if self.jitter:
+            delay += self.rng.uniform(-self.jitter, self.jitter)
+        return max(0.0, delay)
+
+    def _schedule(self, msg, now):
+        response_id = self.id_map.get(msg.arbitration_id)
+        if response_id is None:
+            return
+
+        with self._lock:
+            self.received += 1
+            if self.loss and self.rng.random() < self.loss:
+                self.dropped += 1
+                return
+
+        response = self.respond(msg.arbitration_id, bytes(msg.data))
+        if response is None:
+            return
+        heapq.heappush(self._due, (now + self._delay_for(msg.data), next(self._seq), response_id, response))
+
+    def _send_due(self, now):
+        while self._due and self._due[0][0] <= now:
+            _, _, response_id, response = heapq.heappop(self._due)
+            self.bus.send(can.Message(arbitration_id=response_id, data=response, is_extended_id=False))
+            key = (response_id, response[sid_offset(response)])
+            with self._lock:
+                self.answered += 1
+                self.answered_by[key] = self.answered_by.get(key, 0) + 1
+
+    def _run(self):
+        while self._running:
+            now = time.perf_counter()
+            self._send_due(now)
+            timeout = 0.05
+            if self._due:
+                timeout = max(0.0, min(timeout, self._due[0][0] - now))
+
+            msg = self.bus.recv(timeout=timeout)
+            if msg is not None:
+                self._schedule(msg, time.perf_counter())
+
+
+# ============================================================================
+# БЕНЧМАРК
+# ============================================================================
+def synthetic_frames(count, interval, start=0.0):
+    """Последовательность команд клапанов 06 2F 4B 12 03 xx yy 00 с шагом interval"""
+    frames = []
+    for i in range(count):
+        mask = (i * 7) & 0xFF
+        data = bytes([0x06, 0x2F, 0x4B, 0x12, 0x03, mask, 0x40 | (i & 0x0F), 0x00])
+        frames.append((start + i * interval, 0x740, data))
+    return frames
+
+
+def start_tester_present(tx, interval):
+    addresses = list(DEFAULT_ID_MAP)
+    for i, addr in enumerate(addresses):
+        tx.add_periodic(f"Tester Present 0x{addr:03X}", addr, TESTER_PRESENT, interval,
+                        first_delay=i * interval / len(addresses))
+
+
+def run_sequential(bus, frames, timeout, tx=None, response_id=0x760):
+    """
+    Режим отправить-ждать, как в replay_740_760: после каждого 0x740 ждём 0x760 до timeout.
+    Возвращает (stats, scheduler).
+    """
+    scheduler = ReplayScheduler()
+    scheduler.start(frames[0][0])
+    stats = {'sent': 0, 'positive': 0, 'negative': 0, 'timeouts': 0,
+             'unmatched_responses': 0, 'order_violations': 0}
+
+    for timestamp, arbitration_id, data in frames:
+        tx_msg = can.Message(arbitration_id=arbitration_id, data=data, is_extended_id=False)
+        if tx is None:
+            deadline = scheduler.wait_until(timestamp)
+            bus.send(tx_msg)
+            scheduler.record_send(deadline)
+        else:
+            deadline = scheduler.deadline_for(timestamp)
+            job = tx.send_at(deadline, tx_msg)
+            job.wait()
+            scheduler.record_send(deadline, job.sent_at)
+        stats['sent'] += 1
+
+        end_wait = time.perf_counter() + timeout
+        matched = None
+        while matched is None:
+            remaining = end_wait - time.perf_counter()
+            if remaining <= 0:
+                break
+            response = bus.recv(timeout=remaining)
+            if response is None or response.arbitration_id != response_id:
+                continue
+            resp_data = bytes(response.data)
+            off = sid_offset(resp_data)
+            if len(resp_data) > off and resp_data[off] == 0x7E:
+                continue  # ответ на Tester Present
+            matched = response_matches(data, resp_data)
+            if matched is None:
+                stats['unmatched_responses'] += 1
+
+        if matched == 'positive':
+            stats['positive'] += 1
+        elif matched == 'negative':
+            stats['negative'] += 1
+        else:
+            stats['timeouts'] += 1
+
+    return stats, scheduler
+
+
+def run_pipelined(bus, frames, timeout, tx=None):
+    engine = PipelinedReplayEngine(bus, timeout=timeout, tx_scheduler=tx)
+    stats = engine.run(frames)
+    return stats, engine.scheduler
+
+
+def run_mode(mode, frames, timeout, latency, jitter, loss, tester_present_interval, seed=None,
+             channel=DEFAULT_CHANNEL):
+    """Один прогон режима mode против свежего EcuResponder. Возвращает строку результатов"""
+    ecu_bus = open_virtual_bus(channel)
+    tester_bus = open_virtual_bus(channel)
+    responder = EcuResponder(ecu_bus, latency=latency, jitter=jitter, loss=loss, seed=seed).start()
+
+    tx = None
+    if mode.endswith('_tx'):
+        tx = TxScheduler(tester_bus).start()
+        start_tester_present(tx, tester_present_interval)
+
+    started = time.perf_counter()
+    try:
+        if mode.startswith('sequential'):
+            stats, scheduler = run_sequential(tester_bus, frames, timeout, tx=tx)
+        else:
+            stats, scheduler = run_pipelined(tester_bus, frames, timeout, tx=tx)
+        duration = time.perf_counter() - started
+    finally:
+        if tx is not None:
+            tx.remove_all_periodic()
+            tx.stop()
+        responder.stop()
+        tester_bus.shutdown()
+        ecu_bus.shutdown()
+
+    timing = scheduler.stats() or {}
+    # ответы на команды клапанов (6F), без ответов на Tester Present
+    answered_740 = responder.answered_by.get((0x760, 0x6F), 0)
+    matched = stats['positive'] + stats['negative']
+
+    row = {
+        'mode': mode,
+        'frames': stats['sent'],
+        'duration_s': round(duration, 3),
+        'throughput_fps': round(stats['sent'] / duration, 1) if duration > 0 else None,
+        'send_err_mean_us': round(timing.get('mean_us', 0.0), 1),
+        'send_err_p99_us': round(timing.get('p99_us', 0.0), 1),
+        'send_err_max_us': round(timing.get('max_us', 0.0), 1),
+        'ecu_answered': answered_740,
+        'ecu_dropped': responder.dropped,
+        'matched': matched,
+        'timeouts': stats['timeouts'],
+        'unmatched': stats['unmatched_responses'],
+        'order_violations': stats['order_violations'],
+        # каждый отправленный ответ на 0x740 сопоставлен, каждая потеря - таймаут
+        'matching_ok': (matched == answered_740 and stats['unmatched_responses'] == 0
+                        and stats['order_violations'] == 0),
+    }
+    if tx is not None:
+        drift = [job['drift_p99_ms'] for job in tx.periodic_stats() if job['drift_p99_ms'] is not None]
+        row['tp_drift_p99_ms'] = round(max(drift), 3) if drift else None
+    return row
+
+
+def run_benchmarks(modes=None, frames_count=2000, interval=0.002, timeout=0.05, latency=0.003,
+                   jitter=0.0005, loss=0.0, tester_present_interval=0.5, seed=1):
+    frames = synthetic_frames(frames_count, interval)
+    results = []
+    for mode in modes or BENCH_MODES:
+        print(f"[Bench] {mode}: {frames_count} frames, interval {interval * 1000:.2f} ms, "
+              f"ECU latency {latency * 1000:.2f} ms, loss {loss:.1%}")
+        results.append(run_mode(mode, frames, timeout, latency, jitter, loss, tester_present_interval, seed))
+    return results
+
+
+def print_results(results):
+    if not results:
+        return
+    columns = list(dict.fromkeys(key for row in results for key in row))
+    widths = {col: max(len(col), *(len(str(row.get(col, ''))) for row in results)) for col in columns}
+    print('  '.join(col.ljust(widths[col]) for col in columns))
+    for row in results:
+        print('  '.join(str(row.get(col, '')).ljust(widths[col]) for col in columns))
+
+
+def save_results_csv(results, path):
+    columns = list(dict.fromkeys(key for row in results for key in row))
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.DictWriter(f, fieldnames=columns, delimiter=';')
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"[Bench] Results saved: {path}")
+
+
+# ============================================================================
+# ПРОГОН НАСТОЯЩЕГО РЕПЛЕЕРА
+# ============================================================================
+def replay_file(file_path, pipelined=False, latency=0.005, jitter=0.0, loss=0.0, no_blf=True, respond=None):
+    """
+    Запускает replay_universal_pci_fix.replay_740_760 на виртуальной шине против EcuResponder.
+    latency/respond - как у EcuResponder (например модель из ecu_log_emulator.py)
+    """
+    import replay_universal_pci_fix as replayer
+
+    replayer.CAN_INTERFACE = 'virtual'
+    ecu_bus = can.Bus(interface='virtual', channel=0, receive_own_messages=False)
+    responder = EcuResponder(ecu_bus, latency=latency, jitter=jitter, loss=loss, respond=respond).start()
+    try:
+        replayer.replay_740_760(use_virtual=True, auto_session=True, file_path=file_path,
+                                enable_blf=not no_blf, pipelined=pipelined)
+    finally:
+        responder.stop()
+        ecu_bus.shutdown()
+
+    print(f"[ECU] received {responder.received}, answered {responder.answered}, dropped {responder.dropped}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Software CAN loopback: ECU responder + replay benchmarks')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    bench = subparsers.add_parser('bench', help='Benchmark all replay modes on a virtual bus')
+    bench.add_argument('--modes', nargs='+', choices=BENCH_MODES, default=BENCH_MODES)
+    bench.add_argument('--frames', type=int, default=2000, help='Number of 0x740 frames (default: 2000)')
+    bench.add_argument('--interval', type=float, default=0.002, help='Frame interval, s (default: 0.002)')
+    bench.add_argument('--timeout', type=float, default=0.05, help='Response timeout, s (default: 0.05)')
+    bench.add_argument('--latency', type=float, default=0.003, help='ECU response latency, s (default: 0.003)')
+    bench.add_argument('--jitter', type=float, default=0.0005, help='ECU latency jitter, s (default: 0.0005)')
+    bench.add_argument('--loss', type=float, default=0.0, help='Share of lost responses 0..1 (default: 0)')
+    bench.add_argument('--tp-interval', type=float, default=0.5,
+                       help='Tester Present interval in *_tx modes, s (default: 0.5)')
+    bench.add_argument('--seed', type=int, default=1)
+    bench.add_argument('--csv', type=str, default=None, help='Save results to CSV')
+
+    replay = subparsers.add_parser('replay', help='Run replay_universal_pci_fix against the ECU responder')
+    replay.add_argument('file', help='BLF/XLSX log to replay')
+    replay.add_argument('--pipelined', action='store_true')
+    replay.add_argument('--latency', type=float, default=0.005)
+    replay.add_argument('--jitter', type=float, default=0.0)
+    replay.add_argument('--loss', type=float, default=0.0)
+    replay.add_argument('--blf', action='store_true', help='Write the replay BLF log')
+
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        results = run_benchmarks(args.modes, args.frames, args.interval, args.timeout, args.latency,
+                                 args.jitter, args.loss, args.tp_interval, args.seed)
+        print()
+        print_results(results)
+        if args.csv:
+            save_results_csv(results, args.csv)
+    else:
+        replay_file(args.file, pipelined=args.pipelined, latency=args.latency, jitter=args.jitter,
+                    loss=args.loss, no_blf=not args.blf)
+
+
+if __name__ == "__main__":
+    main()
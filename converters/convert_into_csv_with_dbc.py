@@ -1,18 +1,225 @@
+"""
+BLF + DBC -> таблицы сигналов (Parquet / CSV)
+=============================================
+
+Старый формат (--long): одна строка на кадр, все сигналы склеены в строку
+"k: v; k: v" - для анализа её приходилось парсить обратно. На каждый кадр вызывались
+db.decode_message и db.get_message_by_frame_id (два поиска по ID), печать - каждые
+1000 кадров.
+
+Широкий формат (по умолчанию): один файл на тип сообщения DBC
+(<output>/<MessageName>.parquet и/или .csv), колонки - timestamp и сигналы сообщения.
+- сообщения DBC ищутся один раз: словарь frame_id -> MessageColumns; неизвестные ID
+  отсекаются проверкой по множеству до декодирования
+- значения копятся в типизированных буферах (array 'd' / 'q'); при ROW_GROUP_SIZE
+  строк буфер сбрасывается row group в Parquet (pyarrow.parquet.ParquetWriter) или
+  в CSV, так что память ограничена ROW_GROUP_SIZE строками на сообщение
+- мультиплексированные сообщения пишутся с пустыми значениями для отсутствующих сигналов
+- прогресс и итог: кадров, кадров/с, строк по сообщениям
+
+ИСПОЛЬЗОВАНИЕ:
+    python convert_into_csv_with_dbc.py log.blf pressures_sensors_ni6002.dbc -o log_signals
+    python convert_into_csv_with_dbc.py log.blf sensors.dbc -o out --format both --row-group 200000
+    python convert_into_csv_with_dbc.py log.blf sensors.dbc --long output.csv      # старый формат
+"""
+
+import argparse
+import csv
+import os
+import time
+from array import array
+
 import can
 import cantools
-import csv
-from can.message import Message
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
 
 # Конфигурация - укажите пути к вашим файлам
 BLF_FILE = 'currently_under_calc.blf'
 DBC_FILE = 'pressures_sensors_ni6002.dbc'
 CSV_FILE = 'output.csv'
 
-def main():
+# Строк в буфере сообщения до сброса в файл (row group Parquet)
+ROW_GROUP_SIZE = 100000
+
+# Как часто печатать прогресс (сек)
+PROGRESS_INTERVAL = 2.0
+
+
+def is_integer_signal(signal):
+    """Сигнал без масштаба и смещения декодируется в int - храним как int64"""
+    return (not signal.is_float and signal.scale == 1 and signal.offset == 0
+            and signal.length <= 63 and not signal.choices)
+
+
+class MessageColumns:
+    """Буферы колонок одного сообщения DBC и его выходные файлы"""
+
+    def __init__(self, message, output_dir, write_parquet, write_csv, compression):
+        self.message = message
+        self.name = message.name
+        self.signal_names = [signal.name for signal in message.signals]
+        # мультиплексированные сообщения содержат не все сигналы в каждом кадре -> нужны пустые значения
+        self.nullable = message.is_multiplexed()
+        self.integer = [is_integer_signal(signal) for signal in message.signals]
+
+        self.timestamps = array('d')
+        self._reset_buffers()
+        self.rows = 0
+
+        base = os.path.join(output_dir, self.name)
+        self.parquet_path = base + '.parquet' if write_parquet else None
+        self.csv_path = base + '.csv' if write_csv else None
+        self.compression = compression
+        self._parquet_writer = None
+        self._csv_file = None
+        self._csv_writer = None
+
+    def _reset_buffers(self):
+        self.timestamps = array('d')
+        if self.nullable:
+            self.columns = [[] for _ in self.signal_names]
+        else:
+            self.columns = [array('q') if integer else array('d') for integer in self.integer]
+
+    def append(self, timestamp, decoded):
+        self.timestamps.append(timestamp)
+        if self.nullable:
+            for column, name in zip(self.columns, self.signal_names):
+                column.append(decoded.get(name))
+        else:
+            for column, name in zip(self.columns, self.signal_names):
+                column.append(decoded[name])
+        if len(self.timestamps) >= ROW_GROUP_SIZE:
+            self.flush()
+
+    # ------------------------------------------------------------------
+    # Запись
+    # ------------------------------------------------------------------
+    def _arrow_column(self, column, integer):
+        arrow_type = pa.int64() if integer else pa.float64()
+        if isinstance(column, array):
+            # без копирования: буфер array -> arrow
+            return pa.Array.from_buffers(arrow_type, len(column), [None, pa.py_buffer(column)])
+        return pa.array(column, type=arrow_type)
+
+    def _write_parquet(self):
+        arrays = [self._arrow_column(self.timestamps, False)]
+        arrays.extend(self._arrow_column(column, integer) for column, integer in zip(self.columns, self.integer))
+        table = pa.Table.from_arrays(arrays, names=['timestamp'] + self.signal_names)
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(self.parquet_path, table.schema, compression=self.compression)
+        self._parquet_writer.write_table(table)
+
+    def _write_csv(self):
+        if self._csv_writer is None:
+            self._csv_file = open(self.csv_path, 'w', newline='', encoding='utf-8')
+            self._csv_writer = csv.writer(self._csv_file)
+            self._csv_writer.writerow(['timestamp'] + self.signal_names)
+        self._csv_writer.writerows(zip(self.timestamps, *self.columns))
+
+    def flush(self):
+        count = len(self.timestamps)
+        if not count:
+            return
+        if self.parquet_path:
+            self._write_parquet()
+        if self.csv_path:
+            self._write_csv()
+        self.rows += count
+        self._reset_buffers()
+
+    def close(self):
+        self.flush()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+        if self._csv_file is not None:
+            self._csv_file.close()
+            self._csv_file = None
+
+
+def convert_wide(blf_path, dbc_path, output_dir, write_parquet=True, write_csv=False,
+                 compression='zstd', progress_interval=PROGRESS_INTERVAL):
+    """Потоковая конвертация BLF в таблицы сигналов по сообщениям. Возвращает словарь статистики"""
+    if write_parquet and pa is None:
+        raise RuntimeError("pyarrow is not installed: 'pip install pyarrow' or use --format csv")
+
+    db = cantools.database.load_file(dbc_path)
+    print(f"Успешно загружена DBC база: {dbc_path}")
+    print(f"Загружено сообщений: {len(db.messages)}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    # поиск сообщения по ID - один раз, а не на каждый кадр
+    by_id = {message.frame_id: MessageColumns(message, output_dir, write_parquet, write_csv, compression)
+             for message in db.messages}
+    known_ids = frozenset(by_id)
+
+    frames = 0
+    unknown = 0
+    decode_errors = 0
+    start = time.perf_counter()
+    last_report = start
+
+    try:
+        for msg in can.BLFReader(blf_path):
+            frames += 1
+            arbitration_id = msg.arbitration_id
+            if arbitration_id not in known_ids or msg.is_error_frame or msg.is_remote_frame:
+                unknown += 1
+            else:
+                columns = by_id[arbitration_id]
+                try:
+                    decoded = columns.message.decode(msg.data, decode_choices=False)
+                except Exception:
+                    decode_errors += 1
+                else:
+                    columns.append(msg.timestamp, decoded)
+
+            if not frames & 0x3FFF:
+                now = time.perf_counter()
+                if now - last_report >= progress_interval:
+                    print(f"Обработано кадров: {frames} ({frames / (now - start):.0f} кадров/с)")
+                    last_report = now
+    finally:
+        for columns in by_id.values():
+            columns.close()
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        'frames': frames,
+        'unknown_ids': unknown,
+        'decode_errors': decode_errors,
+        'elapsed_s': elapsed,
+        'frames_per_s': frames / elapsed if elapsed > 0 else 0.0,
+        'rows': {columns.name: columns.rows for columns in by_id.values() if columns.rows},
+    }
+
+    print(f"Обработка завершена: {frames} кадров за {elapsed:.1f} с ({stats['frames_per_s']:.0f} кадров/с)")
+    print(f"  Неизвестные ID: {unknown}, ошибки декодирования: {decode_errors}")
+    for name, rows in sorted(stats['rows'].items()):
+        print(f"  {name}: {rows} строк")
+    # пустые сообщения не оставляют файлов
+    for columns in by_id.values():
+        if not columns.rows:
+            continue
+        for path in (columns.parquet_path, columns.csv_path):
+            if path:
+                print(f"  -> {path}")
+    return stats
+
+
+def convert_long(blf_path, dbc_path, csv_path):
+    """Старый формат: одна строка на кадр, сигналы строкой "k: v; k: v" """
     # Загружаем базу данных CAN из DBC файла
     try:
-        db = cantools.db.load_file(DBC_FILE)
-        print(f"Успешно загружена DBC база: {DBC_FILE}")
+        db = cantools.database.load_file(dbc_path)
+        print(f"Успешно загружена DBC база: {dbc_path}")
         print(f"Загружено сообщений: {len(db.messages)}")
     except Exception as e:
         print(f"Ошибка загрузки DBC файла: {e}")
@@ -20,43 +227,42 @@ def main():
 
     # Открываем BLF файл для чтения
     try:
-        log = can.BLFReader(BLF_FILE)
-        print(f"Успешно открыт BLF файл: {BLF_FILE}")
+        log = can.BLFReader(blf_path)
+        print(f"Успешно открыт BLF файл: {blf_path}")
     except Exception as e:
         print(f"Ошибка открытия BLF файла: {e}")
         return
 
+    messages = {message.frame_id: message for message in db.messages}
+
     # Создаем CSV файл и записываем заголовок
     try:
-        with open(CSV_FILE, 'w', newline='', encoding='utf-8') as csvfile:
+        with open(csv_path, 'w', newline='', encoding='utf-8') as csvfile:
             writer = csv.writer(csvfile)
 
             # Записываем заголовок CSV
             header = ['Timestamp', 'Arbitration_ID', 'Message_Name', 'Signals']
             writer.writerow(header)
-            print(f"Создан CSV файл: {CSV_FILE}")
+            print(f"Создан CSV файл: {csv_path}")
 
             # Обрабатываем каждое CAN-сообщение
             message_count = 0
             for msg in log:
+                message = messages.get(msg.arbitration_id)
+                if message is None:
+                    continue
                 try:
                     # Парсим сообщение с помощью DBC
-                    decoded = db.decode_message(msg.arbitration_id, msg.data)
+                    decoded = message.decode(msg.data)
 
                     # Форматируем сигналы в строку
                     signals_str = "; ".join([f"{key}: {value}" for key, value in decoded.items()])
 
-                    # Получаем имя сообщения по ID
-                    try:
-                        msg_name = db.get_message_by_frame_id(msg.arbitration_id).name
-                    except:
-                        msg_name = "UNKNOWN"
-
                     # Записываем данные в CSV
                     row = [
                         msg.timestamp,          # Метка времени
                         hex(msg.arbitration_id),# ID сообщения в hex
-                        msg_name,               # Имя сообщения из DBC
+                        message.name,           # Имя сообщения из DBC
                         signals_str             # Расшифрованные сигналы
                     ]
                     writer.writerow(row)
@@ -78,5 +284,38 @@ def main():
         print(f"Ошибка записи в CSV файл: {e}")
         return
 
+
+def main():
+    global ROW_GROUP_SIZE
+
+    parser = argparse.ArgumentParser(description='BLF + DBC -> per-message signal tables (Parquet/CSV)')
+    parser.add_argument('blf', nargs='?', default=BLF_FILE, help=f'BLF file (default: {BLF_FILE})')
+    parser.add_argument('dbc', nargs='?', default=DBC_FILE, help=f'DBC file (default: {DBC_FILE})')
+    parser.add_argument('-o', '--output', default=None,
+                        help='Output directory for the wide format (default: <blf name>_signals)')
+    parser.add_argument('--format', choices=['parquet', 'csv', 'both'], default='parquet',
+                        help='Wide format output (default: parquet)')
+    parser.add_argument('--row-group', type=int, default=ROW_GROUP_SIZE,
+                        help=f'Rows buffered per message before a flush (default: {ROW_GROUP_SIZE})')
+    parser.add_argument('--compression', default='zstd', help='Parquet compression (default: zstd)')
+    parser.add_argument('--long', nargs='?', const=CSV_FILE, default=None, metavar='CSV',
+                        help=f'Old single-CSV format with a "Signals" string column (default file: {CSV_FILE})')
+    args = parser.parse_args()
+
+    if args.long:
+        convert_long(args.blf, args.dbc, args.long)
+        return
+
+    ROW_GROUP_SIZE = max(1, args.row_group)
+    output_dir = args.output or os.path.splitext(args.blf)[0] + '_signals'
+    try:
+        convert_wide(args.blf, args.dbc, output_dir,
+                     write_parquet=args.format in ('parquet', 'both'),
+                     write_csv=args.format in ('csv', 'both'),
+                     compression=args.compression)
+    except Exception as e:
+        print(f"Ошибка конвертации: {e}")
+
+
 if __name__ == "__main__":
     main()
@@ -2,6 +2,26 @@
 Конвертировать то конвертирует. Но DBC я так и не смог читаемую записать. Да и к blf всегда были вопросы к открытию.
 Не факт, что она полная, и в режиме графика в векторе откроется. Поддержки нет полной в open source. Единственный надёжный способ - через
 проприетарные конвертые перегонять blf->asc->blf
+
+Режим упаковки (--pack float32 / int16)
+---------------------------------------
+Обычный режим пишет каждый отсчёт отдельным кадром с ID из MD5 имени (11 бит):
+совпадение хэшей молча сливает сигналы, а кадр на отсчёт раздувает BLF.
+В режиме упаковки каналы одной группы TDMS (общая ось времени) укладываются в кадр:
+- float32: 2 сигнала float32 в 8 байтах, свой ID на каждую пару
+- int16:   байт мультиплексора + 3 сигнала по 16 бит (масштаб/смещение по min/max
+           канала в первом файле, где он встретился; выход за диапазон обрезается
+           и считается), до PACK_MUX_LIMIT значений мультиплексора на один ID
+ID выдаются подряд с PACK_BASE_ID для всего прогона (один конвертер на папку) - без
+коллизий, один и тот же канал в разных файлах получает тот же слот. После 0x7FF
+идут расширенные ID. DBC описывает упаковку (в режиме int16 - мультиплексированные
+сообщения). Кадры строятся массивами NumPy и пишутся блоками (ColumnarBLFWriter),
+без can.Message на каждый отсчёт.
+
+ИСПОЛЬЗОВАНИЕ:
+    python tdms_to_blf_converter.py                              # выбор папки, кадр на отсчёт
+    python tdms_to_blf_converter.py D:\\logs\\tdms --pack float32
+    python tdms_to_blf_converter.py D:\\logs\\tdms --pack int16
 """
 import os
 import re
@@ -27,8 +47,84 @@ import cantools
 from cantools.database import Database, Message, Signal
 from cantools.database.conversion import LinearConversion
 import hashlib
-
-
+import argparse
+from can.io.blf import (OBJ_HEADER_BASE_STRUCT, OBJ_HEADER_V1_STRUCT, CAN_MSG_STRUCT, CAN_MESSAGE,
+                        CAN_MSG_EXT, TIME_ONE_NANS)
+
+
+# Первый ID режима упаковки; ID выдаются подряд
+PACK_BASE_ID = 0x100
+
+# Значений мультиплексора на один ID (режим int16)
+PACK_MUX_LIMIT = 256
+
+# Кадров в одном блоке записи ColumnarBLFWriter
+PACK_WRITE_BLOCK = 1000000
+
+# Раскладка 8 байт кадра: сигналов в кадре, тип слота, мультиплексор в байте 0
+PACK_LAYOUTS = {
+    'float32': {'slots': 2, 'dtype': np.dtype([('value', '<f4', (2,))]), 'multiplexed': False},
+    'int16': {'slots': 3, 'dtype': np.dtype([('mux', 'u1'), ('value', '<u2', (3,)), ('pad', 'u1')]),
+              'multiplexed': True},
+}
+
+# Объект CAN_MESSAGE целиком (заголовок base + v1 + CAN_MSG), 48 байт - как пишет BLFWriter
+CAN_OBJECT_DTYPE = np.dtype([
+    ('signature', 'S4'), ('header_size', '<u2'), ('header_version', '<u2'), ('obj_size', '<u4'), ('obj_type', '<u4'),
+    ('time_flags', '<u4'), ('client_index', '<u2'), ('object_version', '<u2'), ('timestamp', '<u8'),
+    ('channel', '<u2'), ('flags', 'u1'), ('dlc', 'u1'), ('can_id', '<u4'), ('data', 'u1', (8,)),
+])
+assert CAN_OBJECT_DTYPE.itemsize == OBJ_HEADER_BASE_STRUCT.size + OBJ_HEADER_V1_STRUCT.size + CAN_MSG_STRUCT.size
+
+
+class ColumnarBLFWriter(BLFWriter):
+    """BLFWriter с записью массивов кадров: объекты собираются NumPy, в контейнеры идут блоками"""
+
+    def write_frames(self, timestamps, can_ids, payloads):
+        """timestamps (сек, по возрастанию), can_ids, payloads (N x 8 uint8)"""
+        count = len(timestamps)
+        if not count:
+            return
+        if self.start_timestamp is None:
+            self.start_timestamp = int(timestamps[0] * 1000) / 1000
+
+        records = np.zeros(count, dtype=CAN_OBJECT_DTYPE)
+        records['signature'] = b"LOBJ"
+        records['header_size'] = OBJ_HEADER_BASE_STRUCT.size + OBJ_HEADER_V1_STRUCT.size
+        records['header_version'] = 1
+        records['obj_size'] = CAN_OBJECT_DTYPE.itemsize
+        records['obj_type'] = CAN_MESSAGE
+        records['time_flags'] = TIME_ONE_NANS
+        records['timestamp'] = np.maximum((timestamps - self.start_timestamp) * 1e9, 0).astype(np.uint64)
+        records['channel'] = self.channel
+        records['dlc'] = 8
+        records['can_id'] = np.where(can_ids > 0x7FF, can_ids | CAN_MSG_EXT, can_ids)
+        records['data'] = payloads
+
+        # объекты кратны 4 байтам - без выравнивания; в буфер кусками по контейнеру
+        block = memoryview(records.tobytes())
+        step = self.max_container_size
+        for pos in range(0, len(block), step):
+            piece = block[pos:pos + step].tobytes()
+            self._buffer.append(piece)
+            self._buffer_size += len(piece)
+            if self._buffer_size >= step:
+                self._flush()
+        self.object_count += count
+        self.stop_timestamp = float(timestamps[-1])
+
+
+def dbc_identifier(text):
+    """Имя для DBC: только буквы, цифры и _"""
+    name = re.sub(r'\W', '_', text, flags=re.ASCII).strip('_') or 'X'
+    return name if not name[0].isdigit() else '_' + name
+
+
+def as_unix_seconds(timestamps):
+    timestamps = np.asarray(timestamps)
+    if np.issubdtype(timestamps.dtype, np.datetime64):
+        return timestamps.astype('datetime64[ns]').astype(np.int64) / 1e9
+    return timestamps.astype(np.float64)
 
 
 class TDMS_to_BLF_Converter:
@@ -40,6 +136,14 @@ class TDMS_to_BLF_Converter:
 
         self.output_directory = None  # Будем хранить путь к папке с файлами
 
+        # Режим упаковки: (группа, канал) -> слот, кадры (ID, мультиплексор) -> каналы
+        self.packed_slots = {}
+        self.packed_frames = {}
+        self.packed_open = {}  # группа -> последний незаполненный кадр
+        self.packed_scaling = {}
+        self.next_packed_id = PACK_BASE_ID
+        self.pack_layout = None
+
     def set_output_directory(self, file_path):
         """Устанавливает директорию для сохранения на основе первого файла"""
         if self.output_directory is None:
@@ -203,6 +307,183 @@ class TDMS_to_BLF_Converter:
                 print(f"✗ Ошибка: {e}")
             return False, 0
 
+    def assign_packed_slot(self, group_name, channel_name, layout):
+        """Слот канала (ID, мультиплексор, позиция) - постоянный для всего прогона, без коллизий ID"""
+        key = (group_name, channel_name)
+        if key in self.packed_slots:
+            return self.packed_slots[key]
+
+        spec = PACK_LAYOUTS[layout]
+        frame = self.packed_open.get(group_name)
+        if frame is None or len(self.packed_frames[frame]['channels']) >= spec['slots']:
+            if frame is not None and spec['multiplexed'] and frame[1] + 1 < PACK_MUX_LIMIT:
+                frame = (frame[0], frame[1] + 1)
+            else:
+                frame = (self.next_packed_id, 0)
+                self.next_packed_id += 1
+            self.packed_frames[frame] = {'group': group_name, 'channels': []}
+            self.packed_open[group_name] = frame
+
+        channels = self.packed_frames[frame]['channels']
+        self.packed_slots[key] = (frame[0], frame[1], len(channels))
+        channels.append(channel_name)
+        return self.packed_slots[key]
+
+    def packed_int16_scaling(self, key, data):
+        """Масштаб/смещение 16 бит по min/max канала при первой встрече"""
+        if key not in self.packed_scaling:
+            finite = data[np.isfinite(data)]
+            low = float(finite.min()) if len(finite) else 0.0
+            high = float(finite.max()) if len(finite) else 0.0
+            scale = (high - low) / 0xFFFF if high > low else 1.0
+            self.packed_scaling[key] = (scale, low)
+        return self.packed_scaling[key]
+
+    def convert_tdms_to_blf_packed(self, filein, layout='float32', DEBUG=False):
+        """
+        Конвертирует TDMS в BLF с упаковкой нескольких сигналов группы в кадр.
+        Возвращает (успех, кадров)
+        """
+        try:
+            if self.pack_layout not in (None, layout):
+                raise ValueError(f"one DBC per run: layout {self.pack_layout} already used")
+            self.pack_layout = layout
+            spec = PACK_LAYOUTS[layout]
+
+            file_path = Path(filein)
+            base_name = file_path.stem.replace("℃", "C")
+            self.set_output_directory(filein)
+            blf_path = str(file_path.with_name(f"{base_name}.blf"))
+
+            if DEBUG:
+                print(f"Конвертация (упаковка {layout}): {file_path.name}")
+
+            all_times, all_ids, all_payloads = [], [], []
+            clipped = 0
+            with TdmsFile.read(filein) as tdms_file:
+                for group in tdms_file.groups():
+                    timestamp_channel = None
+                    for channel in group.channels():
+                        if channel.name.lower() in ['time', 'timestamp', 't']:
+                            timestamp_channel = channel
+                            break
+                    if not timestamp_channel:
+                        continue
+
+                    timestamps = as_unix_seconds(timestamp_channel[:])
+                    count = len(timestamps)
+                    payloads = {}
+                    for channel in group.channels():
+                        if channel is timestamp_channel:
+                            continue
+                        data = channel[:]
+                        if data.dtype.kind not in 'biuf':
+                            if DEBUG:
+                                print(f"  {group.name}/{channel.name}: нечисловой канал пропущен")
+                            continue
+                        data = np.asarray(data[:count], dtype=np.float64)
+
+                        can_id, mux, slot = self.assign_packed_slot(group.name, channel.name, layout)
+                        self.signal_info.setdefault(f"{can_id}_{mux}_{channel.name}",
+                                                    self.extract_signal_metadata(data, channel))
+                        frame = payloads.get((can_id, mux))
+                        if frame is None:
+                            frame = payloads[(can_id, mux)] = np.zeros(count, dtype=spec['dtype'])
+                            if spec['multiplexed']:
+                                frame['mux'] = mux
+
+                        if layout == 'float32':
+                            frame['value'][:len(data), slot] = data
+                        else:
+                            scale, offset = self.packed_int16_scaling((group.name, channel.name), data)
+                            raw = np.round((np.nan_to_num(data, nan=offset) - offset) / scale)
+                            clipped += int(np.count_nonzero((raw < 0) | (raw > 0xFFFF)))
+                            frame['value'][:len(data), slot] = np.clip(raw, 0, 0xFFFF)
+
+                    for (can_id, mux), frame in payloads.items():
+                        all_times.append(timestamps)
+                        all_ids.append(np.full(count, can_id, dtype=np.uint32))
+                        all_payloads.append(frame.view(np.uint8).reshape(count, 8))
+
+            total_messages = 0
+            with ColumnarBLFWriter(blf_path) as blf_writer:
+                if all_times:
+                    timestamps = np.concatenate(all_times)
+                    can_ids = np.concatenate(all_ids)
+                    payloads = np.concatenate(all_payloads)
+                    order = np.argsort(timestamps, kind='stable')
+                    for pos in range(0, len(order), PACK_WRITE_BLOCK):
+                        block = order[pos:pos + PACK_WRITE_BLOCK]
+                        blf_writer.write_frames(timestamps[block], can_ids[block], payloads[block])
+                    total_messages = len(order)
+
+            self.processed_files.append(file_path.name)
+            if DEBUG:
+                print(f"✓ Создан: {Path(blf_path).name}")
+                print(f"  Кадров: {total_messages}")
+                if clipped:
+                    print(f"  ⚠ Значений вне диапазона int16 (обрезано): {clipped}")
+
+            return True, total_messages
+
+        except Exception as e:
+            if DEBUG:
+                print(f"✗ Ошибка: {e}")
+            return False, 0
+
+    def build_packed_dbc(self):
+        """Сообщения DBC по раскладке упаковки (int16 - мультиплексированные)"""
+        spec = PACK_LAYOUTS[self.pack_layout]
+        by_id = {}
+        for (can_id, mux), frame in sorted(self.packed_frames.items()):
+            by_id.setdefault(can_id, []).append((mux, frame))
+
+        for can_id, frames in by_id.items():
+            group_name = frames[0][1]['group']
+            signals = []
+            if spec['multiplexed']:
+                signals.append(Signal(name='Mux', start=0, length=8, byte_order='little_endian',
+                                      is_multiplexer=True))
+            used_names = {'Mux'}
+            for mux, frame in frames:
+                for slot, channel_name in enumerate(frame['channels']):
+                    # имена сигналов в сообщении уникальны (после очистки имена каналов могут совпасть)
+                    name = dbc_identifier(channel_name)
+                    if name in used_names:
+                        name = f"{name}_{mux}_{slot}"
+                    used_names.add(name)
+                    meta = self.signal_info.get(f"{can_id}_{mux}_{channel_name}", {})
+                    if self.pack_layout == 'float32':
+                        conversion = LinearConversion(scale=1, offset=0, is_float=True)
+                        start, length = 32 * slot, 32
+                    else:
+                        scale, offset = self.packed_scaling[(group_name, channel_name)]
+                        conversion = LinearConversion(scale=scale, offset=offset, is_float=False)
+                        start, length = 8 + 16 * slot, 16
+                    signals.append(Signal(
+                        name=name,
+                        start=start,
+                        length=length,
+                        byte_order='little_endian',
+                        is_signed=False,
+                        conversion=conversion,
+                        minimum=meta.get('min'),
+                        maximum=meta.get('max'),
+                        unit=meta.get('unit', ''),
+                        comment=f"From group: {group_name}, channel: {channel_name}",
+                        multiplexer_ids=[mux] if spec['multiplexed'] else None,
+                        multiplexer_signal='Mux' if spec['multiplexed'] else None,
+                    ))
+            self.can_db.messages.append(Message(
+                frame_id=can_id,
+                name=f"PACK_{can_id:03X}_{dbc_identifier(group_name)}",
+                length=8,
+                signals=signals,
+                is_extended_frame=can_id > 0x7FF,
+                comment=f"Packed {self.pack_layout} signals of TDMS group {group_name}",
+            ))
+        self.can_db.refresh()
+
     def save_dbc_file(self, dbc_name="converted_signals.dbc"):
         """Сохраняет собранный DBC файл в директории с конвертированными файлами"""
         if self.output_directory is None:
@@ -210,6 +491,8 @@ class TDMS_to_BLF_Converter:
             return False
 
         try:
+            if self.pack_layout is not None:
+                self.build_packed_dbc()
             dbc_path = self.output_directory / dbc_name
             with open(dbc_path, 'w', encoding='utf-8') as f:
                 f.write(self.can_db.as_dbc_string())
@@ -265,9 +548,10 @@ class FileDealer():
                     self.add_item_fullpath(filename)
 
 
-    def convertall(self):
+    def convertall(self, pack=None):
         startpoint = time.perf_counter_ns()
         successfully_converted = 0
+        total_messages = 0
 
         converter = TDMS_to_BLF_Converter()
 
@@ -281,24 +565,26 @@ class FileDealer():
 
             #  res = self.convert_tdms_to_blf_optimized(file)
 
-            success, count = converter.convert_tdms_to_blf(file, DEBUG=True)
+            if pack:
+                success, count = converter.convert_tdms_to_blf_packed(file, layout=pack, DEBUG=True)
+            else:
+                success, count = converter.convert_tdms_to_blf(file, DEBUG=True)
 
             if success:
                 successfully_converted += 1
+                total_messages += count
 
-        if successfully_converted == i and i > 0:
+        total = len(self.items_to_dealwith)
+        if successfully_converted == total and total > 0:
             print("ALL OK")
-            try:
-                converter.save_dbc_file("auto_generated.dbc")
-            except Exception:
-                print(e)
-            else:
+            if converter.save_dbc_file("auto_generated.dbc"):
                 print("dbc successfully saved!")
         else:
-            print(f"\nSuccess - {successfully_converted} from {i + 1} files")
+            print(f"\nSuccess - {successfully_converted} from {total} files")
 
-
-        print(f"time taken: {((time.perf_counter_ns())/1000000) - startpoint} ms.")
+        elapsed_ms = (time.perf_counter_ns() - startpoint) / 1000000
+        print(f"Frames written: {total_messages}")
+        print(f"time taken: {elapsed_ms:.0f} ms.")
 
 
 
@@ -398,6 +684,12 @@ class FileDealer():
 
 
 def main():
+    parser = argparse.ArgumentParser(description='TDMS -> BLF converter with an auto-generated DBC')
+    parser.add_argument('folder', nargs='?', default=None, help='Folder with TDMS files (default: choose in a dialog)')
+    parser.add_argument('--pack', choices=sorted(PACK_LAYOUTS), default=None,
+                        help='Pack several signals of a group into one frame (default: one sample per frame)')
+    args = parser.parse_args()
+
     print("file run")
 
     #  fd = FileDealer("C:\\Users\\belousov\\Documents\\PyScripts\\test_tdms\\folder_with_files")
@@ -410,9 +702,12 @@ def main():
 
     files_processed = files_written = files_scipped = wrong_filenames = 0
 
-    root = Tk()
-    root.withdraw()
-    PA = filedialog.askdirectory()
+    if args.folder is None:
+        root = Tk()
+        root.withdraw()
+        PA = filedialog.askdirectory()
+    else:
+        PA = args.folder
     fd = FileDealer(PA)
     fd.list_files()
     #  print(fd)
@@ -422,7 +717,7 @@ def main():
 
     files_written = 0
 
-    fd.convertall()
+    fd.convertall(pack=args.pack)
 
 if __name__ == "__main__":
     main()
@@ -1,9 +1,43 @@
+"""
+TDMS -> MF4 (asammdf)
+=====================
+
+Папка (или список файлов) TDMS конвертируется в MDF 4.10 рядом с исходниками
+(<name>.mf4, символ ℃ заменяется на C).
+
+Раньше convert_tdms_to_md4 читал файл целиком (TdmsFile.read), на каждый канал заново
+читал group["Time"][:] и дважды channel[:], а MDF.append вызывался после цикла по
+группам - в файл попадала только последняя группа.
+
+Сейчас:
+- файл открывается потоково (TdmsFile.open), каналы читаются кусками по CHUNK_SAMPLES
+  отсчётов (channel.read_data) - память ограничена одним куском группы
+- одна группа TDMS = одна группа каналов MDF (acq_name = имя группы) с одной общей
+  осью времени: первый кусок - MDF.append(common_timebase=True), следующие -
+  MDF.extend(index, ...) (asammdf держит данные во временном файле до save)
+- ось времени: канал Time/Timestamp/t, иначе свойства waveform (wf_start_offset,
+  wf_increment); время datetime64 пишется в секундах от первой метки файла (первой
+  группы с таким временем) - одно начало для всех групп, чтобы группы каналов
+  совпадали по времени; эта метка становится start_time заголовка MDF
+- нечисловые каналы и каналы другой длины, чем ось времени, пропускаются с сообщением
+- несколько файлов конвертируются параллельно (ProcessPoolExecutor, -j)
+
+ИСПОЛЬЗОВАНИЕ:
+    python tdms_to_mf4_converter.py                        # выбор папки через gui
+    python tdms_to_mf4_converter.py D:\\logs\\tdms -j 4
+    python tdms_to_mf4_converter.py a.tdms b.tdms --chunk 200000
+"""
+
+import argparse
 import os
 import re
 from pathlib import Path
 from glob import glob
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
 
 from tkinter import filedialog, Tk
+import numpy as np
 from nptdms import TdmsFile
 
 import time
@@ -12,6 +46,13 @@ import time
 from asammdf.signal import Signal
 from asammdf.mdf import MDF
 
+# Отсчётов канала, читаемых за раз (на группу в памяти - CHUNK_SAMPLES * число каналов)
+CHUNK_SAMPLES = 1000000
+
+# Имена канала времени (без учёта регистра), как в tdms_to_blf_converter
+TIME_CHANNEL_NAMES = ('time', 'timestamp', 't')
+
+
 class FileDealer():
     def __init__(self, path):
         self.filderpath = path
@@ -56,96 +97,202 @@ class FileDealer():
                     self.add_item_fullpath(filename)
 
 
-    def convertall(self):
+    def convertall(self, jobs=1, chunk_samples=CHUNK_SAMPLES):
         startpoint = time.perf_counter_ns()
+        total = len(self.items_to_dealwith)
         successfully_converted = 0
-        for i, file in enumerate(self.items_to_dealwith):
-            #  print(file)
-            #  print(file[-5:])
-            res = None
-            res = self.convert_tdms_to_md4(file)
-            if res:
-                successfully_converted += 1
-
-        if successfully_converted == i and i > 0:
-            print("ALL OK")
+
+        if jobs > 1 and total > 1:
+            with ProcessPoolExecutor(max_workers=min(jobs, total)) as executor:
+                futures = [executor.submit(convert_tdms_file, file, chunk_samples)
+                           for file in self.items_to_dealwith]
+                for future in as_completed(futures):
+                    if report_conversion(future.result()):
+                        successfully_converted += 1
         else:
-            print(f"\nSuccess - {successfully_converted} from {i + 1} files")
+            for file in self.items_to_dealwith:
+                if self.convert_tdms_to_md4(file, chunk_samples):
+                    successfully_converted += 1
 
+        if successfully_converted == total and total > 0:
+            print("\nALL OK")
+        else:
+            print(f"\nSuccess - {successfully_converted} from {total} files")
 
-        print(f"time taken: {((time.perf_counter_ns())/1000000) - startpoint} ms.")
+        print(f"time taken: {(time.perf_counter_ns() - startpoint) / 1000000:.0f} ms.")
 
 
-    def convert_tdms_to_md4(self, filein):
-        try:
-            md4path = filein[:-4].replace("℃", "C") + "md4"
-            with TdmsFile.read(filein) as tdms_file:
-                #  print(type(tdms_file.groups()))
-                for group in tdms_file.groups():
+    def convert_tdms_to_md4(self, filein, chunk_samples=CHUNK_SAMPLES):
+        return report_conversion(convert_tdms_file(filein, chunk_samples))
 
-                    group_name = group.name
-                    #  print(type(group))
-
-                    #  print(f"{group_name = }")
-                    listofsignals = []
-                    timestampchannel = group["Time"]
-                    for i, channel in enumerate(group.channels()):
-                        #  print(f"{type(group.channels()) = }")
-                        channel_name = channel.name
-                        #  print(f"{channel_name = }")
-                        #  Signal(samples=None, timestamps=None, unit='', name='', info=None, comment='')¶
-                        listofsignals.append(Signal(samples=channel[:],timestamps=timestampchannel[:], name=channel_name))
-
-                        # Access dictionary of properties:
-                        properties = channel.properties
-                        # Access numpy array of data for channel:
-                        data = channel[:]
-                        # Access a subset of data
-                        #  if channel_name == 'ECU_Current':
-                        if channel_name == 'Time':
-                            data_subset = channel[:]
-                            #  print(data_subset)
-                            #  print(f"{type(data_subset) = }")
-                            #  print(dir(channel))
-
-                mdf_file = MDF(version='4.10')
-                mdf_file.append(listofsignals, comment='created by asammdf v8.2.9')
-
-                mdf_file.save(md4path)
-                mdf_file.close()
-                print("*", end="")
-        except Exception as e:
-            print(e)
-            return False
-        else:
-            return True
 
-def main():
-    print("file run")
+def mf4_path_for(filein):
+    """Имя выходного файла: <name>.mf4 рядом с TDMS, ℃ -> C (asammdf всё равно меняет суффикс на .mf4)"""
+    return filein[:-4].replace("℃", "C") + "mf4"
 
-    #  fd = FileDealer("C:\\Users\\belousov\\Documents\\PyScripts\\test_tdms\\folder_with_files")
-    #  fd.list_files()
 
-    #  print(fd)
+def find_time_channel(group):
+    for channel in group.channels():
+        if channel.name.lower() in TIME_CHANNEL_NAMES:
+            return channel
+    return None
 
 
-    #  fd.add_item_fullpath("C:\\Users\\belousov\\Documents\\PyScripts\\test_tdms\\endu_20250516\\20250516_1_23°C-(1)-(1)-Ignition cycle_0_50_0_1-20250516160156-1-23.0℃.tdms")
+def channel_unit(channel):
+    properties = channel.properties
+    return str(properties.get('unit_string', properties.get('unit', '')))
 
-    files_processed = files_written = files_scipped = wrong_filenames = 0
 
-    root = Tk()
-    root.withdraw()
-    PA = filedialog.askdirectory()
-    fd = FileDealer(PA)
-    fd.list_files()
-    print(fd)
+class GroupTimebase:
+    """Общая ось времени группы: канал времени или waveform свойства первого канала.
+    origin - начало отсчёта datetime64 для всего файла (None - берётся первая метка группы)"""
+
+    def __init__(self, time_channel, data_channels, origin=None):
+        self.time_channel = time_channel
+        if time_channel is not None:
+            self.length = len(time_channel)
+            self.increment = None
+        else:
+            first = data_channels[0] if data_channels else None
+            properties = first.properties if first is not None else {}
+            self.increment = properties.get('wf_increment')
+            self.start_offset = float(properties.get('wf_start_offset', 0.0))
+            self.length = len(first) if first is not None and self.increment else 0
+        self.origin = origin  # метка datetime64, от которой считаются секунды
+
+    def read(self, offset, length):
+        if self.time_channel is None:
+            return self.start_offset + np.arange(offset, offset + length, dtype=np.float64) * float(self.increment)
+
+        data = self.time_channel.read_data(offset, length)
+        if np.issubdtype(data.dtype, np.datetime64):
+            data = data.astype('datetime64[ns]')
+            if self.origin is None:
+                self.origin = data[0]
+            return (data - self.origin).astype(np.int64) / 1e9
+        return np.asarray(data, dtype=np.float64)
+
+
+def convert_group(mdf_file, group, chunk_samples, notes, origin=None):
+    """
+    Потоково пишет группу TDMS в одну группу каналов MDF. Возвращает (каналов, отсчётов, origin);
+    origin - общее для файла начало отсчёта (передаётся из предыдущих групп)
+    """
+    time_channel = find_time_channel(group)
+    candidates = [channel for channel in group.channels() if channel is not time_channel]
+    timebase = GroupTimebase(time_channel, candidates, origin)
+    if not timebase.length:
+        notes.append(f"group '{group.name}': no time channel or waveform timing, skipped")
+        return 0, 0, origin
+
+    channels = []
+    for channel in candidates:
+        if channel.dtype is None or channel.dtype.kind not in 'biuf':
+            notes.append(f"'{group.name}/{channel.name}': non-numeric ({channel.dtype}), skipped")
+        elif len(channel) != timebase.length:
+            notes.append(f"'{group.name}/{channel.name}': {len(channel)} samples, "
+                         f"time axis {timebase.length}, skipped")
+        else:
+            channels.append(channel)
+    if not channels:
+        notes.append(f"group '{group.name}': no numeric channels, skipped")
+        return 0, 0, origin
+
+    index = None
+    for offset in range(0, timebase.length, chunk_samples):
+        length = min(chunk_samples, timebase.length - offset)
+        timestamps = timebase.read(offset, length)
+        # каждый канал читается один раз - только свой кусок
+        chunks = [channel.read_data(offset, length) for channel in channels]
+        if index is None:
+            signals = [Signal(samples=samples, timestamps=timestamps, name=channel.name, unit=channel_unit(channel),
+                              comment=f"From group: {group.name}")
+                       for channel, samples in zip(channels, chunks)]
+            mdf_file.append(signals, acq_name=group.name, comment=group.name, common_timebase=True)
+            index = len(mdf_file.groups) - 1
+        else:
+            mdf_file.extend(index, [(timestamps, None)] + [(samples, None) for samples in chunks])
+
+    return len(channels), timebase.length, timebase.origin
+
+
+def convert_tdms_file(filein, chunk_samples=CHUNK_SAMPLES):
+    """
+    Потоковая конвертация одного TDMS в MF4. Возвращает словарь результата
+    (pickle-совместимый - вызывается и из ProcessPoolExecutor)
+    """
+    result = {'file': filein, 'ok': False, 'groups': 0, 'channels': 0, 'samples': 0, 'notes': [], 'error': None}
+    try:
+        mf4path = mf4_path_for(filein)
+        mdf_file = MDF(version='4.10')
+        start_time = None
+        try:
+            with TdmsFile.open(filein) as tdms_file:
+                for group in tdms_file.groups():
+                    # start_time - первая метка первой группы с datetime временем, общая для всех групп
+                    channels, samples, start_time = convert_group(mdf_file, group, chunk_samples,
+                                                                  result['notes'], start_time)
+                    if channels:
+                        result['groups'] += 1
+                        result['channels'] += channels
+                        result['samples'] += samples * channels
+
+            if start_time is not None:
+                mdf_file.header.start_time = datetime.fromtimestamp(
+                    start_time.astype('datetime64[ns]').astype(np.int64) / 1e9, tz=timezone.utc)
+            saved = mdf_file.save(mf4path, overwrite=True)
+        finally:
+            mdf_file.close()
+        result['output'] = str(saved)
+        result['ok'] = True
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+
+def report_conversion(result):
+    for note in result['notes']:
+        print(f"  {Path(result['file']).name}: {note}")
+    if result['ok']:
+        print("*", end="", flush=True)
+    else:
+        print(f"\n{result['file']}: {result['error']}")
+    return result['ok']
 
-    #  result = [y for x in os.walk(PA) for y in glob(os.path.join(x[0], '*.blf'))]
-    # result = [y for x in os.walk(PATH) for y in glob(os.path.join(x[0], '*.blf'))]
 
-    files_written = 0
+def main():
+    global CHUNK_SAMPLES
+
+    parser = argparse.ArgumentParser(description='TDMS -> MF4 converter (streaming, one channel group per TDMS group)')
+    parser.add_argument('paths', nargs='*', help='TDMS files or folders (default: choose a folder in a dialog)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Files converted in parallel (default: CPU count)')
+    parser.add_argument('--chunk', type=int, default=CHUNK_SAMPLES,
+                        help=f'Samples per channel read at once (default: {CHUNK_SAMPLES})')
+    args = parser.parse_args()
+    CHUNK_SAMPLES = max(1, args.chunk)
+
+    print("file run")
+
+    if not args.paths:
+        root = Tk()
+        root.withdraw()
+        PA = filedialog.askdirectory()
+        fd = FileDealer(PA)
+        fd.list_files()
+    else:
+        fd = FileDealer("./")
+        for path in args.paths:
+            if os.path.isdir(path):
+                folder = FileDealer(path)
+                folder.list_files()
+                for item in folder.items_to_dealwith:
+                    fd.add_item(item)
+            else:
+                fd.add_item(path)
+    print(fd)
 
-    fd.convertall()
+    fd.convertall(jobs=max(1, args.jobs), chunk_samples=CHUNK_SAMPLES)
 
 if __name__ == "__main__":
     main()
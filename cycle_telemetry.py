@@ -0,0 +1,428 @@
+"""
+Телеметрия циклов табличного плеера (SQLite)
+=============================================
+
+В режиме --cycle piter_roller_bench_table_player.py открывает новый BLF на каждый
+цикл и печатает время цикла. За несколько суток прогона нельзя было ответить на
+вопросы "когда начали опаздывать кадры" или "на каком шаге ЭБУ стал отвечать NRC".
+
+TelemetryStore - файл SQLite только на дозапись:
+- runs     - один прогон плеера (таблица, время запуска, пауза цикла)
+- cycles   - строка на цикл: плановое и фактическое начало, ошибка времени отправки
+             (mean/max), ответы, таймауты, NRC, ошибки передачи, BLF файл
+- commands - строка на кадр: плановое смещение, ошибка времени отправки, задержка
+             ответа, ответ, NRC (пусто, если ответ положительный)
+Строки цикла пишутся одной транзакцией после цикла, в паузе, а не во время отправки.
+
+ResponseCollector - can.Listener (в потоке can.Notifier): сопоставляет ответы 0x760
+с отправленными кадрами (pipelined_replay.response_matches, по порядку отправки).
+Кадр регистрируется до bus.send (register), время отправки дописывается после
+(confirm_send) - как в PipelinedReplayEngine, быстрый ответ не теряется.
+Положительный ответ 6F с эхом состояния клапанов сначала ищется среди запросов с
+тем же состоянием - один потерянный ответ не сдвигает сопоставление всех следующих.
+Запросы без ответа дольше timeout снимаются. NRC 0x78 (responsePending) не считается
+окончательным ответом.
+
+ИСПОЛЬЗОВАНИЕ:
+    python piter_roller_bench_table_player.py -t 1 --cycle --telemetry endurance.sqlite
+
+    python cycle_telemetry.py endurance.sqlite runs
+    python cycle_telemetry.py endurance.sqlite trend --bucket 100       # дрейф и отказы по 100 циклов
+    python cycle_telemetry.py endurance.sqlite failures --run 3         # шаги с NRC/таймаутами
+    python cycle_telemetry.py endurance.sqlite cycles --last 20
+"""
+
+import argparse
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import can
+
+from pipelined_replay import response_matches, sid_offset
+
+SCHEMA_VERSION = 1
+
+# Сколько ждать ответ ЭБУ на кадр таблицы (сек)
+DEFAULT_RESPONSE_TIMEOUT = 0.5
+
+RESPONSE_ID = 0x760
+
+# requestCorrectlyReceived-ResponsePending - ЭБУ ответит позже
+NRC_RESPONSE_PENDING = 0x78
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at TEXT NOT NULL,
+    table_name TEXT,
+    frames_per_cycle INTEGER,
+    cycle_duration_s REAL,
+    cycle_pause_s REAL,
+    note TEXT
+);
+CREATE TABLE IF NOT EXISTS cycles (
+    run_id INTEGER NOT NULL,
+    cycle_num INTEGER NOT NULL,
+    started_at TEXT NOT NULL,
+    planned_start_s REAL,
+    start_drift_ms REAL,
+    duration_s REAL,
+    frames INTEGER,
+    sent INTEGER,
+    send_errors INTEGER,
+    send_error_mean_us REAL,
+    send_error_max_us REAL,
+    late_frames INTEGER,
+    responses INTEGER,
+    timeouts INTEGER,
+    nrc_count INTEGER,
+    latency_mean_ms REAL,
+    latency_max_ms REAL,
+    blf_file TEXT,
+    PRIMARY KEY (run_id, cycle_num)
+);
+CREATE TABLE IF NOT EXISTS commands (
+    run_id INTEGER NOT NULL,
+    cycle_num INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    arbitration_id INTEGER,
+    data TEXT,
+    description TEXT,
+    planned_offset_s REAL,
+    send_error_us REAL,
+    send_failed INTEGER,
+    latency_ms REAL,
+    response TEXT,
+    nrc INTEGER,
+    PRIMARY KEY (run_id, cycle_num, idx)
+);
+CREATE INDEX IF NOT EXISTS commands_nrc ON commands (run_id, nrc);
+"""
+
+# Кадр считается опоздавшим, если ушёл позже дедлайна больше чем на это (мкс)
+LATE_THRESHOLD_US = 1000.0
+
+
+# ============================================================================
+# Сбор ответов
+# ============================================================================
+class CommandRecord:
+    __slots__ = ('idx', 'arbitration_id', 'data', 'description', 'planned_offset', 'send_time',
+                 'send_error', 'send_failed', 'latency', 'response', 'nrc')
+
+    def __init__(self, idx, msg, description, planned_offset, send_time, send_error, send_failed=False):
+        self.idx = idx
+        self.arbitration_id = msg.arbitration_id
+        self.data = bytes(msg.data)
+        self.description = description
+        self.planned_offset = planned_offset
+        self.send_time = send_time      # perf_counter
+        self.send_error = send_error    # секунды, None если отправка не удалась
+        self.send_failed = send_failed
+        self.latency = None
+        self.response = None
+        self.nrc = None
+
+
+class ResponseCollector(can.Listener):
+    """Сопоставляет ответы ЭБУ с кадрами текущего цикла"""
+
+    def __init__(self, response_id=RESPONSE_ID, timeout=DEFAULT_RESPONSE_TIMEOUT):
+        self.response_id = response_id
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self.records = []
+
+    def start_cycle(self):
+        with self._lock:
+            self._pending.clear()
+            self.records = []
+
+    def register(self, record):
+        """Кадр сейчас уйдёт (поток передачи, до bus.send); send_time - пока дедлайн"""
+        with self._lock:
+            self.records.append(record)
+            self._pending.append(record)
+
+    def confirm_send(self, record, send_time, send_error):
+        """Фактическое время отправки; задержка уже полученного ответа пересчитывается от него"""
+        with self._lock:
+            if record.latency is not None:
+                record.latency = max(0.0, record.latency - (send_time - record.send_time))
+            record.send_time = send_time
+            record.send_error = send_error
+
+    def mark_failed(self, record):
+        """bus.send не удался: запись остаётся в цикле, ответ на неё не ждётся"""
+        with self._lock:
+            record.send_failed = True
+            record.send_error = None
+            record.latency = record.response = record.nrc = None
+            if record in self._pending:
+                self._pending.remove(record)
+
+    def on_message_received(self, msg):
+        if msg.arbitration_id != self.response_id:
+            return
+        receive_time = time.perf_counter()
+        data = bytes(msg.data)
+        off = sid_offset(data)
+        if len(data) > off + 2 and data[off] == 0x7F and data[off + 2] == NRC_RESPONSE_PENDING:
+            return
+
+        with self._lock:
+            while self._pending and receive_time - self._pending[0].send_time > self.timeout:
+                self._pending.popleft()
+
+            matched = None
+            kind = None
+            for position, record in enumerate(self._pending):
+                record_kind = response_matches(record.data, data)
+                if record_kind is None:
+                    continue
+                if matched is None:
+                    matched, kind = position, record_kind
+                if record_kind == 'negative' or self._echo_matches(record.data, data):
+                    matched, kind = position, record_kind
+                    break
+            if matched is None:
+                return
+
+            record = self._pending[matched]
+            record.latency = receive_time - record.send_time
+            record.response = data
+            if kind == 'negative':
+                record.nrc = data[off + 2] if len(data) > off + 2 else 0
+            del self._pending[matched]
+
+    @staticmethod
+    def _echo_matches(request_data, response_data):
+        """2F DID 03 <state> -> 6F DID 03 <state>: совпадают ли байты после SID"""
+        req_off = sid_offset(request_data)
+        resp_off = sid_offset(response_data)
+        request_params = request_data[req_off + 1:req_off + request_data[0]] if req_off else request_data[1:]
+        response_params = response_data[resp_off + 1:resp_off + response_data[0]] if resp_off else response_data[1:]
+        return len(request_params) > 3 and request_params == response_params
+
+    def finish_cycle(self):
+        """Ждёт хвост ответов (до timeout после последней отправки) и возвращает записи цикла"""
+        with self._lock:
+            last_send = max((record.send_time for record in self.records), default=time.perf_counter())
+        end_wait = last_send + self.timeout
+        while time.perf_counter() < end_wait:
+            with self._lock:
+                if not self._pending:
+                    break
+            time.sleep(0.005)
+
+        with self._lock:
+            self._pending.clear()
+            records = self.records
+            self.records = []
+        return records
+
+
+# ============================================================================
+# Хранилище
+# ============================================================================
+class TelemetryStore:
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if row is None:
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+        elif int(row[0]) != SCHEMA_VERSION:
+            raise ValueError(f"{path}: unsupported telemetry schema version {row[0]}")
+        self.conn.commit()
+        self.run_id = None
+
+    def start_run(self, table_name, frames_per_cycle, cycle_duration, cycle_pause=None, note=None):
+        cursor = self.conn.execute(
+            "INSERT INTO runs (started_at, table_name, frames_per_cycle, cycle_duration_s, cycle_pause_s, note) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (datetime.now().isoformat(timespec='seconds'), table_name, frames_per_cycle,
+             cycle_duration, cycle_pause, note))
+        self.conn.commit()
+        self.run_id = cursor.lastrowid
+        return self.run_id
+
+    def record_cycle(self, cycle_num, records, planned_start, start_drift, duration, blf_file=None):
+        """
+        Одна транзакция на цикл: строка в cycles и строки в commands.
+        planned_start - смещение начала цикла от начала прогона (сек),
+        start_drift   - фактическая отправка первого кадра минус её дедлайн (сек)
+        """
+        send_errors_us = [record.send_error * 1e6 for record in records if record.send_error is not None]
+        latencies_ms = [record.latency * 1000.0 for record in records if record.latency is not None]
+        failed = sum(1 for record in records if record.send_failed)
+        nrc_count = sum(1 for record in records if record.nrc is not None)
+        timeouts = sum(1 for record in records if not record.send_failed and record.response is None)
+
+        cycle_row = (
+            self.run_id, cycle_num, datetime.now().isoformat(timespec='seconds'),
+            planned_start, start_drift * 1000.0 if start_drift is not None else None, duration,
+            len(records), len(records) - failed, failed,
+            sum(send_errors_us) / len(send_errors_us) if send_errors_us else None,
+            max(send_errors_us) if send_errors_us else None,
+            sum(1 for error in send_errors_us if error > LATE_THRESHOLD_US),
+            len(latencies_ms), timeouts, nrc_count,
+            sum(latencies_ms) / len(latencies_ms) if latencies_ms else None,
+            max(latencies_ms) if latencies_ms else None,
+            blf_file,
+        )
+        command_rows = [
+            (self.run_id, cycle_num, record.idx, record.arbitration_id, record.data.hex(' ').upper(),
+             record.description, record.planned_offset,
+             record.send_error * 1e6 if record.send_error is not None else None,
+             1 if record.send_failed else 0,
+             record.latency * 1000.0 if record.latency is not None else None,
+             record.response.hex(' ').upper() if record.response is not None else None,
+             record.nrc)
+            for record in records
+        ]
+
+        with self.conn:
+            self.conn.execute(f"INSERT OR REPLACE INTO cycles VALUES ({', '.join('?' * len(cycle_row))})", cycle_row)
+            self.conn.executemany("INSERT OR REPLACE INTO commands VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                  command_rows)
+        return cycle_row
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def format_cycle_summary(store, cycle_num):
+    row = store.conn.execute(
+        "SELECT start_drift_ms, send_error_max_us, late_frames, responses, timeouts, nrc_count, latency_max_ms "
+        "FROM cycles WHERE run_id = ? AND cycle_num = ?", (store.run_id, cycle_num)).fetchone()
+    if row is None:
+        return ""
+    drift, error_max, late, responses, timeouts, nrc, latency_max = row
+    # все отправки цикла могли упасть (bus-off) - тогда времён нет, печатаем "-"
+    drift = "-" if drift is None else f"{drift:.3f}"
+    error_max = "-" if error_max is None else f"{error_max:.0f}"
+    text = (f"Telemetry: start drift {drift} ms, max send error {error_max} us, "
+            f"late {late}, responses {responses}, timeouts {timeouts}, NRC {nrc}")
+    if latency_max is not None:
+        text += f", max latency {latency_max:.1f} ms"
+    return text
+
+
+# ============================================================================
+# Запросы
+# ============================================================================
+def _latest_run(conn):
+    row = conn.execute("SELECT MAX(run_id) FROM runs").fetchone()
+    return row[0]
+
+
+def _print_rows(headers, rows):
+    widths = [len(header) for header in headers]
+    text_rows = []
+    for row in rows:
+        cells = []
+        for value in row:
+            if value is None:
+                cells.append("-")
+            elif isinstance(value, float):
+                cells.append(f"{value:.3f}")
+            else:
+                cells.append(str(value))
+        text_rows.append(cells)
+        widths = [max(width, len(cell)) for width, cell in zip(widths, cells)]
+    print("  ".join(header.rjust(width) for header, width in zip(headers, widths)))
+    for cells in text_rows:
+        print("  ".join(cell.rjust(width) for cell, width in zip(cells, widths)))
+
+
+def query_runs(conn):
+    rows = conn.execute(
+        "SELECT r.run_id, r.started_at, r.table_name, r.frames_per_cycle, r.cycle_pause_s, "
+        "COUNT(c.cycle_num), SUM(c.timeouts), SUM(c.nrc_count), SUM(c.late_frames) "
+        "FROM runs r LEFT JOIN cycles c ON c.run_id = r.run_id GROUP BY r.run_id ORDER BY r.run_id").fetchall()
+    _print_rows(["run", "started", "table", "frames", "pause_s", "cycles", "timeouts", "nrc", "late"], rows)
+
+
+def query_trend(conn, run_id, bucket):
+    """Дрейф и отказы по группам из bucket циклов"""
+    rows = conn.execute(
+        "SELECT (cycle_num - 1) / ? * ? + 1 AS first_cycle, MAX(cycle_num), COUNT(*), "
+        "AVG(start_drift_ms), MAX(start_drift_ms), AVG(send_error_mean_us), MAX(send_error_max_us), "
+        "SUM(late_frames), SUM(send_errors), SUM(timeouts), SUM(nrc_count), AVG(latency_mean_ms), MAX(latency_max_ms) "
+        "FROM cycles WHERE run_id = ? GROUP BY first_cycle ORDER BY first_cycle",
+        (bucket, bucket, run_id)).fetchall()
+    _print_rows(["from", "to", "cycles", "drift_avg_ms", "drift_max_ms", "err_mean_us", "err_max_us",
+                 "late", "tx_fail", "timeouts", "nrc", "lat_avg_ms", "lat_max_ms"], rows)
+
+
+def query_failures(conn, run_id, limit):
+    """Шаги таблицы с NRC, таймаутами и ошибками передачи"""
+    rows = conn.execute(
+        "SELECT idx, data, description, "
+        "SUM(CASE WHEN nrc IS NOT NULL THEN 1 ELSE 0 END) AS nrc_total, "
+        "GROUP_CONCAT(DISTINCT CASE WHEN nrc IS NOT NULL THEN printf('0x%02X', nrc) END), "
+        "SUM(CASE WHEN response IS NULL AND send_failed = 0 THEN 1 ELSE 0 END) AS timeouts, "
+        "SUM(send_failed), MIN(cycle_num), MAX(cycle_num) "
+        "FROM commands WHERE run_id = ? AND (nrc IS NOT NULL OR response IS NULL OR send_failed = 1) "
+        "GROUP BY idx ORDER BY nrc_total + timeouts DESC, idx LIMIT ?",
+        (run_id, limit)).fetchall()
+    _print_rows(["idx", "data", "description", "nrc", "codes", "timeouts", "tx_fail", "first", "last"], rows)
+
+
+def query_cycles(conn, run_id, last):
+    rows = conn.execute(
+        "SELECT cycle_num, started_at, start_drift_ms, duration_s, sent, send_error_max_us, late_frames, "
+        "responses, timeouts, nrc_count, latency_max_ms FROM cycles WHERE run_id = ? "
+        "ORDER BY cycle_num DESC LIMIT ?", (run_id, last)).fetchall()
+    _print_rows(["cycle", "started", "drift_ms", "dur_s", "sent", "err_max_us", "late",
+                 "resp", "timeouts", "nrc", "lat_max_ms"], rows[::-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the table player cycle telemetry (SQLite)')
+    parser.add_argument('database', help='Telemetry file written with --telemetry')
+    parser.add_argument('query', nargs='?', default='trend', choices=['runs', 'trend', 'failures', 'cycles'])
+    parser.add_argument('--run', type=int, default=None, help='Run id (default: latest)')
+    parser.add_argument('--bucket', type=int, default=100, help='Cycles per trend row (default: 100)')
+    parser.add_argument('--last', type=int, default=20, help='Cycles to show for "cycles" (default: 20)')
+    parser.add_argument('--limit', type=int, default=30, help='Rows for "failures" (default: 30)')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(f"file:{args.database}?mode=ro", uri=True)
+    try:
+        if args.query == 'runs':
+            query_runs(conn)
+            return 0
+
+        run_id = args.run or _latest_run(conn)
+        if run_id is None:
+            print("No runs recorded")
+            return 1
+        print(f"Run {run_id}")
+        if args.query == 'trend':
+            query_trend(conn, run_id, max(1, args.bucket))
+        elif args.query == 'failures':
+            query_failures(conn, run_id, args.limit)
+        else:
+            query_cycles(conn, run_id, args.last)
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
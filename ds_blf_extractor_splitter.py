@@ -13,18 +13,37 @@ START_TIME и END_TIME - диапазон в секундах
 Выберите режим вырезки (раскомментируйте нужную функцию)
 
 Запустите программу - она создаст новый файл с префиксом part_of_
+
+Режим разбиения (split_blf) - этим уже можно пользоваться:
+большой BLF режется на части по N секунд или N МБ. Границы контейнеров и их время
+берутся из индекса blf_index.py (один проход по файлу, потом из кэша log.blf.blfidx),
+части пишутся параллельно процессами-воркерами, каждый распаковывает только свои
+контейнеры и копирует объекты как есть (метки времени остаются абсолютными).
+
+    python ds_blf_extractor_splitter.py night.blf --seconds 600
+    python ds_blf_extractor_splitter.py night.blf --mb 500 -o D:/logs/night_parts -j 6
+
+Вырезка интервала из нескольких файлов папки - blf_index.py extract.
 """
 
 
+import argparse
 import can
+import time
 from pathlib import Path
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import tkinter as tk
 from tkinter import ttk, messagebox
 from tkinter import filedialog
 import os
 
+import numpy as np
+
+from blf_index import get_index, load_index, iter_run_objects, object_time, RawBLFWriter
+from timebase import ABSOLUTE, format_report, is_clean, normalize_timestamps, timestamp_clock
+
 # ========== НАСТРОЙКИ ==========
 # Укажите здесь параметры для вырезки
 INPUT_BLF_FILE = "C:\\Users\\belousov\\Documents\\PyScripts\\CanBLF\\logs\\bogo_log_fixed_timestamps.blf"
@@ -260,42 +279,38 @@ def show_file_time_range(input_path):
 
     try:
         with can.BLFReader(input_path) as reader:
-            first_message = None
-            last_message = None
-            min_time = float('inf')
-            max_time = float('-inf')
-            message_count = 0
-
-            for message in reader:
-                if first_message is None:
-                    first_message = message
-                last_message = message
-                min_time = min(min_time, message.timestamp)
-                max_time = max(max_time, message.timestamp)
-                message_count += 1
+            timestamps = np.fromiter((message.timestamp for message in reader), dtype=np.float64)
 
-            if first_message is None:
-                print("Файл пустой!")
-                return
-
-            duration = max_time - min_time
-
-            print(f"Сообщений: {message_count}")
-            print(f"Абсолютное время первого сообщения: {first_message.timestamp}")
-            print(f"Абсолютное время последнего сообщения: {last_message.timestamp}")
-            print(f"Минимальное время: {min_time}")
-            print(f"Максимальное время: {max_time}")
-            print(f"Длительность файла: {duration:.3f} секунд")
-
-            # Определяем тип времени
-            if first_message.timestamp > 1000000000:  # Unix timestamp (после 2001 года)
-                print("Тип времени: АБСОЛЮТНОЕ (Unix timestamp)")
-                print(f"Дата начала: {unix_time_to_human(first_message.timestamp)}")
-                print(f"Дата окончания: {unix_time_to_human(last_message.timestamp)}")
-            else:
-                print("Тип времени: ОТНОСИТЕЛЬНОЕ")
+        if not len(timestamps):
+            print("Файл пустой!")
+            return
 
-            print(f"\nРекомендуемый диапазон для вырезки: 0 - {duration:.1f} секунд")
+        min_time = timestamps.min()
+        max_time = timestamps.max()
+        # переключения часов, скачки назад и нулевые метки - единая шкала (timebase)
+        fixed, report = normalize_timestamps(timestamps)
+        duration = fixed[-1] - fixed[0]
+
+        print(f"Сообщений: {len(timestamps)}")
+        print(f"Абсолютное время первого сообщения: {timestamps[0]}")
+        print(f"Абсолютное время последнего сообщения: {timestamps[-1]}")
+        print(f"Минимальное время: {min_time}")
+        print(f"Максимальное время: {max_time}")
+        print(f"Длительность файла: {duration:.3f} секунд")
+
+        # Определяем тип времени
+        if report['clock'] == ABSOLUTE:
+            print("Тип времени: АБСОЛЮТНОЕ (Unix timestamp)")
+            print(f"Дата начала: {unix_time_to_human(fixed[0])}")
+            print(f"Дата окончания: {unix_time_to_human(fixed[-1])}")
+        elif report['clock'] == 'mixed':
+            print("Тип времени: СМЕШАННОЕ (относительное и абсолютное) - исправьте файл logfixing_grok.py")
+        else:
+            print("Тип времени: ОТНОСИТЕЛЬНОЕ")
+        if not is_clean(report):
+            print(format_report(report))
+
+        print(f"\nРекомендуемый диапазон для вырезки: 0 - {duration:.1f} секунд")
 
     except Exception as e:
         print(f"Ошибка при анализе файла: {e}")
@@ -337,6 +352,116 @@ def extract_with_absolute_time(input_path, abs_start_time, abs_end_time):
         print(f"Ошибка: {e}")
         return False
 
+# ========== РАЗБИЕНИЕ НА ЧАСТИ ==========
+# индекс исходного файла в процессе-воркере (загружается один раз в _split_worker_init)
+_SPLIT_SOURCE = None
+
+
+def plan_parts_by_time(meta, containers, seconds):
+    """
+    Части по seconds секунд от первого объекта: [(номер, первый контейнер, последний, t0, t1)].
+    Контейнер попадает во все части, которые пересекает; объекты режутся по времени в воркере.
+    """
+    t_first = meta['t_first']
+    ranges = {}
+    for index, (_, _, _, t_min, t_max, count) in enumerate(containers):
+        if not count:
+            continue
+        for number in range(int((t_min - t_first) // seconds), int((t_max - t_first) // seconds) + 1):
+            first, last = ranges.get(number, (index, index))
+            ranges[number] = (min(first, index), max(last, index))
+    return [(number, first, last, t_first + number * seconds, t_first + (number + 1) * seconds)
+            for number, (first, last) in sorted(ranges.items())]
+
+
+def plan_parts_by_size(containers, megabytes):
+    """Части по ~megabytes МБ сжатых контейнеров: [(номер, первый контейнер, последний, None, None)]"""
+    limit = megabytes * 1024 * 1024
+    parts = []
+    first = 0
+    size = 0
+    for index, container in enumerate(containers):
+        size += container[1]
+        if size >= limit:
+            parts.append((len(parts), first, index, None, None))
+            first = index + 1
+            size = 0
+    if first < len(containers):
+        parts.append((len(parts), first, len(containers) - 1, None, None))
+    return parts
+
+
+def _split_worker_init(input_path):
+    global _SPLIT_SOURCE
+    meta, containers = load_index(input_path)
+    if meta is None:
+        raise RuntimeError(f"BLF index is missing or stale: {input_path}")
+    _SPLIT_SOURCE = (input_path, meta, containers)
+
+
+def _write_part(part, output_path):
+    """Воркер: объекты контейнеров части (с отсечкой [t0, t1) в режиме по времени) -> отдельный BLF"""
+    number, first, last, t0, t1 = part
+    input_path, meta, containers = _SPLIT_SOURCE
+    start_timestamp = meta['start_timestamp']
+
+    written = 0
+    with open(input_path, 'rb') as f, RawBLFWriter(output_path, start_timestamp=start_timestamp) as writer:
+        for data, objects in iter_run_objects(f, containers, first, last):
+            for start, end, _, flags, timestamp in objects:
+                if flags is None:
+                    continue
+                moment = object_time(flags, timestamp, start_timestamp)
+                if t0 is not None and not t0 <= moment < t1:
+                    continue
+                writer.add(data[start:end], moment, start_timestamp)
+                written += 1
+    return number, output_path, written
+
+
+def split_blf(input_path, seconds=None, megabytes=None, output_dir=None, jobs=None):
+    """
+    Режет BLF на части по seconds секунд или megabytes МБ.
+    Части: <output_dir>/<имя>_partNNN.blf, по умолчанию <папка лога>/<имя>_parts.
+    """
+    input_path = Path(input_path)
+    output_dir = Path(output_dir) if output_dir else input_path.parent / f"{input_path.stem}_parts"
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    started = time.perf_counter()
+    meta, containers = get_index(str(input_path))
+    if not meta['objects']:
+        print("Файл пустой!")
+        return []
+
+    if seconds:
+        parts = plan_parts_by_time(meta, containers, seconds)
+        mode = f"по {seconds:g} с"
+    else:
+        parts = plan_parts_by_size(containers, megabytes)
+        mode = f"по {megabytes:g} МБ"
+    digits = max(3, len(str(len(parts))))
+    print(f"Файл: {input_path} ({len(containers)} контейнеров, {meta['objects']} объектов, "
+          f"индекс за {time.perf_counter() - started:.1f} с)")
+    print(f"Разбиение {mode}: {len(parts)} частей -> {output_dir}")
+
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_split_worker_init,
+                             initargs=(str(input_path),)) as executor:
+        futures = [executor.submit(_write_part, part,
+                                   str(output_dir / f"{input_path.stem}_part{part[0] + 1:0{digits}d}.blf"))
+                   for part in parts]
+        for done, future in enumerate(as_completed(futures), start=1):
+            number, output_path, written = future.result()
+            results.append((number, output_path, written))
+            size_mb = os.path.getsize(output_path) / 1e6
+            print(f"  ({done}/{len(parts)}) {os.path.basename(output_path)}: {written} объектов, {size_mb:.1f} МБ")
+
+    results.sort()
+    print(f"Готово: {len(results)} частей за {time.perf_counter() - started:.1f} с")
+    return [output_path for _, output_path, _ in results]
+
+
 # ========== АВТОМАТИЧЕСКИЙ РЕЖИМ ==========
 def auto_extract(input_path, start_time_rel=10.0, end_time_rel=30.0):
     """
@@ -357,7 +482,7 @@ def auto_extract(input_path, start_time_rel=10.0, end_time_rel=30.0):
                 return False
 
             # Определяем тип времени
-            if first_message.timestamp > 1000000000:  # Вероятно Unix timestamp
+            if timestamp_clock(first_message.timestamp) == ABSOLUTE:  # Unix timestamp
                 print("Обнаружено абсолютное время (Unix timestamp)")
                 print(f"Первое сообщение: {first_message.timestamp}")
                 print(f"Дата: {unix_time_to_human(first_message.timestamp)}")
@@ -378,6 +503,24 @@ def auto_extract(input_path, start_time_rel=10.0, end_time_rel=30.0):
         return False
 
 def main():
+    parser = argparse.ArgumentParser(description='BLF segment extractor / splitter')
+    parser.add_argument('blf', nargs='?', default=None, help='BLF file (file dialog if omitted)')
+    split_mode = parser.add_mutually_exclusive_group()
+    split_mode.add_argument('--seconds', type=float, default=None, help='Split into parts of N seconds')
+    split_mode.add_argument('--mb', type=float, default=None, help='Split into parts of about N MB')
+    parser.add_argument('-o', '--output-dir', default=None, help='Folder for the parts (default: <name>_parts)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Worker processes (default: CPU count)')
+    args = parser.parse_args()
+
+    if args.seconds or args.mb:
+        path_to_blf = args.blf or select_file(" select BLF file")[0]
+        if not path_to_blf:
+            print("canceled")
+            return
+        split_blf(path_to_blf, seconds=args.seconds, megabytes=args.mb,
+                  output_dir=args.output_dir, jobs=args.jobs)
+        return
+
     print("=== ВЫРЕЗКА ОТРЕЗКА BLF ФАЙЛА ===")
 
 
@@ -0,0 +1,246 @@
+"""
+Эмулятор ответов ЭБУ по записанному логу
+========================================
+
+Без ЭБУ реплееры ждут 0x760 на каждый 0x740 до RESPONSE_TIMEOUT, и сухой прогон
+лога занимает минуты. Этот модуль учится на существующем логе (BLF/XLSX/CSV/ASCII):
+
+- пары запрос 2F -> ответ 6F берутся из analyze_commands анализатора
+  (piter_roller_bench_log_analyzer.py), то есть сопоставление то же, что в отчётах
+- для каждого запроса запоминаются встреченные ответы и задержки ответа;
+  на запрос отвечаем самым частым ответом, задержка - случайная выборка из
+  записанных для этого запроса (или из всех, если запрос не встречался)
+- остальные запросы (10, 3E, 14, незнакомые 2F) - ответ по умолчанию
+  can_loopback_harness.default_response с медианной задержкой лога
+
+Модель можно сохранить в JSON и отвечать на шине в реальном времени (EcuResponder)
+отдельным процессом - на шине, видимой другим процессам (--interface socketcan с vcan0,
+socketcand, kvaser с виртуальным каналом Kvaser), - или сразу прогнать реплеер против
+неё (--replay, python-can virtual внутри одного процесса). Шина python-can 'virtual'
+существует только внутри процесса, реплеер из другого процесса её не увидит.
+
+ИСПОЛЬЗОВАНИЕ:
+    python ecu_log_emulator.py AVA_OK.xlsx --interface socketcan --channel vcan0
+    python ecu_log_emulator.py AVA_OK.xlsx --interface kvaser --channel 0 --bitrate 500000
+    python ecu_log_emulator.py AVA_OK.xlsx --interface socketcand --channel can0   # host/port - в конфиге python-can
+    python ecu_log_emulator.py AVA_OK.xlsx --save-model ava_ecu.json       # только построить модель
+    python ecu_log_emulator.py ava_ecu.json --replay AVA_OK.xlsx --pipelined
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import can
+
+from pipelined_replay import sid_offset
+from can_loopback_harness import EcuResponder, default_response, replay_file
+
+MODEL_VERSION = 1
+
+# Задержка ответа, если в логе не нашлось ни одной пары (сек)
+DEFAULT_LATENCY = 0.005
+
+
+def hex_to_bytes(hex_data):
+    return bytes(int(b, 16) for b in hex_data.split())
+
+
+def request_key(data):
+    """Полезные байты запроса/ответа без PCI и выравнивания: 06 2F 4B 12 03 55 43 00 -> 2F 4B 12 03 55 43"""
+    data = bytes(data)
+    if sid_offset(data) == 1:
+        return data[1:1 + data[0]]
+    return data
+
+
+def with_pci_like(request_data, payload):
+    """Оформляет ответ в том же формате, что и запрос (с PCI и до 8 байт или без)"""
+    if sid_offset(bytes(request_data)) == 1:
+        return (bytes([len(payload)]) + payload).ljust(8, b'\x00')
+    return bytes(payload)
+
+
+class LearnedEcuModel:
+    def __init__(self, seed=None):
+        self.responses = defaultdict(Counter)   # ключ запроса -> Counter ответов
+        self.latencies = defaultdict(list)      # ключ запроса -> задержки, сек
+        self.all_latencies = []
+        self.rng = random.Random(seed)
+        self.source = None
+
+    # ------------------------------------------------------------------
+    # Обучение
+    # ------------------------------------------------------------------
+    def learn_pairs(self, command_pairs):
+        """command_pairs - stats['command_pairs'] из analyze_commands"""
+        for pair in command_pairs:
+            request = request_key(hex_to_bytes(pair['request']['data']))
+            response = request_key(hex_to_bytes(pair['response']['data']))
+            latency = pair['response_time'] / 1000.0
+            if not request or not response or latency < 0:
+                continue
+            self.responses[request][response] += 1
+            self.latencies[request].append(latency)
+            self.all_latencies.append(latency)
+        return self
+
+    @classmethod
+    def from_log(cls, file_path, file_type='auto', seed=None):
+        """Строит модель по логу через парсеры и analyze_commands анализатора"""
+        import piter_roller_bench_log_analyzer as analyzer
+
+        if file_type == 'auto':
+            file_type = analyzer.detect_file_format(file_path)
+        messages = analyzer.parse_input_file(file_path, file_type)
+        command_stats = analyzer.analyze_commands(messages, file_type)
+
+        model = cls(seed=seed).learn_pairs(command_stats['command_pairs'])
+        model.source = str(file_path)
+        return model
+
+    # ------------------------------------------------------------------
+    # Ответы
+    # ------------------------------------------------------------------
+    def respond(self, arbitration_id, request_data):
+        """callable для EcuResponder: ответ на запрос (формат PCI - как у запроса)"""
+        counter = self.responses.get(request_key(request_data))
+        if counter:
+            payload = counter.most_common(1)[0][0]
+            return with_pci_like(request_data, payload)
+        return default_response(request_data)
+
+    def sample_latency(self, request_data):
+        """callable для EcuResponder: задержка из записанного распределения"""
+        samples = self.latencies.get(request_key(request_data)) or self.all_latencies
+        if not samples:
+            return DEFAULT_LATENCY
+        return self.rng.choice(samples)
+
+    def median_latency(self):
+        return statistics.median(self.all_latencies) if self.all_latencies else DEFAULT_LATENCY
+
+    def summary(self):
+        lines = [f"ECU model: {len(self.responses)} distinct requests, {len(self.all_latencies)} pairs"
+                 + (f" from {self.source}" if self.source else "")]
+        if self.all_latencies:
+            ordered = sorted(self.all_latencies)
+            count = len(ordered)
+            lines.append(f"  Latency: min {ordered[0] * 1000:.2f} ms, median {self.median_latency() * 1000:.2f} ms, "
+                         f"p95 {ordered[min(count - 1, int(0.95 * count))] * 1000:.2f} ms, "
+                         f"max {ordered[-1] * 1000:.2f} ms")
+        ambiguous = sum(1 for counter in self.responses.values() if len(counter) > 1)
+        if ambiguous:
+            lines.append(f"  Requests with more than one recorded response: {ambiguous} (most common is used)")
+        return '\n'.join(lines)
+
+    # ------------------------------------------------------------------
+    # Сохранение
+    # ------------------------------------------------------------------
+    def save(self, path):
+        data = {
+            'version': MODEL_VERSION,
+            'source': self.source,
+            'requests': [
+                {
+                    'request': key.hex(' ').upper(),
+                    'responses': {resp.hex(' ').upper(): count for resp, count in counter.items()},
+                    'latencies_s': self.latencies[key],
+                }
+                for key, counter in self.responses.items()
+            ],
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        print(f"[ECU model] Saved: {path}")
+
+    @classmethod
+    def load(cls, path, seed=None):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != MODEL_VERSION:
+            raise ValueError(f"Unsupported ECU model version: {data.get('version')}")
+
+        model = cls(seed=seed)
+        model.source = data.get('source')
+        for item in data['requests']:
+            key = bytes.fromhex(item['request'])
+            for resp, count in item['responses'].items():
+                model.responses[key][bytes.fromhex(resp)] = count
+            model.latencies[key] = list(item['latencies_s'])
+            model.all_latencies.extend(item['latencies_s'])
+        return model
+
+
+def load_model(path, file_type='auto', seed=None):
+    """JSON модели или лог, по которому её построить"""
+    if Path(path).suffix.lower() == '.json':
+        return LearnedEcuModel.load(path, seed=seed)
+    return LearnedEcuModel.from_log(path, file_type, seed=seed)
+
+
+def parse_channel(channel):
+    """'0' -> 0 (kvaser, virtual), 'vcan0' / 'can0' - как есть (socketcan, socketcand)"""
+    return int(channel) if channel.isdigit() else channel
+
+
+def serve(model, channel=0, interface='virtual', loss=0.0, bitrate=None):
+    """Отвечает на шине до Ctrl+C"""
+    if interface == 'virtual':
+        print("[ECU] Warning: the python-can virtual bus exists only inside this process - "
+              "use --interface socketcan/socketcand/kvaser to serve another process, or --replay")
+    options = {'bitrate': bitrate} if bitrate else {}
+    bus = can.Bus(interface=interface, channel=channel, receive_own_messages=False, **options)
+    responder = EcuResponder(bus, latency=model.sample_latency, respond=model.respond, loss=loss).start()
+    print(f"[ECU] Answering on {interface} channel {channel}, Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        responder.stop()
+        bus.shutdown()
+    print(f"[ECU] received {responder.received}, answered {responder.answered}, dropped {responder.dropped}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ECU 0x760 response emulator learned from a recorded log')
+    parser.add_argument('source', help='BLF/XLSX/CSV/ASCII log to learn from, or a saved model (.json)')
+    parser.add_argument('-t', '--type', default='auto',
+                        choices=['auto', 'blf', 'csv', 'xlsx', 'xlsx_custom', 'ascii'],
+                        help='Log type for the analyzer parsers (default: auto)')
+    parser.add_argument('--save-model', type=str, default=None, help='Save the learned model to JSON and exit')
+    parser.add_argument('--replay', type=str, default=None,
+                        help='Run replay_universal_pci_fix on this log against the emulator (virtual bus)')
+    parser.add_argument('--pipelined', action='store_true', help='Pipelined replay mode for --replay')
+    parser.add_argument('--interface', default='virtual',
+                        help='python-can interface to answer on: socketcan, socketcand, kvaser, ... '
+                             '(default: virtual - in-process only, useful with --replay)')
+    parser.add_argument('--channel', default='0', help='Channel to answer on: 0, vcan0, can0 (default: 0)')
+    parser.add_argument('--bitrate', type=int, default=None, help='Bus bitrate for hardware interfaces')
+    parser.add_argument('--loss', type=float, default=0.0, help='Share of dropped responses 0..1')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    model = load_model(args.source, args.type, seed=args.seed)
+    print(model.summary())
+
+    if args.save_model:
+        model.save(args.save_model)
+        return
+
+    if args.replay:
+        replay_file(args.replay, pipelined=args.pipelined, latency=model.sample_latency,
+                    loss=args.loss, respond=model.respond)
+    else:
+        serve(model, channel=parse_channel(args.channel), interface=args.interface,
+              loss=args.loss, bitrate=args.bitrate)
+
+
+if __name__ == "__main__":
+    main()
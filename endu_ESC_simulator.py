@@ -9,18 +9,43 @@ ESC Block Simulator - 30 Second Test Duration
 - Стенд отправляет на 0x720
 - ESC (этот симулятор) отвечает на 0x728
 
+Несколько стендов: один событийный цикл (MultiESCHost) обслуживает N независимых
+экземпляров ESC на разных парах ID. Обработчик выбирается по готовой таблице
+COMMAND_HANDLERS, таймеры экземпляров (окончание теста, статистика) - в одной куче
+без потоков на экземпляр, вывод кадров - в фоновом потоке (AsyncLogWriter).
+В конце печатается задержка ответа (p50/p99/max) по экземплярам.
+
+Сценарии: JSON файл (--scenarios, пример - endu_esc_scenarios.json) задаёт для каждого
+номера сценария длительность, STATUS ответа на START (0x02 - давление не соответствует),
+переходы STATUS ответа на POLL по времени и инъекции отрицательных ответов (по номеру
+команды или окну времени). Время сценариев идёт по SimClock: --speed 50 проходит
+30-секундный сценарий за 0.6 с. --matrix прогоняет все сценарии так, как их проходит
+стенд (INIT, START, POLL до завершения, RESET), на virtual шине.
+
 ИСПОЛЬЗОВАНИЕ:
   python esc_simulator_30s.py            # реальный канал 1 (физически канал 2)
   python esc_simulator_30s.py --virtual  # виртуальная шина
   python esc_simulator_30s.py --debug    # с расширенным дебагом
+  python esc_simulator_30s.py --instances 8                 # 0x720/0x728, 0x730/0x738, ...
+  python esc_simulator_30s.py --pair 0x720:0x728 --pair 0x7A0:0x7A8
+  python esc_simulator_30s.py --load-test --instances 16    # нагрузочный тест на virtual шине
+  python esc_simulator_30s.py --scenarios endu_esc_scenarios.json --speed 50
+  python esc_simulator_30s.py --scenarios endu_esc_scenarios.json --speed 100 --matrix
 """
 
 import can
 import time
 import argparse
+import heapq
+import json
+import itertools
 import threading
+from array import array
 from datetime import datetime
 
+from async_log_writer import AsyncLogWriter
+from replay_scheduler import ReplayScheduler
+
 # ANSI Colors
 COLOR_RESET = "\033[0m"
 COLOR_RED = "\033[91m"
@@ -42,20 +67,209 @@ TEST_DURATION = 30.0  # секунды
 STEND_ID = 0x720  # ID команд от стенда
 ESC_ID = 0x728    # ID ответов от ESC
 
+# Несколько экземпляров: ID запроса/ответа экземпляра k = STEND_ID/ESC_ID + k * INSTANCE_ID_STEP
+INSTANCE_ID_STEP = 0x10
+
+# Нагрузочный тест: 500 кбит/с ~ 4000 кадров/с, половина из них - запросы стенда
+LOAD_TEST_RATE = 2000      # запросов в секунду на все экземпляры
+LOAD_TEST_DURATION = 10.0  # секунды
+
+# Ускорение времени сценариев (1.0 = реальное время) и файл сценариев (None = все по TEST_DURATION)
+SIM_SPEED = 1.0
+SCENARIOS_FILE = None
+
+# Прогон матрицы сценариев: интервал опроса POLL со стороны стенда, сек времени симулятора
+MATRIX_POLL_INTERVAL = 1.0
+
 DEBUG_MODE = False
 
 # Фильтры вывода
 PRINT_ONLY_CMDS = True   # True = показывать только 0x720 и 0x728, False = все CAN сообщения
 PRINT_STATS = False      # True = показывать статистику каждые 5 сек, False = не показывать
 
+# ============================================================================
+# VIRTUAL CLOCK
+# ============================================================================
+class SimClock:
+    """
+    Часы сценариев: время симулятора идёт в speed раз быстрее реального.
+    speed=1 - обычный режим, 50 - 30-секундный сценарий проходит за 0.6 с.
+    """
+
+    def __init__(self, speed=1.0):
+        if speed <= 0:
+            raise ValueError(f"Clock speed must be positive, got {speed}")
+        self.speed = speed
+        self._origin = time.perf_counter()
+
+    def now(self):
+        """Время симулятора, секунды"""
+        return (time.perf_counter() - self._origin) * self.speed
+
+    def real_delay(self, sim_seconds):
+        """Сколько реальных секунд длится sim_seconds времени симулятора"""
+        return sim_seconds / self.speed
+
+# ============================================================================
+# SCENARIOS
+# ============================================================================
+START_STATUS_NOT_RECEIVED = 0x00
+START_STATUS_STARTED = 0x01
+STATUS_PRESSURE_MISMATCH = 0x02
+
+POLL_STATUS_RUNNING = 0x00
+POLL_STATUS_COMPLETE = 0x01
+
+
+class ScenarioSpec:
+    """
+    Описание одного сценария:
+    duration     - длительность, сек (времени симулятора)
+    start_status - STATUS ответа на START: 0x01 запущен, 0x00 не получен, 0x02 давление не соответствует
+    transitions  - [(at, status), ...] STATUS ответа на POLL начиная с момента at
+    negative     - инъекции отрицательных ответов 7F CMD CTR NRC
+    """
+
+    def __init__(self, duration=TEST_DURATION, start_status=START_STATUS_STARTED,
+                 transitions=None, negative=None):
+        self.duration = duration
+        self.start_status = start_status
+        if transitions is None:
+            transitions = [(0.0, POLL_STATUS_RUNNING), (duration, POLL_STATUS_COMPLETE)]
+        self.transitions = sorted(transitions)
+        self.negative = negative or []
+
+    def poll_status(self, elapsed):
+        status = POLL_STATUS_RUNNING
+        for at, transition_status in self.transitions:
+            if elapsed < at:
+                break
+            status = transition_status
+        return status
+
+    def find_negative(self, command, occurrence, elapsed):
+        """NRC для команды (occurrence - номер команды с начала сценария, с 1) или None"""
+        for rule in self.negative:
+            if rule['command'] != command:
+                continue
+            if rule['nth'] is not None and rule['nth'] != occurrence:
+                continue
+            if elapsed is not None:
+                if rule['from'] is not None and elapsed < rule['from']:
+                    continue
+                if rule['to'] is not None and elapsed >= rule['to']:
+                    continue
+            elif rule['from'] is not None or rule['to'] is not None:
+                continue
+            return rule['nrc']
+        return None
+
+    def describe(self):
+        parts = [f"{self.duration:g}s"]
+        if self.start_status != START_STATUS_STARTED:
+            parts.append(f"START->0x{self.start_status:02X}")
+        default = [(0.0, POLL_STATUS_RUNNING), (self.duration, POLL_STATUS_COMPLETE)]
+        if self.transitions != default:
+            parts.append("POLL " + ", ".join(f"{at:g}s:0x{status:02X}" for at, status in self.transitions))
+        if self.negative:
+            parts.append(f"{len(self.negative)} NRC rule(s)")
+        return "; ".join(parts)
+
+
+def _parse_byte(value, what):
+    if isinstance(value, str):
+        value = int(value, 0)
+    if not isinstance(value, int) or not 0 <= value <= 0xFF:
+        raise ValueError(f"{what}: expected a byte 0..0xFF, got {value!r}")
+    return value
+
+
+def parse_scenario(item, what):
+    """dict из JSON -> ScenarioSpec (с проверкой полей)"""
+    known = {'duration', 'start_status', 'transitions', 'negative', 'comment'}
+    unknown = set(item) - known
+    if unknown:
+        raise ValueError(f"{what}: unknown field(s) {sorted(unknown)}")
+
+    duration = float(item.get('duration', TEST_DURATION))
+    if duration <= 0:
+        raise ValueError(f"{what}: duration must be positive")
+    start_status = _parse_byte(item.get('start_status', START_STATUS_STARTED), f"{what}.start_status")
+
+    transitions = None
+    if 'transitions' in item:
+        transitions = []
+        for index, transition in enumerate(item['transitions']):
+            where = f"{what}.transitions[{index}]"
+            if 'at' not in transition or 'status' not in transition:
+                raise ValueError(f"{where}: 'at' and 'status' are required")
+            transitions.append((float(transition['at']), _parse_byte(transition['status'], f"{where}.status")))
+
+    command_codes = {name: code for code, name in COMMAND_NAMES.items()}
+    negative = []
+    for index, rule in enumerate(item.get('negative', [])):
+        where = f"{what}.negative[{index}]"
+        command = rule.get('command')
+        if isinstance(command, str) and command.upper() in command_codes:
+            command = command_codes[command.upper()]
+        else:
+            command = _parse_byte(command, f"{where}.command")
+        nrc = _parse_byte(rule.get('nrc'), f"{where}.nrc")
+        negative.append({
+            'command': command,
+            'nrc': nrc,
+            'nth': int(rule['nth']) if 'nth' in rule else None,
+            'from': float(rule['from']) if 'from' in rule else None,
+            'to': float(rule['to']) if 'to' in rule else None,
+        })
+
+    return ScenarioSpec(duration, start_status, transitions, negative)
+
+
+def load_scenarios(path):
+    """
+    JSON файл сценариев:
+    {
+      "default": {"duration": 30},
+      "scenarios": {
+        "1": {"duration": 30},
+        "2": {"start_status": "0x02"},
+        "3": {"duration": 20, "transitions": [{"at": 0, "status": 0}, {"at": 20, "status": 1}]},
+        "4": {"negative": [{"command": "POLL", "nth": 3, "nrc": "0x22"}]}
+      }
+    }
+    Возвращает (default ScenarioSpec, {номер сценария: ScenarioSpec})
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    default = parse_scenario(data.get('default', {}), "default")
+    scenarios = {}
+    for key, item in data.get('scenarios', {}).items():
+        number = _parse_byte(key, f"scenario key {key!r}")
+        merged = dict(data.get('default', {}))
+        merged.update(item)
+        scenarios[number] = parse_scenario(merged, f"scenarios[{key}]")
+    return default, scenarios
+
 # ============================================================================
 # STATE MACHINE
 # ============================================================================
 class ESCSimulator:
-    def __init__(self):
+    def __init__(self, scenarios=None, default_scenario=None, clock=None):
+        """
+        scenarios        - {номер: ScenarioSpec}; неописанные сценарии используют default_scenario
+        default_scenario - ScenarioSpec по умолчанию (TEST_DURATION, обычный ход)
+        clock            - SimClock (по умолчанию реальное время)
+        """
+        self.scenarios = scenarios or {}
+        self.default_scenario = default_scenario or ScenarioSpec()
+        self.clock = clock or SimClock()
         self.test_running = False
         self.test_start_time = None
         self.current_scenario = None
+        self.current_spec = None
+        self.command_counts = {}
         self.lock = threading.Lock()
         self.stats = {
             'total_received': 0,
@@ -63,17 +277,28 @@ class ESCSimulator:
             'commands_poll': 0,
             'commands_reset': 0,
             'commands_init': 0,
-            'responses_sent': 0
+            'responses_sent': 0,
+            'negative_injected': 0
         }
 
+    def scenario_spec(self, scenario_num):
+        return self.scenarios.get(scenario_num, self.default_scenario)
+
     def start_test(self, scenario_num):
-        """Запуск тестового сценария"""
+        """Запуск тестового сценария. Возвращает STATUS для ответа на START"""
+        spec = self.scenario_spec(scenario_num)
         with self.lock:
+            self.stats['commands_start'] += 1
+            if spec.start_status != START_STATUS_STARTED:
+                debug_print(f"Test not started: scenario {scenario_num}, STATUS=0x{spec.start_status:02X}", "WARN")
+                return spec.start_status
             self.test_running = True
-            self.test_start_time = time.time()
+            self.test_start_time = self.clock.now()
             self.current_scenario = scenario_num
-            self.stats['commands_start'] += 1
-            debug_print(f"Test started: scenario {scenario_num}", "INFO")
+            self.current_spec = spec
+            self.command_counts = {}
+            debug_print(f"Test started: scenario {scenario_num} ({spec.describe()})", "INFO")
+            return START_STATUS_STARTED
 
     def reset_test(self):
         """Сброс тестового сценария"""
@@ -81,6 +306,8 @@ class ESCSimulator:
             self.test_running = False
             self.test_start_time = None
             self.current_scenario = None
+            self.current_spec = None
+            self.command_counts = {}
             self.stats['commands_reset'] += 1
             debug_print("Test reset", "INFO")
 
@@ -88,20 +315,38 @@ class ESCSimulator:
         """Получить статус выполнения теста"""
         with self.lock:
             if not self.test_running or self.test_start_time is None:
-                return 0x00  # Не запущен
-
-            elapsed = time.time() - self.test_start_time
-            if elapsed >= TEST_DURATION:
-                return 0x01  # Завершён
-            else:
-                return 0x00  # Выполняется
+                return POLL_STATUS_RUNNING  # Не запущен
+            return self.current_spec.poll_status(self.clock.now() - self.test_start_time)
 
     def get_elapsed_time(self):
         """Получить время выполнения"""
         with self.lock:
             if self.test_start_time is None:
                 return 0.0
-            return time.time() - self.test_start_time
+            return self.clock.now() - self.test_start_time
+
+    def get_duration(self):
+        spec = self.current_spec or self.default_scenario
+        return spec.duration
+
+    def injected_nrc(self, command, scenario_num):
+        """NRC, если сценарий требует отрицательный ответ на эту команду, иначе None"""
+        with self.lock:
+            if self.test_running:
+                spec = self.current_spec
+                elapsed = self.clock.now() - self.test_start_time
+            else:
+                # START и INIT до запуска: правила сценария из CTR, без временного окна
+                spec = self.scenario_spec(scenario_num)
+                elapsed = None
+            if not spec.negative:
+                return None
+            occurrence = self.command_counts.get(command, 0) + 1
+            self.command_counts[command] = occurrence
+            nrc = spec.find_negative(command, occurrence, elapsed)
+            if nrc is not None:
+                self.stats['negative_injected'] += 1
+            return nrc
 
 # ============================================================================
 # KVASER HARDWARE CHECK
@@ -200,10 +445,10 @@ def handle_command_start(data, simulator):
         return None
 
     scenario = data[1]  # CTR
-    simulator.start_test(scenario)
+    status = simulator.start_test(scenario)
 
-    # Ответ: всегда успешный запуск
-    response = [0x81, scenario, 0x01, 0x00, 0x00, 0x00, 0x00, 0x00]
+    # Ответ: STATUS из описания сценария (по умолчанию - успешный запуск)
+    response = [0x81, scenario, status, 0x00, 0x00, 0x00, 0x00, 0x00]
     return bytes(response)
 
 def handle_command_poll(data, simulator):
@@ -255,33 +500,71 @@ def handle_command_init(data, simulator):
     response = [0x84, scenario, 0x00, 0x01, 0x00, 0x00, 0x00, 0x00]
     return bytes(response)
 
+# Таблица обработчиков строится один раз, а не на каждый кадр
+COMMAND_HANDLERS = {
+    0x01: handle_command_start,
+    0x02: handle_command_poll,
+    0x03: handle_command_reset,
+    0x04: handle_command_init,
+}
+
+COMMAND_NAMES = {
+    0x01: "START",
+    0x02: "POLL",
+    0x03: "RESET",
+    0x04: "INIT",
+}
+
+
+def build_response(data, simulator):
+    """Ответ на команду стенда (None - не отвечать)"""
+    handler = COMMAND_HANDLERS.get(data[0])
+    if handler is None:
+        debug_print(f"Unknown command: 0x{data[0]:02X}", "WARN")
+        # Negative response: неверная команда
+        return bytes([0x7F, data[0], 0x00, 0x01, 0x00, 0x00, 0x00, 0x00])
+
+    # Отрицательный ответ, заданный сценарием
+    nrc = simulator.injected_nrc(data[0], data[1])
+    if nrc is not None:
+        debug_print(f"Injected negative response: {COMMAND_NAMES[data[0]]} NRC=0x{nrc:02X}", "WARN")
+        return bytes([0x7F, data[0], data[1], nrc, 0x00, 0x00, 0x00, 0x00])
+    return handler(data, simulator)
+
+
+def format_exchange(request_id, request_data, response_id, response_data):
+    """Строки [RX]/[TX] для консоли (вызывается в потоке записи)"""
+    cmd = request_data[0]
+    cmd_name = COMMAND_NAMES.get(cmd, f"0x{cmd:02X}")
+
+    # Цвет ответа
+    if response_data[0] == 0x7F:
+        color = COLOR_RED
+        resp_name = "ERROR"
+    elif response_data[0] == 0x82 and len(response_data) >= 3:
+        if response_data[2] == 0x00:
+            color = COLOR_YELLOW
+            resp_name = "RUNNING"
+        else:
+            color = COLOR_GREEN
+            resp_name = "COMPLETE"
+    else:
+        color = COLOR_GREEN
+        resp_name = "OK"
+
+    return (f"{COLOR_WHITE}[RX] 0x{request_id:03X}: {format_hex(request_data):<24} ({cmd_name}){COLOR_RESET}\n"
+            f"{color}[TX] 0x{response_id:03X}: {format_hex(response_data):<24} ({resp_name}){COLOR_RESET}\n")
+
+
 def process_message(msg, simulator, bus):
-    """Обработка входящего сообщения"""
+    """Обработка входящего сообщения (один экземпляр, синхронный вывод)"""
     simulator.stats['total_received'] += 1
 
     if len(msg.data) < 2:
         debug_print(f"Ignoring short message: {format_hex(msg.data)}", "WARN")
         return
 
-    cmd = msg.data[0]
-
-    # Определяем обработчик
-    handlers = {
-        0x01: handle_command_start,
-        0x02: handle_command_poll,
-        0x03: handle_command_reset,
-        0x04: handle_command_init,
-    }
-
-    handler = handlers.get(cmd)
-
-    if handler is None:
-        debug_print(f"Unknown command: 0x{cmd:02X}", "WARN")
-        # Negative response: неверная команда
-        response_data = bytes([0x7F, cmd, 0x00, 0x01, 0x00, 0x00, 0x00, 0x00])
-    else:
-        response_data = handler(msg.data, simulator)
-
+    response_data = build_response(msg.data, simulator)
     if response_data is None:
         return
 
@@ -295,38 +578,374 @@ def process_message(msg, simulator, bus):
     try:
         bus.send(response_msg)
         simulator.stats['responses_sent'] += 1
+        print(format_exchange(STEND_ID, msg.data, ESC_ID, response_data))
 
-        # Логирование
-        cmd_names = {
-            0x01: "START",
-            0x02: "POLL",
-            0x03: "RESET",
-            0x04: "INIT",
-        }
-        cmd_name = cmd_names.get(cmd, f"0x{cmd:02X}")
-
-        print(f"{COLOR_WHITE}[RX] 0x{STEND_ID:03X}: {format_hex(msg.data):<24} ({cmd_name}){COLOR_RESET}")
-
-        # Цвет ответа
-        if response_data[0] == 0x7F:
-            color = COLOR_RED
-            resp_name = "ERROR"
-        elif response_data[0] == 0x82 and len(response_data) >= 3:
-            if response_data[2] == 0x00:
-                color = COLOR_YELLOW
-                resp_name = "RUNNING"
-            else:
-                color = COLOR_GREEN
-                resp_name = "COMPLETE"
+    except Exception as e:
+        print(f"{COLOR_RED}Error sending response: {e}{COLOR_RESET}")
+
+# ============================================================================
+# MULTI-INSTANCE EVENT LOOP
+# ============================================================================
+class ESCInstance:
+    """Один виртуальный ESC: своя пара ID, свой автомат состояний и статистика задержек"""
+
+    def __init__(self, index, request_id, response_id, scenarios=None, default_scenario=None, clock=None):
+        self.index = index
+        self.request_id = request_id
+        self.response_id = response_id
+        self.simulator = ESCSimulator(scenarios, default_scenario, clock)
+        self.latencies = array('d')  # секунды, от приёма запроса до отправки ответа
+        self.timer_generation = 0    # таймеры от прошлых START/RESET игнорируются
+
+    def name(self):
+        return f"ESC#{self.index} 0x{self.request_id:03X}/0x{self.response_id:03X}"
+
+
+def latency_summary(latencies):
+    """p50/p99/max в миллисекундах"""
+    if not latencies:
+        return None
+    ordered = sorted(latencies)
+    count = len(ordered)
+    return {
+        'count': count,
+        'p50_ms': ordered[count // 2] * 1000.0,
+        'p99_ms': ordered[min(count - 1, int(0.99 * count))] * 1000.0,
+        'max_ms': ordered[-1] * 1000.0,
+    }
+
+
+def make_instance_pairs(count, base_request_id=STEND_ID, base_response_id=ESC_ID, step=INSTANCE_ID_STEP):
+    return [(base_request_id + k * step, base_response_id + k * step) for k in range(count)]
+
+
+class MultiESCHost:
+    """
+    Событийный цикл на одном потоке: bus.recv до ближайшего таймера, диспетчеризация
+    по arbitration_id в словарь экземпляров, таймеры - куча (deadline, seq, callback).
+    """
+
+    def __init__(self, bus, pairs, log_writer=None, verbose=True, scenarios=None, default_scenario=None, clock=None):
+        """scenarios/default_scenario/clock - см. ESCSimulator, общие для всех экземпляров"""
+        self.bus = bus
+        self.clock = clock or SimClock()
+        self.instances = {}
+        for index, (request_id, response_id) in enumerate(pairs):
+            self.instances[request_id] = ESCInstance(index, request_id, response_id,
+                                                     scenarios, default_scenario, self.clock)
+        self.log_writer = log_writer
+        self.verbose = verbose and log_writer is not None
+
+        self._timers = []
+        self._seq = itertools.count()
+        self.running = False
+        self.frames_received = 0
+        self.frames_ignored = 0
+
+    # ------------------------------------------------------------------
+    # Таймеры
+    # ------------------------------------------------------------------
+    def add_timer(self, delay, callback):
+        heapq.heappush(self._timers, (time.perf_counter() + delay, next(self._seq), callback))
+
+    def _run_due_timers(self, now):
+        while self._timers and self._timers[0][0] <= now:
+            _, _, callback = heapq.heappop(self._timers)
+            callback()
+
+    def _schedule_completion(self, instance):
+        instance.timer_generation += 1
+        generation = instance.timer_generation
+        scenario = instance.simulator.current_scenario
+        duration = instance.simulator.get_duration()
+
+        def on_complete():
+            if generation == instance.timer_generation and self.log_writer:
+                self.log_writer.print(f"{COLOR_GREEN}[{instance.name()}] scenario {scenario} "
+                                      f"complete ({duration:g}s){COLOR_RESET}")
+
+        self.add_timer(self.clock.real_delay(duration), on_complete)
+
+    def _schedule_stats(self, interval=5.0):
+        def on_stats():
+            if self.running:
+                self.log_writer.console(format_host_status, self)
+                self.add_timer(interval, on_stats)
+
+        self.add_timer(interval, on_stats)
+
+    # ------------------------------------------------------------------
+    # Обработка кадров
+    # ------------------------------------------------------------------
+    def handle(self, msg, received_at):
+        instance = self.instances.get(msg.arbitration_id)
+        if instance is None:
+            self.frames_ignored += 1
+            return
+
+        simulator = instance.simulator
+        simulator.stats['total_received'] += 1
+        data = msg.data
+        if len(data) < 2:
+            debug_print(f"[{instance.name()}] Ignoring short message: {format_hex(data)}", "WARN")
+            return
+
+        response_data = build_response(data, simulator)
+        if response_data is None:
+            return
+
+        try:
+            self.bus.send(can.Message(arbitration_id=instance.response_id, data=response_data,
+                                      is_extended_id=False))
+        except Exception as e:
+            if self.log_writer:
+                self.log_writer.print(f"{COLOR_RED}[{instance.name()}] Error sending response: {e}{COLOR_RESET}")
+            return
+
+        instance.latencies.append(time.perf_counter() - received_at)
+        simulator.stats['responses_sent'] += 1
+
+        cmd = data[0]
+        if cmd == 0x01 and simulator.test_running:
+            self._schedule_completion(instance)
+        elif cmd == 0x03:
+            instance.timer_generation += 1
+
+        if self.verbose:
+            self.log_writer.console(format_exchange, instance.request_id, bytes(data),
+                                    instance.response_id, response_data)
+
+    def run(self, duration=None, stats_interval=None):
+        """Цикл до Ctrl+C, stop() или duration секунд"""
+        self.running = True
+        end_time = time.perf_counter() + duration if duration else None
+        if stats_interval and self.log_writer:
+            self._schedule_stats(stats_interval)
+
+        try:
+            while self.running:
+                now = time.perf_counter()
+                self._run_due_timers(now)
+                if end_time is not None and now >= end_time:
+                    break
+
+                timeout = 0.1
+                if self._timers:
+                    timeout = min(timeout, max(0.0, self._timers[0][0] - now))
+                if end_time is not None:
+                    timeout = min(timeout, max(0.0, end_time - now))
+
+                msg = self.bus.recv(timeout=timeout)
+                if msg is not None:
+                    self.frames_received += 1
+                    self.handle(msg, time.perf_counter())
+        finally:
+            self.running = False
+
+    def stop(self):
+        self.running = False
+
+    def latency_report(self):
+        lines = ["Response latency (receive -> send):"]
+        all_latencies = array('d')
+        for instance in self.instances.values():
+            all_latencies.extend(instance.latencies)
+            summary = latency_summary(instance.latencies)
+            if summary is None:
+                lines.append(f"  {instance.name()}: no responses")
+                continue
+            lines.append(f"  {instance.name()}: {summary['count']} responses, p50 {summary['p50_ms']:.3f} ms, "
+                         f"p99 {summary['p99_ms']:.3f} ms, max {summary['max_ms']:.3f} ms")
+        summary = latency_summary(all_latencies)
+        if summary is not None and len(self.instances) > 1:
+            lines.append(f"  ALL: {summary['count']} responses, p50 {summary['p50_ms']:.3f} ms, "
+                         f"p99 {summary['p99_ms']:.3f} ms, max {summary['max_ms']:.3f} ms")
+        return '\n'.join(lines)
+
+
+def format_host_status(host):
+    """Короткий статус всех экземпляров (для периодического вывода)"""
+    lines = [f"{COLOR_CYAN}--- {len(host.instances)} ESC instances, {host.frames_received} frames received ---{COLOR_RESET}"]
+    for instance in host.instances.values():
+        simulator = instance.simulator
+        if simulator.test_running:
+            state = f"scenario {simulator.current_scenario}, {simulator.get_elapsed_time():.1f}s"
         else:
-            color = COLOR_GREEN
-            resp_name = "OK"
+            state = "IDLE"
+        lines.append(f"  {instance.name()}: {state}, responses {simulator.stats['responses_sent']}")
+    return '\n'.join(lines)
 
-        print(f"{color}[TX] 0x{ESC_ID:03X}: {format_hex(response_data):<24} ({resp_name}){COLOR_RESET}")
-        print()
 
-    except Exception as e:
-        print(f"{COLOR_RED}Error sending response: {e}{COLOR_RESET}")
+# ============================================================================
+# LOAD TEST (virtual bus)
+# ============================================================================
+def run_load_test(pairs, rate=LOAD_TEST_RATE, duration=LOAD_TEST_DURATION, channel="esc_load_test"):
+    """
+    Стенд и MultiESCHost на одной virtual шине: стенд запускает сценарий на каждом
+    экземпляре и опрашивает их по кругу с частотой rate запросов/с.
+    Печатает достигнутую частоту, задержку обработки (host) и round-trip со стороны стенда.
+    """
+    host_bus = can.Bus(interface='virtual', channel=channel, receive_own_messages=False)
+    stand_bus = can.Bus(interface='virtual', channel=channel, receive_own_messages=False)
+    host = MultiESCHost(host_bus, pairs, log_writer=None, verbose=False)
+
+    response_to_request = {response_id: request_id for request_id, response_id in pairs}
+    sent_times = {request_id: [] for request_id, _ in pairs}
+    round_trips = array('d')
+
+    class StandReceiver(can.Listener):
+        def on_message_received(self, msg):
+            request_id = response_to_request.get(msg.arbitration_id)
+            if request_id is None:
+                return
+            queue_ = sent_times[request_id]
+            if queue_:
+                round_trips.append(time.perf_counter() - queue_.pop(0))
+
+    host_thread = threading.Thread(target=host.run, kwargs={'duration': duration + 2.0}, daemon=True)
+    host_thread.start()
+    notifier = can.Notifier(stand_bus, [StandReceiver()], timeout=0.05)
+
+    def send(request_id, data):
+        sent_times[request_id].append(time.perf_counter())
+        stand_bus.send(can.Message(arbitration_id=request_id, data=data, is_extended_id=False))
+
+    print(f"{COLOR_CYAN}Load test: {len(pairs)} instances, {rate} req/s, {duration:.0f}s{COLOR_RESET}")
+    for request_id, _ in pairs:
+        send(request_id, [0x01, 0x01, 0, 0, 0, 0, 0, 0])
+    time.sleep(0.1)
+
+    scheduler = ReplayScheduler()
+    scheduler.start(0.0)
+    total = int(rate * duration)
+    request_ids = [request_id for request_id, _ in pairs]
+    for i in range(total):
+        deadline = scheduler.wait_until(i / rate)
+        send(request_ids[i % len(request_ids)], [0x02, 0x01, 0, 0, 0, 0, 0, 0])
+        scheduler.record_send(deadline)
+    elapsed = time.perf_counter() - scheduler.start_perf
+
+    time.sleep(0.2)
+    host.stop()
+    host_thread.join(timeout=2.0)
+    notifier.stop()
+    lost = sum(len(queue_) for queue_ in sent_times.values())
+    stand_bus.shutdown()
+    host_bus.shutdown()
+
+    print(f"{COLOR_WHITE}Sent {total} polls in {elapsed:.2f}s ({total / elapsed:.0f} req/s), "
+          f"responses {len(round_trips)}, lost {lost}{COLOR_RESET}")
+    print(f"{COLOR_WHITE}{host.latency_report()}{COLOR_RESET}")
+    summary = latency_summary(round_trips)
+    if summary:
+        print(f"{COLOR_WHITE}Stand round-trip: p50 {summary['p50_ms']:.3f} ms, p99 {summary['p99_ms']:.3f} ms, "
+              f"max {summary['max_ms']:.3f} ms{COLOR_RESET}")
+    print(f"{COLOR_WHITE}{scheduler.format_report()}{COLOR_RESET}")
+    return host
+
+# ============================================================================
+# SCENARIO MATRIX (virtual bus)
+# ============================================================================
+def _exchange(bus, request_id, response_id, data, timeout=1.0):
+    """Запрос стенда и ожидание ответа ESC (None - нет ответа)"""
+    bus.send(can.Message(arbitration_id=request_id, data=data, is_extended_id=False))
+    end_time = time.perf_counter() + timeout
+    while True:
+        remaining = end_time - time.perf_counter()
+        if remaining <= 0:
+            return None
+        msg = bus.recv(timeout=remaining)
+        if msg is not None and msg.arbitration_id == response_id:
+            return bytes(msg.data)
+
+
+def run_scenario(bus, clock, scenario, spec, request_id=STEND_ID, response_id=ESC_ID,
+                 poll_interval=MATRIX_POLL_INTERVAL):
+    """
+    Один сценарий так, как его проходит стенд: INIT, START, POLL до завершения, RESET.
+    Возвращает словарь результата.
+    """
+    result = {'scenario': scenario, 'outcome': None, 'polls': 0, 'nrc': [],
+              'sim_time': 0.0, 'real_time': 0.0}
+    real_start = time.perf_counter()
+    sim_start = clock.now()
+
+    def finish(outcome):
+        _exchange(bus, request_id, response_id, [0x03, 0xFF, 0, 0, 0, 0, 0, 0])
+        result['outcome'] = outcome
+        result['sim_time'] = clock.now() - sim_start
+        result['real_time'] = time.perf_counter() - real_start
+        return result
+
+    for cmd, name in ((0x04, "INIT"), (0x01, "START")):
+        response = _exchange(bus, request_id, response_id, [cmd, scenario if cmd == 0x01 else 0x01, 0, 0, 0, 0, 0, 0])
+        if response is None:
+            return finish(f"{name} TIMEOUT")
+        if response[0] == 0x7F:
+            result['nrc'].append(f"{name}:0x{response[3]:02X}")
+            return finish(f"{name} NRC 0x{response[3]:02X}")
+
+    if response[2] == STATUS_PRESSURE_MISMATCH:
+        return finish("PRESSURE MISMATCH (START)")
+    if response[2] != START_STATUS_STARTED:
+        return finish(f"NOT STARTED (0x{response[2]:02X})")
+
+    # запас на случай сценария, который не завершается
+    limit = spec.duration * 2 + 10 * poll_interval
+    while clock.now() - sim_start < limit:
+        time.sleep(clock.real_delay(poll_interval))
+        response = _exchange(bus, request_id, response_id, [0x02, scenario, 0, 0, 0, 0, 0, 0])
+        result['polls'] += 1
+        if response is None:
+            return finish("POLL TIMEOUT")
+        if response[0] == 0x7F:
+            result['nrc'].append(f"POLL:0x{response[3]:02X}")
+            continue
+        if response[2] == POLL_STATUS_COMPLETE:
+            return finish("COMPLETE")
+        if response[2] == STATUS_PRESSURE_MISMATCH:
+            return finish("PRESSURE MISMATCH")
+    return finish("NOT COMPLETED")
+
+
+def run_scenario_matrix(scenario_numbers, scenarios=None, default_scenario=None, speed=SIM_SPEED,
+                        poll_interval=MATRIX_POLL_INTERVAL, channel="esc_scenario_matrix"):
+    """Все сценарии подряд против MultiESCHost на virtual шине с ускоренными часами"""
+    scenarios = scenarios or {}
+    default_scenario = default_scenario or ScenarioSpec()
+    clock = SimClock(speed)
+
+    host_bus = can.Bus(interface='virtual', channel=channel, receive_own_messages=False)
+    stand_bus = can.Bus(interface='virtual', channel=channel, receive_own_messages=False)
+    host = MultiESCHost(host_bus, [(STEND_ID, ESC_ID)], log_writer=None, verbose=False,
+                        scenarios=scenarios, default_scenario=default_scenario, clock=clock)
+    host_thread = threading.Thread(target=host.run, daemon=True)
+    host_thread.start()
+
+    print(f"{COLOR_CYAN}Scenario matrix: {len(scenario_numbers)} scenarios, clock x{speed:g}, "
+          f"poll every {poll_interval:g}s (sim){COLOR_RESET}")
+    results = []
+    real_start = time.perf_counter()
+    try:
+        for scenario in scenario_numbers:
+            spec = scenarios.get(scenario, default_scenario)
+            result = run_scenario(stand_bus, clock, scenario, spec, poll_interval=poll_interval)
+            results.append(result)
+            color = COLOR_GREEN if result['outcome'] == "COMPLETE" else COLOR_YELLOW
+            nrc = f", NRC {' '.join(result['nrc'])}" if result['nrc'] else ""
+            print(f"{color}  Scenario {scenario:3d} [{spec.describe()}]: {result['outcome']}, "
+                  f"{result['polls']} polls{nrc}, {result['sim_time']:.1f}s sim / "
+                  f"{result['real_time']:.2f}s real{COLOR_RESET}")
+    finally:
+        host.stop()
+        host_thread.join(timeout=2.0)
+        stand_bus.shutdown()
+        host_bus.shutdown()
+
+    total_sim = sum(result['sim_time'] for result in results)
+    print(f"{COLOR_WHITE}Matrix done: {total_sim:.1f}s of scenario time in "
+          f"{time.perf_counter() - real_start:.2f}s{COLOR_RESET}")
+    return results
 
 # ============================================================================
 # STATUS DISPLAY
@@ -337,17 +956,17 @@ def display_status(simulator):
     print(f"{COLOR_CYAN}ESC SIMULATOR STATUS{COLOR_RESET}")
     print(f"{COLOR_CYAN}{'='*70}{COLOR_RESET}")
 
-    with simulator.lock:
-        if simulator.test_running and simulator.test_start_time:
-            elapsed = time.time() - simulator.test_start_time
-            remaining = max(0, TEST_DURATION - elapsed)
-            progress = min(100, (elapsed / TEST_DURATION) * 100)
+    if simulator.test_running:
+        elapsed = simulator.get_elapsed_time()
+        duration = simulator.get_duration()
+        remaining = max(0, duration - elapsed)
+        progress = min(100, (elapsed / duration) * 100)
 
-            print(f"{COLOR_WHITE}Test running: Scenario {simulator.current_scenario}{COLOR_RESET}")
-            print(f"{COLOR_YELLOW}Elapsed: {elapsed:.1f}s / {TEST_DURATION:.1f}s ({progress:.0f}%){COLOR_RESET}")
-            print(f"{COLOR_YELLOW}Remaining: {remaining:.1f}s{COLOR_RESET}")
-        else:
-            print(f"{COLOR_WHITE}Status: IDLE{COLOR_RESET}")
+        print(f"{COLOR_WHITE}Test running: Scenario {simulator.current_scenario}{COLOR_RESET}")
+        print(f"{COLOR_YELLOW}Elapsed: {elapsed:.1f}s / {duration:.1f}s ({progress:.0f}%){COLOR_RESET}")
+        print(f"{COLOR_YELLOW}Remaining: {remaining:.1f}s{COLOR_RESET}")
+    else:
+        print(f"{COLOR_WHITE}Status: IDLE{COLOR_RESET}")
 
     print(f"\n{COLOR_WHITE}Statistics:{COLOR_RESET}")
     print(f"  Total received: {simulator.stats['total_received']}")
@@ -356,6 +975,8 @@ def display_status(simulator):
     print(f"  Commands RESET: {simulator.stats['commands_reset']}")
     print(f"  Commands INIT:  {simulator.stats['commands_init']}")
     print(f"  Responses sent: {simulator.stats['responses_sent']}")
+    if simulator.stats['negative_injected']:
+        print(f"  Injected NRC:   {simulator.stats['negative_injected']}")
     print(f"{COLOR_CYAN}{'='*70}{COLOR_RESET}\n")
 
 # ============================================================================
@@ -372,6 +993,30 @@ def status_display_thread(simulator, running_flag):
         if running_flag['running']:
             display_status(simulator)
 
+def run_multi_instance(bus, pairs, scenarios=None, default_scenario=None, clock=None):
+    """Событийный цикл MultiESCHost до Ctrl+C"""
+    for request_id, response_id in pairs:
+        print(f"{COLOR_WHITE}Listening on 0x{request_id:03X}, responding on 0x{response_id:03X}{COLOR_RESET}")
+    print(f"{COLOR_YELLOW}Press Ctrl+C to stop{COLOR_RESET}")
+    print(f"{COLOR_CYAN}{'='*70}{COLOR_RESET}\n")
+
+    log_writer = AsyncLogWriter()
+    host = MultiESCHost(bus, pairs, log_writer=log_writer, verbose=DEBUG_MODE,
+                        scenarios=scenarios, default_scenario=default_scenario, clock=clock)
+    with bus:
+        try:
+            host.run(stats_interval=5.0 if PRINT_STATS else None)
+        except KeyboardInterrupt:
+            print(f"\n{COLOR_YELLOW}Interrupted by user{COLOR_RESET}")
+        finally:
+            log_writer.close()
+
+    print(format_host_status(host))
+    print(f"{COLOR_WHITE}{host.latency_report()}{COLOR_RESET}")
+    print(f"{COLOR_WHITE}{log_writer.format_report()}{COLOR_RESET}")
+    print(f"{COLOR_GREEN}Simulator stopped{COLOR_RESET}")
+    return 0
+
 # ============================================================================
 # MAIN
 # ============================================================================
@@ -389,9 +1034,59 @@ def main():
                         help='Enable debug output')
     parser.add_argument('--quiet', '-q', action='store_true',
                         help='Disable auto-debug (only errors)')
+    parser.add_argument('--instances', '-n', type=int, default=1,
+                        help=f'Number of ESC instances, IDs step 0x{INSTANCE_ID_STEP:X} (default: 1)')
+    parser.add_argument('--pair', action='append', default=[], metavar='REQ:RESP',
+                        help='Explicit request:response ID pair, e.g. 0x720:0x728 (repeatable)')
+    parser.add_argument('--load-test', action='store_true',
+                        help='Run a load test against the instances on a python-can virtual bus and exit')
+    parser.add_argument('--rate', type=float, default=LOAD_TEST_RATE,
+                        help=f'Load test requests per second (default: {LOAD_TEST_RATE})')
+    parser.add_argument('--duration', type=float, default=LOAD_TEST_DURATION,
+                        help=f'Load test duration, seconds (default: {LOAD_TEST_DURATION:.0f})')
+
+    parser.add_argument('--scenarios', type=str, default=SCENARIOS_FILE,
+                        help='Scenario definitions (JSON): duration, status transitions, injected NRC')
+    parser.add_argument('--speed', type=float, default=SIM_SPEED,
+                        help='Scenario clock speed-up, e.g. 50 = 30 s scenario in 0.6 s (default: 1)')
+    parser.add_argument('--matrix', nargs='?', const='all', default=None, metavar='N,N,...',
+                        help='Run the stand test matrix on a python-can virtual bus and exit '
+                             '(default: all scenarios from --scenarios)')
 
     args = parser.parse_args()
 
+    default_scenario = ScenarioSpec()
+    scenarios = {}
+    if args.scenarios:
+        try:
+            default_scenario, scenarios = load_scenarios(args.scenarios)
+        except (OSError, ValueError) as e:
+            print(f"{COLOR_RED}Failed to load scenarios {args.scenarios}: {e}{COLOR_RESET}")
+            return 1
+        print(f"{COLOR_WHITE}Scenarios loaded: {len(scenarios)} from {args.scenarios}{COLOR_RESET}")
+    clock = SimClock(args.speed)
+
+    if args.matrix is not None:
+        if args.matrix == 'all':
+            scenario_numbers = sorted(scenarios) or [1]
+        else:
+            scenario_numbers = [int(number, 0) for number in args.matrix.split(',')]
+        run_scenario_matrix(scenario_numbers, scenarios, default_scenario, speed=args.speed)
+        return 0
+
+    if args.pair:
+        pairs = []
+        for pair in args.pair:
+            request_id, _, response_id = pair.partition(':')
+            pairs.append((int(request_id, 0), int(response_id, 0)))
+    else:
+        pairs = make_instance_pairs(max(1, args.instances))
+    multi_instance = len(pairs) > 1 or pairs[0] != (STEND_ID, ESC_ID)
+
+    if args.load_test:
+        run_load_test(pairs, rate=args.rate, duration=args.duration)
+        return 0
+
     # Включаем дебаг по умолчанию, если не указан --quiet
     if args.debug or not args.quiet:
         DEBUG_MODE = True
@@ -403,7 +1098,7 @@ def main():
     print(f"{COLOR_BOLD}{COLOR_CYAN}{'='*70}{COLOR_RESET}")
     print(f"{COLOR_WHITE}Channel: {CHANNEL} (физически канал 2 на Kvaser){COLOR_RESET}")
     print(f"{COLOR_WHITE}Bitrate: {BITRATE} bps{COLOR_RESET}")
-    print(f"{COLOR_WHITE}Test duration: {TEST_DURATION} seconds{COLOR_RESET}")
+    print(f"{COLOR_WHITE}Test duration: {default_scenario.duration:g} seconds (clock x{args.speed:g}){COLOR_RESET}")
     print(f"{COLOR_WHITE}Virtual mode: {'YES' if args.virtual else 'NO'}{COLOR_RESET}")
     print(f"{COLOR_WHITE}Debug mode: {'YES' if DEBUG_MODE else 'NO'}{COLOR_RESET}")
     print(f"{COLOR_WHITE}Print only 0x720/0x728: {'YES' if PRINT_ONLY_CMDS else 'NO (all CAN)'}{COLOR_RESET}")
@@ -422,7 +1117,7 @@ def main():
         print(f"{COLOR_YELLOW}canlib not available, skipping hardware check{COLOR_RESET}")
 
     # Создаём симулятор
-    simulator = ESCSimulator()
+    simulator = ESCSimulator(scenarios, default_scenario, clock)
 
     # Подключение к CAN
     try:
@@ -478,6 +1173,9 @@ def main():
             print(f"{COLOR_RED}✗ Test message send FAILED: {e}{COLOR_RESET}")
         print()
 
+        if multi_instance:
+            return run_multi_instance(bus, pairs, scenarios, default_scenario, clock)
+
         print(f"{COLOR_WHITE}Listening on 0x{STEND_ID:03X}, responding on 0x{ESC_ID:03X}{COLOR_RESET}")
         print(f"{COLOR_YELLOW}Press Ctrl+C to stop{COLOR_RESET}")
         print(f"{COLOR_CYAN}{'='*70}{COLOR_RESET}\n")
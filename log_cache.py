@@ -0,0 +1,150 @@
+"""
+Кэш распарсенных логов (XLSX/ASCII/CSV -> NPZ рядом с исходником)
+==================================================================
+
+Заводские XLSX и ASCII логи при каждом запуске анализатора или реплеера парсятся заново.
+Этот модуль сохраняет результат парсинга в сжатый .npz рядом с исходным файлом:
+
+    AVA_OK.xlsx  ->  AVA_OK.xlsx.<profile>.cache.npz
+
+profile - кто и как парсил (у анализатора и реплееров разные выходные данные),
+например "analyzer_xlsx_custom" или "replay_740".
+
+Кэш считается свежим, если совпадают размер и mtime исходника, версия формата кэша
+и params (настройки парсера, влияющие на результат). Иначе он пересобирается.
+Принудительная пересборка - флаг --rebuild-cache в скриптах.
+
+Для CAN сообщений есть готовые преобразования:
+    messages_to_columns(messages) -> timestamp, can_id, is_rx, is_extended, dlc, payload
+    columns_to_messages(columns)  -> список can.Message
+
+ИСПОЛЬЗОВАНИЕ:
+    columns, meta = load_cache(path, "replay_740")
+    if columns is None:
+        messages = parse(path)
+        save_cache(path, "replay_740", messages_to_columns(messages))
+"""
+
+import json
+import os
+
+import numpy as np
+
+# Версия формата - при изменении структуры кэша старые файлы пересобираются
+CACHE_VERSION = 1
+
+CACHE_SUFFIX = ".cache.npz"
+
+
+def cache_path_for(source_path, profile):
+    """Путь к файлу кэша рядом с исходником"""
+    return f"{source_path}.{profile}{CACHE_SUFFIX}"
+
+
+def _source_signature(source_path):
+    stat = os.stat(source_path)
+    return {'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns}
+
+
+def load_cache(source_path, profile, params=None):
+    """
+    Загружает кэш, если он свежий.
+    Возвращает (columns: dict[str, np.ndarray], meta: dict) или (None, None).
+    """
+    path = cache_path_for(source_path, profile)
+    if not os.path.exists(path):
+        return None, None
+
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['__meta__']))
+            expected = dict(_source_signature(source_path),
+                            cache_version=CACHE_VERSION,
+                            profile=profile,
+                            params=params or {})
+            for key, value in expected.items():
+                if meta.get(key) != value:
+                    print(f"[LogCache] Stale cache ({key} changed): {path}")
+                    return None, None
+
+            columns = {key: data[key] for key in data.files if key != '__meta__'}
+    except Exception as e:
+        print(f"[LogCache] Could not read cache {path}: {e}")
+        return None, None
+
+    print(f"[LogCache] Loaded {profile} cache: {path}")
+    return columns, meta
+
+
+def save_cache(source_path, profile, columns, params=None, extra_meta=None):
+    """
+    Сохраняет колонки (dict имя -> массив/список одинаковой длины) в сжатый .npz.
+    extra_meta - произвольные JSON-сериализуемые данные (например тип источника лога).
+    Ошибки записи (папка только для чтения и т.п.) не прерывают работу.
+    """
+    path = cache_path_for(source_path, profile)
+    meta = dict(_source_signature(source_path),
+                cache_version=CACHE_VERSION,
+                profile=profile,
+                params=params or {},
+                extra=extra_meta or {})
+
+    arrays = {key: np.asarray(value) for key, value in columns.items()}
+    arrays['__meta__'] = np.asarray(json.dumps(meta, ensure_ascii=False))
+
+    tmp_path = path + ".tmp.npz"
+    try:
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        print(f"[LogCache] Saved {profile} cache: {path}")
+        return path
+    except Exception as e:
+        print(f"[LogCache] Could not write cache {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+
+def messages_to_columns(messages):
+    """Список can.Message -> колонки (timestamp, id, направление, payload)"""
+    count = len(messages)
+    max_len = max((len(msg.data) for msg in messages), default=8)
+
+    payload = np.zeros((count, max_len), dtype=np.uint8)
+    dlc = np.zeros(count, dtype=np.uint8)
+    for i, msg in enumerate(messages):
+        length = len(msg.data)
+        payload[i, :length] = np.frombuffer(bytes(msg.data), dtype=np.uint8)
+        dlc[i] = length
+
+    return {
+        'timestamp': np.array([msg.timestamp for msg in messages], dtype=np.float64),
+        'can_id': np.array([msg.arbitration_id for msg in messages], dtype=np.uint32),
+        'is_rx': np.array([msg.is_rx for msg in messages], dtype=bool),
+        'is_extended': np.array([msg.is_extended_id for msg in messages], dtype=bool),
+        'dlc': dlc,
+        'payload': payload,
+    }
+
+
+def columns_to_messages(columns):
+    """Колонки из messages_to_columns -> список can.Message"""
+    import can
+
+    timestamps = columns['timestamp'].tolist()
+    can_ids = columns['can_id'].tolist()
+    is_rx = columns['is_rx'].tolist()
+    is_extended = columns['is_extended'].tolist()
+    dlc = columns['dlc'].tolist()
+    payload = columns['payload']
+
+    messages = []
+    for i in range(len(timestamps)):
+        messages.append(can.Message(
+            arbitration_id=can_ids[i],
+            data=payload[i, :dlc[i]].tobytes(),
+            timestamp=timestamps[i],
+            is_rx=is_rx[i],
+            is_extended_id=is_extended[i]
+        ))
+    return messages
@@ -2,10 +2,12 @@ import can
 from pathlib import Path
 import numpy as np
 
+from timebase import ABSOLUTE_MIN, format_report, normalize_timestamps
+
 def fix_blf_timestamps(input_path, output_path=None):
     """
     Исправляет временные метки в BLF файле, делая их консистентными.
-    Преобразует смешанные/абсолютные метки в относительные от 0.
+    Преобразует смешанные/абсолютные метки в относительные от 0 (timebase.normalize_timestamps).
     """
     input_path = Path(input_path)
 
@@ -34,62 +36,29 @@ def fix_blf_timestamps(input_path, output_path=None):
 
 def analyze_time_structure_detailed(reader):
     """
-    Детальный анализ временной структуры файла
+    Детальный анализ временной структуры файла: метки собираются в массив,
+    переключения режимов, скачки назад и нулевые серии ищет normalize_timestamps
     """
     messages = []
-    time_deltas = []
-    previous_time = None
-    has_relative = False
-    has_absolute = False
-    absolute_times = []
-    relative_times = []
-
-    # Собираем информацию о всех сообщениях
     for i, message in enumerate(reader):
         messages.append(message)
 
-        # Определяем тип времени
-        if message.timestamp < 1000000:  # Относительное время
-            has_relative = True
-            relative_times.append(message.timestamp)
-        else:  # Абсолютное время
-            has_absolute = True
-            absolute_times.append(message.timestamp)
-
-        # Вычисляем дельты между сообщениями
-        if previous_time is not None:
-            time_deltas.append(message.timestamp - previous_time)
-        previous_time = message.timestamp
-
         # Прогресс для больших файлов
         if (i + 1) % 100000 == 0:
-            print(f"Проанализировано {i + 1} сообщений...")
+            print(f"Прочитано {i + 1} сообщений...")
 
-    # Определяем общий тип
-    if has_relative and has_absolute:
-        time_type = 'mixed'
-    elif has_absolute:
-        time_type = 'absolute'
-    else:
-        time_type = 'relative'
-
-    # Находим точку перехода (если есть)
-    transition_index = None
-    if time_type == 'mixed':
-        for i, msg in enumerate(messages):
-            if i > 0 and msg.timestamp >= 1000000 and messages[i-1].timestamp < 1000000:
-                transition_index = i
-                break
+    timestamps = np.fromiter((msg.timestamp for msg in messages), dtype=np.float64, count=len(messages))
+    fixed, report = normalize_timestamps(timestamps, origin='zero')
 
     return {
-        'type': time_type,
+        'type': report['clock'],
         'messages': messages,
-        'time_deltas': time_deltas,
-        'transition_index': transition_index,
-        'absolute_times': absolute_times,
-        'relative_times': relative_times,
-        'min_time': min([msg.timestamp for msg in messages]),
-        'max_time': max([msg.timestamp for msg in messages]),
+        'timestamps': timestamps,
+        'fixed': fixed,
+        'report': report,
+        'time_deltas': np.diff(timestamps),
+        'min_time': float(timestamps.min()) if len(timestamps) else 0.0,
+        'max_time': float(timestamps.max()) if len(timestamps) else 0.0,
         'message_count': len(messages)
     }
 
@@ -102,88 +71,41 @@ def print_time_analysis(time_info):
     print(f"Всего сообщений: {time_info['message_count']}")
     print(f"Временной диапазон: {time_info['min_time']} - {time_info['max_time']}")
 
-    if time_info['time_deltas']:
-        print(f"Средняя дельта: {np.mean(time_info['time_deltas']):.6f} сек")
-        print(f"Максимальная дельта: {np.max(time_info['time_deltas']):.6f} сек")
-        print(f"Минимальная дельта: {np.min(time_info['time_deltas']):.6f} сек")
-
-    if time_info['type'] == 'mixed':
-        print(f"Точка перехода: сообщение #{time_info['transition_index']}")
-        print(f"Время до перехода: относительное")
-        print(f"Время после перехода: абсолютное (Unix timestamp)")
-
-        # Анализируем абсолютные времена
-        if time_info['absolute_times']:
-            abs_times = time_info['absolute_times']
-            print(f"Абсолютные времена: {min(abs_times)} - {max(abs_times)}")
-            print(f"Это соответствует датам: {unix_time_to_human(min(abs_times))} - {unix_time_to_human(max(abs_times))}")
+    deltas = time_info['time_deltas']
+    if len(deltas):
+        print(f"Средняя дельта: {deltas.mean():.6f} сек")
+        print(f"Максимальная дельта: {deltas.max():.6f} сек")
+        print(f"Минимальная дельта: {deltas.min():.6f} сек")
 
-    elif time_info['type'] == 'absolute':
-        print("Все временные метки - абсолютные (Unix timestamp)")
-        print(f"Даты: {unix_time_to_human(time_info['min_time'])} - {unix_time_to_human(time_info['max_time'])}")
+    timestamps = time_info['timestamps']
+    absolute = timestamps[timestamps >= ABSOLUTE_MIN]
+    if len(absolute):
+        print(f"Абсолютные времена: {absolute.min()} - {absolute.max()}")
+        print(f"Это соответствует датам: {unix_time_to_human(absolute.min())} - {unix_time_to_human(absolute.max())}")
 
+    print(format_report(time_info['report']))
     print("=" * 50)
 
 def rewrite_with_fixed_timestamps(reader, output_path, time_info):
     """
-    Перезаписывает файл с исправленными временными метками
+    Перезаписывает файл с исправленными временными метками.
+    Меняется только timestamp исходного сообщения - флаги FD/BRS, DLC и канал сохраняются.
     """
+    fixed = time_info['fixed']
     messages_written = 0
-    base_time = None
-    last_fixed_time = 0.0
 
     with can.BLFWriter(output_path) as writer:
-        for i, original_message in enumerate(time_info['messages']):
-            # Определяем базовое время для абсолютных меток
-            if base_time is None and time_info['type'] in ['absolute', 'mixed']:
-                if original_message.timestamp >= 1000000:
-                    base_time = original_message.timestamp
-                else:
-                    # Ищем первое абсолютное время
-                    for msg in time_info['messages']:
-                        if msg.timestamp >= 1000000:
-                            base_time = msg.timestamp
-                            break
-                    if base_time is None:
-                        base_time = 0.0
-
-            # Вычисляем исправленное время
-            if time_info['type'] == 'relative':
-                # Уже относительное время - оставляем как есть
-                fixed_timestamp = original_message.timestamp
-
-            elif time_info['type'] == 'absolute':
-                # Абсолютное время -> преобразуем в относительное
-                fixed_timestamp = original_message.timestamp - base_time
-
-            elif time_info['type'] == 'mixed':
-                if original_message.timestamp < 1000000:
-                    # Относительное время - оставляем
-                    fixed_timestamp = original_message.timestamp
-                else:
-                    # Абсолютное время -> преобразуем в относительное
-                    fixed_timestamp = original_message.timestamp - base_time
-
-            # Создаем исправленное сообщение
-            fixed_message = can.Message(
-                arbitration_id=original_message.arbitration_id,
-                data=original_message.data,
-                timestamp=fixed_timestamp,
-                is_extended_id=original_message.is_extended_id,
-                is_remote_frame=original_message.is_remote_frame,
-                is_error_frame=original_message.is_error_frame,
-                channel=original_message.channel
-            )
-
-            writer.on_message_received(fixed_message)
+        for i, message in enumerate(time_info['messages']):
+            message.timestamp = float(fixed[i])
+            writer.on_message_received(message)
             messages_written += 1
-            last_fixed_time = fixed_timestamp
 
             # Прогресс
             if (i + 1) % 100000 == 0:
                 print(f"Обработано {i + 1}/{time_info['message_count']} сообщений...")
 
-    print(f"Исправлено сообщений: {messages_written}")
+    last_fixed_time = float(fixed[-1]) if len(fixed) else 0.0
+    print(f"Исправлено сообщений: {messages_written} (изменено меток: {time_info['report']['changed']})")
     print(f"Финальное время в файле: {last_fixed_time:.3f} сек")
     print(f"Длительность исправленного файла: {last_fixed_time:.3f} сек")
 
@@ -208,8 +130,8 @@ def verify_fixed_file(original_path, fixed_path):
     try:
         with can.BLFReader(original_path) as orig_reader:
             with can.BLFReader(fixed_path) as fixed_reader:
-                orig_times = [msg.timestamp for msg in orig_reader]
-                fixed_times = [msg.timestamp for msg in fixed_reader]
+                orig_times = np.fromiter((msg.timestamp for msg in orig_reader), dtype=np.float64)
+                fixed_times = np.fromiter((msg.timestamp for msg in fixed_reader), dtype=np.float64)
 
                 print(f"Оригинальных сообщений: {len(orig_times)}")
                 print(f"Исправленных сообщений: {len(fixed_times)}")
@@ -218,11 +140,11 @@ def verify_fixed_file(original_path, fixed_path):
                     print("⚠️  Предупреждение: разное количество сообщений!")
 
                 # Проверяем временные метки
-                print(f"Оригинальное время: {min(orig_times):.3f} - {max(orig_times):.3f}")
-                print(f"Исправленное время: {min(fixed_times):.3f} - {max(fixed_times):.3f}")
+                print(f"Оригинальное время: {orig_times.min():.3f} - {orig_times.max():.3f}")
+                print(f"Исправленное время: {fixed_times.min():.3f} - {fixed_times.max():.3f}")
 
                 # Проверяем монотонность
-                is_monotonic = all(fixed_times[i] <= fixed_times[i+1] for i in range(len(fixed_times)-1))
+                is_monotonic = bool(np.all(np.diff(fixed_times) >= 0))
                 print(f"Время монотонно: {'✅' if is_monotonic else '❌'}")
 
                 return True
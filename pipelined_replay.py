@@ -0,0 +1,326 @@
+"""
+Конвейерное (pipelined) проигрывание 0x740 -> 0x760
+====================================================
+
+Обычный режим реплееров: отправить 0x740, затем блокироваться в bus.recv до
+RESPONSE_TIMEOUT, и только потом отправлять следующий кадр. Медленный ЭБУ сдвигает
+всё проигрывание относительно записанной временной шкалы.
+
+Здесь передача и приём развязаны:
+- передача идёт строго по временным меткам лога (ReplayScheduler, абсолютные дедлайны)
+  и не ждёт ответов
+- can.Notifier в фоновом потоке читает шину, ResponseMatcher сопоставляет каждый 0x760
+  с ожидающими запросами (положительный ответ SID+0x40 с тем же DID, либо 7F SID NRC)
+- запросы без ответа дольше timeout помечаются как таймаут
+- ответ не на самый старый ожидающий запрос считается нарушением порядка
+
+В конце печатается отчёт: задержки ответа (min/mean/p50/p95/p99/max), таймауты,
+NRC, ответы без запроса, нарушения порядка, ошибка времени отправки.
+
+ИСПОЛЬЗОВАНИЕ:
+    engine = PipelinedReplayEngine(bus, timeout=0.5, on_response=..., on_timeout=...)
+    result = engine.run(frames)   # frames: [(timestamp, arbitration_id, data), ...]
+    engine.print_report()
+"""
+
+import threading
+import time
+from collections import deque
+
+import can
+
+from replay_scheduler import ReplayScheduler
+
+REQUEST_ID = 0x740
+RESPONSE_ID = 0x760
+
+# SID ответов, которые не сопоставляются с проигрываемыми запросами
+# (TesterPresent отвечает фоновому потоку реплеера)
+IGNORED_RESPONSE_SIDS = {0x7E}
+
+# SID с 2-байтным идентификатором данных (DID) после SID
+DID_SERVICES = {0x22, 0x2E, 0x2F, 0x31}
+
+
+def sid_offset(data):
+    """Индекс байта SID: 1 для формата с PCI (06 2F 4B ...), 0 для 6-байтного без PCI"""
+    if len(data) > 1 and data[0] <= 0x07:
+        return 1
+    return 0
+
+
+def response_matches(request_data, response_data):
+    """
+    Проверяет, является ли response_data ответом на request_data.
+    Возвращает 'positive', 'negative' или None.
+    """
+    req_off = sid_offset(request_data)
+    resp_off = sid_offset(response_data)
+    if len(request_data) <= req_off or len(response_data) <= resp_off:
+        return None
+
+    req_sid = request_data[req_off]
+    resp_sid = response_data[resp_off]
+
+    if resp_sid == 0x7F:
+        if len(response_data) > resp_off + 1 and response_data[resp_off + 1] == req_sid:
+            return 'negative'
+        return None
+
+    if resp_sid != req_sid + 0x40:
+        return None
+
+    if req_sid in DID_SERVICES:
+        req_did = bytes(request_data[req_off + 1:req_off + 3])
+        resp_did = bytes(response_data[resp_off + 1:resp_off + 3])
+        if req_did != resp_did:
+            return None
+
+    return 'positive'
+
+
+class PendingRequest:
+    __slots__ = ('seq', 'arbitration_id', 'data', 'deadline', 'send_time', 'log_timestamp')
+
+    def __init__(self, seq, arbitration_id, data, deadline, send_time, log_timestamp):
+        self.seq = seq
+        self.arbitration_id = arbitration_id
+        self.data = data
+        self.deadline = deadline
+        self.send_time = send_time
+        self.log_timestamp = log_timestamp
+
+
+class ResponseMatcher(can.Listener):
+    """Фоновый приёмник: сопоставляет ответы 0x760 с ожидающими запросами"""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def on_message_received(self, msg):
+        if msg.arbitration_id != self.engine.response_id:
+            return
+        self.engine._handle_response(msg, time.perf_counter())
+
+    def on_error(self, exc):
+        print(f"[Pipelined] Reader error: {exc}")
+
+
+class PipelinedReplayEngine:
+    def __init__(self, bus, timeout=0.5, response_id=RESPONSE_ID, scheduler=None,
+                 on_sent=None, on_response=None, on_timeout=None, on_unmatched=None, tx_scheduler=None):
+        """
+        tx_scheduler - TxScheduler, если передачей владеет он (шину делит Tester Present):
+                       кадры ставятся в его очередь с дедлайном вместо прямого bus.send
+        on_sent(pending)                      - после отправки запроса (поток передачи)
+        on_response(pending, msg, latency, kind) - ответ сопоставлен (поток Notifier), kind: positive/negative
+        on_timeout(pending)                   - запрос остался без ответа
+        on_unmatched(msg)                     - ответ, которому не нашлось запроса
+        """
+        self.bus = bus
+        self.timeout = timeout
+        self.response_id = response_id
+        self.scheduler = scheduler or ReplayScheduler()
+        self.on_sent = on_sent
+        self.on_response = on_response
+        self.on_timeout = on_timeout
+        self.on_unmatched = on_unmatched
+        self.tx_scheduler = tx_scheduler
+
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.sent = 0
+        self.latencies = []
+        self.positive = 0
+        self.negative = 0
+        self.timeouts = 0
+        self.unmatched = 0
+        self.order_violations = 0
+
+    # ------------------------------------------------------------------
+    # Приём
+    # ------------------------------------------------------------------
+    def _handle_response(self, msg, receive_time):
+        data = bytes(msg.data)
+        off = sid_offset(data)
+        if len(data) > off and data[off] in IGNORED_RESPONSE_SIDS:
+            return
+
+        matched = None
+        kind = None
+        with self._lock:
+            expired = self._expire_locked(receive_time)
+            for position, pending in enumerate(self._pending):
+                kind = response_matches(pending.data, data)
+                if kind:
+                    matched = pending
+                    if position != 0:
+                        self.order_violations += 1
+                    del self._pending[position]
+                    break
+
+            if matched is not None:
+                latency = receive_time - matched.send_time
+                self.latencies.append(latency)
+                if kind == 'negative':
+                    self.negative += 1
+                else:
+                    self.positive += 1
+            else:
+                self.unmatched += 1
+
+        self._notify_timeouts(expired)
+        if matched is not None:
+            if self.on_response:
+                self.on_response(matched, msg, latency, kind)
+        elif self.on_unmatched:
+            self.on_unmatched(msg)
+
+    def _expire_locked(self, now, expire_all=False):
+        """
+        Снимает запросы без ответа дольше timeout (вызывать под self._lock).
+        Возвращает список истёкших - колбэки вызываются уже без блокировки.
+        """
+        expired = []
+        still_pending = deque()
+        for pending in self._pending:
+            if expire_all or now - pending.send_time > self.timeout:
+                expired.append(pending)
+            else:
+                still_pending.append(pending)
+        self._pending = still_pending
+
+        self.timeouts += len(expired)
+        return expired
+
+    def _notify_timeouts(self, expired):
+        if self.on_timeout:
+            for pending in expired:
+                self.on_timeout(pending)
+
+    def expire(self, expire_all=False):
+        with self._lock:
+            expired = self._expire_locked(time.perf_counter(), expire_all)
+        self._notify_timeouts(expired)
+
+    # ------------------------------------------------------------------
+    # Передача
+    # ------------------------------------------------------------------
+    def run(self, frames, progress=None):
+        """
+        Проигрывает frames: список (timestamp, arbitration_id, data) по временной шкале лога.
+        progress() - опциональный колбэк после каждого отправленного кадра (например pbar.update).
+        Возвращает словарь статистики (см. stats()).
+        """
+        self.reset_stats()
+        if not frames:
+            return self.stats()
+
+        matcher = ResponseMatcher(self)
+        notifier = can.Notifier(self.bus, [matcher], timeout=0.05)
+
+        try:
+            self.scheduler.start(frames[0][0])
+            for seq, (timestamp, arbitration_id, data) in enumerate(frames):
+                tx_msg = can.Message(arbitration_id=arbitration_id, data=data, is_extended_id=False)
+
+                if self.tx_scheduler is None:
+                    deadline = self.scheduler.wait_until(timestamp)
+                    send_time = time.perf_counter()
+                else:
+                    # точное ожидание дедлайна делает поток TxScheduler
+                    deadline = self.scheduler.deadline_for(timestamp)
+                    send_time = deadline
+                pending = PendingRequest(seq, arbitration_id, bytes(data), deadline,
+                                         send_time, self.scheduler.log_time(send_time))
+
+                # регистрируем до send, чтобы быстрый ответ не обогнал запрос в очереди
+                with self._lock:
+                    self._pending.append(pending)
+
+                if self.tx_scheduler is None:
+                    self.bus.send(tx_msg)
+                    self.scheduler.record_send(deadline)
+                else:
+                    job = self.tx_scheduler.send_at(deadline, tx_msg)
+                    job.wait()
+                    if job.cancelled:
+                        raise RuntimeError("TX scheduler stopped")
+                    if job.error is not None:
+                        raise job.error
+                    pending.send_time = job.sent_at
+                    pending.log_timestamp = self.scheduler.log_time(job.sent_at)
+                    self.scheduler.record_send(deadline, job.sent_at)
+                self.sent += 1
+
+                if self.on_sent:
+                    self.on_sent(pending)
+                if progress:
+                    progress()
+
+                self.expire()
+
+            # ждём хвост ответов
+            end_wait = time.perf_counter() + self.timeout
+            while time.perf_counter() < end_wait:
+                with self._lock:
+                    if not self._pending:
+                        break
+                time.sleep(0.005)
+        finally:
+            notifier.stop()
+
+        # всё, что осталось после ожидания хвоста - таймауты
+        self.expire(expire_all=True)
+
+        return self.stats()
+
+    # ------------------------------------------------------------------
+    # Отчёт
+    # ------------------------------------------------------------------
+    def stats(self):
+        latencies_ms = sorted(latency * 1000.0 for latency in self.latencies)
+        count = len(latencies_ms)
+
+        def percentile(p):
+            return latencies_ms[min(count - 1, int(p / 100.0 * count))] if count else None
+
+        return {
+            'sent': self.sent,
+            'positive': self.positive,
+            'negative': self.negative,
+            'timeouts': self.timeouts,
+            'unmatched_responses': self.unmatched,
+            'order_violations': self.order_violations,
+            'latency_min_ms': latencies_ms[0] if count else None,
+            'latency_mean_ms': sum(latencies_ms) / count if count else None,
+            'latency_p50_ms': percentile(50),
+            'latency_p95_ms': percentile(95),
+            'latency_p99_ms': percentile(99),
+            'latency_max_ms': latencies_ms[-1] if count else None,
+        }
+
+    def format_report(self):
+        stats = self.stats()
+        lines = [
+            "Pipelined replay report:",
+            f"  Sent requests:        {stats['sent']}",
+            f"  Positive responses:   {stats['positive']}",
+            f"  Negative responses:   {stats['negative']}",
+            f"  Timeouts:             {stats['timeouts']}",
+            f"  Unmatched responses:  {stats['unmatched_responses']}",
+            f"  Ordering violations:  {stats['order_violations']}",
+        ]
+        if stats['latency_mean_ms'] is not None:
+            lines.append(f"  Latency: min {stats['latency_min_ms']:.2f} ms, mean {stats['latency_mean_ms']:.2f} ms, "
+                         f"max {stats['latency_max_ms']:.2f} ms")
+            lines.append(f"           p50 {stats['latency_p50_ms']:.2f} ms, p95 {stats['latency_p95_ms']:.2f} ms, "
+                         f"p99 {stats['latency_p99_ms']:.2f} ms")
+        lines.append(self.scheduler.format_report())
+        return '\n'.join(lines)
+
+    def print_report(self):
+        print(self.format_report())
@@ -30,16 +30,22 @@ python universal_valve_control.py --table-sequence --virtual=False
 # Проигрывание XLSX без модификации команд
 python universal_valve_control.py --replay-blf data.xlsx --no-replace-cmd
 
+# Конвейерное проигрывание: передача по шкале лога, ответы 0x760 сопоставляются в фоне
+python universal_valve_control.py --replay-blf log.blf --pipelined
+
 """
 
 import can
 import time
 import argparse
-import re
-import pandas as pd
 from tqdm import tqdm
 from pathlib import Path
 from datetime import datetime
+from replay_scheduler import ReplayScheduler
+from pipelined_replay import PipelinedReplayEngine
+from async_log_writer import AsyncLogWriter
+from xlsx_stream_reader import FACTORY_COLUMNS, read_xlsx_header, read_factory_can_events
+from blf_index import read_messages
 from canlib import canlib
 import os
 
@@ -69,6 +75,7 @@ class UniversalValveController:
         self.blf_output = blf_output
         self.bus = None
         self.logger = None
+        self.log_writer = None
         self.current_wheel = "FL"
 
     def check_kvaser_hardware(self):
@@ -165,6 +172,9 @@ class UniversalValveController:
                 self.logger = can.BLFWriter(self.blf_output)
                 print(f"{COLOR_GREEN}Логгирование в файл: {self.blf_output}{COLOR_RESET}")
 
+            # Вывод кадров и запись BLF - в фоновом потоке, вне цикла отправки
+            self.log_writer = AsyncLogWriter(blf_writer=self.logger)
+
             return True
 
         except Exception as e:
@@ -176,14 +186,30 @@ class UniversalValveController:
         if self.bus:
             self.bus.shutdown()
             self.bus = None
+        if self.log_writer:
+            self.log_writer.close()
+            print(f"{COLOR_WHITE}{self.log_writer.format_report()}{COLOR_RESET}")
+            self.log_writer = None
         if self.logger:
             self.logger.stop()
             self.logger = None
 
     def log_message(self, msg):
-        """Записывает сообщение в логгер BLF"""
-        if self.logger:
-            self.logger.on_message_received(msg)
+        """Ставит сообщение в очередь записи BLF"""
+        if self.log_writer:
+            self.log_writer.blf(msg)
+
+    def console(self, formatter, *args):
+        """Строка для консоли, formatter(*args) выполняется в потоке записи"""
+        if self.log_writer:
+            self.log_writer.console(formatter, *args)
+        else:
+            print(formatter(*args))
+
+    def format_frame(self, timestamp, arbitration_id, data, direction, color, tag=""):
+        """Строка кадра в формате ASC"""
+        data_hex = ' '.join([f'{b:02X}' for b in data])
+        return f"{color}{timestamp:12.6f} {self.channel}  {arbitration_id:03X}       {direction}   d {len(data)} {data_hex}{tag}{COLOR_RESET}"
 
     def send_message(self, msg, description="", wait_time=0):
         """Отправка CAN сообщения с логированием"""
@@ -199,17 +225,15 @@ class UniversalValveController:
             self.bus.send(msg)
             self.log_message(msg)
 
-            # Определяем цвет и форматируем вывод
+            # Определяем цвет, форматирование и вывод - в потоке записи
             msg_type = self.get_message_type(msg.data)
             color = self.get_color_for_message(msg_type, is_response=False)
-
-            data_hex = ' '.join([f'{b:02X}' for b in msg.data])
             direction = "Rx" if msg.is_rx else "Tx"
 
-            print(f"{color}{msg.timestamp:12.6f} {msg.channel}  {msg.arbitration_id:03X}       {direction}   d {len(msg.data)} {data_hex}{COLOR_RESET}")
+            self.console(self.format_frame, msg.timestamp, msg.arbitration_id, msg.data, direction, color)
 
             if description:
-                print(f"{COLOR_CYAN}# {description}{COLOR_RESET}")
+                self.console(str, f"{COLOR_CYAN}# {description}{COLOR_RESET}")
 
             if wait_time > 0:
                 time.sleep(wait_time)
@@ -380,98 +404,59 @@ class UniversalValveController:
     def parse_xlsx_file(self, file_path):
         """
         Парсит XLSX файл нового завода и возвращает список CAN сообщений.
+
+        Формат XLSX нового завода:
+        № п/п | Date       | Time         | Type | Level | Event
+
+        Файл читается потоково (openpyxl read-only), Event и Date/Time разбираются векторно.
         """
         try:
-            # Читаем Excel файл
-            df = pd.read_excel(file_path)
-            print(f"{COLOR_WHITE}XLSX файл загружен. Строк: {len(df)}{COLOR_RESET}")
-            print(f"{COLOR_WHITE}Колонки: {df.columns.tolist()}{COLOR_RESET}")
+            # Проверяем наличие обязательных колонок - читаем только заголовок
+            columns = read_xlsx_header(file_path)
+            print(f"{COLOR_WHITE}Колонки: {columns}{COLOR_RESET}")
 
-            # Проверяем наличие обязательных колонок
-            required_columns = ['№ п/п', 'Date', 'Time', 'Type', 'Level', 'Event']
-            missing_columns = [col for col in required_columns if col not in df.columns]
+            missing_columns = [col for col in FACTORY_COLUMNS if col not in columns]
 
             if missing_columns:
                 print(f"{COLOR_RED}ОШИБКА: В файле отсутствуют обязательные колонки: {missing_columns}{COLOR_RESET}")
                 return []
 
-            # Фильтруем только CAN сообщения
-            df_can = df[df['Type'] == 'Can'].copy()
+            # Только CAN сообщения (Type='Can')
+            df_can = read_factory_can_events(file_path)
             print(f"{COLOR_WHITE}Найдено CAN сообщений: {len(df_can)}{COLOR_RESET}")
 
             if len(df_can) == 0:
                 print(f"{COLOR_RED}ОШИБКА: В файле нет CAN сообщений (Type='Can'){COLOR_RESET}")
                 return []
 
+            bad_time = df_can['timestamp'].isna().sum()
+            if bad_time:
+                print(f"{COLOR_RED}Ошибка парсинга времени в {bad_time} строках - пропущены{COLOR_RESET}")
+
             messages = []
             base_timestamp = None
 
-            # Функция для парсинга времени
-            def parse_timestamp(date_str, time_str):
-                try:
-                    # Объединяем дату и время
-                    datetime_str = f"{date_str} {time_str}"
-                    # Парсим в datetime объект
-                    dt = datetime.strptime(datetime_str, "%d.%m.%Y %H:%M:%S.%f")
-                    return dt.timestamp()
-                except ValueError:
-                    try:
-                        dt = datetime.strptime(datetime_str, "%d.%m.%Y %H:%M:%S")
-                        return dt.timestamp()
-                    except Exception as e:
-                        print(f"{COLOR_RED}Ошибка парсинга времени '{datetime_str}': {e}{COLOR_RESET}")
-                        return None
-
-            # Функция для парсинга CAN события
-            def parse_can_event(event_str):
-                pattern = r'\[(0x[0-9a-fA-F]+)\]\s*\((\d+)\)\s*(->|<-)\s*(.+)'
-                match = re.search(pattern, event_str)
-
-                if match:
-                    can_id = match.group(1)  # 0x740 или 0x760
-                    dlc = int(match.group(2))
-                    direction = match.group(3)  # -> или <-
-                    data_hex = match.group(4)   # HEX данные
-
-                    # Конвертируем CAN ID
-                    try:
-                        arbitration_id = int(can_id, 16)
-                    except:
-                        print(f"{COLOR_RED}Ошибка парсинга CAN ID: {can_id}{COLOR_RESET}")
-                        return None, None, None
-
-                    # Конвертируем HEX данные в байты
-                    try:
-                        hex_bytes = data_hex.split()
-                        data_bytes = bytes(int(byte, 16) for byte in hex_bytes)
-
-                        if len(data_bytes) != dlc:
-                            print(f"{COLOR_YELLOW}Предупреждение: DLC ({dlc}) не соответствует длине данных ({len(data_bytes)}){COLOR_RESET}")
-
-                        return arbitration_id, data_bytes, direction
-                    except Exception as e:
-                        print(f"{COLOR_RED}Ошибка парсинга данных: {data_hex} - {e}{COLOR_RESET}")
-                        return None, None, None
-
-                return None, None, None
-
             # Обрабатываем каждую CAN строку
             valid_messages = 0
-            for idx, row in df_can.iterrows():
+            for row in df_can.itertuples(index=False):
                 try:
-                    # Парсим время
-                    timestamp = parse_timestamp(row['Date'], row['Time'])
-                    if timestamp is None:
+                    # Время уже распарсено
+                    timestamp = row.timestamp
+                    if timestamp != timestamp:  # NaN
                         continue
 
                     # Устанавливаем базовое время
                     if base_timestamp is None:
                         base_timestamp = timestamp
 
-                    # Парсим CAN событие
-                    arbitration_id, data, direction = parse_can_event(str(row['Event']))
-                    if arbitration_id is None:
+                    # CAN событие уже разобрано
+                    if row.can_id != row.can_id or not row.data_hex:
                         continue
+                    arbitration_id = int(row.can_id)
+                    data = bytes.fromhex(row.data_hex)
+
+                    if len(data) != int(row.dlc):
+                        print(f"{COLOR_YELLOW}Предупреждение: DLC ({int(row.dlc)}) не соответствует длине данных ({len(data)}){COLOR_RESET}")
 
                     # Создаем CAN сообщение
                     # Временная метка относительно начала файла
@@ -481,7 +466,7 @@ class UniversalValveController:
                         arbitration_id=arbitration_id,
                         data=data,
                         timestamp=relative_timestamp,
-                        is_rx=(direction == '<-')
+                        is_rx=(row.direction == '<-')
                     )
 
                     messages.append(msg)
@@ -489,11 +474,10 @@ class UniversalValveController:
 
                     # Выводим первые несколько сообщений для отладки
                     if valid_messages <= 3:
-                        data_hex = ' '.join([f'{b:02X}' for b in data])
-                        print(f"{COLOR_WHITE}DEBUG: CAN ID: 0x{arbitration_id:03X}, Data: {data_hex}, Time: {relative_timestamp:.3f}s{COLOR_RESET}")
+                        print(f"{COLOR_WHITE}DEBUG: CAN ID: 0x{arbitration_id:03X}, Data: {row.data_hex}, Time: {relative_timestamp:.3f}s{COLOR_RESET}")
 
                 except Exception as e:
-                    print(f"{COLOR_RED}Ошибка обработки строки {idx}: {e}{COLOR_RESET}")
+                    print(f"{COLOR_RED}Ошибка обработки строки {row.row_index}: {e}{COLOR_RESET}")
                     continue
 
             print(f"{COLOR_GREEN}Успешно обработано CAN сообщений: {valid_messages}{COLOR_RESET}")
@@ -521,12 +505,8 @@ class UniversalValveController:
 
         if file_ext in ['.blf']:
             # Старый функционал для BLF файлов
-            messages = []
-            with can.BLFReader(file_path) as log:
-                for msg in log:
-                    if msg.arbitration_id == 0x740:
-                        messages.append(msg)
-            return messages
+            # остальные кадры отсеиваются по заголовку объекта, без can.Message (blf_index.py)
+            return list(read_messages(file_path, {0x740}))
 
         elif file_ext in ['.xlsx', '.xls']:
             # Новый функционал для XLSX файлов нового завода
@@ -537,7 +517,69 @@ class UniversalValveController:
             print(f"{COLOR_YELLOW}Поддерживаемые форматы: .blf, .xlsx, .xls{COLOR_RESET}")
             return []
 
-    def replay_blf_file(self, blf_file_path, timeout=0.1):
+    def replay_pipelined(self, requests_740, timeout=0.1):
+        """
+        Конвейерное проигрывание: 0x740 уходят строго по временным меткам лога,
+        ответы 0x760 сопоставляются с запросами в фоновом потоке (pipelined_replay.py).
+        Модификация команд (REPLACE_CMD) не зависит от ответов, поэтому считается заранее.
+        """
+        frames = []
+        modified_seqs = set()
+        for msg in requests_740:
+            tx_data = msg.data
+            if REPLACE_CMD:
+                self.check_outlet_and_switch(msg.data)
+                new_data = self.modify_valve_command(msg.data)
+                if new_data != msg.data:
+                    tx_data = new_data
+                    modified_seqs.add(len(frames))
+            frames.append((msg.timestamp, msg.arbitration_id, tx_data))
+
+        pbar = tqdm(total=len(frames), desc="Отправка 0x740", unit="msg", ncols=100)
+        self.log_writer.attach_progress(pbar)
+
+        def on_sent(pending):
+            log_msg = can.Message(
+                arbitration_id=pending.arbitration_id,
+                data=pending.data,
+                timestamp=pending.log_timestamp,
+                channel=self.channel,
+                is_rx=False
+            )
+            self.log_message(log_msg)
+            if pending.seq in modified_seqs:
+                color, tag = COLOR_CYAN, " [MODIFIED]"
+            else:
+                color, tag = self.get_color_for_message(self.get_message_type(pending.data)), ""
+            self.console(self.format_frame, pending.log_timestamp, pending.arbitration_id, pending.data, "Tx", color, tag)
+
+        def on_response(pending, response, latency, kind):
+            response.timestamp = engine.scheduler.log_time()
+            response.channel = self.channel
+            self.log_message(response)
+            color_resp = self.get_color_for_message(self.get_message_type(response.data), is_response=True)
+            self.console(self.format_frame, response.timestamp, response.arbitration_id, response.data, "Rx",
+                         color_resp, f" ({latency * 1000:.1f} ms, #{pending.seq})")
+
+        def on_timeout(pending):
+            self.console(str, f"{COLOR_RED}{engine.scheduler.log_time():12.6f} {self.channel}  760       Rx   d 0 -- TIMEOUT -- (#{pending.seq}){COLOR_RESET}")
+
+        engine = PipelinedReplayEngine(self.bus, timeout=timeout, on_sent=on_sent,
+                                       on_response=on_response, on_timeout=on_timeout)
+        try:
+            engine.run(frames, progress=self.log_writer.advance)
+        except KeyboardInterrupt:
+            self.console(str, f"\n{COLOR_YELLOW}Остановлено пользователем{COLOR_RESET}")
+        self.log_writer.attach_progress(None)
+        pbar.close()
+
+        print()
+        print(f"{COLOR_GREEN}{'='*60}{COLOR_RESET}")
+        print(f"{COLOR_WHITE}Воспроизведение завершено{COLOR_RESET}")
+        print(f"{COLOR_CYAN}{engine.format_report()}{COLOR_RESET}")
+        print(f"{COLOR_GREEN}{'='*60}{COLOR_RESET}")
+
+    def replay_blf_file(self, blf_file_path, timeout=0.1, pipelined=False):
         """Проигрывание только сообщений 0x740 с ожиданием ответов 0x760"""
         if not Path(blf_file_path).exists():
             print(f"{COLOR_RED}Файл {blf_file_path} не найден!{COLOR_RESET}")
@@ -566,11 +608,18 @@ class UniversalValveController:
                 print(f"{COLOR_WHITE}Нажмите Ctrl+C для остановки{COLOR_RESET}")
                 print()
 
+                if pipelined:
+                    self.replay_pipelined(requests_740, timeout=timeout)
+                    return True
+
                 # Прогресс-бар
                 pbar = tqdm(total=total_requests, desc="Отправка 0x740", unit="msg", ncols=100)
+                self.log_writer.attach_progress(pbar)
 
-                start_time = time.perf_counter()
                 first_timestamp = requests_740[0].timestamp
+                scheduler = ReplayScheduler()
+                scheduler.start(first_timestamp)
+                start_time = scheduler.start_perf
 
                 success_count = 0
                 timeout_count = 0
@@ -579,9 +628,7 @@ class UniversalValveController:
                 for i, msg in enumerate(requests_740):
                     try:
                         # Выдерживаем временные интервалы из лога
-                        elapsed = msg.timestamp - first_timestamp
-                        while (time.perf_counter() - start_time) < elapsed:
-                            time.sleep(0.001)
+                        deadline = scheduler.wait_until(msg.timestamp)
 
                         # Определяем тип сообщения для цветового кодирования
                         msg_type = self.get_message_type(msg.data)
@@ -608,6 +655,7 @@ class UniversalValveController:
 
                         # Отправляем сообщение
                         self.bus.send(tx_msg)
+                        scheduler.record_send(deadline)
 
                         # Создаем сообщение для логирования с текущим временем
                         current_ts = time.perf_counter() - start_time + first_timestamp
@@ -623,13 +671,10 @@ class UniversalValveController:
                         # Вывод запроса
                         if modified:
                             # Показываем оригинал и модификацию
-                            orig_hex = ' '.join([f'{b:02X}' for b in msg.data])
-                            print(f"{COLOR_WHITE}{current_ts:12.6f} {self.channel}  {msg.arbitration_id:03X}       Tx   d {len(msg.data)} {orig_hex} [ORIG]{COLOR_RESET}")
-                            data_hex = ' '.join([f'{b:02X}' for b in tx_data])
-                            print(f"{COLOR_CYAN}{current_ts:12.6f} {self.channel}  {msg.arbitration_id:03X}       Tx   d {len(tx_data)} {data_hex} [MODIFIED]{COLOR_RESET}")
+                            self.console(self.format_frame, current_ts, msg.arbitration_id, msg.data, "Tx", COLOR_WHITE, " [ORIG]")
+                            self.console(self.format_frame, current_ts, msg.arbitration_id, tx_data, "Tx", COLOR_CYAN, " [MODIFIED]")
                         else:
-                            data_hex = ' '.join([f'{b:02X}' for b in tx_data])
-                            print(f"{color_req}{current_ts:12.6f} {self.channel}  {msg.arbitration_id:03X}       Tx   d {len(tx_data)} {data_hex}{COLOR_RESET}")
+                            self.console(self.format_frame, current_ts, msg.arbitration_id, tx_data, "Tx", color_req)
 
                         # Ожидаем ответ 0x760
                         response = self.wait_for_response(expected_id=0x760, timeout=timeout)
@@ -644,8 +689,8 @@ class UniversalValveController:
                             response.channel = self.channel
 
                             # Вывод ответа
-                            data_hex = ' '.join([f'{b:02X}' for b in response.data])
-                            print(f"{color_resp}{response.timestamp:12.6f} {self.channel}  {response.arbitration_id:03X}       Rx   d {len(response.data)} {data_hex}{COLOR_RESET}")
+                            self.console(self.format_frame, response.timestamp, response.arbitration_id,
+                                         response.data, "Rx", color_resp)
 
                             if resp_type == "negative_response":
                                 error_count += 1
@@ -654,19 +699,20 @@ class UniversalValveController:
                         else:
                             # Таймаут - ответ не получен
                             timeout_ts = time.perf_counter() - start_time + first_timestamp
-                            print(f"{COLOR_RED}{timeout_ts:12.6f} {self.channel}  760       Rx   d 0 -- TIMEOUT --{COLOR_RESET}")
+                            self.console(str, f"{COLOR_RED}{timeout_ts:12.6f} {self.channel}  760       Rx   d 0 -- TIMEOUT --{COLOR_RESET}")
                             timeout_count += 1
 
-                        pbar.update(1)
-                        print()  # пустая строка между парами запрос-ответ
+                        self.log_writer.advance()
+                        self.console(str, "")  # пустая строка между парами запрос-ответ
 
                     except KeyboardInterrupt:
-                        print(f"\n{COLOR_YELLOW}Остановлено пользователем{COLOR_RESET}")
+                        self.console(str, f"\n{COLOR_YELLOW}Остановлено пользователем{COLOR_RESET}")
                         break
                     except Exception as e:
-                        print(f"{COLOR_RED}Ошибка при обработке сообщения: {e}{COLOR_RESET}")
+                        self.console(str, f"{COLOR_RED}Ошибка при обработке сообщения: {e}{COLOR_RESET}")
                         continue
 
+                self.log_writer.attach_progress(None)
                 pbar.close()
                 print()
                 print(f"{COLOR_GREEN}{'='*60}{COLOR_RESET}")
@@ -674,6 +720,7 @@ class UniversalValveController:
                 print(f"{COLOR_GREEN}Успешных ответов: {success_count}{COLOR_RESET}")
                 print(f"{COLOR_RED}Negative Response: {error_count}{COLOR_RESET}")
                 print(f"{COLOR_RED}Таймаутов: {timeout_count}{COLOR_RESET}")
+                print(f"{COLOR_WHITE}{scheduler.format_report()}{COLOR_RESET}")
                 print(f"{COLOR_GREEN}{'='*60}{COLOR_RESET}")
 
             return True
@@ -701,6 +748,7 @@ class UniversalValveController:
 
             total_steps = 82
             pbar = tqdm(total=total_steps, desc="Табличная последовательность", unit="msg", ncols=100)
+            self.log_writer.attach_progress(pbar)
 
             start_time = time.time()
             self.current_wheel = "FL"
@@ -708,11 +756,11 @@ class UniversalValveController:
             # === ШАГ 1-2: Инициализация ===
             self.send_message(can.Message(arbitration_id=0x740, data=[0x02, 0x10, 0x03, 0x00, 0x00, 0x00, 0x00, 0x00]),
                             "Extended Session", T1)
-            pbar.update(1)
+            self.log_writer.advance()
 
             self.send_message(can.Message(arbitration_id=0x740, data=[0x04, 0x14, 0xFF, 0xFF, 0xFF, 0x00, 0x00, 0x00]),
                             "Security Access", T1)
-            pbar.update(1)
+            self.log_writer.advance()
 
             # === ШАГ 3-6: Базовые команды ===
             commands = [
@@ -724,10 +772,10 @@ class UniversalValveController:
 
             for data, desc, stage_time in commands:
                 self.send_message(can.Message(arbitration_id=0x740, data=data), desc, stage_time)
-                pbar.update(1)
+                self.log_writer.advance()
 
             # === ШАГ 7-13: FL колесо ===
-            print(f"{COLOR_CYAN}>>> Начало тестирования FL колеса{COLOR_RESET}")
+            self.console(str, f"{COLOR_CYAN}>>> Начало тестирования FL колеса{COLOR_RESET}")
 
             fl_commands = [
                 ([0x06, 0x2F, 0x4B, 0x12, 0x03, 0x00, 0x00, 0x00], "Все выкл", T1),
@@ -741,29 +789,29 @@ class UniversalValveController:
 
             for data, desc, stage_time in fl_commands:
                 self.send_message(can.Message(arbitration_id=0x740, data=data), desc, stage_time)
-                pbar.update(1)
+                self.log_writer.advance()
 
             # === ЦИКЛ FL: 5 включений/выключений ===
-            print(f"{COLOR_CYAN}>>> Цикл FL: 5 включений/выключений{COLOR_RESET}")
+            self.console(str, f"{COLOR_CYAN}>>> Цикл FL: 5 включений/выключений{COLOR_RESET}")
             for i in range(5):
                 self.send_message(can.Message(arbitration_id=0x740, data=[0x06, 0x2F, 0x4B, 0x12, 0x03, 0x55, 0x4A, 0x00]),
                                 f"EVFL вкл ({i+1}/5)", T2)
-                pbar.update(1)
+                self.log_writer.advance()
                 self.send_message(can.Message(arbitration_id=0x740, data=[0x06, 0x2F, 0x4B, 0x12, 0x03, 0x54, 0x4A, 0x00]),
                                 f"EVFL выкл ({i+1}/5)", T2)
-                pbar.update(1)
+                self.log_writer.advance()
 
             # === Переключение на FR ===
             self.send_message(can.Message(arbitration_id=0x740, data=[0x06, 0x2F, 0x4B, 0x12, 0x03, 0x55, 0x42, 0x00]),
                             "shu_2 выкл", T1)
-            pbar.update(1)
+            self.log_writer.advance()
             self.send_message(can.Message(arbitration_id=0x740, data=[0x06, 0x2F, 0x4B, 0x12, 0x03, 0x57, 0x41, 0x00]),
                             "AVFL вкл, iso_1 вкл", T3)
-            pbar.update(1)
+            self.log_writer.advance()
             self.switch_wheel("FR")
 
             # === FR этап ===
-            print(f"{COLOR_CYAN}>>> Начало тестирования FR колеса{COLOR_RESET}")
+            self.console(str, f"{COLOR_CYAN}>>> Начало тестирования FR колеса{COLOR_RESET}")
             fr_commands = [
                 ([0x06, 0x2F, 0x4B, 0x12, 0x03, 0x55, 0x41, 0x00], "AVFL выкл", T4),
                 ([0x06, 0x2F, 0x4B, 0x12, 0x03, 0x55, 0x45, 0x00], "shu_1 вкл", T1),
@@ -772,29 +820,29 @@ class UniversalValveController:
 
             for data, desc, stage_time in fr_commands:
                 self.send_message(can.Message(arbitration_id=0x740, data=data), desc, stage_time)
-                pbar.update(1)
+                self.log_writer.advance()
 
             # === ЦИКЛ FR: 5 включений/выключений ===
-            print(f"{COLOR_CYAN}>>> Цикл FR: 5 включений/выключений{COLOR_RESET}")
+            self.console(str, f"{COLOR_CYAN}>>> Цикл FR: 5 включений/выключений{COLOR_RESET}")
             for i in range(5):
                 self.send_message(can.Message(arbitration_id=0x740, data=[0x06, 0x2F, 0x4B, 0x12, 0x03, 0x55, 0x45, 0x00]),
                                 f"EVFR вкл ({i+1}/5)", T2)
-                pbar.update(1)
+                self.log_writer.advance()
                 self.send_message(can.Message(arbitration_id=0x740, data=[0x06, 0x2F, 0x4B, 0x12, 0x03, 0x51, 0x45, 0x00]),
                                 f"EVFR выкл ({i+1}/5)", T2)
-                pbar.update(1)
+                self.log_writer.advance()
 
             # === Переключение на RL ===
             self.send_message(can.Message(arbitration_id=0x740, data=[0x06, 0x2F, 0x4B, 0x12, 0x03, 0x55, 0x41, 0x00]),
                             "shu_1 выкл", T4)
-            pbar.update(1)
+            self.log_writer.advance()
             self.send_message(can.Message(arbitration_id=0x740, data=[0x06, 0x2F, 0x4B, 0x12, 0x03, 0x5D, 0x41, 0x00]),
                             "AVFR вкл", T3)
-            pbar.update(1)
+            self.log_writer.advance()
             self.switch_wheel("RL")
 
             # === RL этап ===
-            print(f"{COLOR_CYAN}>>> Начало тестирования RL колеса{COLOR_RESET}")
+            self.console(str, f"{COLOR_CYAN}>>> Начало тестирования RL колеса{COLOR_RESET}")
             rl_commands = [
                 ([0x06, 0x2F, 0x4B, 0x12, 0x03, 0x55, 0x41, 0x00], "AVFR выкл", T4),
                 ([0x06, 0x2F, 0x4B, 0x12, 0x03, 0x55, 0x45, 0x00], "shu_1 вкл", T1),
@@ -803,29 +851,29 @@ class UniversalValveController:
 
             for data, desc, stage_time in rl_commands:
                 self.send_message(can.Message(arbitration_id=0x740, data=data), desc, stage_time)
-                pbar.update(1)
+                self.log_writer.advance()
 
             # === ЦИКЛ RL: 5 включений/выключений ===
-            print(f"{COLOR_CYAN}>>> Цикл RL: 5 включений/выключений{COLOR_RESET}")
+            self.console(str, f"{COLOR_CYAN}>>> Цикл RL: 5 включений/выключений{COLOR_RESET}")
             for i in range(5):
                 self.send_message(can.Message(arbitration_id=0x740, data=[0x06, 0x2F, 0x4B, 0x12, 0x03, 0x55, 0x45, 0x00]),
                                 f"EVRL вкл ({i+1}/5)", T2)
-                pbar.update(1)
+                self.log_writer.advance()
                 self.send_message(can.Message(arbitration_id=0x740, data=[0x06, 0x2F, 0x4B, 0x12, 0x03, 0x45, 0x45, 0x00]),
                                 f"EVRL выкл ({i+1}/5)", T2)
-                pbar.update(1)
+                self.log_writer.advance()
 
             # === Переключение на RR ===
             self.send_message(can.Message(arbitration_id=0x740, data=[0x06, 0x2F, 0x4B, 0x12, 0x03, 0x55, 0x41, 0x00]),
                             "shu_1 выкл", T4)
-            pbar.update(1)
+            self.log_writer.advance()
             self.send_message(can.Message(arbitration_id=0x740, data=[0x06, 0x2F, 0x4B, 0x12, 0x03, 0x75, 0x42, 0x00]),
                             "AVRL вкл, iso_2 вкл", T3)
-            pbar.update(1)
+            self.log_writer.advance()
             self.switch_wheel("RR")
 
             # === RR этап ===
-            print(f"{COLOR_CYAN}>>> Начало тестирования RR колеса{COLOR_RESET}")
+            self.console(str, f"{COLOR_CYAN}>>> Начало тестирования RR колеса{COLOR_RESET}")
             rr_commands = [
                 ([0x06, 0x2F, 0x4B, 0x12, 0x03, 0x55, 0x42, 0x00], "AVRL выкл", T3),
                 ([0x06, 0x2F, 0x4B, 0x12, 0x03, 0x55, 0x4A, 0x00], "shu_2 вкл", T4),
@@ -834,28 +882,28 @@ class UniversalValveController:
 
             for data, desc, stage_time in rr_commands:
                 self.send_message(can.Message(arbitration_id=0x740, data=data), desc, stage_time)
-                pbar.update(1)
+                self.log_writer.advance()
 
             # === ЦИКЛ RR: 5 включений/выключений ===
-            print(f"{COLOR_CYAN}>>> Цикл RR: 5 включений/выключений{COLOR_RESET}")
+            self.console(str, f"{COLOR_CYAN}>>> Цикл RR: 5 включений/выключений{COLOR_RESET}")
             for i in range(5):
                 self.send_message(can.Message(arbitration_id=0x740, data=[0x06, 0x2F, 0x4B, 0x12, 0x03, 0x55, 0x4A, 0x00]),
                                 f"EVRR вкл ({i+1}/5)", T2)
-                pbar.update(1)
+                self.log_writer.advance()
                 self.send_message(can.Message(arbitration_id=0x740, data=[0x06, 0x2F, 0x4B, 0x12, 0x03, 0x15, 0x4A, 0x00]),
                                 f"EVRR выкл ({i+1}/5)", T2)
-                pbar.update(1)
+                self.log_writer.advance()
 
             # === Завершение ===
             self.send_message(can.Message(arbitration_id=0x740, data=[0x06, 0x2F, 0x4B, 0x12, 0x03, 0x55, 0x42, 0x00]),
                             "shu_2 выкл", T4)
-            pbar.update(1)
+            self.log_writer.advance()
             self.send_message(can.Message(arbitration_id=0x740, data=[0x06, 0x2F, 0x4B, 0x12, 0x03, 0xD5, 0x42, 0x00]),
                             "AVRR вкл", T3)
-            pbar.update(1)
+            self.log_writer.advance()
             self.send_message(can.Message(arbitration_id=0x740, data=[0x06, 0x2F, 0x4B, 0x12, 0x03, 0x55, 0x42, 0x00]),
                             "AVRR выкл", T4)
-            pbar.update(1)
+            self.log_writer.advance()
 
             # === Финальные команды ===
             final_commands = [
@@ -868,8 +916,9 @@ class UniversalValveController:
 
             for data, desc, stage_time in final_commands:
                 self.send_message(can.Message(arbitration_id=0x740, data=data), desc, stage_time)
-                pbar.update(1)
+                self.log_writer.advance()
 
+            self.log_writer.attach_progress(None)
             pbar.close()
 
             total_time = time.time() - start_time
@@ -913,6 +962,8 @@ def main():
                        help='Timeout for response waiting (default: 0.1s)')
     parser.add_argument('--no-replace-cmd', action='store_true',
                        help='Disable command modification (use original commands)')
+    parser.add_argument('--pipelined', action='store_true',
+                       help='Replay on the recorded timeline without blocking on each 0x760 response')
 
     args = parser.parse_args()
 
@@ -938,7 +989,7 @@ def main():
     # Запуск выбранного режима
     success = False
     if args.replay_blf:
-        success = controller.replay_blf_file(args.replay_blf, timeout=args.timeout)
+        success = controller.replay_blf_file(args.replay_blf, timeout=args.timeout, pipelined=args.pipelined)
     elif args.table_sequence:
         success = controller.run_table_sequence()
 
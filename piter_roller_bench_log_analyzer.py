@@ -25,6 +25,14 @@ python can_analyzer.py -t ascii         # ASCII лог
 # Дополнительные опции
 python can_analyzer.py --only-requests  # Только запросы (игнорировать ответы)
 python can_analyzer.py --no-graph       # Не создавать графики
+python can_analyzer.py --rebuild-cache  # Пересобрать кэш распарсенного лога (*.cache.npz)
+python can_analyzer.py --no-cache       # Не использовать кэш
+python can_analyzer.py --step-graph     # Старый ступенчатый график вместо интервалов
+python can_analyzer.py --no-rasterize   # Не растеризовать полосы клапанов
+
+# Batch режим без окон: папка или маска, параллельно, с общей сводной таблицей
+python can_analyzer.py batch D:/bench_logs -j 8
+python can_analyzer.py -t xlsx_custom batch "D:/bench_logs/*.xlsx" --force
 
 # Комбинированные опции
 python can_analyzer.py -t xlsx_custom --only-requests --no-graph
@@ -142,10 +150,18 @@ import chardet
 from datetime import datetime
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
-from can import BLFReader
 import can
+import numpy as np
 import pandas as pd
 import argparse
+import glob
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from xlsx_stream_reader import FACTORY_COLUMNS, read_xlsx_header, read_xlsx_frame, read_factory_can_events, TIME_OF_DAY_RE
+from log_cache import load_cache, save_cache
+from blf_index import read_messages
+from timebase import format_report, is_clean, normalize_timestamps
 
 target_ids = [0x740, 0x760]
 
@@ -164,6 +180,24 @@ GRAPH_FOR_MOTOR_ONLY = False
 
 IGNORE_RESPONSES_IN_GRAPH = True
 
+# без окон Tk: сообщения только в консоль (batch режим)
+HEADLESS = False
+
+# кэш распарсенных XLSX/CSV/ASCII логов рядом с исходником (см. log_cache.py)
+USE_LOG_CACHE = True
+# принудительно пересобрать кэш (--rebuild-cache)
+REBUILD_LOG_CACHE = False
+
+# файл с хешами уже обработанных файлов в корне batch-папки
+BATCH_MANIFEST_NAME = ".batch_manifest.json"
+BATCH_EXTENSIONS = ['.blf', '.csv', '.xlsx', '.xls', '.txt', '.log', '.asc']
+
+# рисовать клапаны интервалами (один broken_barh на клапан) вместо ступенчатых линий.
+# Время отрисовки зависит от числа смен состояния, а не от числа команд
+GRAPH_AS_INTERVALS = True
+# растеризовать полосы клапанов в PNG (быстрее на логах с десятками тысяч команд)
+RASTERIZE_TIMELINE = True
+
 # Valve names mapping table - ОБНОВЛЕНО
 VALVE_NAMES = {
     "pump": "pump",  # Изменено с "pu"
@@ -230,6 +264,80 @@ def find_valve_activity_period(processed_data):
 
     return (start_time_with_buffer, end_time_with_buffer)
 
+def build_valve_state_runs(graph_data, first_timestamp):
+    """
+    Сворачивает подряд идущие одинаковые состояния клапанов в интервалы (run-length encoding).
+    Возвращает список (start_sec, end_sec, bitmask), где бит i соответствует VALVE_ORDER[i].
+    Последний интервал заканчивается на последней временной метке.
+    """
+    valve_bits = {valve: 1 << i for i, valve in enumerate(VALVE_ORDER)}
+
+    runs = []
+    current_bytes = None
+    current_mask = 0
+    run_start = None
+    last_time = None
+
+    for entry in graph_data:
+        bytes_val = entry[2]
+        valves = entry[4]
+        timestamp_ms = entry[7]
+        if timestamp_ms is None:
+            continue
+
+        time_sec = (timestamp_ms - first_timestamp) / 1000.0
+        last_time = time_sec
+
+        # Сравниваем сырые байты - маску считаем только при смене состояния
+        if bytes_val == current_bytes:
+            continue
+
+        mask = 0
+        for valve in valves:
+            mask |= valve_bits.get(valve, 0)
+
+        if run_start is not None and mask == current_mask:
+            current_bytes = bytes_val
+            continue
+
+        if run_start is not None:
+            runs.append((run_start, time_sec, current_mask))
+
+        current_bytes = bytes_val
+        current_mask = mask
+        run_start = time_sec
+
+    if run_start is not None:
+        runs.append((run_start, last_time, current_mask))
+
+    return runs
+
+def valve_intervals_from_runs(runs):
+    """
+    Превращает интервалы состояний в xranges (start, width) для каждого клапана.
+    Соседние интервалы с активным клапаном склеиваются.
+    """
+    intervals = {valve: [] for valve in VALVE_ORDER}
+
+    for bit, valve in enumerate(VALVE_ORDER):
+        valve_mask = 1 << bit
+        open_start = None
+        open_end = None
+
+        for start_sec, end_sec, mask in runs:
+            if mask & valve_mask:
+                if open_start is None:
+                    open_start = start_sec
+                open_end = end_sec
+            elif open_start is not None:
+                intervals[valve].append((open_start, open_end - open_start))
+                open_start = None
+
+        if open_start is not None:
+            intervals[valve].append((open_start, open_end - open_start))
+
+    return intervals
+
 def filter_data_for_motor_period(processed_data, activity_period):
     """
     Фильтрует processed_data, оставляя только данные в пределах периода активности клапанов
@@ -256,10 +364,10 @@ def detect_file_format(file_path):
     elif ext == '.csv':
         return 'csv'
     elif ext in ['.xlsx', '.xls']:
-        # Проверяем структуру файла для определения подтипа
+        # Проверяем структуру файла для определения подтипа - читаем только заголовок
         try:
-            df = pd.read_excel(file_path)
-            if all(col in df.columns for col in ['№ п/п', 'Date', 'Time', 'Type', 'Level', 'Event']):
+            columns = read_xlsx_header(file_path)
+            if all(col in columns for col in FACTORY_COLUMNS):
                 return 'xlsx_custom'  # Новый формат
             else:
                 return 'xlsx'  # Старый формат
@@ -285,63 +393,31 @@ def parse_xlsx_file_custom(file_path):
     """
     Parses XLSX file in custom format (№ п/п, Date, Time, Type, Level, Event)
     Returns list of tuples: (timestamp_ms, hex_data_string, original_line)
+    Потоковое чтение (openpyxl read-only) + векторный разбор Event и Date/Time
     """
     messages = []
 
     try:
-        # Читаем Excel файл
-        df = pd.read_excel(file_path)
-        print(f"Excel file loaded. Shape: {df.shape}")
-        print(f"Columns: {df.columns.tolist()}")
-
-        # Фильтруем только CAN сообщения
-        df_can = df[df['Type'] == 'Can'].copy()
-        print(f"Found {len(df_can)} CAN messages")
-
-        # Функция для парсинга CAN сообщений из колонки Event
-        def parse_can_event(event_str):
-            pattern = r'\[(0x[0-9a-fA-F]+)\]\s*\((\d+)\)\s*(->|<-)\s*(.+)'
-            match = re.search(pattern, event_str)
-
-            if match:
-                can_id = match.group(1)
-                dlc = int(match.group(2))
-                direction = match.group(3)
-                data_hex = match.group(4)
+        # Читаем только CAN строки, Event и время уже разобраны
+        events = read_factory_can_events(file_path)
+        print(f"Found {len(events)} CAN messages")
 
-                # Конвертируем данные в формат XX XX XX
-                hex_bytes = data_hex.split()
-                formatted_data = ' '.join([byte.upper().replace('0X', '') for byte in hex_bytes])
+        # Строки без распознанного Event пропускаем
+        events = events[events['can_id'].notna() & (events['data_hex'].fillna('') != '')]
 
-                return can_id, dlc, direction, formatted_data
-            return None, None, None, None
-
-        # Обрабатываем каждую CAN строку
-        for idx, row in df_can.iterrows():
-            try:
-                # Создаем timestamp (объединяем дату и время)
-                timestamp_str = f"{row['Date']} {row['Time']}"
-
-                # Парсим CAN сообщение
-                can_id, dlc, direction, data = parse_can_event(str(row['Event']))
-
-                if can_id and data:
-                    # Парсим timestamp в миллисекунды
-                    timestamp_ms = parse_timestamp_custom(timestamp_str)
-                    if timestamp_ms is None:
-                        timestamp_ms = idx * 1000  # fallback
-
-                    # Создаем оригинальную строку для совместимости
-                    original_line = f"Date: {row['Date']} Time: {row['Time']} Event: {row['Event']}"
+        for row in events.itertuples(index=False):
+            if row.ms_of_day == row.ms_of_day:  # not NaN
+                timestamp_ms = int(row.ms_of_day)
+            else:
+                timestamp_ms = row.row_index * 1000  # fallback
 
-                    messages.append((timestamp_ms, data, original_line))
+            # Создаем оригинальную строку для совместимости
+            original_line = f"Date: {row.date} Time: {row.time} Event: {row.event}"
 
-                    if len(messages) <= 5:  # Выводим первые 5 сообщений для отладки
-                        print(f"DEBUG: Parsed CAN message - Time: {timestamp_str}, ID: {can_id}, Data: {data}")
+            messages.append((timestamp_ms, row.data_hex, original_line))
 
-            except Exception as e:
-                print(f"Error parsing row {idx}: {e}")
-                continue
+            if len(messages) <= 5:  # Выводим первые 5 сообщений для отладки
+                print(f"DEBUG: Parsed CAN message - Time: {row.date} {row.time}, ID: 0x{int(row.can_id):X}, Data: {row.data_hex}")
 
         print(f"Successfully parsed {len(messages)} CAN messages from XLSX")
         return messages
@@ -442,31 +518,25 @@ def parse_ascii_log(file_path):
         return []
 
 def parse_blf_file(file_path):
-    """Parses BLF file with fallback for invalid timestamps"""
+    """Parses BLF file; zero/mixed/backward timestamps are repaired by timebase.normalize_timestamps"""
     messages = []
 
     try:
-        with BLFReader(file_path) as log:
-            msg_index = 0
-            for msg in log:
-                if msg.arbitration_id not in target_ids:
-                    continue
-
-                # Check if timestamp is valid (not 0 or very small)
-                if msg.timestamp < 0.001:  # Less than 1ms - likely invalid
-                    # Use message index as fallback (10ms intervals)
-                    timestamp_ms = msg_index * 10
-                    if msg_index < 5:  # Show first 5 for debugging
-                        print(f"Warning: Invalid timestamp {msg.timestamp:.6f} for message {msg_index}, "
-                              f"using index-based time: {timestamp_ms} ms")
-                else:
-                    timestamp_ms = int(msg.timestamp * 1000)
-
-                hex_data = ' '.join(f'{b:02X}' for b in msg.data)
-                original_line = f"{msg.timestamp:.6f};ID={msg.arbitration_id:03X};{hex_data}"
-
-                messages.append((timestamp_ms, hex_data, original_line))
-                msg_index += 1
+        # кадры не из target_ids отсеиваются по заголовку объекта, без can.Message (blf_index.py)
+        frames = list(read_messages(file_path, target_ids))
+        timestamps = np.fromiter((msg.timestamp for msg in frames), dtype=np.float64, count=len(frames))
+        # метки < 1 мс, переключение относительное -> абсолютное время и скачки назад
+        # чинятся на массиве целиком; лог без меток получает индекс * 10 мс, как раньше
+        fixed, report = normalize_timestamps(timestamps, inplace=True)
+        if not is_clean(report):
+            print(format_report(report))
+        timestamps_ms = (fixed * 1000).astype(np.int64).tolist()
+
+        for msg, timestamp_ms in zip(frames, timestamps_ms):
+            hex_data = ' '.join(f'{b:02X}' for b in msg.data)
+            original_line = f"{msg.timestamp:.6f};ID={msg.arbitration_id:03X};{hex_data}"
+
+            messages.append((timestamp_ms, hex_data, original_line))
 
         print(f"Parsed BLF file: {len(messages)} relevant CAN messages found")
         return messages
@@ -533,198 +603,9 @@ def parse_csv_file(file_path):
 def parse_xlsx_file(file_path):
     """
     Parses XLSX file and returns list of tuples: (timestamp_ms, hex_data_string, original_line)
-    Улучшенная версия с лучшей обработкой ID и отладочной информацией
+    Оставлено для совместимости - то же самое, что parse_xlsx_file_generic
     """
-    messages = []
-
-    try:
-        # Читаем Excel файл
-        df = pd.read_excel(file_path)
-        print(f"Excel file loaded. Shape: {df.shape}")
-        print(f"Columns: {df.columns.tolist()}")
-
-        # Автоматическое определение колонок
-        time_col = None
-        data_col = None
-        id_col = None
-
-        # Сначала ищем по ключевым словам в названиях колонок
-        for col in df.columns:
-            col_str = str(col).lower()
-
-            # Поиск колонки времени
-            if not time_col and any(keyword in col_str for keyword in
-                                  ['time', 'timestamp', 'время', 'date', 'временная']):
-                time_col = col
-                print(f"Found time column: {col}")
-
-            # Поиск колонки данных
-            if not data_col and any(keyword in col_str for keyword in
-                                  ['data', 'данные', 'hex', 'message', 'can']):
-                data_col = col
-                print(f"Found data column: {col}")
-
-            # Поиск колонки ID
-            if not id_col and any(keyword in col_str for keyword in
-                                ['id', 'идентификатор', 'arbitration']):
-                id_col = col
-                print(f"Found ID column: {col}")
-
-        # Если не нашли по названиям, используем стандартные имена
-        if not time_col:
-            for col in ['Time', 'Время', 'Timestamp']:
-                if col in df.columns:
-                    time_col = col
-                    break
-            if not time_col and len(df.columns) >= 1:
-                time_col = df.columns[0]
-                print(f"Using first column as time: {time_col}")
-
-        if not data_col:
-            for col in ['Data', 'Данные', 'Message', 'CAN Data']:
-                if col in df.columns:
-                    data_col = col
-                    break
-            if not data_col and len(df.columns) >= 2:
-                data_col = df.columns[1]
-                print(f"Using second column as data: {data_col}")
-
-        if not id_col:
-            for col in ['ID', 'Id', 'Arbitration ID']:
-                if col in df.columns:
-                    id_col = col
-                    break
-            if not id_col and len(df.columns) >= 3:
-                id_col = df.columns[2]
-                print(f"Using third column as ID: {id_col}")
-
-        print(f"Final columns - Time: {time_col}, Data: {data_col}, ID: {id_col}")
-
-        if time_col is None or data_col is None:
-            raise ValueError(f"Cannot find required columns. Time: {time_col}, Data: {data_col}")
-
-        # Функция для парсинга ID с поддержкой разных форматов
-        def parse_id(id_val):
-            if pd.isna(id_val):
-                return None
-            try:
-                if isinstance(id_val, str):
-                    id_val = id_val.strip()
-                    # Убираем префиксы если есть
-                    if id_val.startswith('0x'):
-                        return int(id_val, 16)
-                    elif id_val.startswith('⇨') or id_val.startswith('⇦'):
-                        # Убираем стрелки если есть
-                        id_val = id_val[1:].strip()
-                    # Пробуем как hex (без префикса)
-                    try:
-                        return int(id_val, 16)
-                    except ValueError:
-                        # Пробуем как decimal
-                        return int(id_val)
-                else:
-                    # Если это число, считаем что это уже правильный ID
-                    return int(id_val)
-            except Exception as e:
-                print(f"Error parsing ID '{id_val}': {e}")
-                return None
-
-        # Собираем статистику по ID для отладки
-        id_stats = {}
-        processed_count = 0
-        target_ids_found = 0
-
-        # Обрабатываем каждую строку
-        for index, row in df.iterrows():
-            try:
-                # Получаем данные
-                if data_col not in row:
-                    continue
-
-                hex_data = str(row[data_col]).strip()
-
-                # Пропускаем пустые строки
-                if not hex_data or hex_data.lower() in ['nan', 'none', '']:
-                    continue
-
-                # Очищаем данные - убираем лишние пробелы
-                hex_data = ' '.join(hex_data.split())
-
-                # Парсим ID
-                arbitration_id = None
-                if id_col and id_col in row and not pd.isna(row[id_col]):
-                    arbitration_id = parse_id(row[id_col])
-
-                    # Собираем статистику
-                    if arbitration_id is not None:
-                        id_stats[arbitration_id] = id_stats.get(arbitration_id, 0) + 1
-
-                    # Фильтруем по целевым ID
-                    if arbitration_id not in target_ids:
-                        continue
-                    else:
-                        target_ids_found += 1
-                else:
-                    # Если нет колонки ID, пропускаем фильтрацию
-                    print(f"Warning: No ID column or empty ID in row {index}")
-                    continue
-
-                # Получаем время
-                timestamp_ms = None
-                if time_col in row and not pd.isna(row[time_col]):
-                    timestamp_str = str(row[time_col])
-                    timestamp_ms = parse_timestamp(timestamp_str)
-
-                    # Альтернативные методы парсинга времени
-                    if timestamp_ms is None:
-                        try:
-                            if isinstance(row[time_col], (pd.Timestamp, datetime)):
-                                dt = row[time_col]
-                                total_seconds = dt.hour * 3600 + dt.minute * 60 + dt.second
-                                timestamp_ms = int(total_seconds * 1000 + dt.microsecond / 1000)
-                                print(f"Parsed timestamp from datetime: {dt} -> {timestamp_ms} ms")
-                        except:
-                            pass
-
-                # Если время не распарсилось, используем индекс
-                if timestamp_ms is None:
-                    timestamp_ms = index * 1000
-                    print(f"Using index as timestamp for row {index}: {timestamp_ms} ms")
-
-                # Создаем оригинальную строку для совместимости
-                original_parts = []
-                if time_col in row:
-                    original_parts.append(f"Time: {row[time_col]}")
-                if id_col and id_col in row:
-                    original_parts.append(f"ID: {row[id_col]}")
-                original_parts.append(f"Data: {hex_data}")
-
-                original_line = "; ".join(original_parts)
-
-                messages.append((timestamp_ms, hex_data, original_line))
-                processed_count += 1
-
-                if processed_count <= 5:  # Выводим первые 5 сообщений для отладки
-                    print(f"DEBUG: Successfully parsed row {index}: ID={arbitration_id:03X}, Data={hex_data}")
-
-            except Exception as e:
-                print(f"Error parsing row {index}: {e}")
-                continue
-
-        # Выводим статистику по ID
-        print(f"ID statistics in XLSX file:")
-        for id_val, count in sorted(id_stats.items()):
-            print(f"  ID 0x{id_val:03X} ({id_val}): {count} occurrences")
-
-        print(f"Target IDs found: {target_ids_found}")
-        print(f"Successfully parsed XLSX file: {processed_count} messages processed")
-        return messages
-
-    except Exception as e:
-        print(f"Error parsing XLSX file: {e}")
-        import traceback
-        traceback.print_exc()
-        return []
+    return parse_xlsx_file_generic(file_path)
 
 def parse_xlsx_file_generic(file_path):
     """
@@ -734,8 +615,8 @@ def parse_xlsx_file_generic(file_path):
     messages = []
 
     try:
-        # Читаем Excel файл
-        df = pd.read_excel(file_path)
+        # Читаем Excel файл потоково (openpyxl read-only)
+        df = read_xlsx_frame(file_path)
         print(f"Excel file loaded. Shape: {df.shape}")
         print(f"Columns: {df.columns.tolist()}")
 
@@ -827,85 +708,48 @@ def parse_xlsx_file_generic(file_path):
 
         # Собираем статистику по ID для отладки
         id_stats = {}
-        processed_count = 0
-        target_ids_found = 0
-
-        # Обрабатываем каждую строку
-        for index, row in df.iterrows():
-            try:
-                # Получаем данные
-                if data_col not in row:
-                    continue
-
-                hex_data = str(row[data_col]).strip()
-
-                # Пропускаем пустые строки
-                if not hex_data or hex_data.lower() in ['nan', 'none', '']:
-                    continue
 
-                # Очищаем данные - убираем лишние пробелы
-                hex_data = ' '.join(hex_data.split())
-
-                # Парсим ID
-                arbitration_id = None
-                if id_col and id_col in row and not pd.isna(row[id_col]):
-                    arbitration_id = parse_id(row[id_col])
-
-                    # Собираем статистику
-                    if arbitration_id is not None:
-                        id_stats[arbitration_id] = id_stats.get(arbitration_id, 0) + 1
-
-                    # Фильтруем по целевым ID
-                    if arbitration_id not in target_ids:
-                        continue
-                    else:
-                        target_ids_found += 1
-                else:
-                    # Если нет колонки ID, пропускаем фильтрацию
-                    print(f"Warning: No ID column or empty ID in row {index}")
-                    continue
-
-                # Получаем время
-                timestamp_ms = None
-                if time_col in row and not pd.isna(row[time_col]):
-                    timestamp_str = str(row[time_col])
-                    timestamp_ms = parse_timestamp(timestamp_str)
-
-                    # Альтернативные методы парсинга времени
-                    if timestamp_ms is None:
-                        try:
-                            if isinstance(row[time_col], (pd.Timestamp, datetime)):
-                                dt = row[time_col]
-                                total_seconds = dt.hour * 3600 + dt.minute * 60 + dt.second
-                                timestamp_ms = int(total_seconds * 1000 + dt.microsecond / 1000)
-                                print(f"Parsed timestamp from datetime: {dt} -> {timestamp_ms} ms")
-                        except:
-                            pass
-
-                # Если время не распарсилось, используем индекс
-                if timestamp_ms is None:
-                    timestamp_ms = index * 1000
-                    print(f"Using index as timestamp for row {index}: {timestamp_ms} ms")
-
-                # Создаем оригинальную строку для совместимости
-                original_parts = []
-                if time_col in row:
-                    original_parts.append(f"Time: {row[time_col]}")
-                if id_col and id_col in row:
-                    original_parts.append(f"ID: {row[id_col]}")
-                original_parts.append(f"Data: {hex_data}")
-
-                original_line = "; ".join(original_parts)
-
-                messages.append((timestamp_ms, hex_data, original_line))
-                processed_count += 1
-
-                if processed_count <= 5:  # Выводим первые 5 сообщений для отладки
-                    print(f"DEBUG: Successfully parsed row {index}: ID={arbitration_id:03X}, Data={hex_data}")
-
-            except Exception as e:
-                print(f"Error parsing row {index}: {e}")
-                continue
+        # Разбираем ID один раз по уникальным значениям и отбрасываем чужие ID до цикла по строкам
+        if id_col and id_col in df.columns:
+            unique_ids = {val: parse_id(val) for val in df[id_col].dropna().unique()}
+            parsed_ids = df[id_col].map(unique_ids)
+            id_stats = {int(k): int(v) for k, v in parsed_ids.dropna().value_counts().items()}
+            df = df[parsed_ids.isin(target_ids)]
+
+        if not (id_col and id_col in df.columns):
+            # Без колонки ID фильтровать по целевым ID нечем - как раньше, строки пропускаются
+            print("Warning: No ID column, rows skipped")
+            df = df.iloc[0:0]
+        target_ids_found = len(df)
+
+        # Данные: пустые строки пропускаются, лишние пробелы убираются
+        hex_data = df[data_col].map(str).str.split().str.join(' ')
+        keep = hex_data.notna() & ~hex_data.str.lower().isin(['nan', 'none', ''])
+        df, hex_data = df[keep], hex_data[keep]
+
+        # Время HH:MM:SS[.mmm] (строкой, datetime или time) -> мс от начала суток, векторно;
+        # не распарсилось - индекс строки * 1000, как раньше
+        time_text = df[time_col].map(str).str.replace(r'[⇨⇦]', '', regex=True)
+        parts = time_text.str.extract(TIME_OF_DAY_RE)
+        fraction = parts[3].fillna('').str.ljust(3, '0').str[:3]
+        timestamps_ms = ((pd.to_numeric(parts[0], errors='coerce') * 3600 +
+                          pd.to_numeric(parts[1], errors='coerce') * 60 +
+                          pd.to_numeric(parts[2], errors='coerce')) * 1000 +
+                         pd.to_numeric(fraction, errors='coerce'))
+        unparsed = timestamps_ms.isna() | df[time_col].isna()
+        if unparsed.any():
+            print(f"Using index as timestamp for {int(unparsed.sum())} row(s) without a parsable time")
+            timestamps_ms[unparsed] = df.index[unparsed.to_numpy()].to_numpy() * 1000
+
+        # Оригинальная строка для совместимости
+        original_lines = ("Time: " + df[time_col].map(str) + "; ID: " + df[id_col].map(str) +
+                          "; Data: " + hex_data) if len(df) else hex_data
+
+        messages = list(zip(timestamps_ms.astype('int64').tolist(), hex_data.tolist(), original_lines.tolist()))
+        processed_count = len(messages)
+
+        for index, line in zip(df.index[:5], original_lines[:5]):  # первые 5 сообщений для отладки
+            print(f"DEBUG: Successfully parsed row {index}: {line}")
 
         # Выводим статистику по ID
         print(f"ID statistics in XLSX file:")
@@ -929,6 +773,33 @@ def parse_input_file(file_path, file_type='auto'):
 
     print(f"Using file type: {file_type.upper()}")
 
+    # BLF и так бинарный - кэшируем только текстовые/табличные форматы
+    if USE_LOG_CACHE and file_type != 'blf':
+        profile = f"analyzer_{file_type}"
+        params = {'target_ids': target_ids}
+
+        if not REBUILD_LOG_CACHE:
+            columns, _ = load_cache(file_path, profile, params)
+            if columns is not None:
+                messages = list(zip(columns['timestamp_ms'].tolist(),
+                                    columns['hex_data'].tolist(),
+                                    columns['original_line'].tolist()))
+                print(f"Loaded {len(messages)} messages from cache")
+                return messages
+
+        messages = parse_input_file_uncached(file_path, file_type)
+        if messages:
+            save_cache(file_path, profile, {
+                'timestamp_ms': [m[0] for m in messages],
+                'hex_data': [m[1] for m in messages],
+                'original_line': [m[2] for m in messages],
+            }, params)
+        return messages
+
+    return parse_input_file_uncached(file_path, file_type)
+
+def parse_input_file_uncached(file_path, file_type):
+    """Dispatches to the format-specific parser without touching the cache"""
     if file_type == 'blf':
         return parse_blf_file(file_path)
     elif file_type == 'csv':
@@ -1307,8 +1178,9 @@ def analyze_response_times(command_stats):
 
     return stats
 
-def format_command_analysis_report(command_stats, file_format):
-    """Formats command analysis for the report - ОБНОВЛЕНО с анализом времени ответа"""
+def format_command_analysis_report(command_stats, file_format, response_time_stats):
+    """Formats command analysis for the report - ОБНОВЛЕНО с анализом времени ответа
+    response_time_stats - результат analyze_response_times (или None)"""
     report = []
 
     report.append("COMMAND ANALYSIS REPORT")
@@ -1339,7 +1211,6 @@ def format_command_analysis_report(command_stats, file_format):
         report.append("")
 
     # НОВЫЙ РАЗДЕЛ: Анализ времени ответа блока
-    response_time_stats = analyze_response_times(command_stats)
     if response_time_stats:
         report.append("=" * 80)
         report.append("ECU RESPONSE TIME ANALYSIS")
@@ -1748,6 +1619,11 @@ def analyze_pressure_modes(processed_data):
 
 def show_message(title, message, is_error=False):
     """Shows message without blocking main thread"""
+    if HEADLESS:
+        prefix = "ERROR" if is_error else "INFO"
+        print(f"[{prefix}] {title}: {message}")
+        return
+
     root = tk.Tk()
     root.withdraw()
     root.attributes('-topmost', True)
@@ -1871,26 +1747,46 @@ def create_valve_timeline_graph(directory, filename, processed_data, pressure_st
             print("[GraphDebug] Could not find any timestamps")
             return None
 
-        # Теперь строим timeline для клапанов
-        for idx, entry in enumerate(graph_data):
-            line_num, sequence, bytes_val, timediff, valves, req_type, full_line, timestamp_ms = entry
-
-            if timestamp_ms is not None:
-                time_sec = (timestamp_ms - first_timestamp) / 1000.0
-
-                for valve in VALVE_ORDER:
-                    is_active = valve in valves
-                    valve_timelines[valve].append((time_sec, is_active))
-
         if first_timestamp is None:
             print("[GraphDebug] Could not parse timestamps - first_timestamp is None")
             return None
 
+        if GRAPH_AS_INTERVALS:
+            # Сворачиваем одинаковые состояния в интервалы - один broken_barh на клапан
+            runs = build_valve_state_runs(graph_data, first_timestamp)
+            valve_intervals = valve_intervals_from_runs(runs)
+            print(f"[GraphDebug] Collapsed {len(graph_data)} commands into {len(runs)} state runs")
+        else:
+            # Теперь строим timeline для клапанов
+            for idx, entry in enumerate(graph_data):
+                line_num, sequence, bytes_val, timediff, valves, req_type, full_line, timestamp_ms = entry
+
+                if timestamp_ms is not None:
+                    time_sec = (timestamp_ms - first_timestamp) / 1000.0
+
+                    for valve in VALVE_ORDER:
+                        is_active = valve in valves
+                        valve_timelines[valve].append((time_sec, is_active))
+
         # Create figure
         fig, ax = plt.subplots(figsize=(16, 10), dpi=150)
 
         # Plot each valve
         for idx, valve in enumerate(VALVE_ORDER):
+            if GRAPH_AS_INTERVALS:
+                xranges = valve_intervals[valve]
+                if not xranges:
+                    continue
+
+                y_pos = len(VALVE_ORDER) - idx
+                ax.broken_barh(xranges, (y_pos - 0.35, 0.7),
+                               facecolors=VALVE_COLORS[valve],
+                               edgecolor='none',
+                               alpha=0.8,
+                               label=valve,
+                               rasterized=RASTERIZE_TIMELINE)
+                continue
+
             timeline = valve_timelines[valve]
             if not timeline:
                 continue
@@ -2075,7 +1971,8 @@ RELEASE : Outlet valve active (for specific wheel)
 
 
 # Add this to your existing write_analysis_report function:
-def write_analysis_report(directory, filename, processed_data, mismatches, pressure_stats, command_stats, file_format):
+def write_analysis_report(directory, filename, processed_data, mismatches, pressure_stats, command_stats, file_format,
+                          response_time_stats):
     """Creates detailed report file with command analysis"""
     VALVE_ORDER_FULL = [
         "pump", "FL RR Electric shuttle EV", "FR RL Electric shuttle EV",
@@ -2101,7 +1998,7 @@ def write_analysis_report(directory, filename, processed_data, mismatches, press
             report_file.write("=" * 160 + "\n\n")
 
             # Add command analysis at the beginning
-            command_report = format_command_analysis_report(command_stats, file_format)
+            command_report = format_command_analysis_report(command_stats, file_format, response_time_stats)
             report_file.write(command_report)
             report_file.write("\n\n")
 
@@ -2227,7 +2124,7 @@ def process_file(file_path, file_type='auto'):
 
         if not messages:
             show_message("Error", "No valid messages found in file", is_error=True)
-            return
+            return None
 
         # Analyze commands with file format information
         command_stats = analyze_commands(messages, actual_file_type)
@@ -2484,6 +2381,9 @@ def process_file(file_path, file_type='auto'):
         # Analyze pressure modes
         pressure_stats = analyze_pressure_modes(processed_data)
 
+        # Время ответа считаем один раз - и для отчёта, и для сводки batch режима
+        response_time_stats = analyze_response_times(command_stats)
+
         # Create graph if enabled
         graph_path = None
         if WITHGRAPH and processed_data:
@@ -2492,7 +2392,8 @@ def process_file(file_path, file_type='auto'):
         # Create report if we have processed data
         report_path = None
         if processed_data:
-            report_path = write_analysis_report(output_dir, filename_no_ext, processed_data, mismatches, pressure_stats, command_stats, actual_file_type)
+            report_path = write_analysis_report(output_dir, filename_no_ext, processed_data, mismatches, pressure_stats, command_stats, actual_file_type,
+                                                response_time_stats)
             if report_path:
                 print(f"\nCreated detailed report file: {report_path}")
             else:
@@ -2509,10 +2410,184 @@ def process_file(file_path, file_type='auto'):
                     f"{'Created detailed report file.' if processed_data else ''}{mismatch_msg}{graph_msg}\n"
                     f"Original file unchanged.")
 
+        # Сводка для batch режима
+        summary = {
+            'file': filename_with_ext,
+            'file_type': actual_file_type,
+            'messages': len(messages),
+            'combinations': processed_count,
+            'commands_2F': len(command_stats['2F_commands']),
+            'responses_6F': len(command_stats['6F_responses']),
+            'errors_7F': len(command_stats['7F_errors']),
+            'missing_responses': len(command_stats['missing_responses']),
+            'mismatches': len(mismatches),
+        }
+        for wheel in ['FL', 'FR', 'RL', 'RR']:
+            summary[f'build_{wheel}_s'] = round(pressure_stats['build'][wheel], 3)
+            summary[f'release_{wheel}_s'] = round(pressure_stats['release'][wheel], 3)
+        if response_time_stats:
+            summary['response_avg_ms'] = round(response_time_stats['average'], 2)
+            summary['response_min_ms'] = response_time_stats['min']
+            summary['response_max_ms'] = response_time_stats['max']
+        else:
+            summary['response_avg_ms'] = None
+            summary['response_min_ms'] = None
+            summary['response_max_ms'] = None
+
+        return summary
+
     except Exception as e:
         show_message("Error", f"Error processing file: {e}", is_error=True)
         import traceback
         traceback.print_exc()
+        return None
+
+
+def file_content_hash(file_path):
+    """SHA1 от содержимого файла - чтобы не обрабатывать неизменённые логи повторно"""
+    sha = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def collect_batch_files(path_or_glob):
+    """
+    Собирает список логов для batch режима: папка (рекурсивно) или glob-маска.
+    Возвращает (root_directory, sorted list of file paths)
+    """
+    if os.path.isdir(path_or_glob):
+        root_dir = path_or_glob
+        candidates = glob.glob(os.path.join(path_or_glob, '**', '*'), recursive=True)
+        candidates = [f for f in candidates if os.path.splitext(f)[1].lower() in BATCH_EXTENSIONS]
+    else:
+        candidates = glob.glob(path_or_glob, recursive=True)
+        if candidates:
+            root_dir = os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in candidates])
+        else:
+            root_dir = os.getcwd()
+
+    files = []
+    for f in candidates:
+        if not os.path.isfile(f):
+            continue
+        name = os.path.basename(f)
+        # пропускаем собственные выходные файлы анализатора
+        if name.startswith('v_names_') or name.startswith('batch_summary_') or name.startswith('valves_analysis_'):
+            continue
+        files.append(os.path.abspath(f))
+
+    return os.path.abspath(root_dir), sorted(files)
+
+def load_batch_manifest(root_dir):
+    manifest_path = os.path.join(root_dir, BATCH_MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[Batch] Warning: could not read manifest {manifest_path}: {e}")
+        return {}
+
+def save_batch_manifest(root_dir, manifest):
+    manifest_path = os.path.join(root_dir, BATCH_MANIFEST_NAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+def _batch_worker_init(only_request, with_graph, graph_as_intervals, rasterize, use_cache, rebuild_cache):
+    """Инициализация процесса-воркера: флаги не наследуются при spawn (Windows)"""
+    global ONLYREQUEST, WITHGRAPH, GRAPH_AS_INTERVALS, RASTERIZE_TIMELINE, HEADLESS
+    global USE_LOG_CACHE, REBUILD_LOG_CACHE
+    ONLYREQUEST = only_request
+    WITHGRAPH = with_graph
+    GRAPH_AS_INTERVALS = graph_as_intervals
+    RASTERIZE_TIMELINE = rasterize
+    USE_LOG_CACHE = use_cache
+    REBUILD_LOG_CACHE = rebuild_cache
+    HEADLESS = True
+    plt.switch_backend('Agg')
+
+def _batch_process_one(file_path, file_type):
+    summary = process_file(file_path, file_type)
+    return file_path, summary
+
+def process_batch(path_or_glob, file_type='auto', jobs=None, force=False):
+    """
+    Headless batch режим: обрабатывает все логи из папки/маски в параллельных процессах.
+    Для каждого файла создаются те же выходные файлы, что и в обычном режиме,
+    плюс общий batch_summary_<timestamp>.csv в корневой папке.
+    Файлы с неизменённым содержимым (по SHA1) пропускаются, их строки берутся из манифеста.
+    """
+    global HEADLESS
+    HEADLESS = True
+
+    root_dir, files = collect_batch_files(path_or_glob)
+    if not files:
+        print(f"[Batch] No log files found for: {path_or_glob}")
+        return None
+
+    manifest = {} if force else load_batch_manifest(root_dir)
+
+    rows = {}
+    to_process = {}
+    for file_path in files:
+        key = os.path.relpath(file_path, root_dir)
+        content_hash = file_content_hash(file_path)
+        entry = manifest.get(key)
+        if entry and entry.get('sha1') == content_hash and entry.get('summary'):
+            rows[key] = entry['summary']
+            continue
+        to_process[file_path] = (key, content_hash)
+
+    print(f"[Batch] Files found: {len(files)}, unchanged (skipped): {len(rows)}, to process: {len(to_process)}")
+
+    if to_process:
+        with ProcessPoolExecutor(max_workers=jobs,
+                                 initializer=_batch_worker_init,
+                                 initargs=(ONLYREQUEST, WITHGRAPH, GRAPH_AS_INTERVALS, RASTERIZE_TIMELINE,
+                                           USE_LOG_CACHE, REBUILD_LOG_CACHE)) as executor:
+            futures = {executor.submit(_batch_process_one, file_path, file_type): file_path
+                       for file_path in to_process}
+
+            for done, future in enumerate(as_completed(futures), start=1):
+                file_path = futures[future]
+                key, content_hash = to_process[file_path]
+                try:
+                    _, summary = future.result()
+                    error = None if summary is not None else "processing failed, see log"
+                except Exception as e:
+                    summary, error = None, f"{type(e).__name__}: {e}"
+
+                if summary is None:
+                    # Строка с ошибкой попадает в сводку, но не в манифест - файл повторится в следующем прогоне
+                    print(f"[Batch] ({done}/{len(futures)}) FAILED: {key}: {error}")
+                    rows[key] = {'file': key, 'error': error}
+                    manifest.pop(key, None)
+                    continue
+
+                summary['file'] = key
+                rows[key] = summary
+                manifest[key] = {'sha1': content_hash, 'summary': summary}
+                print(f"[Batch] ({done}/{len(futures)}) done: {key}")
+
+                # Сохраняем манифест по ходу, чтобы прерванный прогон не начинался с нуля
+                save_batch_manifest(root_dir, manifest)
+
+    if not rows:
+        print("[Batch] Nothing to summarize")
+        return None
+
+    summary_df = pd.DataFrame([rows[key] for key in sorted(rows)])
+    if 'error' in summary_df.columns:
+        summary_df = summary_df[[c for c in summary_df.columns if c != 'error'] + ['error']]
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    summary_path = os.path.join(root_dir, f"batch_summary_{timestamp}.csv")
+    summary_df.to_csv(summary_path, index=False, sep=';', encoding='utf-8-sig')
+    print(f"[Batch] Summary table: {summary_path}")
+    return summary_path
 
 
 def main():
@@ -2526,18 +2601,44 @@ def main():
                        help='Process only requests (skip responses)')
     parser.add_argument('--no-graph', action='store_true',
                        help='Disable graph generation')
+    parser.add_argument('--rebuild-cache', action='store_true',
+                       help='Ignore and rebuild the parsed-log cache next to the source file')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Do not read or write the parsed-log cache')
+    parser.add_argument('--step-graph', action='store_true',
+                       help='Draw valves as step lines (slow on long logs) instead of intervals')
+    parser.add_argument('--no-rasterize', action='store_true',
+                       help='Keep valve bars as vector graphics')
+
+
+    subparsers = parser.add_subparsers(dest='command')
+    batch_parser = subparsers.add_parser('batch', help='Headless batch processing of a directory or glob')
+    batch_parser.add_argument('path', help='Directory (searched recursively) or glob pattern, e.g. "logs/*.blf"')
+    batch_parser.add_argument('-j', '--jobs', type=int, default=None,
+                              help='Number of worker processes (default: CPU count)')
+    batch_parser.add_argument('--force', action='store_true',
+                              help='Reprocess files even if their content is unchanged')
 
     args = parser.parse_args()
 
     # Update global flags
-    global ONLYREQUEST, WITHGRAPH
+    global ONLYREQUEST, WITHGRAPH, GRAPH_AS_INTERVALS, RASTERIZE_TIMELINE, USE_LOG_CACHE, REBUILD_LOG_CACHE
     ONLYREQUEST = args.only_requests
     WITHGRAPH = not args.no_graph
+    GRAPH_AS_INTERVALS = not args.step_graph
+    RASTERIZE_TIMELINE = not args.no_rasterize
+    USE_LOG_CACHE = not args.no_cache
+    REBUILD_LOG_CACHE = args.rebuild_cache
 
     print(f"File type: {args.type}")
     print(f"Only requests: {ONLYREQUEST}")
     print(f"With graph: {WITHGRAPH}")
 
+    if args.command == 'batch':
+        process_batch(args.path, args.type, jobs=args.jobs, force=args.force)
+        print("\nScript finished.")
+        return
+
     # Select file
     path_to_file, directory, name_no_ext, extension = select_file("Select log file")
 
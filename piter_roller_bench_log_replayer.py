@@ -40,6 +40,7 @@ CAN Bus Valve Control Replay Script
   python replay_740_760.py              # реальный Kvaser адаптер
   python replay_740_760.py --virtual    # виртуальный канал (для теста)
   python replay_740_760.py -v           # короткий флаг
+  python replay_740_760.py --rebuild-cache  # пересобрать кэш XLSX (*.cache.npz)
 
 КОНФИГУРАЦИЯ:
   - blf_file_path: путь к BLF файлу
@@ -52,7 +53,7 @@ CAN Bus Valve Control Replay Script
   - python-can
   - canlib (Kvaser CANlib SDK)
   - tqdm (прогресс-бар)
-  - pandas (для XLSX файлов)
+  - pandas + openpyxl (для XLSX файлов, см. xlsx_stream_reader.py)
 
 ИЗВЕСТНЫЕ БАГИ:
     Так и не проигрывает логи из автоваза. Так и не нашёл я баг. Но это и не потребовалось.
@@ -62,11 +63,12 @@ CAN Bus Valve Control Replay Script
 import can
 import time
 import argparse
-import re
-import pandas as pd
 from tqdm import tqdm
 from pathlib import Path
-from datetime import datetime
+from replay_scheduler import ReplayScheduler
+from xlsx_stream_reader import FACTORY_COLUMNS, read_xlsx_header, read_factory_can_events
+from log_cache import load_cache, save_cache, messages_to_columns, columns_to_messages
+from blf_index import read_messages
 from canlib import canlib
 
 # ANSI цветовые коды
@@ -83,6 +85,10 @@ REPLACE_CMD = True
 #  BLF_FILE_PATH = "./log_to_replay/XTAGA0000T0014007.xlsx"
 BLF_FILE_PATH = "/home/st/tmptmp/Roller_bench_12025_11_18_13_25_30_xjo_dynamic_OK.blf"
 
+# Кэш распарсенного XLSX рядом с исходником (см. log_cache.py)
+USE_LOG_CACHE = True
+REBUILD_LOG_CACHE = False
+
 
 
 
@@ -108,98 +114,56 @@ def parse_xlsx_file(file_path):
 
     Формат XLSX нового завода:
     № п/п | Date       | Time         | Type | Level | Event
+
+    Файл читается потоково (openpyxl read-only), Event и Date/Time разбираются векторно.
     """
     try:
-        # Читаем Excel файл
-        df = pd.read_excel(file_path)
-        print(f"{COLOR_WHITE}XLSX файл загружен. Строк: {len(df)}{COLOR_RESET}")
-        print(f"{COLOR_WHITE}Колонки: {df.columns.tolist()}{COLOR_RESET}")
+        # Проверяем наличие обязательных колонок - читаем только заголовок
+        columns = read_xlsx_header(file_path)
+        print(f"{COLOR_WHITE}Колонки: {columns}{COLOR_RESET}")
 
-        # Проверяем наличие обязательных колонок
-        required_columns = ['№ п/п', 'Date', 'Time', 'Type', 'Level', 'Event']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        missing_columns = [col for col in FACTORY_COLUMNS if col not in columns]
 
         if missing_columns:
             print(f"{COLOR_RED}ОШИБКА: В файле отсутствуют обязательные колонки: {missing_columns}{COLOR_RESET}")
             return []
 
-        # Фильтруем только CAN сообщения
-        df_can = df[df['Type'] == 'Can'].copy()
+        # Только CAN сообщения (Type='Can')
+        df_can = read_factory_can_events(file_path)
         print(f"{COLOR_WHITE}Найдено CAN сообщений: {len(df_can)}{COLOR_RESET}")
 
         if len(df_can) == 0:
             print(f"{COLOR_RED}ОШИБКА: В файле нет CAN сообщений (Type='Can'){COLOR_RESET}")
             return []
 
+        bad_time = df_can['timestamp'].isna().sum()
+        if bad_time:
+            print(f"{COLOR_RED}Ошибка парсинга времени в {bad_time} строках - пропущены{COLOR_RESET}")
+
         messages = []
         base_timestamp = None
 
-        # Функция для парсинга времени
-        def parse_timestamp(date_str, time_str):
-            try:
-                # Объединяем дату и время
-                datetime_str = f"{date_str} {time_str}"
-                # Парсим в datetime объект
-                dt = datetime.strptime(datetime_str, "%d.%m.%Y %H:%M:%S.%f")
-                return dt.timestamp()
-            except ValueError:
-                try:
-                    dt = datetime.strptime(datetime_str, "%d.%m.%Y %H:%M:%S")
-                    return dt.timestamp()
-                except Exception as e:
-                    print(f"{COLOR_RED}Ошибка парсинга времени '{datetime_str}': {e}{COLOR_RESET}")
-                    return None
-
-        # Функция для парсинга CAN события
-        def parse_can_event(event_str):
-            pattern = r'\[(0x[0-9a-fA-F]+)\]\s*\((\d+)\)\s*(->|<-)\s*(.+)'
-            match = re.search(pattern, event_str)
-
-            if match:
-                can_id = match.group(1)  # 0x740 или 0x760
-                dlc = int(match.group(2))
-                direction = match.group(3)  # -> или <-
-                data_hex = match.group(4)   # HEX данные
-
-                # Конвертируем CAN ID
-                try:
-                    arbitration_id = int(can_id, 16)
-                except:
-                    print(f"{COLOR_RED}Ошибка парсинга CAN ID: {can_id}{COLOR_RESET}")
-                    return None, None, None
-
-                # Конвертируем HEX данные в байты
-                try:
-                    hex_bytes = data_hex.split()
-                    data_bytes = bytes(int(byte, 16) for byte in hex_bytes)
-
-                    if len(data_bytes) != dlc:
-                        print(f"{COLOR_YELLOW}Предупреждение: DLC ({dlc}) не соответствует длине данных ({len(data_bytes)}){COLOR_RESET}")
-
-                    return arbitration_id, data_bytes, direction
-                except Exception as e:
-                    print(f"{COLOR_RED}Ошибка парсинга данных: {data_hex} - {e}{COLOR_RESET}")
-                    return None, None, None
-
-            return None, None, None
-
         # Обрабатываем каждую CAN строку
         valid_messages = 0
-        for idx, row in df_can.iterrows():
+        for row in df_can.itertuples(index=False):
             try:
-                # Парсим время
-                timestamp = parse_timestamp(row['Date'], row['Time'])
-                if timestamp is None:
+                # Время уже распарсено
+                timestamp = row.timestamp
+                if timestamp != timestamp:  # NaN
                     continue
 
                 # Устанавливаем базовое время
                 if base_timestamp is None:
                     base_timestamp = timestamp
 
-                # Парсим CAN событие
-                arbitration_id, data, direction = parse_can_event(str(row['Event']))
-                if arbitration_id is None:
+                # CAN событие уже разобрано
+                if row.can_id != row.can_id or not row.data_hex:
                     continue
+                arbitration_id = int(row.can_id)
+                data = bytes.fromhex(row.data_hex)
+
+                if len(data) != int(row.dlc):
+                    print(f"{COLOR_YELLOW}Предупреждение: DLC ({int(row.dlc)}) не соответствует длине данных ({len(data)}){COLOR_RESET}")
 
                 # Создаем CAN сообщение
                 # Временная метка относительно начала файла
@@ -209,7 +173,7 @@ def parse_xlsx_file(file_path):
                     arbitration_id=arbitration_id,
                     data=data,
                     timestamp=relative_timestamp,
-                    is_rx=(direction == '<-')
+                    is_rx=(row.direction == '<-')
                 )
 
                 messages.append(msg)
@@ -217,11 +181,10 @@ def parse_xlsx_file(file_path):
 
                 # Выводим первые несколько сообщений для отладки
                 if valid_messages <= 3:
-                    data_hex = ' '.join([f'{b:02X}' for b in data])
-                    print(f"{COLOR_WHITE}DEBUG: CAN ID: 0x{arbitration_id:03X}, Data: {data_hex}, Time: {relative_timestamp:.3f}s{COLOR_RESET}")
+                    print(f"{COLOR_WHITE}DEBUG: CAN ID: 0x{arbitration_id:03X}, Data: {row.data_hex}, Time: {relative_timestamp:.3f}s{COLOR_RESET}")
 
             except Exception as e:
-                print(f"{COLOR_RED}Ошибка обработки строки {idx}: {e}{COLOR_RESET}")
+                print(f"{COLOR_RED}Ошибка обработки строки {row.row_index}: {e}{COLOR_RESET}")
                 continue
 
         print(f"{COLOR_GREEN}Успешно обработано CAN сообщений: {valid_messages}{COLOR_RESET}")
@@ -388,16 +351,25 @@ def read_can_messages(file_path):
 
     if file_ext in ['.blf']:
         # Старый функционал для BLF файлов
-        messages = []
-        with can.BLFReader(file_path) as log:
-            for msg in log:
-                if msg.arbitration_id == 0x740:
-                    messages.append(msg)
-        return messages
+        # остальные кадры отсеиваются по заголовку объекта, без can.Message (blf_index.py)
+        return list(read_messages(file_path, {0x740}))
 
     elif file_ext in ['.xlsx', '.xls']:
         # Новый функционал для XLSX файлов нового завода
-        return parse_xlsx_file(file_path)
+        if not USE_LOG_CACHE:
+            return parse_xlsx_file(file_path)
+
+        if not REBUILD_LOG_CACHE:
+            columns, _ = load_cache(file_path, "replay_740")
+            if columns is not None:
+                messages = columns_to_messages(columns)
+                print(f"{COLOR_GREEN}Из кэша: {len(messages)} сообщений 0x740{COLOR_RESET}")
+                return messages
+
+        messages = parse_xlsx_file(file_path)
+        if messages:
+            save_cache(file_path, "replay_740", messages_to_columns(messages))
+        return messages
 
     else:
         print(f"{COLOR_RED}Неподдерживаемый формат файла: {file_ext}{COLOR_RESET}")
@@ -505,8 +477,10 @@ def replay_740_760(use_virtual=False):
             # Прогресс-бар
             pbar = tqdm(total=total_requests, desc="Отправка 0x740", unit="msg", ncols=100)
 
-            start_time = time.perf_counter()
             first_timestamp = requests_740[0].timestamp
+            scheduler = ReplayScheduler()
+            scheduler.start(first_timestamp)
+            start_time = scheduler.start_perf
 
             success_count = 0
             timeout_count = 0
@@ -515,9 +489,7 @@ def replay_740_760(use_virtual=False):
             for i, msg in enumerate(requests_740):
                 try:
                     # Выдерживаем временные интервалы из лога
-                    elapsed = msg.timestamp - first_timestamp
-                    while (time.perf_counter() - start_time) < elapsed:
-                        time.sleep(0.001)
+                    deadline = scheduler.wait_until(msg.timestamp)
 
                     # Определяем тип сообщения для цветового кодирования
                     msg_type = get_message_type(msg.data)
@@ -544,6 +516,7 @@ def replay_740_760(use_virtual=False):
 
                     # Отправляем сообщение
                     bus.send(tx_msg)
+                    scheduler.record_send(deadline)
 
                     # Создаем сообщение для логирования с текущим временем
                     current_ts = time.perf_counter() - start_time + first_timestamp
@@ -617,6 +590,7 @@ def replay_740_760(use_virtual=False):
             print(f"{COLOR_GREEN}Успешных ответов: {success_count}{COLOR_RESET}")
             print(f"{COLOR_RED}Negative Response: {error_count}{COLOR_RESET}")
             print(f"{COLOR_RED}Таймаутов: {timeout_count}{COLOR_RESET}")
+            print(f"{COLOR_WHITE}{scheduler.format_report()}{COLOR_RESET}")
             print(f"{COLOR_GREEN}{'='*60}{COLOR_RESET}")
 
     except Exception as e:
@@ -628,6 +602,13 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Replay CAN messages 0x740 -> 0x760')
     parser.add_argument('--virtual', '-v', action='store_true',
                         help='Use Kvaser virtual channel')
+    parser.add_argument('--rebuild-cache', action='store_true',
+                        help='Rebuild the parsed XLSX cache (*.cache.npz)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not use the parsed XLSX cache')
     args = parser.parse_args()
 
+    USE_LOG_CACHE = not args.no_cache
+    REBUILD_LOG_CACHE = args.rebuild_cache
+
     replay_740_760(use_virtual=args.virtual)
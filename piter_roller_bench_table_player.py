@@ -5,14 +5,32 @@ Plays ESC valve testing sequence according to table 1 or 2.
 Tables are presented in a maximally readable format with full descriptions.
 
 CYCLE MODE: Use --cycle to repeat table infinitely with pause between cycles.
+
+Tables are compiled once (table_sequence.compile_table) into a flat schedule of
+preallocated frames; every frame and every cycle start is an absolute deadline,
+so the timing does not drift over thousands of cycles.
+
+TABLE FILES: --table-file tables/table1.json (or .yaml) replaces the built-in
+TABLE_1/TABLE_2. The file is validated on load; --review prints every frame with
+decoded valve bits. In cycle mode the file is watched and changes are applied at
+the next cycle boundary without reconnecting the bus.
+
+TELEMETRY: --telemetry endurance.sqlite records one row per cycle and per frame
+(planned vs actual send time, 0x760 response latency, NRC) - see cycle_telemetry.py
+for the query CLI.
 """
 
 import can
+import math
 import time
 import argparse
 import os
 from datetime import datetime
 from tqdm import tqdm
+from async_log_writer import AsyncLogWriter
+from replay_scheduler import ReplayScheduler
+from cycle_telemetry import CommandRecord, ResponseCollector, TelemetryStore, format_cycle_summary
+from table_sequence import TableWatcher, compile_table, format_table_review, play_schedule
 
 # ANSI color codes
 COLOR_RED = "\033[91m"
@@ -199,14 +217,30 @@ TABLE_2 = {
 }
 
 
+def format_tx_line(timestamp, data):
+    """ASC-like line for a sent 0x740 frame"""
+    data_hex = ' '.join([f'{b:02X}' for b in data])
+    return f"{COLOR_WHITE}{timestamp:.6f} 0  740       Tx   d {len(data)} {data_hex}{COLOR_RESET}"
+
+
+def format_step_line(description):
+    return f"{COLOR_CYAN}# {description}{COLOR_RESET}"
+
+
 class ValveController:
-    def __init__(self, use_virtual=True, channel=0, bitrate=500000, blf_prefix=None):
+    def __init__(self, use_virtual=True, channel=0, bitrate=500000, blf_prefix=None, telemetry_path=None):
         self.use_virtual = use_virtual
         self.channel = channel
         self.bitrate = bitrate
         self.blf_prefix = blf_prefix
+        self.telemetry_path = telemetry_path
         self.bus = None
         self.logger = None
+        self.log_writer = None
+        self.log_filename = None
+        self.telemetry = None
+        self.collector = None
+        self.notifier = None
         self.current_wheel = "FL"
         self.current_diagonal = "FL_RR"
 
@@ -238,6 +272,15 @@ class ValveController:
                 )
 
             print(f"{COLOR_GREEN}Successfully connected to CAN bus{COLOR_RESET}")
+
+            # Frame output and BLF writes run in a background thread, outside the send timing
+            self.log_writer = AsyncLogWriter()
+
+            if self.telemetry_path:
+                self.telemetry = TelemetryStore(self.telemetry_path)
+                self.collector = ResponseCollector()
+                self.notifier = can.Notifier(self.bus, [self.collector], timeout=0.05)
+                print(f"{COLOR_GREEN}Telemetry: {self.telemetry_path}{COLOR_RESET}")
             return True
 
         except Exception as e:
@@ -246,6 +289,20 @@ class ValveController:
 
     def disconnect(self):
         """Disconnect from CAN bus and close logger"""
+        if self.notifier:
+            self.notifier.stop()
+            self.notifier = None
+            self.collector = None
+
+        if self.telemetry:
+            self.telemetry.close()
+            self.telemetry = None
+
+        if self.log_writer:
+            self.log_writer.close()
+            print(f"{COLOR_WHITE}{self.log_writer.format_report()}{COLOR_RESET}")
+            self.log_writer = None
+
         if self.logger:
             self.logger.stop()
             self.logger = None
@@ -256,6 +313,10 @@ class ValveController:
 
     def start_new_log(self, table_num, cycle_num=None):
         """Start new BLF log file"""
+        if self.log_writer:
+            # drain queued frames into the previous file before closing it
+            self.log_writer.set_blf_writer(None)
+
         if self.logger:
             self.logger.stop()
             self.logger = None
@@ -269,111 +330,148 @@ class ValveController:
 
             os.makedirs(os.path.dirname(filename) if os.path.dirname(filename) else '.', exist_ok=True)
             self.logger = can.BLFWriter(filename)
+            self.log_filename = filename
+            if self.log_writer:
+                self.log_writer.set_blf_writer(self.logger)
             print(f"{COLOR_GREEN}Logging to: {filename}{COLOR_RESET}")
             return filename
         return None
 
     def log_message(self, msg):
-        """Log message"""
-        if self.logger:
+        """Queue message for the BLF log"""
+        if self.log_writer:
+            self.log_writer.blf(msg)
+        elif self.logger:
             self.logger.on_message_received(msg)
 
-    def send_command(self, data, description="", stage_time=T1):
-        """Send command with stage time delay"""
-        if not self.bus:
-            print(f"{COLOR_RED}CAN bus not connected!{COLOR_RESET}")
-            return False
-
-        try:
-            stage_start = time.time()
-
-            tx_msg = can.Message(
-                arbitration_id=0x740,
-                data=data,
-                is_extended_id=False,
-                timestamp=time.time()
-            )
-
-            self.bus.send(tx_msg)
-            self.log_message(tx_msg)
-
-            data_hex = ' '.join([f'{b:02X}' for b in data])
-            print(f"{COLOR_WHITE}{tx_msg.timestamp:.6f} 0  740       Tx   d {len(data)} {data_hex}{COLOR_RESET}")
-
-            if description:
-                print(f"{COLOR_CYAN}# {description}{COLOR_RESET}")
-
-            elapsed = time.time() - stage_start
-            remaining = stage_time - elapsed
-            if remaining > 0:
-                time.sleep(remaining)
-
-            return True
-
-        except Exception as e:
-            print(f"{COLOR_RED}Send error: {e}{COLOR_RESET}")
-            return False
-
-    def run_sequence_once(self, table_data, show_header=True):
-        """Run table sequence once (without connect/disconnect)"""
+    def console(self, formatter, *args):
+        """Console line, formatter(*args) runs in the writer thread"""
+        if self.log_writer:
+            self.log_writer.console(formatter, *args)
+        else:
+            print(formatter(*args))
+
+    def on_frame_sent(self, schedule, index, msg):
+        """Logging for a sent frame (called right after bus.send)"""
+        self.log_message(msg)
+        self.console(format_tx_line, msg.timestamp, msg.data)
+        description = schedule.descriptions[index]
+        if description:
+            self.console(format_step_line, description)
+        self.log_writer.advance()
+
+    def on_send_error(self, index, msg, error):
+        print(f"{COLOR_RED}Send error: {error}{COLOR_RESET}")
+        self.log_writer.advance()
+
+    def register_command(self, schedule, scheduler, base, index, msg):
+        """Telemetry record for a frame, registered before bus.send so a fast response is not lost"""
+        deadline = scheduler.deadline_for(base + schedule.offsets[index])
+        record = CommandRecord(index, msg, schedule.descriptions[index], schedule.offsets[index],
+                               deadline, None)
+        self.collector.register(record)
+        return record
+
+    def confirm_command(self, scheduler, record, failed=False):
+        """Send result for a registered record; scheduler.errors[-1] is the error of this send"""
+        if failed:
+            self.collector.mark_failed(record)
+        else:
+            send_error = scheduler.errors[-1]
+            self.collector.confirm_send(record, record.send_time + send_error, send_error)
+
+    def run_sequence_once(self, table_data, schedule, scheduler, base=0.0, show_header=True, cycle_num=1):
+        """
+        Run compiled table schedule once (without connect/disconnect).
+        base - cycle start offset on the scheduler timeline.
+        """
         if show_header:
             print(f"\n{COLOR_YELLOW}{'='*80}{COLOR_RESET}")
             print(f"{COLOR_YELLOW}{table_data['name']}{COLOR_RESET}")
             print(f"{COLOR_YELLOW}{table_data['description']}{COLOR_RESET}")
             print(f"{COLOR_YELLOW}{'='*80}{COLOR_RESET}")
             print(f"{COLOR_WHITE}Time intervals: T1={T1}s, T2={T2}s, T3={T3}s, T4={T4}s, T5={T5}s{COLOR_RESET}")
+            print(f"{COLOR_WHITE}Compiled: {len(schedule)} frames, {schedule.duration:.3f}s per cycle{COLOR_RESET}")
             print()
 
-        # Count total steps
-        total_steps = 0
-        for step in table_data["sequence"]:
-            if "repeat" in step:
-                total_steps += step["repeat"] * 2
-            else:
-                total_steps += 1
-
-        pbar = tqdm(total=total_steps, desc="Sending commands", unit="msg", ncols=100)
-        start_time = time.time()
-
-        for step in table_data["sequence"]:
-            if "repeat" in step:
-                default_time = step.get("time", T2)
-                off_time = step.get("off_time", default_time)
-                on_time = step.get("on_time", default_time)
-
-                for i in range(step["repeat"]):
-                    self.send_command(step["off"], f"{step['desc']} - OFF ({i+1}/{step['repeat']})", off_time)
-                    pbar.update(1)
-                    self.send_command(step["on"], f"{step['desc']} - ON ({i+1}/{step['repeat']})", on_time)
-                    pbar.update(1)
-            else:
-                self.send_command(step["data"], step["desc"], step["time"])
-                pbar.update(1)
+        pbar = tqdm(total=len(schedule), desc="Sending commands", unit="msg", ncols=100)
+        self.log_writer.attach_progress(pbar)
+        start_time = time.perf_counter()
 
+        registered = {}
+
+        def before_send(index, msg):
+            registered[index] = self.register_command(schedule, scheduler, base, index, msg)
+
+        def on_sent(index, msg):
+            if self.collector:
+                self.confirm_command(scheduler, registered.pop(index))
+            self.on_frame_sent(schedule, index, msg)
+
+        def on_error(index, msg, error):
+            if self.collector:
+                self.confirm_command(scheduler, registered.pop(index), failed=True)
+            self.on_send_error(index, msg, error)
+
+        if self.collector:
+            self.collector.start_cycle()
+        play_schedule(self.bus, schedule, scheduler, base, on_sent=on_sent, on_error=on_error,
+                      before_send=before_send if self.collector else None)
+
+        self.log_writer.attach_progress(None)
         pbar.close()
-        total_time = time.time() - start_time
+        total_time = time.perf_counter() - start_time
+
+        if self.telemetry:
+            records = self.collector.finish_cycle()
+            first_sent = next((record for record in records if record.send_error is not None), None)
+            self.telemetry.record_cycle(cycle_num, records, base,
+                                        first_sent.send_error if first_sent else None,
+                                        total_time, self.log_filename)
+            print(f"{COLOR_WHITE}{format_cycle_summary(self.telemetry, cycle_num)}{COLOR_RESET}")
         return total_time
 
-    def run_table_sequence(self, table_data, cycle_pause=None):
+    def wait_cycle_start(self, scheduler, base):
+        """Countdown to the next cycle start (absolute deadline)"""
+        next_start = scheduler.deadline_for(base)
+        remaining = next_start - time.perf_counter()
+        while remaining > 0:
+            whole = math.ceil(remaining)
+            print(f"\r{COLOR_YELLOW}    Next cycle in: {whole}s   {COLOR_RESET}", end='', flush=True)
+            if whole <= 1:
+                break  # the last fraction is waited precisely by play_schedule
+            time.sleep(remaining - (whole - 1))
+            remaining = next_start - time.perf_counter()
+        print()
+
+    def run_table_sequence(self, table_data, cycle_pause=None, table_watcher=None):
         """
         Run table sequence.
         If cycle_pause is set, runs infinitely with pause between cycles.
+        table_watcher - TableWatcher of the table file: checked at every cycle boundary.
         """
         if not self.connect():
             return False
 
         table_num = 1 if "Table 1" in table_data['name'] else 2
+        schedule = compile_table(table_data, repeat_default_time=T2)
+        scheduler = ReplayScheduler()
+        if self.telemetry:
+            run_id = self.telemetry.start_run(table_data['name'], len(schedule), schedule.duration, cycle_pause)
+            print(f"{COLOR_WHITE}Telemetry run id: {run_id}{COLOR_RESET}")
 
         try:
             if cycle_pause is None:
                 # Single run mode
                 self.start_new_log(table_num)
-                total_time = self.run_sequence_once(table_data, show_header=True)
+                scheduler.start(0.0)
+                total_time = self.run_sequence_once(table_data, schedule, scheduler)
                 print(f"\n{COLOR_GREEN}Table {table_data['name']} completed in {total_time:.1f} seconds!{COLOR_RESET}")
             else:
                 # Infinite cycle mode
                 cycle_num = 1
                 total_cycles_time = 0
+                base = 0.0
 
                 print(f"\n{COLOR_MAGENTA}{'='*80}{COLOR_RESET}")
                 print(f"{COLOR_MAGENTA}CYCLE MODE: Table {table_num}, pause {cycle_pause}s between cycles{COLOR_RESET}")
@@ -387,8 +485,11 @@ class ValveController:
 
                     # New log file for each cycle
                     self.start_new_log(table_num, cycle_num)
+                    if cycle_num == 1:
+                        scheduler.start(0.0)
 
-                    cycle_time = self.run_sequence_once(table_data, show_header=(cycle_num == 1))
+                    cycle_time = self.run_sequence_once(table_data, schedule, scheduler, base,
+                                                        show_header=(cycle_num == 1), cycle_num=cycle_num)
                     total_cycles_time += cycle_time
 
                     print(f"\n{COLOR_GREEN}Cycle {cycle_num} completed in {cycle_time:.1f}s (total: {total_cycles_time:.1f}s){COLOR_RESET}")
@@ -397,11 +498,17 @@ class ValveController:
                     print(f"{COLOR_YELLOW}>>> Waiting {cycle_pause} seconds before next cycle...{COLOR_RESET}")
                     print(f"{COLOR_YELLOW}    (Press Ctrl+C to stop){COLOR_RESET}")
 
-                    # Countdown with progress
-                    for remaining in range(int(cycle_pause), 0, -1):
-                        print(f"\r{COLOR_YELLOW}    Next cycle in: {remaining}s   {COLOR_RESET}", end='', flush=True)
-                        time.sleep(1)
-                    print()
+                    # Next cycle starts at an absolute offset: no drift accumulates between cycles
+                    base += schedule.duration + cycle_pause
+
+                    if table_watcher:
+                        reloaded = table_watcher.poll()
+                        if reloaded:
+                            table_data, schedule = reloaded
+                            print(f"{COLOR_MAGENTA}>>> Table file changed, next cycle uses: {table_data['name']} "
+                                  f"({len(schedule)} frames, {schedule.duration:.3f}s){COLOR_RESET}")
+
+                    self.wait_cycle_start(scheduler, base)
 
                     cycle_num += 1
 
@@ -416,6 +523,8 @@ class ValveController:
             print(f"{COLOR_RED}Execution error: {e}{COLOR_RESET}")
             return False
         finally:
+            if scheduler.errors:
+                print(f"{COLOR_WHITE}{scheduler.format_report()}{COLOR_RESET}")
             self.disconnect()
 
         return True
@@ -459,6 +568,8 @@ Usage examples:
   %(prog)s -t 2 --cycle 30          # Run table 2 infinitely (30s pause)
   %(prog)s -t 1 -p mytest --cycle   # With BLF prefix + infinite cycle
   %(prog)s -t 2 --no-virtual        # Use real CAN interface
+  %(prog)s --table-file tables/table1.json --cycle   # Table from file, edits applied between cycles
+  %(prog)s --table-file tables/table2.json --review  # Decoded valve states, no execution
         """
     )
 
@@ -479,6 +590,12 @@ Usage examples:
                        help='CAN bus speed (default: 500000)')
     parser.add_argument('--compare', action='store_true',
                        help='Show table comparison without execution')
+    parser.add_argument('--table-file', type=str, default=None,
+                       help='Table definition file (.json/.yaml) instead of the built-in table; reloaded between cycles')
+    parser.add_argument('--review', action='store_true',
+                       help='Print the compiled table with decoded valve bits and exit')
+    parser.add_argument('--telemetry', type=str, default=None, metavar='SQLITE',
+                       help='Append per-cycle/per-frame timing and 0x760 responses to this SQLite file')
 
     args = parser.parse_args()
 
@@ -487,13 +604,26 @@ Usage examples:
         return
 
     # Table selection
-    if args.table == 1:
+    table_watcher = None
+    if args.table_file:
+        table_watcher = TableWatcher(args.table_file, repeat_default_time=T2)
+        try:
+            table_data, schedule = table_watcher.load()
+        except (OSError, ValueError) as e:
+            print(f"{COLOR_RED}Invalid table file {args.table_file}: {e}{COLOR_RESET}")
+            return
+        print(f"\n{COLOR_GREEN}Selected table file: {args.table_file} ({table_data['name']}){COLOR_RESET}")
+    elif args.table == 1:
         table_data = TABLE_1
         print(f"\n{COLOR_GREEN}Selected TABLE 1{COLOR_RESET}")
     else:
         table_data = TABLE_2
         print(f"\n{COLOR_GREEN}Selected TABLE 2{COLOR_RESET}")
 
+    if args.review:
+        print(format_table_review(table_data, compile_table(table_data, repeat_default_time=T2)))
+        return
+
     # Mode info
     if args.cycle is not None:
         print(f"{COLOR_CYAN}Mode: INFINITE CYCLE (pause: {args.cycle}s){COLOR_RESET}")
@@ -508,14 +638,15 @@ Usage examples:
         use_virtual=args.virtual,
         channel=args.channel,
         bitrate=args.bitrate,
-        blf_prefix=args.prefix
+        blf_prefix=args.prefix,
+        telemetry_path=args.telemetry
     )
 
     # Brief comparison
     print_table_comparison()
 
     # Run
-    controller.run_table_sequence(table_data, cycle_pause=args.cycle)
+    controller.run_table_sequence(table_data, cycle_pause=args.cycle, table_watcher=table_watcher)
 
 
 if __name__ == "__main__":
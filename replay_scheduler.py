@@ -0,0 +1,154 @@
+"""
+Точный планировщик отправки кадров для реплееров
+=================================================
+
+Раньше все реплееры ждали следующий кадр так:
+
+    while (time.perf_counter() - start_time) < elapsed:
+        time.sleep(0.001)
+
+На Linux это будит процесс тысячу раз в секунду и даёт перелёт до 1 мс и больше
+(sleep(0.001) фактически спит 1.05-1.1 мс + планировщик ОС).
+
+ReplayScheduler:
+- дедлайны абсолютные (от момента start()), ошибки не накапливаются;
+  опоздавший кадр уходит сразу, следующие догоняют расписание
+- спит одним time.sleep() до (дедлайн - SPIN_THRESHOLD), последние сотни
+  микросекунд докручивает busy-wait на perf_counter()
+- для каждого кадра записывает ошибку времени отправки и печатает гистограмму
+
+ИСПОЛЬЗОВАНИЕ:
+    scheduler = ReplayScheduler()
+    scheduler.start(first_timestamp=requests[0].timestamp)
+    for msg in requests:
+        deadline = scheduler.wait_until(msg.timestamp)
+        bus.send(tx_msg)
+        scheduler.record_send(deadline)
+    scheduler.print_report()
+"""
+
+import sys
+import time
+from array import array
+
+# Сколько последних секунд до дедлайна докручивать busy-wait.
+# На Windows до 3.11 sleep() имеет разрешение ~15 мс, поэтому порог больше.
+if sys.platform == 'win32' and sys.version_info < (3, 11):
+    SPIN_THRESHOLD = 0.016
+elif sys.platform == 'win32':
+    SPIN_THRESHOLD = 0.002
+else:
+    SPIN_THRESHOLD = 0.0003
+
+# Границы корзин гистограммы ошибки отправки, микросекунды (отрицательные - раньше срока)
+HISTOGRAM_EDGES_US = [-1000, -100, 0, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 50000]
+
+
+class ReplayScheduler:
+    def __init__(self, spin_threshold=SPIN_THRESHOLD):
+        self.spin_threshold = spin_threshold
+        self.start_perf = None
+        self.first_timestamp = 0.0
+        self.errors = array('d')  # секунды, send_time - deadline
+
+    def start(self, first_timestamp=0.0):
+        """Фиксирует момент начала: кадр с first_timestamp уходит сразу"""
+        self.first_timestamp = first_timestamp
+        self.start_perf = time.perf_counter()
+        self.errors = array('d')
+
+    def deadline_for(self, timestamp):
+        """Абсолютный дедлайн (perf_counter) для временной метки из лога"""
+        return self.start_perf + (timestamp - self.first_timestamp)
+
+    def sleep_until(self, deadline):
+        """Грубый sleep + точный spin до абсолютного дедлайна perf_counter()"""
+        remaining = deadline - time.perf_counter()
+        if remaining > self.spin_threshold:
+            time.sleep(remaining - self.spin_threshold)
+        while time.perf_counter() < deadline:
+            pass
+
+    def wait_until(self, timestamp):
+        """Ждёт момента отправки кадра с временной меткой лога timestamp. Возвращает дедлайн"""
+        deadline = self.deadline_for(timestamp)
+        self.sleep_until(deadline)
+        return deadline
+
+    def record_send(self, deadline, send_time=None):
+        """
+        Записывает ошибку времени отправки (вызывать сразу после bus.send).
+        send_time - фактический perf_counter отправки, если кадр отправлял другой поток (TxScheduler)
+        """
+        if send_time is None:
+            send_time = time.perf_counter()
+        error = send_time - deadline
+        self.errors.append(error)
+        return error
+
+    def log_time(self, perf_time=None):
+        """Время в шкале лога (для timestamp в BLF и выводе): текущее или для perf_time"""
+        if perf_time is None:
+            perf_time = time.perf_counter()
+        return perf_time - self.start_perf + self.first_timestamp
+
+    def stats(self):
+        """Статистика ошибки отправки в микросекундах"""
+        if not self.errors:
+            return None
+
+        errors_us = sorted(e * 1e6 for e in self.errors)
+        count = len(errors_us)
+
+        def percentile(p):
+            return errors_us[min(count - 1, int(p / 100.0 * count))]
+
+        return {
+            'count': count,
+            'mean_us': sum(errors_us) / count,
+            'min_us': errors_us[0],
+            'max_us': errors_us[-1],
+            'p50_us': percentile(50),
+            'p95_us': percentile(95),
+            'p99_us': percentile(99),
+        }
+
+    def histogram(self):
+        """Список (label, count) по корзинам HISTOGRAM_EDGES_US"""
+        edges = HISTOGRAM_EDGES_US
+        counts = [0] * (len(edges) + 1)
+        for error in self.errors:
+            error_us = error * 1e6
+            bucket = 0
+            while bucket < len(edges) and error_us >= edges[bucket]:
+                bucket += 1
+            counts[bucket] += 1
+
+        labels = [f"< {edges[0]} us"]
+        for low, high in zip(edges, edges[1:]):
+            labels.append(f"{low}..{high} us")
+        labels.append(f">= {edges[-1]} us")
+        return list(zip(labels, counts))
+
+    def format_report(self, width=40):
+        """Текстовый отчёт: статистика + гистограмма"""
+        stats = self.stats()
+        if stats is None:
+            return "Send timing: no frames sent"
+
+        lines = [
+            f"Send timing error ({stats['count']} frames, spin threshold {self.spin_threshold * 1e6:.0f} us):",
+            f"  mean {stats['mean_us']:.1f} us, min {stats['min_us']:.1f} us, max {stats['max_us']:.1f} us",
+            f"  p50 {stats['p50_us']:.1f} us, p95 {stats['p95_us']:.1f} us, p99 {stats['p99_us']:.1f} us",
+        ]
+        histogram = self.histogram()
+        peak = max(count for _, count in histogram) or 1
+        for label, count in histogram:
+            if count == 0:
+                continue
+            bar = '#' * max(1, int(count / peak * width))
+            lines.append(f"  {label:>16} | {count:>7} {bar}")
+        return '\n'.join(lines)
+
+    def print_report(self):
+        print(self.format_report())
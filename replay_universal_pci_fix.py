@@ -21,12 +21,16 @@ CAN Bus Valve Control Replay Script - UNIVERSAL PCI FORMAT FIX
 import can
 import time
 import argparse
-import re
-import threading
-import pandas as pd
 from tqdm import tqdm
 from pathlib import Path
 from datetime import datetime
+from replay_scheduler import ReplayScheduler
+from pipelined_replay import PipelinedReplayEngine
+from async_log_writer import AsyncLogWriter
+from tx_scheduler import TxScheduler
+from xlsx_stream_reader import FACTORY_COLUMNS, read_xlsx_header, read_factory_can_events
+from log_cache import load_cache, save_cache, messages_to_columns, columns_to_messages
+from blf_index import read_messages
 
 # ANSI цветовые коды
 COLOR_RED = "\033[91m"
@@ -53,12 +57,22 @@ TESTER_PRESENT_ADDRESSES = [0x740, 0x745, 0x7E0, 0x7E1]
 # Интервал Tester Present (секунды)
 TESTER_PRESENT_INTERVAL = 2.0
 
+# Свой интервал для отдельных адресов: {0x7E0: 1.0}
+TESTER_PRESENT_INTERVALS = {}
+
 # Таймаут ожидания ответа
 RESPONSE_TIMEOUT = 0.5
 
+# Интерфейс python-can: "kvaser" (стенд) или "virtual" (петля can_loopback_harness.py без адаптера)
+CAN_INTERFACE = "kvaser"
+
 # Пауза после последней команды (секунды)
 POST_CONTROL_DELAY = 5.0
 
+# Кэш распарсенного XLSX рядом с исходником (см. log_cache.py)
+USE_LOG_CACHE = True
+REBUILD_LOG_CACHE = False
+
 # ============================================================================
 # UDS КОМАНДЫ - СТАНДАРТНЫЙ 8-БАЙТНЫЙ ФОРМАТ
 # ============================================================================
@@ -66,15 +80,6 @@ UDS_EXTENDED_SESSION = bytes([0x02, 0x10, 0x03, 0x00, 0x00, 0x00, 0x00, 0x00])
 UDS_TESTER_PRESENT = bytes([0x02, 0x3E, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00])
 UDS_CLEAR_DTC = bytes([0x04, 0x14, 0xFF, 0xFF, 0xFF, 0x00, 0x00, 0x00])
 
-# ============================================================================
-# ГЛОБАЛЬНЫЕ ПЕРЕМЕННЫЕ ДЛЯ TESTER PRESENT THREAD
-# ============================================================================
-tester_present_running = False
-tester_present_thread = None
-tester_present_bus = None
-tester_present_lock = threading.Lock()
-tester_present_stats = {"sent": 0, "success": 0, "failed": 0}
-
 # Статистика PCI конверсий
 pci_conversion_stats = {
     "converted_6to8": 0,
@@ -190,68 +195,36 @@ def normalize_to_8byte_uds(data, dlc=None):
 
 
 # ============================================================================
-# TESTER PRESENT BACKGROUND THREAD
+# TESTER PRESENT (периодические задания TxScheduler)
 # ============================================================================
-def tester_present_worker():
-    """Фоновый поток для отправки Tester Present"""
-    global tester_present_running, tester_present_bus, tester_present_stats
-
-    debug_print("Tester Present thread started", "INFO")
-
-    while tester_present_running:
-        try:
-            with tester_present_lock:
-                if tester_present_bus is None:
-                    break
-
-                for addr in TESTER_PRESENT_ADDRESSES:
-                    msg = can.Message(
-                        arbitration_id=addr,
-                        data=UDS_TESTER_PRESENT,
-                        is_extended_id=False
-                    )
-                    try:
-                        tester_present_bus.send(msg)
-                        tester_present_stats["sent"] += 1
-                        tester_present_stats["success"] += 1
-                        debug_print(f"Tester Present sent to 0x{addr:03X}", "DEBUG")
-                    except Exception as e:
-                        tester_present_stats["failed"] += 1
-                        debug_print(f"Tester Present failed for 0x{addr:03X}: {e}", "ERROR")
-
-            time.sleep(TESTER_PRESENT_INTERVAL)
-
-        except Exception as e:
-            debug_print(f"Tester Present thread error: {e}", "ERROR")
-            break
-
-    debug_print("Tester Present thread stopped", "INFO")
-
-
-def start_tester_present(bus):
-    """Запуск фонового потока Tester Present"""
-    global tester_present_running, tester_present_thread, tester_present_bus, tester_present_stats
+def start_tester_present(tx):
+    """Ставит периодический Tester Present на каждый адрес в очередь TxScheduler"""
+    count = len(TESTER_PRESENT_ADDRESSES)
+    for i, addr in enumerate(TESTER_PRESENT_ADDRESSES):
+        interval = TESTER_PRESENT_INTERVALS.get(addr, TESTER_PRESENT_INTERVAL)
+        # разносим адреса по фазе, чтобы четыре кадра не уходили пачкой
+        tx.add_periodic(f"Tester Present 0x{addr:03X}", addr, UDS_TESTER_PRESENT, interval,
+                        first_delay=i * interval / count)
+        debug_print(f"Tester Present 0x{addr:03X} every {interval}s", "DEBUG")
 
-    tester_present_bus = bus
-    tester_present_running = True
-    tester_present_stats = {"sent": 0, "success": 0, "failed": 0}
+    print(f"{COLOR_GREEN}>>> Tester Present scheduled (every {TESTER_PRESENT_INTERVAL}s){COLOR_RESET}")
 
-    tester_present_thread = threading.Thread(target=tester_present_worker, daemon=True)
-    tester_present_thread.start()
 
-    print(f"{COLOR_GREEN}>>> Tester Present thread started (every {TESTER_PRESENT_INTERVAL}s){COLOR_RESET}")
+def stop_tester_present(tx):
+    """Снимает периодический Tester Present и печатает статистику дрейфа"""
+    tx.remove_all_periodic()
 
+    stats = tx.periodic_stats()
+    # 'sent' в статистике TxScheduler - только успешные отправки
+    success = sum(item['sent'] for item in stats)
+    failed = sum(item['failed'] for item in stats)
+    print(f"{COLOR_YELLOW}>>> Tester Present stopped{COLOR_RESET}")
+    print(f"{COLOR_WHITE}    Sent: {success + failed}, Success: {success}, Failed: {failed}{COLOR_RESET}")
 
-def stop_tester_present():
-    """Остановка фонового потока Tester Present"""
-    global tester_present_running, tester_present_thread
 
-    tester_present_running = False
-    if tester_present_thread is not None:
-        tester_present_thread.join(timeout=3.0)
-
-    print(f"{COLOR_YELLOW}>>> Tester Present thread stopped{COLOR_RESET}")
-    print(f"{COLOR_WHITE}    Sent: {tester_present_stats['sent']}, Success: {tester_present_stats['success']}, Failed: {tester_present_stats['failed']}{COLOR_RESET}")
+def on_tx_error(job, exc):
+    """Ошибка отправки в потоке TxScheduler"""
+    debug_print(f"TX failed for 0x{job.msg.arbitration_id:03X}: {exc}", "ERROR")
 
 
 # ============================================================================
@@ -374,23 +347,20 @@ def check_kvaser_hardware():
 # FILE PARSING WITH PCI NORMALIZATION
 # ============================================================================
 def parse_xlsx_file(file_path):
-    """Парсит XLSX файл с автоматической нормализацией PCI"""
+    """Парсит XLSX файл с автоматической нормализацией PCI (потоковое чтение)"""
     global pci_conversion_stats
 
     try:
-        df = pd.read_excel(file_path)
-        print(f"{COLOR_WHITE}XLSX файл загружен. Строк: {len(df)}{COLOR_RESET}")
-
-        # Проверяем колонки
-        required_columns = ['№ п/п', 'Date', 'Time', 'Type', 'Level', 'Event']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        # Проверяем колонки - читаем только заголовок
+        columns = read_xlsx_header(file_path)
+        missing_columns = [col for col in FACTORY_COLUMNS if col not in columns]
 
         if missing_columns:
             print(f"{COLOR_RED}ОШИБКА: Отсутствуют колонки: {missing_columns}{COLOR_RESET}")
             return []
 
-        # Фильтруем CAN сообщения
-        df_can = df[df['Type'] == 'Can'].copy()
+        # CAN сообщения: Event и Date/Time разобраны векторно
+        df_can = read_factory_can_events(file_path)
         print(f"{COLOR_WHITE}Найдено CAN сообщений: {len(df_can)}{COLOR_RESET}")
 
         if len(df_can) == 0:
@@ -400,38 +370,6 @@ def parse_xlsx_file(file_path):
         messages = []
         base_timestamp = None
 
-        def parse_timestamp(date_str, time_str):
-            try:
-                datetime_str = f"{date_str} {time_str}"
-                dt = datetime.strptime(datetime_str, "%d.%m.%Y %H:%M:%S.%f")
-                return dt.timestamp()
-            except ValueError:
-                try:
-                    dt = datetime.strptime(datetime_str, "%d.%m.%Y %H:%M:%S")
-                    return dt.timestamp()
-                except:
-                    return None
-
-        def parse_can_event(event_str):
-            pattern = r'\[(0x[0-9a-fA-F]+)\]\s*\((\d+)\)\s*(->|<-)\s*(.+)'
-            match = re.search(pattern, event_str)
-
-            if match:
-                can_id = match.group(1)
-                dlc = int(match.group(2))
-                direction = match.group(3)
-                data_hex = match.group(4)
-
-                try:
-                    arbitration_id = int(can_id, 16)
-                    hex_bytes = data_hex.split()
-                    data_bytes = bytes(int(byte, 16) for byte in hex_bytes)
-                    return arbitration_id, data_bytes, direction, dlc
-                except:
-                    return None, None, None, None
-
-            return None, None, None, None
-
         # Статистика
         stats = {
             "total_can": 0,
@@ -440,19 +378,21 @@ def parse_xlsx_file(file_path):
             "extended_filtered": 0,
         }
 
-        for idx, row in df_can.iterrows():
+        for row in df_can.itertuples(index=False):
             stats["total_can"] += 1
             try:
-                timestamp = parse_timestamp(row['Date'], row['Time'])
-                if timestamp is None:
+                timestamp = row.timestamp
+                if timestamp != timestamp:  # NaN - время не распарсилось
                     continue
 
                 if base_timestamp is None:
                     base_timestamp = timestamp
 
-                arbitration_id, data, direction, dlc = parse_can_event(str(row['Event']))
-                if arbitration_id is None:
+                if row.can_id != row.can_id or not row.data_hex:
                     continue
+                arbitration_id = int(row.can_id)
+                data = bytes.fromhex(row.data_hex)
+                dlc = int(row.dlc)
 
                 # Фильтруем extended ID
                 if arbitration_id > 0x7FF:
@@ -464,7 +404,7 @@ def parse_xlsx_file(file_path):
 
                 stats["parsed_ok"] += 1
                 relative_timestamp = timestamp - base_timestamp
-                is_rx = (direction == '<-')
+                is_rx = (row.direction == '<-')
 
                 msg = can.Message(
                     arbitration_id=arbitration_id,
@@ -480,7 +420,7 @@ def parse_xlsx_file(file_path):
                 messages.append(msg)
 
             except Exception as e:
-                debug_print(f"Parse error row {idx}: {e}", "ERROR")
+                debug_print(f"Parse error row {row.row_index}: {e}", "ERROR")
 
         # Статистика PCI конверсий
         print(f"\n{COLOR_CYAN}=== СТАТИСТИКА ПАРСИНГА ==={COLOR_RESET}")
@@ -530,26 +470,42 @@ def read_can_messages(file_path):
 
         messages = []
         extended_filtered = 0
-        with can.BLFReader(file_path) as log:
-            for msg in log:
-                if msg.is_extended_id:
-                    extended_filtered += 1
-                    continue
+        # остальные кадры отсеиваются по заголовку объекта, без can.Message (blf_index.py)
+        for msg in read_messages(file_path, {0x740}):
+            if msg.is_extended_id:
+                extended_filtered += 1
+                continue
 
-                if msg.arbitration_id == 0x740:
-                    msg.is_extended_id = False
-                    # Нормализуем данные
-                    msg.data = normalize_to_8byte_uds(msg.data)
-                    messages.append(msg)
+            msg.is_extended_id = False
+            # Нормализуем данные
+            msg.data = normalize_to_8byte_uds(msg.data)
+            messages.append(msg)
 
         print(f"{COLOR_GREEN}BLF: найдено {len(messages)} сообщений 0x740{COLOR_RESET}")
         if extended_filtered > 0:
-            print(f"{COLOR_RED}BLF: отфильтровано {extended_filtered} extended ID{COLOR_RESET}")
+            print(f"{COLOR_RED}BLF: отфильтровано {extended_filtered} extended ID 0x740{COLOR_RESET}")
         print(f"{COLOR_CYAN}Тип лога: FROM_BLF{COLOR_RESET}")
         return messages
 
     elif file_ext in ['.xlsx', '.xls']:
-        return parse_xlsx_file(file_path)
+        if not USE_LOG_CACHE:
+            return parse_xlsx_file(file_path)
+
+        # Кэш: уже нормализованные 0x740 + тип источника лога
+        if not REBUILD_LOG_CACHE:
+            columns, meta = load_cache(file_path, "replay_740_pci")
+            if columns is not None:
+                log_source_type = meta['extra'].get('log_source_type', "unknown")
+                messages = columns_to_messages(columns)
+                print(f"{COLOR_GREEN}Из кэша: {len(messages)} сообщений 0x740{COLOR_RESET}")
+                print(f"{COLOR_CYAN}Тип лога: {log_source_type.upper()}{COLOR_RESET}")
+                return messages
+
+        messages = parse_xlsx_file(file_path)
+        if messages:
+            save_cache(file_path, "replay_740_pci", messages_to_columns(messages),
+                       extra_meta={'log_source_type': log_source_type})
+        return messages
 
     else:
         print(f"{COLOR_RED}Неподдерживаемый формат: {file_ext}{COLOR_RESET}")
@@ -636,10 +592,71 @@ def format_message(msg, color):
     return f"{color}{msg.timestamp:12.6f} {msg.channel}  {msg.arbitration_id:03X}       {direction}   d {len(msg.data)} {data_hex}{COLOR_RESET}"
 
 
+# ============================================================================
+# PIPELINED REPLAY
+# ============================================================================
+def format_timeout(timestamp, channel, suffix=""):
+    """Строка таймаута ответа 0x760"""
+    return f"{COLOR_RED}{timestamp:12.6f} {channel}  760       Rx   d 0 TIMEOUT{suffix}{COLOR_RESET}"
+
+
+def replay_pipelined(bus, tx, requests_740, log_writer, channel, timeout):
+    """
+    Конвейерное проигрывание: 0x740 уходят строго по временным меткам лога через
+    TxScheduler tx, ответы 0x760 сопоставляются с запросами в фоновом потоке (pipelined_replay.py).
+    Консоль и BLF пишет log_writer (AsyncLogWriter).
+    Возвращает (success_count, error_count, timeout_count, scheduler).
+    """
+    def on_sent(pending):
+        log_msg = can.Message(
+            arbitration_id=pending.arbitration_id,
+            data=pending.data,
+            timestamp=pending.log_timestamp,
+            channel=channel,
+            is_rx=False,
+            is_extended_id=False
+        )
+        log_writer.blf(log_msg)
+        log_writer.console(format_message, log_msg, get_color_for_message(get_message_type(pending.data)))
+
+    def format_response(response, latency, seq):
+        resp_type = get_message_type(response.data)
+        return (format_message(response, get_color_for_message(resp_type, is_response=True)) +
+                f" ({latency * 1000:.1f} ms, #{seq})")
+
+    def on_response(pending, response, latency, kind):
+        response.timestamp = engine.scheduler.log_time()
+        response.channel = channel
+        log_writer.blf(response)
+        log_writer.console(format_response, response, latency, pending.seq)
+
+    def on_timeout(pending):
+        log_writer.console(format_timeout, engine.scheduler.log_time(), channel, f" (#{pending.seq})")
+
+    def on_unmatched(response):
+        data_hex = ' '.join(f'{b:02X}' for b in response.data)
+        log_writer.print(f"{COLOR_YELLOW}760 без запроса: {data_hex}{COLOR_RESET}")
+
+    engine = PipelinedReplayEngine(bus, timeout=timeout, on_sent=on_sent, on_response=on_response,
+                                   on_timeout=on_timeout, on_unmatched=on_unmatched,
+                                   tx_scheduler=tx)
+
+    frames = [(msg.timestamp, msg.arbitration_id, msg.data) for msg in requests_740]
+    try:
+        engine.run(frames, progress=log_writer.advance)
+    except KeyboardInterrupt:
+        log_writer.print(f"\n{COLOR_YELLOW}Остановлено пользователем{COLOR_RESET}")
+    log_writer.close()
+
+    print(f"{COLOR_CYAN}{engine.format_report()}{COLOR_RESET}")
+    return engine.positive, engine.negative, engine.timeouts, engine.scheduler
+
+
 # ============================================================================
 # MAIN REPLAY FUNCTION
 # ============================================================================
-def replay_740_760(use_virtual=False, auto_session=True, file_path=None, enable_blf=True, postfix=None, blf_file=None):
+def replay_740_760(use_virtual=False, auto_session=True, file_path=None, enable_blf=True, postfix=None, blf_file=None,
+                   pipelined=False):
     """Проигрывание сообщений 0x740 с ожиданием ответов 0x760"""
 
     blf_file_path = file_path or DEFAULT_FILE
@@ -655,13 +672,14 @@ def replay_740_760(use_virtual=False, auto_session=True, file_path=None, enable_
     print(f"{COLOR_WHITE}CONTROL_ZONE_ONLY: {'ДА' if CONTROL_ZONE_ONLY else 'НЕТ'}{COLOR_RESET}")
     print(f"{COLOR_GREEN}PCI: АВТОМАТИЧЕСКАЯ НОРМАЛИЗАЦИЯ В 8-БАЙТНЫЙ ФОРМАТ{COLOR_RESET}")
     print(f"{COLOR_WHITE}BLF логирование: {'ДА' if enable_blf else 'НЕТ'}{COLOR_RESET}")
+    print(f"{COLOR_WHITE}Конвейерный режим: {'ДА' if pipelined else 'НЕТ'}{COLOR_RESET}")
 
     if not Path(blf_file_path).exists():
         print(f"{COLOR_RED}Файл {blf_file_path} не найден!{COLOR_RESET}")
         return
 
     # Проверка Kvaser
-    if not use_virtual:
+    if CAN_INTERFACE == "kvaser" and not use_virtual:
         hw_present, hw_info = check_kvaser_hardware()
         if not hw_present:
             print(f"{COLOR_RED}Kvaser адаптер не найден: {hw_info}{COLOR_RESET}")
@@ -702,7 +720,10 @@ def replay_740_760(use_virtual=False, auto_session=True, file_path=None, enable_
             total_requests = len(requests_740)
 
         # Подключение к CAN
-        if use_virtual:
+        if CAN_INTERFACE != "kvaser":
+            bus = can.Bus(interface=CAN_INTERFACE, channel=channel, receive_own_messages=False)
+            print(f"{COLOR_WHITE}Подключение к {CAN_INTERFACE} channel {channel}{COLOR_RESET}")
+        elif use_virtual:
             bus = can.Bus(interface='kvaser', channel=channel, bitrate=bitrate,
                          accept_virtual=True, receive_own_messages=False)
             print(f"{COLOR_WHITE}Подключение к Kvaser VIRTUAL channel {channel}{COLOR_RESET}")
@@ -725,123 +746,133 @@ def replay_740_760(use_virtual=False, auto_session=True, file_path=None, enable_
             # Инициализация сессии
             if auto_session:
                 initialize_diagnostic_session(bus, timeout=0.3)
-                start_tester_present(bus)
+
+            # Единственный владелец bus.send: кадры проигрывания и Tester Present в одной очереди
+            tx = TxScheduler(bus, on_error=on_tx_error).start()
+            if auto_session:
+                start_tester_present(tx)
 
             print(f"\n{COLOR_YELLOW}Проигрывание 0x740 -> 0x760{COLOR_RESET}")
             print(f"{COLOR_WHITE}Нажмите Ctrl+C для остановки{COLOR_RESET}")
             print()
 
+            # Форматирование, печать и запись BLF - в фоновом потоке
             pbar = tqdm(total=total_requests, desc="Отправка 0x740", unit="msg", ncols=100)
+            log_writer = AsyncLogWriter(blf_writer=logger, progress=pbar)
 
-            start_time = time.perf_counter()
-            first_timestamp = requests_740[0].timestamp
+            if pipelined:
+                # Передача по шкале лога, ответы сопоставляются в фоновом потоке
+                success_count, error_count, timeout_count, scheduler = replay_pipelined(
+                    bus, tx, requests_740, log_writer, channel, timeout)
+            else:
+                first_timestamp = requests_740[0].timestamp
+                scheduler = ReplayScheduler()
+                scheduler.start(first_timestamp)
+                start_time = scheduler.start_perf
 
-            success_count = 0
-            timeout_count = 0
-            error_count = 0
+                success_count = 0
+                timeout_count = 0
+                error_count = 0
 
-            for i, msg in enumerate(requests_740):
-                try:
-                    # Выдерживаем интервалы
-                    elapsed = msg.timestamp - first_timestamp
-                    while (time.perf_counter() - start_time) < elapsed:
-                        time.sleep(0.001)
-
-                    msg_type = get_message_type(msg.data)
-                    color_req = get_color_for_message(msg_type)
-
-                    # Вычисляем правильный timestamp
-                    current_ts = time.perf_counter() - start_time + first_timestamp
-
-                    # Отправляем (без timestamp для отправки)
-                    tx_msg = can.Message(
-                        arbitration_id=msg.arbitration_id,
-                        data=msg.data,
-                        is_extended_id=False
-                    )
-
-                    with tester_present_lock:
-                        bus.send(tx_msg)
-
-                    # Создаём сообщение для логирования С ПРАВИЛЬНЫМ TIMESTAMP
-                    log_msg = can.Message(
-                        arbitration_id=msg.arbitration_id,
-                        data=msg.data,
-                        timestamp=current_ts,
-                        channel=channel,
-                        is_rx=False,
-                        is_extended_id=False
-                    )
-
-                    # Логируем сообщение с правильным timestamp
-                    if logger:
-                        try:
-                            logger.on_message_received(log_msg)
-                        except Exception as e:
-                            debug_print(f"BLF log error (TX): {e}", "ERROR")
-
-                    print(format_message(log_msg, color_req))
-
-                    # Ждем ответ
-                    response = None
-                    response_received = False
-                    start_wait = time.perf_counter()
-
-                    while (time.perf_counter() - start_wait) < timeout:
-                        remaining = timeout - (time.perf_counter() - start_wait)
-                        if remaining <= 0:
-                            break
-                        response = bus.recv(timeout=remaining)
-                        if response is not None and response.arbitration_id == 0x760:
-                            response_received = True
+                for i, msg in enumerate(requests_740):
+                    try:
+                        # Интервалы выдерживает поток TxScheduler по абсолютному дедлайну
+                        deadline = scheduler.deadline_for(msg.timestamp)
+
+                        msg_type = get_message_type(msg.data)
+                        color_req = get_color_for_message(msg_type)
+
+                        # Отправляем (без timestamp для отправки)
+                        tx_msg = can.Message(
+                            arbitration_id=msg.arbitration_id,
+                            data=msg.data,
+                            is_extended_id=False
+                        )
+
+                        job = tx.send_at(deadline, tx_msg)
+                        job.wait()
+                        if job.cancelled:
                             break
+                        if job.error is not None:
+                            raise job.error
+                        scheduler.record_send(deadline, job.sent_at)
+
+                        # Вычисляем правильный timestamp (фактический момент отправки)
+                        current_ts = job.sent_at - start_time + first_timestamp
+
+                        # Создаём сообщение для логирования С ПРАВИЛЬНЫМ TIMESTAMP
+                        log_msg = can.Message(
+                            arbitration_id=msg.arbitration_id,
+                            data=msg.data,
+                            timestamp=current_ts,
+                            channel=channel,
+                            is_rx=False,
+                            is_extended_id=False
+                        )
+
+                        # Логируем сообщение с правильным timestamp
+                        log_writer.blf(log_msg)
+                        log_writer.console(format_message, log_msg, color_req)
+
+                        # Ждем ответ
+                        response = None
+                        response_received = False
+                        start_wait = time.perf_counter()
+
+                        while (time.perf_counter() - start_wait) < timeout:
+                            remaining = timeout - (time.perf_counter() - start_wait)
+                            if remaining <= 0:
+                                break
+                            response = bus.recv(timeout=remaining)
+                            if response is not None and response.arbitration_id == 0x760:
+                                response_received = True
+                                break
+
+                        if response_received and response is not None:
+                            resp_type = get_message_type(response.data)
+                            color_resp = get_color_for_message(resp_type, is_response=True)
+
+                            # Устанавливаем правильный относительный timestamp
+                            response.timestamp = time.perf_counter() - start_time + first_timestamp
+                            response.channel = channel
+
+                            # Логируем ответ С ПРАВИЛЬНЫМ TIMESTAMP
+                            log_writer.blf(response)
+                            log_writer.console(format_message, response, color_resp)
+
+                            if resp_type == "negative_response":
+                                error_count += 1
+                            else:
+                                success_count += 1
+                        else:
+                            timeout_ts = time.perf_counter() - start_time + first_timestamp
+                            log_writer.console(format_timeout, timeout_ts, channel)
+                            timeout_count += 1
 
-                    if response_received and response is not None:
-                        resp_type = get_message_type(response.data)
-                        color_resp = get_color_for_message(resp_type, is_response=True)
-
-                        # Устанавливаем правильный относительный timestamp
-                        response.timestamp = time.perf_counter() - start_time + first_timestamp
-                        response.channel = channel
-
-                        # Логируем ответ С ПРАВИЛЬНЫМ TIMESTAMP
-                        if logger:
-                            try:
-                                logger.on_message_received(response)
-                            except Exception as e:
-                                debug_print(f"BLF log error (RX): {e}", "ERROR")
-
-                        print(format_message(response, color_resp))
+                        log_writer.advance()
+                        log_writer.print()
 
-                        if resp_type == "negative_response":
-                            error_count += 1
-                        else:
-                            success_count += 1
-                    else:
-                        timeout_ts = time.perf_counter() - start_time + first_timestamp
-                        print(f"{COLOR_RED}{timeout_ts:12.6f} {channel}  760       Rx   d 0 TIMEOUT{COLOR_RESET}")
-                        timeout_count += 1
-
-                    pbar.update(1)
-                    print()
-
-                except KeyboardInterrupt:
-                    print(f"\n{COLOR_YELLOW}Остановлено пользователем{COLOR_RESET}")
-                    break
-                except Exception as e:
-                    print(f"{COLOR_RED}Ошибка: {e}{COLOR_RESET}")
-                    continue
+                    except KeyboardInterrupt:
+                        log_writer.print(f"\n{COLOR_YELLOW}Остановлено пользователем{COLOR_RESET}")
+                        break
+                    except Exception as e:
+                        log_writer.print(f"{COLOR_RED}Ошибка: {e}{COLOR_RESET}")
+                        continue
 
+            log_writer.close()
             pbar.close()
+            print(f"{COLOR_WHITE}{log_writer.format_report()}{COLOR_RESET}")
 
             # Пауза после последней команды
             if CONTROL_ZONE_ONLY:
                 print(f"\n{COLOR_CYAN}>>> Ожидание {POST_CONTROL_DELAY} секунд...{COLOR_RESET}")
                 time.sleep(POST_CONTROL_DELAY)
 
-            # Останавливаем Tester Present
+            # Останавливаем Tester Present и поток передачи
             if auto_session:
-                stop_tester_present()
+                stop_tester_present(tx)
+            tx.stop()
+            print(f"{COLOR_WHITE}{tx.format_report()}{COLOR_RESET}")
 
             # Закрываем BLF логгер
             if logger:
@@ -858,6 +889,7 @@ def replay_740_760(use_virtual=False, auto_session=True, file_path=None, enable_
             print(f"{COLOR_GREEN}Успешных ответов: {success_count}{COLOR_RESET}")
             print(f"{COLOR_RED}Negative Response: {error_count}{COLOR_RESET}")
             print(f"{COLOR_RED}Таймаутов: {timeout_count}{COLOR_RESET}")
+            print(f"{COLOR_WHITE}{scheduler.format_report()}{COLOR_RESET}")
             print(f"{COLOR_GREEN}{'='*60}{COLOR_RESET}")
 
     except Exception as e:
@@ -865,8 +897,11 @@ def replay_740_760(use_virtual=False, auto_session=True, file_path=None, enable_
         import traceback
         traceback.print_exc()
 
-        if auto_session:
-            stop_tester_present()
+        if 'tx' in locals():
+            tx.stop()
+
+        if 'log_writer' in locals():
+            log_writer.close()
 
         # Закрываем логгер при ошибке
         if 'logger' in locals() and logger:
@@ -880,7 +915,7 @@ def replay_740_760(use_virtual=False, auto_session=True, file_path=None, enable_
 # MAIN
 # ============================================================================
 def main():
-    global DEBUG_MODE, CONTROL_ZONE_ONLY
+    global DEBUG_MODE, CONTROL_ZONE_ONLY, USE_LOG_CACHE, REBUILD_LOG_CACHE, CAN_INTERFACE
 
     parser = argparse.ArgumentParser(
         description='CAN Valve Control Replay - Universal PCI Fix',
@@ -896,11 +931,15 @@ def main():
   %(prog)s --no-session                   # Без автосессии
   %(prog)s --virtual                      # Виртуальный канал
   %(prog)s --debug                        # Режим отладки
+  %(prog)s --rebuild-cache                # Пересобрать кэш XLSX
+  %(prog)s --pipelined                    # Конвейерный режим (передача не ждёт ответов)
         """
     )
 
     parser.add_argument('--virtual', '-v', action='store_true',
                         help='Использовать виртуальный канал')
+    parser.add_argument('--interface', choices=['kvaser', 'virtual'], default=CAN_INTERFACE,
+                        help='Интерфейс python-can (virtual - петля без адаптера, см. can_loopback_harness.py)')
     parser.add_argument('--no-session', action='store_true',
                         help='Отключить автоматическую сессию')
     parser.add_argument('--no-control-zone', action='store_true',
@@ -909,6 +948,12 @@ def main():
                         help='Включить дебаг')
     parser.add_argument('--file', '-f', type=str, default=None,
                         help='Путь к файлу')
+    parser.add_argument('--pipelined', action='store_true',
+                        help='Не ждать 0x760 перед следующим 0x740: передача по шкале лога, ответы в фоне')
+    parser.add_argument('--rebuild-cache', action='store_true',
+                        help='Пересобрать кэш распарсенного XLSX (*.cache.npz)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Не использовать кэш распарсенного XLSX')
 
     # Аргументы для логирования
     parser.add_argument('--postfix', '-p', type=str, default=None,
@@ -921,6 +966,9 @@ def main():
     args = parser.parse_args()
 
     DEBUG_MODE = args.debug
+    CAN_INTERFACE = args.interface
+    USE_LOG_CACHE = not args.no_cache
+    REBUILD_LOG_CACHE = args.rebuild_cache
 
     if args.no_control_zone:
         CONTROL_ZONE_ONLY = False
@@ -931,7 +979,8 @@ def main():
         file_path=args.file,
         enable_blf=not args.no_blf,
         postfix=args.postfix,
-        blf_file=args.blf_file
+        blf_file=args.blf_file,
+        pipelined=args.pipelined
     )
 
 
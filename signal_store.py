@@ -0,0 +1,561 @@
+"""
+Хранилище сигналов: BLF + DBC -> сжатая колонка на каждый сигнал
+================================================================
+
+proceed_file, LogDealer.load_files и convert_into_csv_with_dbc на каждом запуске заново
+читают BLF и декодируют каждый кадр через DBC, хотя нужны им два-три сигнала на
+небольшом отрезке времени. Этот модуль декодирует лог один раз и складывает каждый
+сигнал в отдельную колонку рядом с исходником:
+
+    log.blf  ->  log.blf.signals/
+                     manifest.json           сигналы, масштабы, индекс блоков
+                     <Message>.time          метки времени сообщения
+                     <Message>.<Signal>.val  сырые значения сигнала
+
+Формат колонки - последовательность блоков по BLOCK_SIZE отсчётов, каждый блок сжат
+отдельно (zlib):
+- метки времени - int64 наносекунды от начала лога, дельта-кодирование
+- целые сырые значения (scaling=False) - дельта-кодирование; scale/offset лежат в манифесте
+- float сигналы - XOR с предыдущим значением (битовая дельта, без потерь)
+- перед сжатием байты перетасовываются (сначала все младшие байты, потом следующие...)
+У мультиплексированных сообщений у каждого сигнала своя ось времени.
+
+Чтение: файл колонки отображается в память (mmap), по индексу из манифеста
+распаковываются только блоки, пересекающие запрошенный интервал, поэтому запрос
+"BrakingPressure между t0 и t1" занимает миллисекунды независимо от размера лога.
+
+Хранилище считается свежим, если совпадают размер и mtime BLF и DBC и версия формата
+(как в log_cache.py), иначе open_store пересобирает его.
+
+ИСПОЛЬЗОВАНИЕ:
+    store = open_store('log.blf', VESTA_DBC)           # построит, если нет или устарело
+    t, pressure = store.read('BrakingPressure', t0, t1)
+    data = store.read_many(['BrakingPressure', 'VehicleSpeed'], t0, t1)
+
+    python signal_store.py build log.blf vesta.dbc
+    python signal_store.py info log.blf.signals
+    python signal_store.py query log.blf.signals BrakingPressure --t0 120 --t1 130 --relative
+"""
+
+import argparse
+import csv
+import json
+import mmap
+import os
+import shutil
+import time
+import zlib
+from array import array
+
+import can
+import cantools
+import numpy as np
+
+# Версия формата - при изменении структуры хранилища старые пересобираются
+STORE_VERSION = 1
+
+STORE_SUFFIX = '.signals'
+MANIFEST_NAME = 'manifest.json'
+
+# Отсчётов в блоке: меньше - быстрее короткие запросы, больше - лучше сжатие
+BLOCK_SIZE = 65536
+
+COMPRESS_LEVEL = 6
+
+# Как часто печатать прогресс сборки (сек)
+PROGRESS_INTERVAL = 2.0
+
+
+def store_path_for(blf_path):
+    """Папка хранилища рядом с BLF"""
+    return f"{blf_path}{STORE_SUFFIX}"
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+# ----------------------------------------------------------------------
+# Кодирование блоков
+# ----------------------------------------------------------------------
+def _shuffle(values):
+    """int64 -> байты: сначала все младшие байты, затем следующие (лучше сжимается)"""
+    return values.view(np.uint8).reshape(-1, 8).T.tobytes()
+
+
+def _unshuffle(raw, count):
+    return np.frombuffer(raw, dtype=np.uint8).reshape(8, count).T.copy().view(np.int64).ravel()
+
+
+def encode_int(values):
+    deltas = np.diff(values, prepend=np.int64(0))
+    return zlib.compress(_shuffle(deltas), COMPRESS_LEVEL)
+
+
+def decode_int(payload, count):
+    return np.cumsum(_unshuffle(zlib.decompress(payload), count))
+
+
+def encode_float(values):
+    bits = values.view(np.int64)
+    xored = np.bitwise_xor(bits, np.concatenate(([0], bits[:-1])).astype(np.int64))
+    return zlib.compress(_shuffle(xored), COMPRESS_LEVEL)
+
+
+def decode_float(payload, count):
+    return np.bitwise_xor.accumulate(_unshuffle(zlib.decompress(payload), count)).view(np.float64)
+
+
+def signal_kind(signal):
+    """'int' - сырое значение целое и помещается в int64, иначе 'float'"""
+    if signal.is_float or (signal.length >= 64 and not signal.is_signed):
+        return 'float'
+    return 'int'
+
+
+# ----------------------------------------------------------------------
+# Сборка
+# ----------------------------------------------------------------------
+class _Series:
+    """Одна ось времени (сообщение или мультиплексированный сигнал) и её колонки"""
+
+    def __init__(self, builder, name, message, signals):
+        self.builder = builder
+        self.name = name
+        self.time_file = f"{name}.time"
+        self.signal_names = [signal.name for signal in signals]
+        self.kinds = [signal_kind(signal) for signal in signals]
+        self.value_files = [f"{message.name}.{signal.name}.val" for signal in signals]
+        self.blocks = []
+        self.samples = 0
+        self._reset_buffers()
+
+    def _reset_buffers(self):
+        self.timestamps = array('d')
+        self.columns = [array('q') if kind == 'int' else array('d') for kind in self.kinds]
+
+    def append(self, timestamp, values):
+        self.timestamps.append(timestamp)
+        for column, value in zip(self.columns, values):
+            column.append(value)
+        if len(self.timestamps) >= self.builder.block_size:
+            self.flush()
+
+    def flush(self):
+        count = len(self.timestamps)
+        if not count:
+            return
+        timestamps = np.frombuffer(self.timestamps, dtype=np.float64)
+        ns = np.rint((timestamps - self.builder.t_base) * 1e9).astype(np.int64)
+        time_ref = self.builder.write_block(self.time_file, encode_int(ns))
+
+        value_refs = {}
+        for name, kind, column, file_name in zip(self.signal_names, self.kinds, self.columns, self.value_files):
+            if kind == 'int':
+                payload = encode_int(np.frombuffer(column, dtype=np.int64))
+            else:
+                payload = encode_float(np.frombuffer(column, dtype=np.float64))
+            value_refs[name] = self.builder.write_block(file_name, payload)
+
+        # блоки не обязаны идти строго по времени - храним min/max
+        self.blocks.append([float(timestamps.min()), float(timestamps.max()), count, time_ref, value_refs])
+        self.samples += count
+        self._reset_buffers()
+
+
+class SignalStoreBuilder:
+    """Потоковая сборка хранилища: память ограничена block_size отсчётами на ось времени"""
+
+    def __init__(self, blf_path, dbc_path, store_dir=None, block_size=BLOCK_SIZE):
+        self.blf_path = blf_path
+        self.dbc_path = dbc_path
+        self.store_dir = store_dir or store_path_for(blf_path)
+        self.block_size = max(1, block_size)
+        self.t_base = None
+        self._sizes = {}
+        self._work_dir = None
+
+    def write_block(self, file_name, payload):
+        """Дописывает сжатый блок в файл колонки, возвращает [смещение, длина]"""
+        offset = self._sizes.get(file_name, 0)
+        with open(os.path.join(self._work_dir, file_name), 'ab') as f:
+            f.write(payload)
+        self._sizes[file_name] = offset + len(payload)
+        return [offset, len(payload)]
+
+    def _make_series(self, db):
+        """frame_id -> (сообщение, оси времени, мультиплекс?); у мультиплекса - ось на сигнал"""
+        by_id = {}
+        for message in db.messages:
+            if not message.signals:
+                continue
+            if message.is_multiplexed():
+                series = [_Series(self, f"{message.name}.{signal.name}", message, [signal])
+                          for signal in message.signals]
+            else:
+                series = [_Series(self, message.name, message, message.signals)]
+            by_id[message.frame_id] = (message, series, message.is_multiplexed())
+        return by_id
+
+    def build(self, progress_interval=PROGRESS_INTERVAL):
+        db = cantools.database.load_file(self.dbc_path)
+        self._work_dir = self.store_dir + '.tmp'
+        if os.path.exists(self._work_dir):
+            shutil.rmtree(self._work_dir)
+        os.makedirs(self._work_dir)
+
+        by_id = self._make_series(db)
+        known_ids = frozenset(by_id)
+
+        frames = 0
+        decoded_frames = 0
+        decode_errors = 0
+        t_start = t_end = None
+        start = time.perf_counter()
+        last_report = start
+
+        for msg in can.BLFReader(self.blf_path):
+            frames += 1
+            if not frames & 0x3FFF:
+                now = time.perf_counter()
+                if now - last_report >= progress_interval:
+                    print(f"[SignalStore] {frames} frames ({frames / (now - start):.0f} frames/s)")
+                    last_report = now
+
+            arbitration_id = msg.arbitration_id
+            if arbitration_id not in known_ids or msg.is_error_frame or msg.is_remote_frame:
+                continue
+            message, series, multiplexed = by_id[arbitration_id]
+            try:
+                decoded = message.decode(msg.data, decode_choices=False, scaling=False)
+            except Exception:
+                decode_errors += 1
+                continue
+
+            timestamp = msg.timestamp
+            if self.t_base is None:
+                self.t_base = t_start = t_end = timestamp
+            t_start = min(t_start, timestamp)
+            t_end = max(t_end, timestamp)
+            decoded_frames += 1
+
+            if not multiplexed:
+                series[0].append(timestamp, [decoded[name] for name in series[0].signal_names])
+            else:
+                for item in series:
+                    value = decoded.get(item.signal_names[0])
+                    if value is not None:
+                        item.append(timestamp, (value,))
+
+        for _, series, _ in by_id.values():
+            for item in series:
+                item.flush()
+
+        elapsed = time.perf_counter() - start
+        manifest = {
+            'version': STORE_VERSION,
+            'source': os.path.abspath(self.blf_path),
+            'source_signature': _file_signature(self.blf_path),
+            'dbc': os.path.abspath(self.dbc_path),
+            'dbc_signature': _file_signature(self.dbc_path),
+            'block_size': self.block_size,
+            't_base': self.t_base,
+            't_start': t_start,
+            't_end': t_end,
+            'frames': frames,
+            'decoded_frames': decoded_frames,
+            'decode_errors': decode_errors,
+            'build_s': round(elapsed, 3),
+            'series': {},
+            'signals': {},
+        }
+        for message, series, _ in by_id.values():
+            signals = {signal.name: signal for signal in message.signals}
+            for item in series:
+                if not item.samples:
+                    continue
+                manifest['series'][item.name] = {
+                    'time_file': item.time_file,
+                    'samples': item.samples,
+                    'blocks': item.blocks,
+                }
+                for name, kind, file_name in zip(item.signal_names, item.kinds, item.value_files):
+                    signal = signals[name]
+                    manifest['signals'][f"{message.name}.{name}"] = {
+                        'message': message.name,
+                        'signal': name,
+                        'series': item.name,
+                        'file': file_name,
+                        'kind': kind,
+                        'scale': signal.scale,
+                        'offset': signal.offset,
+                        'unit': signal.unit or '',
+                    }
+
+        with open(os.path.join(self._work_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+        if os.path.exists(self.store_dir):
+            shutil.rmtree(self.store_dir)
+        os.replace(self._work_dir, self.store_dir)
+
+        stored = sum(self._sizes.values())
+        print(f"[SignalStore] Built {self.store_dir}: {len(manifest['signals'])} signals, "
+              f"{decoded_frames}/{frames} frames decoded in {elapsed:.1f} s "
+              f"({frames / elapsed if elapsed > 0 else 0:.0f} frames/s), "
+              f"{stored / 1e6:.1f} MB (BLF {manifest['source_signature']['size'] / 1e6:.1f} MB)")
+        return self.store_dir
+
+
+def build_store(blf_path, dbc_path, store_dir=None, block_size=BLOCK_SIZE):
+    return SignalStoreBuilder(blf_path, dbc_path, store_dir, block_size).build()
+
+
+# ----------------------------------------------------------------------
+# Чтение
+# ----------------------------------------------------------------------
+class SignalStore:
+    """Чтение сигналов по интервалу времени; файлы колонок отображаются в память"""
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('version') != STORE_VERSION:
+            raise ValueError(f"Unsupported signal store version: {self.manifest.get('version')}")
+        self.t_base = self.manifest['t_base']
+        self._maps = {}
+
+        # короткие имена сигналов, если они уникальны в DBC
+        self._aliases = {}
+        duplicates = set()
+        for key, info in self.manifest['signals'].items():
+            name = info['signal']
+            if name in self._aliases:
+                duplicates.add(name)
+            self._aliases[name] = key
+        for name in duplicates:
+            del self._aliases[name]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        for file_handle, mapped in self._maps.values():
+            mapped.close()
+            file_handle.close()
+        self._maps.clear()
+
+    def _mapped(self, file_name):
+        if file_name not in self._maps:
+            file_handle = open(os.path.join(self.store_dir, file_name), 'rb')
+            self._maps[file_name] = (file_handle, mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ))
+        return self._maps[file_name][1]
+
+    # ------------------------------------------------------------------
+    # Каталог
+    # ------------------------------------------------------------------
+    def signals(self):
+        return sorted(self.manifest['signals'])
+
+    def resolve(self, name):
+        """'Message.Signal' или короткое имя сигнала, если оно однозначно"""
+        if name in self.manifest['signals']:
+            return name
+        if name in self._aliases:
+            return self._aliases[name]
+        matches = [key for key, info in self.manifest['signals'].items() if info['signal'] == name]
+        if matches:
+            raise KeyError(f"Signal {name!r} is ambiguous, use one of: {', '.join(sorted(matches))}")
+        raise KeyError(f"Signal {name!r} not found in {self.store_dir}")
+
+    def info(self, name):
+        return self.manifest['signals'][self.resolve(name)]
+
+    def time_range(self):
+        return self.manifest['t_start'], self.manifest['t_end']
+
+    # ------------------------------------------------------------------
+    # Данные
+    # ------------------------------------------------------------------
+    def _blocks(self, series, t0, t1):
+        for index, block in enumerate(series['blocks']):
+            block_min, block_max = block[0], block[1]
+            if (t1 is None or block_min <= t1) and (t0 is None or block_max >= t0):
+                yield index, block
+
+    def _to_ns(self, timestamp):
+        return int(np.rint((np.float64(timestamp) - self.t_base) * 1e9))
+
+    def _read(self, key, t0, t1, raw, time_cache):
+        info = self.manifest['signals'][key]
+        series = self.manifest['series'][info['series']]
+        time_map = self._mapped(series['time_file'])
+        value_map = self._mapped(info['file'])
+        decode_values = decode_int if info['kind'] == 'int' else decode_float
+
+        times = []
+        values = []
+        for index, (_, _, count, time_ref, value_refs) in self._blocks(series, t0, t1):
+            cache_key = (info['series'], index)
+            if cache_key not in time_cache:
+                offset, length = time_ref
+                ns = decode_int(time_map[offset:offset + length], count)
+                # сравнение в тех же целых наносекундах, что и при сборке - границы точные
+                mask = np.ones(count, dtype=bool)
+                if t0 is not None:
+                    mask &= ns >= self._to_ns(t0)
+                if t1 is not None:
+                    mask &= ns <= self._to_ns(t1)
+                time_cache[cache_key] = (self.t_base + ns[mask] * 1e-9, mask)
+            block_times, mask = time_cache[cache_key]
+
+            offset, length = value_refs[info['signal']]
+            times.append(block_times)
+            values.append(decode_values(value_map[offset:offset + length], count)[mask])
+
+        value_dtype = np.int64 if info['kind'] == 'int' else np.float64
+        timestamps = np.concatenate(times) if times else np.empty(0, dtype=np.float64)
+        result = np.concatenate(values) if values else np.empty(0, dtype=value_dtype)
+
+        if not raw and (info['scale'] != 1 or info['offset'] != 0 or info['kind'] == 'float'):
+            result = result * info['scale'] + info['offset']
+        return timestamps, result
+
+    def read(self, name, t0=None, t1=None, raw=False):
+        """
+        (timestamps, values) сигнала на [t0, t1] (абсолютные метки времени BLF, None - без границы).
+        raw=True - сырые значения без scale/offset.
+        """
+        return self._read(self.resolve(name), t0, t1, raw, {})
+
+    def read_many(self, names, t0=None, t1=None, raw=False):
+        """{имя: (timestamps, values)}; ось времени общего сообщения распаковывается один раз"""
+        time_cache = {}
+        return {name: self._read(self.resolve(name), t0, t1, raw, time_cache) for name in names}
+
+
+def is_store_fresh(store_dir, blf_path, dbc_path):
+    manifest_path = os.path.join(store_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return False
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except Exception as e:
+        print(f"[SignalStore] Could not read manifest {manifest_path}: {e}")
+        return False
+
+    expected = {
+        'version': STORE_VERSION,
+        'source_signature': _file_signature(blf_path),
+        'dbc_signature': _file_signature(dbc_path),
+    }
+    for key, value in expected.items():
+        if manifest.get(key) != value:
+            print(f"[SignalStore] Stale store ({key} changed): {store_dir}")
+            return False
+    return True
+
+
+def open_store(blf_path, dbc_path, store_dir=None, rebuild=False, block_size=BLOCK_SIZE):
+    """Открывает хранилище для BLF, при отсутствии или устаревании - собирает его"""
+    store_dir = store_dir or store_path_for(blf_path)
+    if rebuild or not is_store_fresh(store_dir, blf_path, dbc_path):
+        build_store(blf_path, dbc_path, store_dir, block_size)
+    return SignalStore(store_dir)
+
+
+# ----------------------------------------------------------------------
+# CLI
+# ----------------------------------------------------------------------
+def print_info(store):
+    manifest = store.manifest
+    t_start, t_end = store.time_range()
+    print(f"Store:   {store.store_dir}")
+    print(f"Source:  {manifest['source']}")
+    print(f"DBC:     {manifest['dbc']}")
+    if t_start is not None:
+        print(f"Time:    {t_start:.6f} .. {t_end:.6f} ({t_end - t_start:.1f} s)")
+    print(f"Frames:  {manifest['decoded_frames']}/{manifest['frames']} decoded, "
+          f"{manifest['decode_errors']} decode errors")
+    print(f"Signals: {len(manifest['signals'])}")
+    for key in store.signals():
+        info = manifest['signals'][key]
+        series = manifest['series'][info['series']]
+        unit = f" [{info['unit']}]" if info['unit'] else ''
+        print(f"  {key}{unit}: {series['samples']} samples, {len(series['blocks'])} blocks, {info['kind']}")
+
+
+def run_query(store, names, t0, t1, relative, csv_path, show):
+    if relative:
+        t0 = None if t0 is None else store.manifest['t_start'] + t0
+        t1 = None if t1 is None else store.manifest['t_start'] + t1
+
+    start = time.perf_counter()
+    data = store.read_many(names, t0, t1)
+    elapsed = time.perf_counter() - start
+
+    for name, (timestamps, values) in data.items():
+        print(f"{name}: {len(values)} samples in {elapsed * 1000:.1f} ms (all signals)")
+        for timestamp, value in list(zip(timestamps, values))[:show]:
+            print(f"  {timestamp:.6f}  {value}")
+
+    if csv_path:
+        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['signal', 'timestamp', 'value'])
+            for name, (timestamps, values) in data.items():
+                writer.writerows((name, timestamp, value) for timestamp, value in zip(timestamps.tolist(), values.tolist()))
+        print(f"Saved: {csv_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-signal compressed column store for BLF + DBC')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='Decode a BLF once into per-signal columns')
+    build.add_argument('blf')
+    build.add_argument('dbc')
+    build.add_argument('-o', '--output', default=None, help=f'Store directory (default: <blf>{STORE_SUFFIX})')
+    build.add_argument('--block-size', type=int, default=BLOCK_SIZE,
+                       help=f'Samples per compressed block (default: {BLOCK_SIZE})')
+    build.add_argument('--force', action='store_true', help='Rebuild even if the store is fresh')
+
+    info = commands.add_parser('info', help='List signals in a store')
+    info.add_argument('store')
+
+    query = commands.add_parser('query', help='Read signals over a time range')
+    query.add_argument('store')
+    query.add_argument('signals', nargs='+', help='Signal names (Message.Signal or unique signal name)')
+    query.add_argument('--t0', type=float, default=None, help='Range start (absolute BLF time)')
+    query.add_argument('--t1', type=float, default=None, help='Range end (absolute BLF time)')
+    query.add_argument('--relative', action='store_true', help='--t0/--t1 are seconds from the log start')
+    query.add_argument('--csv', default=None, help='Save the samples to CSV (signal, timestamp, value)')
+    query.add_argument('--show', type=int, default=5, help='Samples to print per signal (default: 5)')
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        store_dir = args.output or store_path_for(args.blf)
+        if not args.force and is_store_fresh(store_dir, args.blf, args.dbc):
+            print(f"[SignalStore] Up to date: {store_dir}")
+            return
+        build_store(args.blf, args.dbc, store_dir, args.block_size)
+    elif args.command == 'info':
+        with SignalStore(args.store) as store:
+            print_info(store)
+    else:
+        with SignalStore(args.store) as store:
+            try:
+                run_query(store, args.signals, args.t0, args.t1, args.relative, args.csv, args.show)
+            except KeyError as e:
+                print(e.args[0])
+
+
+if __name__ == "__main__":
+    main()
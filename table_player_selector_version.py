@@ -4,6 +4,9 @@ CAN Valve Control Sequence Player - TABLE SELECTOR VERSION
 =========================================================
 Plays ESC valve testing sequence according to table 1 or 2.
 Tables are presented in a maximally readable format with full descriptions.
+Before playing, the table is compiled (table_sequence.compile_table) into a flat
+schedule of preallocated frames sent at absolute deadlines.
+--table-file loads a validated table (.json/.yaml, see tables/) instead of the built-in ones.
 """
 
 import can
@@ -12,6 +15,8 @@ import argparse
 import os
 from datetime import datetime
 from tqdm import tqdm
+from replay_scheduler import ReplayScheduler
+from table_sequence import compile_table, format_table_review, load_table_file, play_schedule
 
 # ANSI color codes
 COLOR_RED = "\033[91m"
@@ -261,42 +266,19 @@ class ValveController:
         if self.logger:
             self.logger.on_message_received(msg)
 
-    def send_command(self, data, description="", stage_time=T1):
-        """Send command with stage time delay"""
-        if not self.bus:
-            print(f"{COLOR_RED}CAN bus not connected!{COLOR_RESET}")
-            return False
-
-        try:
-            stage_start = time.time()
-
-            tx_msg = can.Message(
-                arbitration_id=0x740,
-                data=data,
-                is_extended_id=False,
-                timestamp=time.time()
-            )
+    def on_frame_sent(self, schedule, index, msg):
+        """Log and print a sent frame"""
+        self.log_message(msg)
 
-            self.bus.send(tx_msg)
-            self.log_message(tx_msg)
+        data_hex = ' '.join([f'{b:02X}' for b in msg.data])
+        print(f"{COLOR_WHITE}{msg.timestamp:.6f} 0  740       Tx   d {len(msg.data)} {data_hex}{COLOR_RESET}")
 
-            data_hex = ' '.join([f'{b:02X}' for b in data])
-            print(f"{COLOR_WHITE}{tx_msg.timestamp:.6f} 0  740       Tx   d {len(data)} {data_hex}{COLOR_RESET}")
+        description = schedule.descriptions[index]
+        if description:
+            print(f"{COLOR_CYAN}# {description}{COLOR_RESET}")
 
-            if description:
-                print(f"{COLOR_CYAN}# {description}{COLOR_RESET}")
-
-            # Maintain stage time
-            elapsed = time.time() - stage_start
-            remaining = stage_time - elapsed
-            if remaining > 0:
-                time.sleep(remaining)
-
-            return True
-
-        except Exception as e:
-            print(f"{COLOR_RED}Send error: {e}{COLOR_RESET}")
-            return False
+    def on_send_error(self, index, msg, error):
+        print(f"{COLOR_RED}Send error: {error}{COLOR_RESET}")
 
     def switch_wheel(self, new_wheel, diagonal=None):
         """Switch to next wheel and/or diagonal"""
@@ -323,45 +305,33 @@ class ValveController:
                 print(f"{COLOR_WHITE}Logging: {self.blf_output}{COLOR_RESET}")
             print()
 
-            # Count total steps for progress bar
-            total_steps = 0
-            for step in table_data["sequence"]:
-                if "repeat" in step:
-                    total_steps += step["repeat"] * 2  # on + off for each repeat
-                else:
-                    total_steps += 1
+            # Flat schedule: repeat steps expanded, frames preallocated
+            schedule = compile_table(table_data, repeat_default_time=T2)
+            print(f"{COLOR_WHITE}Compiled: {len(schedule)} frames, {schedule.duration:.3f}s{COLOR_RESET}")
 
             # Progress bar
-            pbar = tqdm(total=total_steps, desc="Sending commands", unit="msg", ncols=100)
+            pbar = tqdm(total=len(schedule), desc="Sending commands", unit="msg", ncols=100)
+
+            def on_sent(index, msg):
+                self.on_frame_sent(schedule, index, msg)
+                pbar.update(1)
+
+            def on_error(index, msg, error):
+                self.on_send_error(index, msg, error)
+                pbar.update(1)
 
             start_time = time.time()
+            scheduler = ReplayScheduler()
+            scheduler.start(0.0)
 
-            # Play sequence
-            for step in table_data["sequence"]:
-                if "repeat" in step:
-                    # Cyclic step
-                    # FIXED: safe time retrieval with fallback
-                    default_time = step.get("time", T2)
-                    off_time = step.get("off_time", default_time)
-                    on_time = step.get("on_time", default_time)
-
-                    for i in range(step["repeat"]):
-                        # OFF command
-                        self.send_command(step["off"], f"{step['desc']} - OFF ({i+1}/{step['repeat']})", off_time)
-                        pbar.update(1)
-
-                        # ON command
-                        self.send_command(step["on"], f"{step['desc']} - ON ({i+1}/{step['repeat']})", on_time)
-                        pbar.update(1)
-                else:
-                    # Single step
-                    self.send_command(step["data"], step["desc"], step["time"])
-                    pbar.update(1)
+            # Play sequence against absolute deadlines
+            play_schedule(self.bus, schedule, scheduler, on_sent=on_sent, on_error=on_error)
 
             pbar.close()
 
             total_time = time.time() - start_time
             print(f"\n{COLOR_GREEN}Table {table_data['name']} completed in {total_time:.1f} seconds!{COLOR_RESET}")
+            print(f"{COLOR_WHITE}{scheduler.format_report()}{COLOR_RESET}")
             return True
 
         except KeyboardInterrupt:
@@ -413,6 +383,7 @@ Usage examples:
   %(prog)s --table 2           # Run table 2
   %(prog)s --table 1 --no-virtual  # Use real CAN interface
   %(prog)s --table 2 --channel 1   # Use CAN channel 1
+  %(prog)s --table-file tables/table2.json --review   # Decoded valve states, no execution
         """
     )
 
@@ -434,6 +405,10 @@ Usage examples:
                        help='BLF output file path (default: auto-generated)')
     parser.add_argument('--compare', action='store_true',
                        help='Show table comparison without execution')
+    parser.add_argument('--table-file', type=str, default=None,
+                       help='Table definition file (.json/.yaml) instead of the built-in table')
+    parser.add_argument('--review', action='store_true',
+                       help='Print the compiled table with decoded valve bits and exit')
 
     args = parser.parse_args()
 
@@ -443,13 +418,24 @@ Usage examples:
         return
 
     # Table selection
-    if args.table == 1:
+    if args.table_file:
+        try:
+            table_data = load_table_file(args.table_file)
+        except (OSError, ValueError) as e:
+            print(f"{COLOR_RED}Invalid table file {args.table_file}: {e}{COLOR_RESET}")
+            return
+        print(f"\n{COLOR_GREEN}Selected table file: {args.table_file} ({table_data['name']}){COLOR_RESET}")
+    elif args.table == 1:
         table_data = TABLE_1
         print(f"\n{COLOR_GREEN}Selected TABLE 1{COLOR_RESET}")
     else:
         table_data = TABLE_2
         print(f"\n{COLOR_GREEN}Selected TABLE 2{COLOR_RESET}")
 
+    if args.review:
+        print(format_table_review(table_data, compile_table(table_data, repeat_default_time=T2)))
+        return
+
     # Logging setup
     blf_output = args.blf_file
     if args.blf and blf_output is None:
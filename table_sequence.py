@@ -0,0 +1,429 @@
+"""
+Компиляция табличных последовательностей клапанов
+==================================================
+
+Табличные плееры (piter_roller_bench_table_player.py, table_player_selector_version.py)
+интерпретировали TABLE_1/TABLE_2 на лету: шаги repeat разворачивались во время
+проигрывания, на каждую отправку создавался новый can.Message, а пауза шага
+отсчитывалась от его собственного начала (time.time() + sleep). Ошибки sleep и
+время отправки/печати накапливались: за тысячи циклов --cycle расписание уезжало.
+
+compile_table() один раз превращает таблицу в плоское расписание:
+- offsets - смещение отправки каждого кадра от начала цикла (сумма времён шагов)
+- frames  - заранее созданные can.Message, по одному на каждую отправку
+- descriptions - подписи для консоли (repeat уже развёрнут: "FL cycle - OFF (1/5)")
+- duration - длительность цикла (после неё можно начинать следующий)
+
+play_schedule() отправляет кадры по абсолютным дедлайнам ReplayScheduler
+(base + offset), так что ошибка не накапливается ни внутри цикла, ни между циклами.
+
+Таблицы можно держать во внешних файлах JSON/YAML (tables/table1.json, tables/table2.json):
+- load_table_file() читает файл и проверяет схему (validate_table): шаги, длины
+  кадров, байты, времена; время шага - число или имя из "times" ("T1".."T5")
+- decode_payload() раскладывает кадр 2F 4B 12 03 на включённые клапаны (EVFL, USV1,
+  PUMP...) - для просмотра таблицы перед запуском (python table_sequence.py table.json)
+- TableWatcher следит за файлом; плеер в режиме --cycle подхватывает изменения на
+  границе цикла, не переподключая шину. Файл с ошибкой не применяется.
+
+ИСПОЛЬЗОВАНИЕ:
+    schedule = compile_table(TABLE_1, repeat_default_time=T2)
+    scheduler = ReplayScheduler()
+    scheduler.start(0.0)
+    base = 0.0
+    while True:
+        play_schedule(bus, schedule, scheduler, base, on_sent=...)
+        base += schedule.duration + cycle_pause
+"""
+
+import argparse
+import json
+import os
+import time
+from array import array
+from pathlib import Path
+
+import can
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# Идентификатор команд клапанов
+VALVE_REQUEST_ID = 0x740
+
+# Времена шагов по умолчанию (как в табличных плеерах), файл может переопределить в "times"
+DEFAULT_TIMES = {
+    "T1": 0.140,  # base timeout
+    "T2": 0.070,  # fast sequence (cycles)
+    "T3": 0.250,  # diagonal change
+    "T4": 0.400,  # pauses between stages
+    "T5": 2.000,  # very long pauses (depressurization)
+}
+
+# InputOutputControlByIdentifier 0x4B12, shortTermAdjustment: 06 2F 4B 12 03 <B5> <B6> 00
+VALVE_COMMAND_PREFIX = bytes([0x06, 0x2F, 0x4B, 0x12, 0x03])
+
+# Биты байтов 5 и 6 команды клапанов (индекс байта в кадре -> [(маска, имя)])
+VALVE_BITS = {
+    5: [(0x01, "EVFL"), (0x02, "AVFL"), (0x04, "EVFR"), (0x08, "AVFR"),
+        (0x10, "EVRL"), (0x20, "AVRL"), (0x40, "EVRR"), (0x80, "AVRR")],
+    6: [(0x01, "USV1"), (0x02, "USV2"), (0x04, "HSV1"), (0x08, "HSV2"), (0x40, "PUMP")],
+}
+
+UDS_SERVICE_NAMES = {
+    0x10: "DiagnosticSessionControl",
+    0x14: "ClearDiagnosticInformation",
+    0x27: "SecurityAccess",
+    0x2F: "InputOutputControlByIdentifier",
+    0x3E: "TesterPresent",
+}
+
+STEP_KEYS = {"data", "time", "desc"}
+REPEAT_KEYS = {"repeat", "on", "off", "time", "on_time", "off_time", "desc"}
+
+
+class CompiledSchedule:
+    """Плоское расписание одной таблицы"""
+
+    def __init__(self, name):
+        self.name = name
+        self.offsets = array('d')
+        self.frames = []
+        self.descriptions = []
+        self.duration = 0.0
+
+    def append(self, data, description, stage_time, arbitration_id=VALVE_REQUEST_ID):
+        self.offsets.append(self.duration)
+        self.frames.append(can.Message(arbitration_id=arbitration_id, data=data, is_extended_id=False))
+        self.descriptions.append(description)
+        self.duration += stage_time
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self):
+        return zip(self.offsets, self.frames, self.descriptions)
+
+
+def compile_table(table_data, repeat_default_time, arbitration_id=VALVE_REQUEST_ID):
+    """
+    Разворачивает table_data["sequence"] в CompiledSchedule.
+    Шаги:
+      {"data": [...], "time": t, "desc": ...}
+      {"repeat": n, "on": [...], "off": [...], "time": t, "on_time": t, "off_time": t, "desc": ...}
+    В repeat сначала уходит off, затем on; время по умолчанию - repeat_default_time.
+    """
+    schedule = CompiledSchedule(table_data.get("name", ""))
+
+    for step in table_data["sequence"]:
+        if "repeat" in step:
+            default_time = step.get("time", repeat_default_time)
+            off_time = step.get("off_time", default_time)
+            on_time = step.get("on_time", default_time)
+            count = step["repeat"]
+
+            for i in range(count):
+                schedule.append(step["off"], f"{step['desc']} - OFF ({i+1}/{count})", off_time, arbitration_id)
+                schedule.append(step["on"], f"{step['desc']} - ON ({i+1}/{count})", on_time, arbitration_id)
+        else:
+            schedule.append(step["data"], step["desc"], step["time"], arbitration_id)
+
+    return schedule
+
+
+def play_schedule(bus, schedule, scheduler, base=0.0, on_sent=None, on_error=None, before_send=None):
+    """
+    Отправляет расписание: кадр i уходит в момент scheduler.deadline_for(base + offsets[i]).
+    scheduler должен быть запущен (scheduler.start(0.0)) до первого цикла.
+    before_send(index, msg)   - в момент дедлайна, до bus.send (регистрация ожидания ответа:
+                                ответ может прийти раньше, чем send вернёт управление)
+    on_sent(index, msg)       - после каждой отправки (msg.timestamp - время отправки, epoch)
+    on_error(index, msg, exc) - ошибка bus.send; без него исключение пробрасывается
+    Возвращает смещение конца цикла (base + duration).
+    """
+    offsets = schedule.offsets
+    frames = schedule.frames
+
+    for index in range(len(frames)):
+        msg = frames[index]
+        deadline = scheduler.wait_until(base + offsets[index])
+        msg.timestamp = time.time()
+        if before_send:
+            before_send(index, msg)
+        try:
+            bus.send(msg)
+        except Exception as e:
+            if on_error is None:
+                raise
+            on_error(index, msg, e)
+            continue
+        scheduler.record_send(deadline)
+
+        if on_sent:
+            on_sent(index, msg)
+
+    return base + schedule.duration
+
+
+# ============================================================================
+# Внешние файлы таблиц
+# ============================================================================
+def decode_payload(data):
+    """Кадр -> читаемое описание: включённые клапаны для 2F 4B 12 03, иначе имя сервиса UDS"""
+    data = bytes(data)
+    if data[:5] == VALVE_COMMAND_PREFIX and len(data) >= 7:
+        names = []
+        unknown = []
+        for index, bits in VALVE_BITS.items():
+            known_mask = 0
+            for mask, name in bits:
+                known_mask |= mask
+                if data[index] & mask:
+                    names.append(name)
+            if data[index] & ~known_mask & 0xFF:
+                unknown.append(f"B{index}&0x{data[index] & ~known_mask & 0xFF:02X}")
+        text = ' '.join(names) if names else "all off"
+        if unknown:
+            text += f" [unknown bits {' '.join(unknown)}]"
+        return text
+
+    if len(data) > 1 and data[0] <= 0x07:
+        sid = data[1]
+        return UDS_SERVICE_NAMES.get(sid, f"SID 0x{sid:02X}")
+    return "?"
+
+
+def _resolve_time(value, times, where):
+    if isinstance(value, str):
+        if value not in times:
+            raise ValueError(f"{where}: unknown time name {value!r} (known: {', '.join(sorted(times))})")
+        value = times[value]
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ValueError(f"{where}: time must be a positive number or a name from 'times', got {value!r}")
+    return float(value)
+
+
+def _resolve_data(value, where):
+    if isinstance(value, str):
+        try:
+            value = [int(b, 16) for b in value.split()]
+        except ValueError:
+            raise ValueError(f"{where}: bad hex string {value!r}")
+    if not isinstance(value, list) or not 1 <= len(value) <= 8:
+        raise ValueError(f"{where}: expected 1..8 bytes, got {value!r}")
+    for b in value:
+        if isinstance(b, bool) or not isinstance(b, int) or not 0 <= b <= 0xFF:
+            raise ValueError(f"{where}: byte out of range: {b!r}")
+    return list(value)
+
+
+def validate_table(raw, default_times=DEFAULT_TIMES):
+    """
+    Проверяет таблицу из файла и приводит её к формату TABLE_1/TABLE_2:
+    времена - числа в секундах, data/on/off - списки байт.
+    Ошибки - ValueError с путём до поля (sequence[12].time).
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("table: expected an object with 'name' and 'sequence'")
+    unknown = set(raw) - {"name", "description", "times", "sequence"}
+    if unknown:
+        raise ValueError(f"table: unknown field(s) {sorted(unknown)}")
+
+    raw_times = raw.get("times", {})
+    if not isinstance(raw_times, dict):
+        raise ValueError(f"times: expected an object of name -> seconds, got {raw_times!r}")
+    times = dict(default_times)
+    for name, value in raw_times.items():
+        times[name] = _resolve_time(value, {}, f"times.{name}")
+
+    sequence = raw.get("sequence")
+    if not isinstance(sequence, list) or not sequence:
+        raise ValueError("sequence: expected a non-empty list of steps")
+
+    steps = []
+    for index, step in enumerate(sequence):
+        where = f"sequence[{index}]"
+        if not isinstance(step, dict):
+            raise ValueError(f"{where}: expected an object")
+
+        if "repeat" in step:
+            unknown = set(step) - REPEAT_KEYS
+            if unknown:
+                raise ValueError(f"{where}: unknown field(s) {sorted(unknown)}")
+            count = step["repeat"]
+            if isinstance(count, bool) or not isinstance(count, int) or count < 1:
+                raise ValueError(f"{where}.repeat: expected a positive integer, got {count!r}")
+            for key in ("on", "off"):
+                if key not in step:
+                    raise ValueError(f"{where}: '{key}' is required for a repeat step")
+            compiled = {
+                "repeat": count,
+                "on": _resolve_data(step["on"], f"{where}.on"),
+                "off": _resolve_data(step["off"], f"{where}.off"),
+                "desc": str(step.get("desc", "")),
+            }
+            for key in ("time", "on_time", "off_time"):
+                if key in step:
+                    compiled[key] = _resolve_time(step[key], times, f"{where}.{key}")
+        else:
+            unknown = set(step) - STEP_KEYS
+            if unknown:
+                raise ValueError(f"{where}: unknown field(s) {sorted(unknown)}")
+            for key in ("data", "time"):
+                if key not in step:
+                    raise ValueError(f"{where}: '{key}' is required")
+            compiled = {
+                "data": _resolve_data(step["data"], f"{where}.data"),
+                "time": _resolve_time(step["time"], times, f"{where}.time"),
+                "desc": str(step.get("desc", "")),
+            }
+        steps.append(compiled)
+
+    return {
+        "name": str(raw.get("name", "")),
+        "description": str(raw.get("description", "")),
+        "sequence": steps,
+    }
+
+
+def load_table_file(path, default_times=DEFAULT_TIMES):
+    """JSON или YAML (.yaml/.yml, нужен PyYAML) -> проверенная таблица в формате TABLE_1"""
+    path = Path(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.suffix.lower() in ('.yaml', '.yml'):
+            if yaml is None:
+                raise ValueError("PyYAML is not installed, use a .json table or 'pip install pyyaml'")
+            try:
+                raw = yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                raise ValueError(f"{path.name}: {e}")
+        else:
+            try:
+                raw = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path.name}: {e}")
+    table = validate_table(raw, default_times)
+    if not table["name"]:
+        table["name"] = path.stem
+    return table
+
+
+def save_table_file(table_data, path, times=DEFAULT_TIMES):
+    """Сохраняет TABLE_1/TABLE_2 в JSON; времена, совпадающие с times, пишутся именами"""
+    names = {value: name for name, value in times.items()}
+
+    def time_value(value):
+        return names.get(value, value)
+
+    def hex_data(data):
+        return ' '.join(f'{b:02X}' for b in data)
+
+    sequence = []
+    for step in table_data["sequence"]:
+        if "repeat" in step:
+            item = {"repeat": step["repeat"], "on": hex_data(step["on"]), "off": hex_data(step["off"])}
+            for key in ("time", "on_time", "off_time"):
+                if key in step:
+                    item[key] = time_value(step[key])
+        else:
+            item = {"data": hex_data(step["data"]), "time": time_value(step["time"])}
+        item["desc"] = step.get("desc", "")
+        sequence.append(item)
+
+    data = {
+        "name": table_data.get("name", ""),
+        "description": table_data.get("description", ""),
+        "times": dict(times),
+        "sequence": sequence,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{\n')
+        f.write(f'  "name": {json.dumps(data["name"], ensure_ascii=False)},\n')
+        f.write(f'  "description": {json.dumps(data["description"], ensure_ascii=False)},\n')
+        f.write(f'  "times": {json.dumps(data["times"])},\n')
+        f.write('  "sequence": [\n')
+        # один шаг - одна строка, как в TABLE_1/TABLE_2
+        f.write(',\n'.join(f'    {json.dumps(item, ensure_ascii=False)}' for item in sequence))
+        f.write('\n  ]\n}\n')
+
+
+def format_table_review(table_data, schedule):
+    """Таблица для просмотра: время, кадр, описание из файла и расшифровка битов"""
+    lines = [f"{table_data['name']}: {len(schedule)} frames, {schedule.duration:.3f}s per cycle"]
+    for offset, msg, description in schedule:
+        data_hex = ' '.join(f'{b:02X}' for b in msg.data)
+        lines.append(f"  {offset:8.3f}s  {data_hex:<23}  {description:<45.45} {decode_payload(msg.data)}")
+    return '\n'.join(lines)
+
+
+class TableWatcher:
+    """
+    Следит за файлом таблицы (mtime + размер). poll() на границе цикла возвращает
+    новую (table_data, schedule), если файл изменился и прошёл проверку, иначе None.
+    Ошибка в изменённом файле печатается один раз, старая таблица продолжает работать.
+    """
+
+    def __init__(self, path, repeat_default_time, arbitration_id=VALVE_REQUEST_ID, default_times=DEFAULT_TIMES):
+        self.path = Path(path)
+        self.repeat_default_time = repeat_default_time
+        self.arbitration_id = arbitration_id
+        self.default_times = default_times
+        self._signature = None
+        self.last_error = None
+
+    def _stat_signature(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def load(self):
+        """Первая загрузка: ошибки пробрасываются"""
+        signature = self._stat_signature()
+        table_data = load_table_file(self.path, self.default_times)
+        self._signature = signature
+        return table_data, compile_table(table_data, self.repeat_default_time, self.arbitration_id)
+
+    def poll(self):
+        try:
+            signature = self._stat_signature()
+        except OSError as e:
+            self._report(f"cannot stat {self.path}: {e}")
+            return None
+        if signature == self._signature:
+            return None
+
+        try:
+            table_data = load_table_file(self.path, self.default_times)
+        except (OSError, ValueError) as e:
+            self._signature = signature
+            self._report(str(e))
+            return None
+
+        self._signature = signature
+        self.last_error = None
+        return table_data, compile_table(table_data, self.repeat_default_time, self.arbitration_id)
+
+    def _report(self, error):
+        if error != self.last_error:
+            print(f"[TableWatcher] {self.path.name} not reloaded: {error}")
+        self.last_error = error
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Validate a valve table file and print the decoded schedule')
+    parser.add_argument('table_file', help='Table definition (.json, .yaml)')
+    args = parser.parse_args()
+
+    try:
+        table_data = load_table_file(args.table_file)
+    except (OSError, ValueError) as e:
+        print(f"Invalid table {args.table_file}: {e}")
+        return 1
+
+    schedule = compile_table(table_data, repeat_default_time=DEFAULT_TIMES["T2"])
+    print(format_table_review(table_data, schedule))
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
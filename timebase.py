@@ -0,0 +1,251 @@
+"""
+Нормализация меток времени CAN логов (относительное / абсолютное / нулевое время)
+================================================================================
+
+В логах встречается смесь: логгер пишет относительное время от включения, потом
+синхронизирует часы и переходит на Unix time; часы переводятся назад; у части кадров
+метка 0. Раньше каждый скрипт решал это сам: logfixing_grok (< 1000000 - относительное),
+auto_extract в ds_blf_extractor_splitter (> 1000000000 - абсолютное), parse_blf_file
+анализатора (< 0.001 - индекс * 10 мс).
+
+normalize_timestamps(timestamps) работает на массиве меток целиком (NumPy) и строит одну
+монотонную шкалу времени:
+
+1. Классификация: ZERO - не число или < ZERO_LIMIT; ABSOLUTE - >= ABSOLUTE_MIN (Unix time
+   после 2001 г.); остальное - RELATIVE (значения между RELATIVE_LIMIT и ABSOLUTE_MIN
+   считаются относительными, но попадают в отчёт как ambiguous).
+2. Сегменты: по ненулевым меткам шкала режется на переключениях RELATIVE <-> ABSOLUTE
+   и на скачках назад больше BACKWARD_TOLERANCE. Внутри сегмента часы считаются верными.
+3. Сшивка: опорный сегмент - первый абсолютный (если есть, иначе первый); он не
+   сдвигается. Сегменты после него продолжают шкалу с шагом step (медиана
+   положительных интервалов лога), кроме абсолютных сегментов, которые и так идут позже -
+   они остаются в реальном времени (пауза логгера). Сегменты до опорного пристыковываются
+   к нему слева, тоже с шагом step.
+4. Нулевые метки: внутри лога - линейно между соседними исправленными метками,
+   в начале/конце - с шагом step. Лог целиком из нулей даёт индекс * DEFAULT_STEP
+   (прежний запасной вариант анализатора).
+5. Дрожание назад меньше BACKWARD_TOLERANCE (слияние каналов) срезается
+   накопительным максимумом - шкала неубывающая.
+
+origin='zero' дополнительно сдвигает шкалу к 0 от первой метки (как делал logfixing_grok).
+Отчёт (словарь) перечисляет переключения, скачки назад, нулевые серии, сегменты со
+сдвигами и число изменённых меток; format_report печатает его.
+
+Ридеры применяют нормализацию как отдельную стадию без копий: inplace=True правит
+переданный float64 массив на месте, apply_to_messages меняет timestamp только у
+изменённых can.Message.
+
+ИСПОЛЬЗОВАНИЕ:
+    fixed, report = normalize_timestamps(timestamps)
+    print(format_report(report))
+
+    report = apply_to_messages(messages, origin='zero')
+"""
+
+import numpy as np
+
+# Ниже - нулевая/невалидная метка (сек)
+ZERO_LIMIT = 0.001
+
+# Ниже - точно относительное время, с ABSOLUTE_MIN - Unix time (сек)
+RELATIVE_LIMIT = 1e6
+ABSOLUTE_MIN = 1e9
+
+# Скачок назад больше этого - сброс/перевод часов (новый сегмент), меньше - дрожание (сек)
+BACKWARD_TOLERANCE = 0.001
+
+# Шаг, если в логе нет ни одного положительного интервала (сек)
+DEFAULT_STEP = 0.010
+
+# Сколько событий каждого вида хранить в отчёте поимённо
+REPORT_LIMIT = 20
+
+RELATIVE = 'relative'
+ABSOLUTE = 'absolute'
+
+
+def timestamp_clock(timestamp):
+    """Часы одной метки: 'absolute', 'relative' или None (нулевая/невалидная)"""
+    if not timestamp >= ZERO_LIMIT:
+        return None
+    return ABSOLUTE if timestamp >= ABSOLUTE_MIN else RELATIVE
+
+
+def _runs(mask):
+    """Серии True в булевом массиве: (начала, длины)"""
+    edges = np.diff(np.concatenate(([False], mask, [False])).astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    return starts, np.flatnonzero(edges == -1) - starts
+
+
+def normalize_timestamps(timestamps, origin='keep', inplace=False, step=None):
+    """
+    Монотонная шкала времени из меток (сек). Возвращает (массив float64, отчёт).
+    origin: 'keep' - опорный сегмент не сдвигается, 'zero' - шкала от 0.
+    inplace=True - результат пишется в timestamps (нужен float64 ndarray), без копии.
+    step - шаг для сшивки и нулевых меток; по умолчанию медиана положительных интервалов.
+    """
+    raw = np.asarray(timestamps, dtype=np.float64)
+    if inplace and raw is not timestamps:
+        raise TypeError("inplace=True needs a float64 numpy array")
+    count = len(raw)
+    out = raw if inplace else raw.copy()
+
+    valid = np.isfinite(raw) & (raw >= ZERO_LIMIT)
+    valid_index = np.flatnonzero(valid)
+    values = raw[valid_index]
+    absolute = values >= ABSOLUTE_MIN
+
+    report = {
+        'samples': count,
+        'clock': None,
+        'step': None,
+        'mode_switches': 0,
+        'backward_jumps': 0,
+        'zero_samples': int(count - len(valid_index)),
+        'zero_runs': 0,
+        'ambiguous': int(np.count_nonzero((values >= RELATIVE_LIMIT) & ~absolute)),
+        'jitter_clamped': 0,
+        'changed': 0,
+        'segments': [],
+        'events': [],
+    }
+    if not count:
+        return out, report
+
+    # --- сегменты по ненулевым меткам ---
+    deltas = np.diff(values)
+    switch = absolute[1:] != absolute[:-1]
+    backward = (deltas < -BACKWARD_TOLERANCE) & ~switch
+    boundaries = np.flatnonzero(switch | backward) + 1
+    seg_starts = np.concatenate(([0], boundaries))
+    seg_ends = np.concatenate((boundaries, [len(values)]))
+    if not len(values):
+        seg_starts = seg_ends = np.empty(0, dtype=np.int64)
+
+    if step is None:
+        inner = deltas[~(switch | backward) & (deltas > 0)]
+        step = float(np.median(inner)) if len(inner) else DEFAULT_STEP
+    report['step'] = step
+    report['mode_switches'] = int(np.count_nonzero(switch))
+    report['backward_jumps'] = int(np.count_nonzero(backward))
+
+    for position in boundaries[:REPORT_LIMIT]:
+        index = int(valid_index[position])
+        kind = 'mode_switch' if switch[position - 1] else 'backward_jump'
+        report['events'].append({'type': kind, 'index': index,
+                                 'from': float(values[position - 1]), 'to': float(values[position])})
+
+    # --- сшивка сегментов (сегментов мало - цикл по сегментам, не по меткам) ---
+    first = values[seg_starts] if len(values) else values
+    last = values[seg_ends - 1] if len(values) else values
+    seg_absolute = absolute[seg_starts] if len(values) else absolute
+    offsets = np.zeros(len(seg_starts))
+    anchor = int(np.argmax(seg_absolute)) if seg_absolute.any() else 0
+
+    for k in range(anchor + 1, len(seg_starts)):
+        previous_end = last[k - 1] + offsets[k - 1]
+        if seg_absolute[k] and first[k] > previous_end:
+            continue  # реальное время после паузы
+        offsets[k] = previous_end + step - first[k]
+    for k in range(anchor - 1, -1, -1):
+        offsets[k] = first[k + 1] + offsets[k + 1] - step - last[k]
+
+    # изменённые метки - булева маска, без копии исходного массива
+    changed = ~valid
+    if len(values):
+        sample_offsets = np.repeat(offsets, seg_ends - seg_starts)
+        out[valid_index] = values + sample_offsets
+        changed[valid_index] = sample_offsets != 0
+
+    if seg_absolute.all() and len(values):
+        report['clock'] = ABSOLUTE
+    elif seg_absolute.any():
+        report['clock'] = 'mixed'
+    elif len(values):
+        report['clock'] = RELATIVE
+    for k in range(min(len(seg_starts), REPORT_LIMIT)):
+        report['segments'].append({
+            'start': int(valid_index[seg_starts[k]]),
+            'end': int(valid_index[seg_ends[k] - 1]),
+            'clock': ABSOLUTE if seg_absolute[k] else RELATIVE,
+            'offset': float(offsets[k]),
+        })
+
+    # --- нулевые метки ---
+    zero_index = np.flatnonzero(~valid)
+    if len(zero_index):
+        run_starts, run_lengths = _runs(~valid)
+        report['zero_runs'] = len(run_starts)
+        for start, length in zip(run_starts[:REPORT_LIMIT].tolist(), run_lengths[:REPORT_LIMIT].tolist()):
+            report['events'].append({'type': 'zero_run', 'index': start, 'length': length})
+
+        if not len(valid_index):
+            out[:] = np.arange(count) * DEFAULT_STEP
+        else:
+            fixed_valid = out[valid_index]
+            out[zero_index] = np.interp(zero_index, valid_index, fixed_valid)
+            lead = zero_index[zero_index < valid_index[0]]
+            out[lead] = fixed_valid[0] - step * (valid_index[0] - lead)
+            tail = zero_index[zero_index > valid_index[-1]]
+            out[tail] = fixed_valid[-1] + step * (tail - valid_index[-1])
+
+    # --- мелкое дрожание назад ---
+    monotonic = np.maximum.accumulate(out)
+    clamped = monotonic != out
+    report['jitter_clamped'] = int(np.count_nonzero(clamped))
+    if report['jitter_clamped']:
+        out[clamped] = monotonic[clamped]
+        changed |= clamped
+
+    if origin == 'zero':
+        if out[0] != 0:
+            out -= out[0]
+            changed[:] = True
+    elif origin != 'keep':
+        raise ValueError(f"Unknown origin: {origin}")
+
+    report['changed'] = int(np.count_nonzero(changed))
+    return out, report
+
+
+def apply_to_messages(messages, origin='keep', step=None):
+    """Нормализует timestamp у списка can.Message на месте (меняются только изменённые). Возвращает отчёт"""
+    timestamps = np.fromiter((msg.timestamp for msg in messages), dtype=np.float64, count=len(messages))
+    fixed, report = normalize_timestamps(timestamps, origin=origin, step=step)
+    for index in np.flatnonzero(fixed != timestamps).tolist():
+        messages[index].timestamp = float(fixed[index])
+    return report
+
+
+def is_clean(report):
+    """Ничего не пришлось чинить (шкала и так монотонная, без нулей и переключений)"""
+    return not (report['mode_switches'] or report['backward_jumps'] or report['zero_samples']
+                or report['jitter_clamped'])
+
+
+def format_report(report):
+    step = f"{report['step'] * 1000:.3f} ms" if report['step'] else '-'
+    lines = [f"Timebase: {report['samples']} samples, clock {report['clock'] or '-'}, step {step}"]
+    if is_clean(report):
+        lines.append("  Monotonic, no repairs needed")
+        return '\n'.join(lines)
+
+    lines.append(f"  Mode switches: {report['mode_switches']}, backward jumps: {report['backward_jumps']}, "
+                 f"zero samples: {report['zero_samples']} in {report['zero_runs']} run(s), "
+                 f"jitter clamped: {report['jitter_clamped']}")
+    if report['ambiguous']:
+        lines.append(f"  Ambiguous values ({RELATIVE_LIMIT:g}..{ABSOLUTE_MIN:g} s) treated as relative: "
+                     f"{report['ambiguous']}")
+    for event in report['events']:
+        if event['type'] == 'zero_run':
+            lines.append(f"  #{event['index']}: {event['length']} zero timestamp(s) interpolated")
+        else:
+            label = 'relative/absolute switch' if event['type'] == 'mode_switch' else 'backward jump'
+            lines.append(f"  #{event['index']}: {label} {event['from']:.6f} -> {event['to']:.6f}")
+    if len(report['segments']) > 1:
+        for segment in report['segments']:
+            lines.append(f"  Segment #{segment['start']}..#{segment['end']} ({segment['clock']}): "
+                         f"shift {segment['offset']:+.6f} s")
+    lines.append(f"  Changed timestamps: {report['changed']}")
+    return '\n'.join(lines)
@@ -0,0 +1,290 @@
+"""
+Единственный владелец передачи на CAN шину
+===========================================
+
+Раньше Tester Present в replay_universal_pci_fix.py слал четыре кадра подряд под
+tester_present_lock, а цикл проигрывания брал тот же lock вокруг каждого bus.send.
+Кадр проигрывания мог ждать до четырёх отправок Tester Present.
+
+TxScheduler - один поток, который владеет bus.send:
+- периодические задания (Tester Present на каждый адрес со своим интервалом)
+- разовые кадры проигрывания с абсолютным дедлайном (perf_counter)
+лежат в одной очереди с приоритетом по дедлайну (heapq). Поток спит до ближайшего
+дедлайна (sleep + spin, как ReplayScheduler) и отправляет кадры строго по порядку.
+При равных дедлайнах кадр проигрывания уходит раньше периодического.
+
+Периодические задания планируются от своего предыдущего дедлайна (без накопления
+ошибки); если поток отстал больше чем на интервал, пропущенные слоты считаются в skipped.
+По каждому заданию собирается дрейф: фактическое время отправки - дедлайн.
+
+ИСПОЛЬЗОВАНИЕ:
+    tx = TxScheduler(bus)
+    tx.start()
+    tx.add_periodic("TP 0x740", 0x740, UDS_TESTER_PRESENT, interval=2.0)
+    job = tx.send_at(deadline, can.Message(arbitration_id=0x740, data=data))
+    job.wait()                  # job.sent_at - фактическое время отправки
+    tx.stop()
+    print(tx.format_report())
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from array import array
+
+import can
+
+from replay_scheduler import SPIN_THRESHOLD
+
+# Приоритет при равных дедлайнах (меньше - раньше)
+PRIORITY_FRAME = 0
+PRIORITY_PERIODIC = 1
+
+
+class TxJob:
+    """Разовый кадр: ждать отправки через wait(), результат в sent_at / error"""
+    __slots__ = ('msg', 'deadline', 'sent_at', 'error', 'cancelled', '_done')
+
+    def __init__(self, msg, deadline):
+        self.msg = msg
+        self.deadline = deadline
+        self.sent_at = None
+        self.error = None
+        self.cancelled = False
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        """True если кадр обработан (отправлен, ошибка или отмена)"""
+        return self._done.wait(timeout)
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+
+class PeriodicJob:
+    """Периодический кадр (Tester Present и т.п.) со статистикой дрейфа"""
+
+    def __init__(self, name, msg, interval, first_deadline):
+        self.name = name
+        self.msg = msg
+        self.interval = interval
+        self.deadline = first_deadline
+        self.active = True
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+        self.drift = array('d')  # секунды, send_time - deadline
+
+    def stats(self):
+        drift_ms = sorted(d * 1000.0 for d in self.drift)
+        count = len(drift_ms)
+        return {
+            'name': self.name,
+            'interval_s': self.interval,
+            'sent': self.sent,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'drift_mean_ms': sum(drift_ms) / count if count else None,
+            'drift_p99_ms': drift_ms[min(count - 1, int(0.99 * count))] if count else None,
+            'drift_max_ms': drift_ms[-1] if count else None,
+        }
+
+
+class TxScheduler:
+    def __init__(self, bus, spin_threshold=SPIN_THRESHOLD, on_error=None):
+        """
+        on_error(job, exc) - ошибка bus.send (job - TxJob или PeriodicJob), вызывается в потоке передачи
+        """
+        self.bus = bus
+        self.spin_threshold = spin_threshold
+        self.on_error = on_error
+
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._periodic = {}
+        self._periodic_history = []  # все когда-либо добавленные задания, для отчёта
+        self._running = False
+        self._thread = None
+
+        self.frames_sent = 0
+        self.frames_failed = 0
+        self.frame_errors = array('d')  # секунды, send_time - deadline для разовых кадров
+
+    # ------------------------------------------------------------------
+    # Управление
+    # ------------------------------------------------------------------
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="TxScheduler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=3.0):
+        """Останавливает поток. Неотправленные разовые кадры помечаются отменёнными."""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+        with self._cond:
+            for _, _, _, job in self._heap:
+                if isinstance(job, TxJob):
+                    job.cancelled = True
+                    job._done.set()
+            self._heap = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _push(self, deadline, priority, job):
+        with self._cond:
+            heapq.heappush(self._heap, (deadline, priority, next(self._seq), job))
+            # будим поток: новый дедлайн может быть раньше того, до которого он спит
+            self._cond.notify()
+
+    # ------------------------------------------------------------------
+    # Задания
+    # ------------------------------------------------------------------
+    def add_periodic(self, name, arbitration_id, data, interval, first_delay=0.0, is_extended_id=False):
+        """Добавляет периодический кадр. first_delay - сдвиг фазы первого кадра (сек)"""
+        self.remove_periodic(name)
+        msg = can.Message(arbitration_id=arbitration_id, data=data, is_extended_id=is_extended_id)
+        job = PeriodicJob(name, msg, interval, time.perf_counter() + first_delay)
+        self._periodic[name] = job
+        self._periodic_history.append(job)
+        self._push(job.deadline, PRIORITY_PERIODIC, job)
+        return job
+
+    def remove_periodic(self, name):
+        """Снимает периодическое задание (запись в куче отбрасывается при извлечении)"""
+        job = self._periodic.pop(name, None)
+        if job is not None:
+            job.active = False
+        return job
+
+    def remove_all_periodic(self):
+        for name in list(self._periodic):
+            self.remove_periodic(name)
+
+    def send_at(self, deadline, msg):
+        """Ставит кадр на отправку в момент deadline (perf_counter). Возвращает TxJob"""
+        job = TxJob(msg, deadline)
+        if not self._running:
+            job.cancelled = True
+            job._done.set()
+            return job
+        self._push(deadline, PRIORITY_FRAME, job)
+        return job
+
+    def send_now(self, msg):
+        return self.send_at(time.perf_counter(), msg)
+
+    # ------------------------------------------------------------------
+    # Поток передачи
+    # ------------------------------------------------------------------
+    def _next_job(self):
+        """Ждёт, пока до ближайшего дедлайна останется spin_threshold, и снимает задание"""
+        with self._cond:
+            while self._running:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+
+                deadline, _, _, job = self._heap[0]
+                if isinstance(job, PeriodicJob) and not job.active:
+                    heapq.heappop(self._heap)
+                    continue
+
+                remaining = deadline - time.perf_counter()
+                if remaining > self.spin_threshold:
+                    self._cond.wait(remaining - self.spin_threshold)
+                    continue
+
+                heapq.heappop(self._heap)
+                return deadline, job
+        return None, None
+
+    def _run(self):
+        while True:
+            deadline, job = self._next_job()
+            if job is None:
+                break
+
+            while time.perf_counter() < deadline:
+                pass
+
+            try:
+                self.bus.send(job.msg)
+                sent_at = time.perf_counter()
+                error = None
+            except Exception as e:
+                sent_at = time.perf_counter()
+                error = e
+
+            if isinstance(job, TxJob):
+                job.sent_at = sent_at
+                job.error = error
+                if error is None:
+                    self.frames_sent += 1
+                    self.frame_errors.append(sent_at - deadline)
+                else:
+                    self.frames_failed += 1
+                job._done.set()
+            else:
+                job.drift.append(sent_at - deadline)
+                if error is None:
+                    job.sent += 1
+                else:
+                    job.failed += 1
+                self._reschedule(job, deadline, sent_at)
+
+            if error is not None and self.on_error:
+                self.on_error(job, error)
+
+    def _reschedule(self, job, deadline, now):
+        if not job.active:
+            return
+        next_deadline = deadline + job.interval
+        if next_deadline <= now:
+            missed = int((now - next_deadline) // job.interval) + 1
+            job.skipped += missed
+            next_deadline += missed * job.interval
+        job.deadline = next_deadline
+        self._push(next_deadline, PRIORITY_PERIODIC, job)
+
+    # ------------------------------------------------------------------
+    # Отчёт
+    # ------------------------------------------------------------------
+    def periodic_stats(self):
+        """Статистика всех периодических заданий, включая снятые"""
+        return [job.stats() for job in self._periodic_history]
+
+    def format_report(self):
+        lines = [f"TX scheduler: {self.frames_sent} frames sent, {self.frames_failed} failed"]
+        if self.frame_errors:
+            errors_us = sorted(e * 1e6 for e in self.frame_errors)
+            count = len(errors_us)
+            lines.append(f"  Frame send error: mean {sum(errors_us) / count:.1f} us, "
+                         f"p99 {errors_us[min(count - 1, int(0.99 * count))]:.1f} us, max {errors_us[-1]:.1f} us")
+        for stats in self.periodic_stats():
+            if stats['drift_mean_ms'] is None:
+                lines.append(f"  {stats['name']}: no frames sent")
+                continue
+            lines.append(f"  {stats['name']} (every {stats['interval_s']:g}s): sent {stats['sent']}, "
+                         f"failed {stats['failed']}, skipped {stats['skipped']}, "
+                         f"drift mean {stats['drift_mean_ms']:.3f} ms, p99 {stats['drift_p99_ms']:.3f} ms, "
+                         f"max {stats['drift_max_ms']:.3f} ms")
+        return '\n'.join(lines)
+
+    def print_report(self):
+        print(self.format_report())
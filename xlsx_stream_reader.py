@@ -0,0 +1,243 @@
+"""
+Потоковое чтение XLSX логов стенда (openpyxl read-only)
+========================================================
+
+pd.read_excel грузит весь workbook в память и строит полный DataFrame, после чего
+парсеры проходят его через iterrows() с regex и strptime на каждой строке.
+На заводских выгрузках в 500k строк это минуты.
+
+Здесь:
+- read_xlsx_header()        - только первая строка (для detect_file_format)
+- read_xlsx_frame()         - весь лист в DataFrame без промежуточной модели openpyxl
+- read_factory_can_events() - формат нового завода (№ п/п, Date, Time, Type, Level, Event):
+  строки читаются потоково, в памяти остаются только CAN строки, Event разбирается
+  одним скомпилированным regex через .str.extract, Date/Time - через pd.to_datetime
+  пачками по chunk_size строк.
+
+Файлы .xls openpyxl не читает - для них fallback на pd.read_excel.
+
+ИСПОЛЬЗОВАНИЕ:
+    from xlsx_stream_reader import read_xlsx_header, read_factory_can_events
+
+    events = read_factory_can_events("AVA_OK.xlsx")
+    for row in events.itertuples(index=False):
+        print(row.timestamp, hex(row.can_id), row.direction, row.data_hex)
+"""
+
+import re
+from datetime import datetime, date, time as dt_time
+from pathlib import Path
+
+import pandas as pd
+from openpyxl import load_workbook
+
+# Колонки XLSX нового завода
+FACTORY_COLUMNS = ['№ п/п', 'Date', 'Time', 'Type', 'Level', 'Event']
+
+# [0x740] (6) -> 0x2F 0x4B 0x12 0x03 0x57 0x43
+CAN_EVENT_RE = re.compile(r'\[(0x[0-9a-fA-F]+)\]\s*\((\d+)\)\s*(->|<-)\s*(.+)')
+
+# Время суток без даты: 13:56:48.123 (доли секунды - необязательны)
+TIME_OF_DAY_RE = re.compile(r'(\d{1,2}):(\d{2}):(\d{2})(?:\.(\d+))?')
+
+# Сколько CAN строк копить перед векторным разбором
+DEFAULT_CHUNK_SIZE = 100000
+
+# Колонки результата read_factory_can_events
+EVENT_COLUMNS = ['row_index', 'date', 'time', 'event', 'timestamp', 'ms_of_day',
+                 'can_id', 'dlc', 'direction', 'data_hex']
+
+
+def _is_xls(file_path):
+    return Path(file_path).suffix.lower() == '.xls'
+
+
+def _header_names(header_row):
+    """Имена колонок как у pandas: пустые ячейки -> 'Unnamed: N'"""
+    names = []
+    for i, value in enumerate(header_row):
+        if value is None:
+            names.append(f"Unnamed: {i}")
+        else:
+            names.append(value.strip() if isinstance(value, str) else value)
+    return names
+
+
+def read_xlsx_header(file_path):
+    """Возвращает список имён колонок, читая только первую строку листа"""
+    if _is_xls(file_path):
+        return pd.read_excel(file_path, nrows=0).columns.tolist()
+
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        for row in ws.iter_rows(min_row=1, max_row=1, values_only=True):
+            return _header_names(row)
+        return []
+    finally:
+        wb.close()
+
+
+def is_factory_xlsx(file_path):
+    """True если это XLSX нового завода (№ п/п, Date, Time, Type, Level, Event)"""
+    try:
+        columns = read_xlsx_header(file_path)
+    except Exception:
+        return False
+    return all(col in columns for col in FACTORY_COLUMNS)
+
+
+def iter_xlsx_rows(file_path):
+    """
+    Генератор строк данных (без заголовка) в виде кортежей значений.
+    Полностью пустые строки пропускаются.
+    """
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        for row in ws.iter_rows(min_row=2, values_only=True):
+            if all(value is None for value in row):
+                continue
+            yield row
+    finally:
+        wb.close()
+
+
+def read_xlsx_frame(file_path):
+    """
+    Читает лист целиком в DataFrame (замена pd.read_excel для старого формата завода).
+    Не строит полную модель workbook в памяти.
+    """
+    if _is_xls(file_path):
+        return pd.read_excel(file_path)
+
+    columns = read_xlsx_header(file_path)
+    width = len(columns)
+    rows = [row[:width] for row in iter_xlsx_rows(file_path)]
+    return pd.DataFrame(rows, columns=columns)
+
+
+def _date_to_str(value):
+    if isinstance(value, (datetime, date)):
+        return value.strftime('%d.%m.%Y')
+    return '' if value is None else str(value).strip()
+
+
+def _time_to_str(value):
+    if isinstance(value, (datetime, dt_time)):
+        return value.strftime('%H:%M:%S.%f')
+    return '' if value is None else str(value).strip()
+
+
+def _parse_event_chunk(row_indices, dates, times, events):
+    """Векторный разбор пачки CAN строк"""
+    chunk = pd.DataFrame({
+        'row_index': row_indices,
+        'date': dates,
+        'time': times,
+        'event': events,
+    })
+
+    # Date/Time -> datetime, сначала с миллисекундами, потом без
+    clean_time = chunk['time'].str.replace(r'[⇨⇦]', '', regex=True).str.strip()
+    combined = chunk['date'] + ' ' + clean_time
+    parsed = pd.to_datetime(combined, format='%d.%m.%Y %H:%M:%S.%f', errors='coerce')
+    missing = parsed.isna()
+    if missing.any():
+        parsed[missing] = pd.to_datetime(combined[missing], format='%d.%m.%Y %H:%M:%S', errors='coerce')
+
+    # Секунды (naive, важны только разности) и миллисекунды от начала суток
+    chunk['timestamp'] = (parsed - pd.Timestamp(0)).dt.total_seconds()
+    chunk['ms_of_day'] = (parsed.dt.hour * 3600000 + parsed.dt.minute * 60000 +
+                          parsed.dt.second * 1000 + parsed.dt.microsecond // 1000)
+
+    # Пустая или другая Date: только Time (как старый parse_timestamp_custom) -> мс от начала суток;
+    # timestamp - от полуночи соседней строки с датой, без неё - секунды от начала суток
+    missing = parsed.isna()
+    if missing.any():
+        parts = clean_time[missing].str.extract(TIME_OF_DAY_RE)
+        fraction = parts[3].fillna('').str.ljust(3, '0').str[:3]
+        ms_of_day = ((pd.to_numeric(parts[0], errors='coerce') * 3600 +
+                      pd.to_numeric(parts[1], errors='coerce') * 60 +
+                      pd.to_numeric(parts[2], errors='coerce')) * 1000 +
+                     pd.to_numeric(fraction, errors='coerce'))
+        midnight = (chunk['timestamp'] - chunk['ms_of_day'] / 1000.0).ffill().bfill().fillna(0.0)
+        chunk.loc[missing, 'ms_of_day'] = ms_of_day
+        chunk.loc[missing, 'timestamp'] = midnight[missing] + ms_of_day / 1000.0
+
+    # Event -> id, dlc, направление, данные
+    extracted = chunk['event'].str.extract(CAN_EVENT_RE)
+    chunk['can_id'] = extracted[0].map(lambda s: int(s, 16), na_action='ignore').astype(float)
+    chunk['dlc'] = pd.to_numeric(extracted[1], errors='coerce')
+    chunk['direction'] = extracted[2]
+    chunk['data_hex'] = (extracted[3].str.upper()
+                         .str.replace('0X', '', regex=False)
+                         .str.replace(r'\s+', ' ', regex=True)
+                         .str.strip())
+
+    return chunk
+
+
+def read_factory_can_events(file_path, chunk_size=DEFAULT_CHUNK_SIZE, only_ids=None):
+    """
+    Потоково читает XLSX нового завода и возвращает DataFrame CAN событий
+    (только строки Type == 'Can') с колонками EVENT_COLUMNS:
+        row_index  - индекс строки данных (как индекс pd.read_excel)
+        date, time, event - исходные строки
+        timestamp  - секунды (float, NaN если время не распарсилось)
+        ms_of_day  - миллисекунды от начала суток (float, NaN если не распарсилось)
+        can_id, dlc - числа (NaN если Event не распознан)
+        direction  - '->' (Tx) или '<-' (Rx)
+        data_hex   - 'XX XX XX' в верхнем регистре
+
+    only_ids - опциональный набор CAN ID, остальные строки отбрасываются сразу после разбора пачки.
+    """
+    columns = read_xlsx_header(file_path)
+    missing_columns = [col for col in FACTORY_COLUMNS if col not in columns]
+    if missing_columns:
+        raise ValueError(f"Missing columns in {file_path}: {missing_columns}")
+
+    date_idx = columns.index('Date')
+    time_idx = columns.index('Time')
+    type_idx = columns.index('Type')
+    event_idx = columns.index('Event')
+
+    if _is_xls(file_path):
+        df = pd.read_excel(file_path)
+        rows = df.itertuples(index=False, name=None)
+    else:
+        rows = iter_xlsx_rows(file_path)
+
+    chunks = []
+    row_indices, dates, times, events = [], [], [], []
+
+    def flush():
+        if not row_indices:
+            return
+        chunk = _parse_event_chunk(row_indices, dates, times, events)
+        if only_ids is not None:
+            chunk = chunk[chunk['can_id'].isin(only_ids)]
+        chunks.append(chunk)
+        row_indices.clear()
+        dates.clear()
+        times.clear()
+        events.clear()
+
+    for row_index, row in enumerate(rows):
+        if row[type_idx] != 'Can':
+            continue
+
+        row_indices.append(row_index)
+        dates.append(_date_to_str(row[date_idx]))
+        times.append(_time_to_str(row[time_idx]))
+        events.append('' if row[event_idx] is None else str(row[event_idx]))
+
+        if len(row_indices) >= chunk_size:
+            flush()
+
+    flush()
+
+    if not chunks:
+        return pd.DataFrame(columns=EVENT_COLUMNS)
+
+    return pd.concat(chunks, ignore_index=True)[EVENT_COLUMNS]